@@ -0,0 +1,109 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Measure the cost of parsing pages of a bucket listing.
+
+This parses synthetic 1000 object pages by building the whole tree and
+parsing each timestamp with L{dateutil}, as L{S3Client} used to, and then
+with L{txaws.s3._listing.parse_listing}, as it now does.  It reports the
+time per page and the peak memory allocated while parsing one.
+
+Run it with::
+
+    PYTHONPATH=. python benchmarks/bucket_listing.py [pages]
+"""
+
+import sys
+import tracemalloc
+from timeit import default_timer
+
+from dateutil.parser import parse as parseTime
+
+from txaws.s3._listing import parse_listing
+from txaws.s3.model import BucketItem, BucketListing, ItemOwner
+from txaws.util import XML
+
+
+def make_page(count=1000):
+    contents = "".join(
+        "<Contents>"
+        "<Key>logs/2019/01/{:02d}/{:06d}.log.gz</Key>"
+        "<LastModified>2019-01-{:02d}T17:50:{:02d}.000Z</LastModified>"
+        "<ETag>&quot;828ef3fdfa96f00ad9f27c383fc9ac7f&quot;</ETag>"
+        "<Size>{}</Size>"
+        "<Owner><ID>bcaf1ffd86f41caff1a493dc2ad8c2c2</ID>"
+        "<DisplayName>webfile</DisplayName></Owner>"
+        "<StorageClass>STANDARD</StorageClass>"
+        "</Contents>".format(
+            i % 28 + 1, i, i % 28 + 1, i % 60, i * 1024,
+        )
+        for i in range(count)
+    )
+    return (
+        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+        "<ListBucketResult><Name>mybucket</Name><Prefix>logs/</Prefix>"
+        "<Marker></Marker><MaxKeys>1000</MaxKeys>"
+        "<IsTruncated>true</IsTruncated>{}</ListBucketResult>".format(
+            contents,
+        )
+    ).encode("utf-8")
+
+
+def tree(xml_bytes):
+    root = XML(xml_bytes)
+    contents = []
+    for content_data in root.findall("Contents"):
+        contents.append(BucketItem(
+            content_data.findtext("Key"),
+            parseTime(content_data.findtext("LastModified")),
+            content_data.findtext("ETag"),
+            content_data.findtext("Size"),
+            content_data.findtext("StorageClass"),
+            ItemOwner(
+                content_data.findtext("Owner/ID"),
+                content_data.findtext("Owner/DisplayName"),
+            ),
+        ))
+    return BucketListing(
+        root.findtext("Name"), root.findtext("Prefix"),
+        root.findtext("Marker"), root.findtext("MaxKeys"),
+        root.findtext("IsTruncated"), contents, [],
+    )
+
+
+def streaming(xml_bytes):
+    return parse_listing(xml_bytes)
+
+
+def measure(parse, xml_bytes, pages):
+    """
+    @return: The seconds per page and the peak bytes allocated parsing
+        one.
+    """
+    parse(xml_bytes)
+    start = default_timer()
+    for i in range(pages):
+        parse(xml_bytes)
+    elapsed = default_timer() - start
+
+    tracemalloc.start()
+    parse(xml_bytes)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / pages, peak
+
+
+def main(pages=50):
+    xml_bytes = make_page()
+    if tree(xml_bytes) != streaming(xml_bytes):
+        raise Exception("The parsers disagree")
+    print("{:<12} {:>12} {:>12}".format("parser", "msec/page", "peak KiB"))
+    for parse in [tree, streaming]:
+        seconds, peak = measure(parse, xml_bytes, pages)
+        print("{:<12} {:>12.2f} {:>12.1f}".format(
+            parse.__name__, seconds * 1e3, peak / 1024,
+        ))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,114 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Measure the cost of building the objects which describe each S3 request.
+
+For the requests C{put_object} and C{get_object} make, this builds the
+L{RequestDetails} and URL context first with the validating attrs
+initializers, as every request used to, and then with
+L{txaws.client._validators.unvalidated}, as L{S3Client} now does.  It
+reports the time and the number of memory blocks allocated per request.
+
+Run it with::
+
+    PYTHONPATH=. python benchmarks/request_objects.py [iterations]
+"""
+
+import sys
+import tracemalloc
+from hashlib import sha256
+from io import BytesIO
+from timeit import default_timer
+
+from twisted.web.client import FileBodyProducer
+from twisted.web.http_headers import Headers
+
+from txaws.client.base import RequestDetails
+from txaws.client._validators import unvalidated
+from txaws.s3.client import _S3URLContext
+
+
+def put_object(construct):
+    body = b"hello world"
+    return construct(
+        RequestDetails,
+        region=b"us-east-1",
+        service=b"s3",
+        method=b"PUT",
+        url_context=construct(
+            _S3URLContext,
+            scheme="https",
+            host="s3.amazonaws.com",
+            port=None,
+            path=["mybucket", "some", "key.txt"],
+            query=[],
+        ),
+        headers=Headers({"content-type": ["text/plain"]}),
+        body_producer=FileBodyProducer(BytesIO(body)),
+        metadata={"color": "blue"},
+        amz_headers={},
+        content_sha256=sha256(body).hexdigest(),
+    )
+
+
+def get_object(construct):
+    return construct(
+        RequestDetails,
+        region=b"us-east-1",
+        service=b"s3",
+        method=b"GET",
+        url_context=construct(
+            _S3URLContext,
+            scheme="https",
+            host="s3.amazonaws.com",
+            port=None,
+            path=["mybucket", "some", "key.txt"],
+            query=[],
+        ),
+        content_sha256=sha256(b"").hexdigest(),
+    )
+
+
+def validated(cls, **kw):
+    return cls(**kw)
+
+
+def measure(request, construct, iterations):
+    """
+    @return: The seconds and allocated memory blocks per request.
+    """
+    request(construct)
+    start = default_timer()
+    for i in range(iterations):
+        request(construct)
+    elapsed = default_timer() - start
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    # Hold on to the results so their allocations are still live.
+    results = [request(construct) for i in range(100)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(
+        stat.count_diff for stat in after.compare_to(before, "filename")
+        if stat.count_diff > 0
+    )
+    del results
+    return elapsed / iterations, blocks / 100
+
+
+def main(iterations=10000):
+    print("{:<12} {:<12} {:>12} {:>12}".format(
+        "request", "construction", "usec/req", "blocks/req",
+    ))
+    for request in [put_object, get_object]:
+        for construct in [validated, unvalidated]:
+            seconds, blocks = measure(request, construct, iterations)
+            print("{:<12} {:<12} {:>12.2f} {:>12.1f}".format(
+                request.__name__, construct.__name__,
+                seconds * 1e6, blocks,
+            ))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -4,6 +4,7 @@ AWS authorization, version 4.
 """
 import hashlib
 import hmac
+from collections import OrderedDict
 from urllib.parse import urlparse, parse_qs, urlunparse, urlencode, quote
 
 import attr
@@ -57,6 +58,90 @@ def getSignatureKey(key, dateStamp, regionName, serviceName):
     return kSigning
 
 
+@attr.s
+class _SigningKeyCache:
+    """
+    A bounded cache of signing keys (see L{getSignatureKey}).
+
+    A signing key depends only on the secret key, the date, the region and
+    the service so it can be reused for every request with the same
+    credentials to the same region and service on the same UTC day.
+    Deriving one takes four HMAC computations.
+
+    Keys are cached per access key, date stamp, region and service.  When
+    a key is derived for a new date, keys for earlier dates with the same
+    access key, region and service are discarded.  When the secret key
+    for an access key changes, all keys for that access key are
+    discarded.  Beyond C{max_size} keys, the least recently used are
+    discarded.
+
+    @ivar max_size: The most signing keys to keep.
+    @type max_size: L{int}
+
+    @ivar _keys: A mapping from (access key, date stamp, region, service)
+        to (secret key, signing key), least recently used first.
+    """
+    max_size = attr.ib(default=128, validator=attr.validators.instance_of(int))
+    _keys = attr.ib(default=attr.Factory(OrderedDict), init=False)
+
+    def get(self, credentials, date_stamp, region, service):
+        """
+        Get a signing key, deriving it if it is not cached.
+
+        @param credentials: The AWS credentials.
+        @type credentials: L{txaws.credentials.AWSCredentials}
+
+        @param date_stamp: The UTC date, serialized as an AWS date stamp.
+
+        @param region: The name of the region.
+
+        @param service: The name of the service.
+
+        @return: The signing key.
+        @rtype: L{bytes}
+        """
+        cache_key = (credentials.access_key, date_stamp, region, service)
+        cached = self._keys.get(cache_key)
+        if cached is not None:
+            secret_key, signing_key = cached
+            if secret_key == credentials.secret_key:
+                self._keys.move_to_end(cache_key)
+                return signing_key
+        self._evict(credentials, date_stamp, region, service)
+        signing_key = getSignatureKey(
+            credentials.secret_key, date_stamp, region, service,
+        )
+        self._keys[cache_key] = (credentials.secret_key, signing_key)
+        while len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+        return signing_key
+
+    def _evict(self, credentials, date_stamp, region, service):
+        """
+        Discard the keys which deriving a key for the given parameters
+        makes obsolete.
+        """
+        for cache_key, (secret_key, _) in list(self._keys.items()):
+            access_key, other_date, other_region, other_service = cache_key
+            if access_key != credentials.access_key:
+                continue
+            if secret_key != credentials.secret_key:
+                # The credentials have been rotated.
+                del self._keys[cache_key]
+            elif (other_region, other_service) == (region, service):
+                # Signing is now happening on a later (or earlier) day.
+                del self._keys[cache_key]
+
+    def clear(self):
+        """
+        Discard all cached keys.
+        """
+        self._keys.clear()
+
+
+_signing_keys = _SigningKeyCache()
+
+
 def makeAMZDate(instant):
     """
     Serialize a L{datetime.datetime} according to the "amz date" format.
@@ -121,6 +206,50 @@ def _make_canonical_query_string(parsed):
     return urlencode(sorted_query_params)
 
 
+def _make_canonical_uri_from_segments(segments, service):
+    """
+    Return the canonical URI for a sequence of path segments.
+
+    Each segment is quoted as it is when the request's URL is encoded, so
+    a segment containing I{/} does not become two.  S3 signs that path.
+    Every other service signs the path quoted again, as it would a URL
+    which is already encoded.  See
+    U{https://docs.aws.amazon.com/general/latest/gr/sigv4-create-canonical-request.html}
+
+    @param segments: The unquoted path segments.
+    @type segments: L{list} of L{str}
+
+    @param service: The AWS service's name (e.g., C{'s3'}).
+    @type service: L{str}
+
+    @return: The canonical URI.
+    @rtype: L{str}
+    """
+    quoted = [quote(segment, safe="") for segment in segments]
+    if service != "s3":
+        quoted = [quote(segment, safe="") for segment in quoted]
+    return "/" + "/".join(quoted)
+
+
+def _make_canonical_query_string_from_arguments(arguments):
+    """
+    Return the canonical query string for a sequence of query arguments.
+
+    @param arguments: The unquoted query arguments.  Each has a C{name}
+        and a C{value}, which is C{None} for an argument with no value.
+    @type arguments: L{list} of L{txaws.client.base._QueryArgument}
+
+    @return: The canonical query string.
+    @rtype: L{str}
+    """
+    pairs = sorted(
+        (quote(argument.name, safe=""),
+         quote(argument.value or "", safe=""))
+        for argument in arguments
+    )
+    return "&".join(name + "=" + value for (name, value) in pairs)
+
+
 def _make_canonical_headers(headers, headers_to_sign):
     """
     Return canonicalized headers.
@@ -265,6 +394,50 @@ class _CanonicalRequest:
             payload_hash=payload_hash,
         )
 
+    @classmethod
+    def from_url_context(
+            cls, method, url_context, headers, headers_to_sign, payload_hash,
+            service,
+    ):
+        """
+        Construct a L{_CanonicalRequest} from the structured path and query
+        of a URL context.
+
+        This is equivalent to L{from_request_components} but skips
+        serializing the URL only to parse it apart again.
+
+        @param method: The HTTP method.
+        @type method: L{bytes}
+
+        @param url_context: The request's URL.
+        @type url_context: L{txaws.client.base._URLContext}
+
+        @param service: The AWS service's name (e.g., C{'s3'}), which
+            decides how the path is encoded.  See
+            L{_make_canonical_uri_from_segments}.
+        @type service: L{str}
+
+        @see: L{from_request_components} for the other parameters.
+
+        @return: A canonical request
+        @rtype: L{_CanonicalRequest}
+        """
+        if payload_hash is None:
+            payload_hash = "UNSIGNED-PAYLOAD"
+        return cls(
+            method=method,
+            canonical_uri=_make_canonical_uri_from_segments(
+                url_context.path, service,
+            ),
+            canonical_query_string=_make_canonical_query_string_from_arguments(
+                url_context.query,
+            ),
+            canonical_headers=_make_canonical_headers(headers,
+                                                      headers_to_sign),
+            signed_headers=_make_signed_headers(headers, headers_to_sign),
+            payload_hash=payload_hash,
+        )
+
     @classmethod
     def from_request_components_and_payload(
             cls, method, url, headers, headers_to_sign, payload,
@@ -434,11 +607,39 @@ class _SignableAWS4HMAC256Token:
         ).hexdigest()
 
 
+def _sign_request(region, service, canonical_request, credentials, instant,
+                  signing_keys):
+    """
+    Sign a request.
+
+    @see: L{_make_authorization_header}
+
+    @return: A three-tuple of the request's L{_CredentialScope}, the
+        signing key and the signature.
+    """
+    date_stamp = makeDateStamp(instant)
+    scope = _CredentialScope(
+        date_stamp=date_stamp,
+        region=region,
+        service=service
+    )
+    signable = _SignableAWS4HMAC256Token(
+        makeAMZDate(instant),
+        scope,
+        canonical_request,
+    )
+    if signing_keys is None:
+        signing_keys = _signing_keys
+    signing_key = signing_keys.get(credentials, date_stamp, region, service)
+    return scope, signing_key, signable.signature(signing_key)
+
+
 def _make_authorization_header(region,
                                service,
                                canonical_request,
                                credentials,
-                               instant):
+                               instant,
+                               signing_keys=None):
     """
     Construct an AWS version 4 authorization value for use in an
     C{Authorization} header.
@@ -460,29 +661,16 @@ def _make_authorization_header(region,
     @type instant: A naive local L{datetime.datetime} (as returned by
         L{datetime.datetime.utcnow})
 
+    @param signing_keys: The cache of signing keys to use or C{None} for
+        the process-wide cache.
+    @type signing_keys: L{_SigningKeyCache}
+
     @return: A value suitable for use in an C{Authorization} header
-    @rtype: L{bytes}
+    @rtype: L{str}
     """
-    date_stamp = makeDateStamp(instant)
-    amz_date = makeAMZDate(instant)
-
-    scope = _CredentialScope(
-        date_stamp=date_stamp,
-        region=region,
-        service=service
-    )
-
-    signable = _SignableAWS4HMAC256Token(
-        amz_date,
-        scope,
-        canonical_request,
-    )
-
-    signature = signable.signature(
-        getSignatureKey(credentials.secret_key,
-                        date_stamp,
-                        region,
-                        service)
+    scope, signing_key, signature = _sign_request(
+        region, service, canonical_request, credentials, instant,
+        signing_keys,
     )
 
     v4credential = _Credential(
@@ -491,9 +679,227 @@ def _make_authorization_header(region,
     )
 
     return (
-        b"%s " % (_SignableAWS4HMAC256Token.ALGORITHM,) +
-        b", ".join([
-            b"Credential=%s" % (v4credential.serialize(),),
-            b"SignedHeaders=%s" % (canonical_request.signed_headers,),
-            b"Signature=%s" % (signature,),
+        "%s " % (_SignableAWS4HMAC256Token.ALGORITHM.decode("ascii"),) +
+        ", ".join([
+            "Credential=%s" % (v4credential.serialize(),),
+            "SignedHeaders=%s" % (canonical_request.signed_headers,),
+            "Signature=%s" % (signature,),
         ]))
+
+
+# The payload hash of a request whose body is signed a chunk at a time as
+# it is sent.  See
+# U{https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-streaming.html}
+STREAMING_PAYLOAD = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD"
+
+_EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class _ChunkSigner:
+    """
+    A signer of the chunks of a streamed payload, in the order they are
+    sent.
+
+    The signature of each chunk covers the signature of the one before,
+    starting from the signature of the request itself, so chunks cannot be
+    reordered, dropped or replaced.
+
+    @ivar _previous: The signature of the last chunk signed.
+    @type _previous: L{str}
+    """
+    ALGORITHM = "AWS4-HMAC-SHA256-PAYLOAD"
+
+    def __init__(self, signing_key, amz_date, scope, seed_signature):
+        """
+        @param signing_key: The key with which the request was signed.
+        @type signing_key: L{bytes}
+
+        @param amz_date: The time the request was signed at.  See
+            L{makeAMZDate}.
+        @type amz_date: L{str}
+
+        @param scope: The scope of the request's credentials.
+        @type scope: L{_CredentialScope}
+
+        @param seed_signature: The signature of the request.
+        @type seed_signature: L{str}
+        """
+        self._signing_key = signing_key
+        self._prefix = "\n".join([
+            self.ALGORITHM, amz_date, scope.serialize(),
+        ])
+        self._previous = seed_signature
+
+    def sign(self, chunk):
+        """
+        Sign the next chunk.
+
+        @param chunk: The chunk.
+        @type chunk: L{bytes}
+
+        @return: The hex signature of the chunk.
+        @rtype: L{str}
+        """
+        string_to_sign = "\n".join([
+            self._prefix,
+            self._previous,
+            _EMPTY_SHA256,
+            hashlib.sha256(chunk).hexdigest(),
+        ]).encode("ascii")
+        self._previous = hmac.new(
+            self._signing_key, string_to_sign, hashlib.sha256,
+        ).hexdigest()
+        return self._previous
+
+
+def _make_chunk_signer(region, service, canonical_request, credentials,
+                       instant, signing_keys=None):
+    """
+    Sign a request whose payload is streamed and get a signer for the
+    chunks of its payload.
+
+    @see: L{_make_authorization_header} for the parameters.  The payload
+        hash of C{canonical_request} must be L{STREAMING_PAYLOAD}.
+
+    @rtype: L{_ChunkSigner}
+    """
+    scope, signing_key, signature = _sign_request(
+        region, service, canonical_request, credentials, instant,
+        signing_keys,
+    )
+    return _ChunkSigner(signing_key, makeAMZDate(instant), scope, signature)
+
+
+# The longest a presigned URL may be valid for, in seconds.
+MAX_PRESIGNED_EXPIRES = 7 * 24 * 60 * 60
+
+
+class _QueryStringSigner:
+    """
+    A signer of URLs which carry their signature in their query string,
+    so anyone holding one can make the request it describes until it
+    expires.  See
+    U{https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-query-string-auth.html}
+
+    Everything but the method, path and query of each URL is fixed when the
+    signer is created: the credential scope, the signing key, the time
+    and the parts of the canonical request and the string to sign which
+    depend only on them.  Signing a URL then costs one SHA-256 hash and
+    one HMAC, so a signer should be used for as many URLs as can share its
+    time.
+
+    Only the I{Host} header is signed, so the request must be made with no
+    other headers which would have to be.
+    """
+    def __init__(self, credentials, region, service, scheme, host, instant,
+                 expires, payload_hash="UNSIGNED-PAYLOAD",
+                 signing_keys=None):
+        """
+        @param credentials: The AWS credentials.
+        @type credentials: L{txaws.credentials.AWSCredentials}
+
+        @param region: The AWS region name (e.g., C{'us-east-1'}).
+        @type region: L{str}
+
+        @param service: The AWS service's name (e.g., C{'s3'}).
+        @type service: L{str}
+
+        @param scheme: The scheme of the URLs.
+        @type scheme: L{str}
+
+        @param host: The host of the URLs, with the port if it is not the
+            scheme's default.
+        @type host: L{str}
+
+        @param instant: The UTC date and time the URLs are valid from.
+        @type instant: A naive L{datetime.datetime}
+
+        @param expires: The number of seconds after C{instant} the URLs
+            are valid for.
+        @type expires: L{int}
+
+        @param payload_hash: The payload hash of the requests.
+
+        @param signing_keys: The cache of signing keys to use or C{None}
+            for the process-wide cache.
+        @type signing_keys: L{_SigningKeyCache}
+        """
+        if not 1 <= expires <= MAX_PRESIGNED_EXPIRES:
+            raise ValueError(
+                "expires must be between 1 and {} seconds, not {}".format(
+                    MAX_PRESIGNED_EXPIRES, expires,
+                ),
+            )
+        amz_date = makeAMZDate(instant)
+        date_stamp = makeDateStamp(instant)
+        scope = _CredentialScope(date_stamp, region, service)
+        credential = _Credential(credentials.access_key, scope)
+        if signing_keys is None:
+            signing_keys = _signing_keys
+        signing_key = signing_keys.get(
+            credentials, date_stamp, region, service,
+        )
+        # Copied for each URL rather than keyed anew.
+        self._hmac = hmac.new(signing_key, digestmod=hashlib.sha256)
+        self._arguments = [
+            ("X-Amz-Algorithm", "AWS4-HMAC-SHA256"),
+            ("X-Amz-Credential", quote(credential.serialize(), safe="")),
+            ("X-Amz-Date", amz_date),
+            ("X-Amz-Expires", str(expires)),
+            ("X-Amz-SignedHeaders", "host"),
+        ]
+        self._query = _join_arguments(self._arguments)
+        self._origin = scheme + "://" + host
+        self._request_tail = "\n".join([
+            "", "host:" + host.lower(), "", "host", payload_hash,
+        ])
+        self._token_head = "\n".join([
+            _SignableAWS4HMAC256Token.ALGORITHM.decode(),
+            amz_date,
+            scope.serialize(),
+            "",
+        ])
+
+    def sign(self, method, path, query=None):
+        """
+        Sign a URL.
+
+        @param method: The HTTP method of the request.
+        @type method: L{str}
+
+        @param path: The path of the URL, unquoted.  It is quoted with
+            every I{/} left as a separator.
+        @type path: L{str}
+
+        @param query: Other arguments of the URL, unquoted, or C{None}.
+        @type query: L{list} of two-L{tuple}s of L{str}
+
+        @return: The URL.
+        @rtype: L{str}
+        """
+        path = quote(path, safe="/")
+        if query:
+            arguments = self._arguments + [
+                (quote(name, safe=""), quote(value, safe=""))
+                for (name, value) in query
+            ]
+            arguments.sort()
+            query = _join_arguments(arguments)
+        else:
+            query = self._query
+        canonical_request = (
+            method + "\n" + path + "\n" + query + self._request_tail
+        )
+        signer = self._hmac.copy()
+        signer.update((
+            self._token_head
+            + hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        ).encode("ascii"))
+        return (
+            self._origin + path + "?" + query + "&X-Amz-Signature="
+            + signer.hexdigest()
+        )
+
+
+def _join_arguments(arguments):
+    return "&".join(name + "=" + value for (name, value) in arguments)
@@ -0,0 +1,144 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Request bodies sent in I{aws-chunked} encoding, each chunk signed as it
+is sent.
+
+See U{https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-streaming.html}.
+"""
+
+from zope.interface import implementer
+
+from twisted.web.iweb import IBodyProducer, UNKNOWN_LENGTH
+
+
+# Every chunk but the last is this size, unless another is asked for.
+DEFAULT_CHUNK_SIZE = 2 ** 16
+
+# S3 refuses smaller chunks, other than the last.
+MIN_CHUNK_SIZE = 2 ** 13
+
+# The length of the hex signature in the header of each chunk.
+_SIGNATURE_LENGTH = 64
+
+
+def _chunk_length(size):
+    """
+    @return: The encoded length of a chunk of C{size} bytes.
+    """
+    return (
+        len(b"%x;chunk-signature=\r\n" % (size,)) + _SIGNATURE_LENGTH
+        + size + 2
+    )
+
+
+def encoded_length(length, chunk_size):
+    """
+    Compute the length of a body once it is encoded.
+
+    @param length: The length of the body.
+    @type length: L{int}
+
+    @param chunk_size: The size of every chunk but the last.
+    @type chunk_size: L{int}
+
+    @rtype: L{int}
+    """
+    full, rest = divmod(length, chunk_size)
+    encoded = full * _chunk_length(chunk_size) + _chunk_length(0)
+    if rest:
+        encoded += _chunk_length(rest)
+    return encoded
+
+
+@implementer(IBodyProducer)
+class SignedChunkProducer:
+    """
+    A producer of the body produced by another producer, encoded in
+    signed chunks.
+
+    The bytes the other producer writes are gathered into chunks of
+    C{chunk_size} bytes.  Each is signed and written as soon as it is
+    complete, so no more than one chunk is held at a time however large
+    the body.  The bytes left over when the other producer finishes make
+    the last chunk, followed by an empty one which ends the body.
+
+    It is the consumer of the producer it wraps.
+
+    @ivar _buffer: A L{bytearray} of the bytes written but not yet sent in
+        a chunk.
+    """
+    def __init__(self, producer, signer, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        @param producer: The producer of the body.  Its length must be
+            known.
+        @type producer: L{IBodyProducer} provider
+
+        @param signer: The signer of the chunks.
+        @type signer: L{txaws._auth_v4._ChunkSigner}
+
+        @param chunk_size: The size of every chunk but the last.
+        @type chunk_size: L{int}
+        """
+        if producer.length is UNKNOWN_LENGTH:
+            raise ValueError("The length of a chunked body must be known")
+        if chunk_size < MIN_CHUNK_SIZE:
+            raise ValueError(
+                "chunk_size must be at least {}, not {}".format(
+                    MIN_CHUNK_SIZE, chunk_size,
+                ),
+            )
+        self._producer = producer
+        self._signer = signer
+        self._chunk_size = chunk_size
+        self.length = encoded_length(producer.length, chunk_size)
+        self._buffer = bytearray()
+        self._consumer = None
+
+    def startProducing(self, consumer):
+        self._consumer = consumer
+        d = self._producer.startProducing(self)
+        d.addCallback(self._finished)
+        return d
+
+    def pauseProducing(self):
+        self._producer.pauseProducing()
+
+    def resumeProducing(self):
+        self._producer.resumeProducing()
+
+    def stopProducing(self):
+        self._producer.stopProducing()
+
+    def write(self, data):
+        """
+        Take some bytes of the body from the producer.
+        """
+        buffer = self._buffer
+        buffer += data
+        size = self._chunk_size
+        if len(buffer) < size:
+            return
+        offset = 0
+        with memoryview(buffer) as view:
+            while len(buffer) - offset >= size:
+                self._send(view[offset:offset + size])
+                offset += size
+        del buffer[:offset]
+
+    def _send(self, chunk):
+        signature = self._signer.sign(chunk)
+        self._consumer.write(b"".join([
+            b"%x;chunk-signature=%s\r\n" % (
+                len(chunk), signature.encode("ascii"),
+            ),
+            chunk,
+            b"\r\n",
+        ]))
+
+    def _finished(self, ignored):
+        if self._buffer:
+            self._send(bytes(self._buffer))
+            del self._buffer[:]
+        self._send(b"")
+        return None
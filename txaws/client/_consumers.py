@@ -0,0 +1,142 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Consumers for writing streamed response bodies.
+"""
+
+from zope.interface import implementer
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.interfaces import IConsumer
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.reflect import namedAny
+
+
+@implementer(IConsumer)
+class FileConsumer:
+    """
+    L{FileConsumer} writes the bytes it is given to a file object.
+
+    Since file writes block, they are performed in a thread pool so a
+    slow disk does not stall the reactor.  Bytes written while an
+    earlier write is still in progress are buffered and written together
+    by the next write.  When more than C{buffer_size} bytes are waiting
+    to be written the producer is paused.  It is resumed once the buffer
+    has drained below half that.
+
+    The file is not closed by the consumer.
+
+    @ivar _file: The file object to which bytes are written.
+
+    @ivar _buffer: A L{list} of the chunks of L{bytes} which have not
+        been written yet.
+
+    @ivar _buffered: The number of bytes in C{_buffer} and in the
+        write which is in progress.
+
+    @ivar _writing: Whether a write is in progress.
+
+    @ivar _failure: The L{Failure} of a write which failed, after which
+        no more bytes will be written.
+    """
+    def __init__(self, fileobj, reactor=None, threadpool=None,
+                 buffer_size=2 ** 20):
+        """
+        @param fileobj: The file object to which to write.
+
+        @param reactor: The reactor to use to call back into the main
+            thread or C{None} for the global reactor.
+
+        @param threadpool: The thread pool in which to write or C{None}
+            for the reactor's thread pool.
+
+        @param buffer_size: The number of unwritten bytes beyond which
+            the producer is paused.
+        @type buffer_size: L{int}
+        """
+        if reactor is None:
+            reactor = namedAny("twisted.internet.reactor")
+        if threadpool is None:
+            threadpool = reactor.getThreadPool()
+        self._file = fileobj
+        self._reactor = reactor
+        self._threadpool = threadpool
+        self._buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+        self._writing = False
+        self._failure = None
+        self._producer = None
+        self._paused = False
+        self._waiting = []
+
+    def registerProducer(self, producer, streaming):
+        if not streaming:
+            raise ValueError(
+                "FileConsumer only supports streaming producers"
+            )
+        self._producer = producer
+
+    def unregisterProducer(self):
+        self._producer = None
+
+    def write(self, data):
+        if self._failure is not None:
+            return
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered > self._buffer_size and not self._paused:
+            if self._producer is not None:
+                self._paused = True
+                self._producer.pauseProducing()
+        self._flush()
+
+    def _flush(self):
+        if self._writing or not self._buffer:
+            return
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._writing = True
+        d = deferToThreadPool(
+            self._reactor, self._threadpool, self._file.write, data,
+        )
+        d.addCallbacks(self._written, self._write_failed, (len(data),))
+
+    def _written(self, ignored, length):
+        self._writing = False
+        self._buffered -= length
+        if self._paused and self._buffered <= self._buffer_size // 2:
+            self._paused = False
+            if self._producer is not None:
+                self._producer.resumeProducing()
+        self._flush()
+        if not self._writing:
+            waiting, self._waiting = self._waiting, []
+            for d in waiting:
+                d.callback(None)
+
+    def _write_failed(self, reason):
+        self._writing = False
+        self._failure = reason
+        self._buffer = []
+        self._buffered = 0
+        if self._producer is not None:
+            self._producer.stopProducing()
+        waiting, self._waiting = self._waiting, []
+        for d in waiting:
+            d.errback(reason)
+
+    def finish(self):
+        """
+        Wait for all of the bytes written so far to reach the file.
+
+        @return: A L{Deferred} that fires with C{None} when there are no
+            more bytes to write or fails if writing to the file failed.
+        """
+        if self._failure is not None:
+            return fail(self._failure)
+        if not self._writing:
+            return succeed(None)
+        d = Deferred()
+        self._waiting.append(d)
+        return d
@@ -4,6 +4,9 @@
 attrs validators for internal use.
 """
 
+from collections import OrderedDict
+from copy import copy
+
 import attr
 from attr import validators
 
@@ -37,19 +40,72 @@ class _ContainerOf:
     validator = attr.ib()
 
     def __call__(self, inst, a, value):
-        validators.instance_of(self.container_type)(inst, a, value)
+        if not isinstance(value, self.container_type):
+            validators.instance_of(self.container_type)(inst, a, value)
+        try:
+            for element in value:
+                self.validator(inst, a, element)
+        except (TypeError, ValueError):
+            # Validate again, more slowly, to identify the element.
+            pass
+        else:
+            return
         for n, element in enumerate(sorted(value)):
             inner_identifier = "sorted({})[{}]".format(a.name, n)
-            # Create an Attribute with a name that refers to the
-            # validator we're using and the index we're validating.
-            # Otherwise the validation failure is pretty confusing.
-            inner_attr = attr.Attribute(
-                name=inner_identifier,
-                default=None,
-                validator=self.validator,
-                repr=False,
-                cmp=False,
-                hash=False,
-                init=False,
-            )
+            # Use an Attribute with a name that refers to the index we're
+            # validating.  Otherwise the validation failure is pretty
+            # confusing.  Attribute's initializer differs between attrs
+            # versions and only newer ones have evolve so copy it.
+            inner_attr = copy(a)
+            object.__setattr__(inner_attr, "name", inner_identifier)
             self.validator(inst, inner_attr, element)
+
+
+def unvalidated(cls, **kw):
+    """
+    Construct an instance of an attrs class without running its
+    validators.
+
+    Defaults and converters are still applied.  This is for internal
+    code constructing objects, once per request, from values it already
+    knows to be valid.  Public constructors should go on validating.
+
+    @param cls: The attrs class.
+
+    @param kw: The initializer arguments.
+
+    @return: An instance of C{cls}.
+    """
+    try:
+        init = _unvalidated_inits[cls]
+    except KeyError:
+        init = _unvalidated_inits[cls] = _unvalidated_init(cls)
+    inst = cls.__new__(cls)
+    init(inst, **kw)
+    return inst
+
+
+_unvalidated_inits = {}
+
+
+def _unvalidated_init(cls):
+    """
+    Make an initializer for instances of an attrs class which does
+    everything that class's initializer does except validate.
+
+    attrs generates it for a frozen, slotted class with the same attributes
+    but no validators.  It sets attributes the way the initializer of such a
+    class does, bypassing C{__setattr__}, so it works for instances of any
+    attrs class.
+    """
+    twin = attr.make_class(
+        cls.__name__,
+        OrderedDict(
+            (a.name, attr.ib(default=a.default, converter=a.converter,
+                             init=a.init))
+            for a in attr.fields(cls)
+        ),
+        frozen=True,
+        slots=True,
+    )
+    return twin.__init__
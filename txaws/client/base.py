@@ -12,7 +12,9 @@ except ImportError:
     from xml.parsers.expat import ExpatError as ParseError
 
 import warnings
+from collections import OrderedDict
 from io import StringIO
+from tempfile import SpooledTemporaryFile
 
 import attr
 from attr import validators
@@ -20,16 +22,15 @@ from attr import validators
 from pyrsistent import PMap, freeze, pmap
 
 from twisted.python.reflect import namedAny
-from twisted.logger import Logger
 from twisted.internet.endpoints import TCP4ClientEndpoint
 from twisted.internet.ssl import ClientContextFactory
 from twisted.internet.protocol import Protocol
-from twisted.internet.defer import Deferred, succeed, fail
+from twisted.internet.defer import Deferred, succeed, fail, gatherResults
 from twisted.python import failure
 from twisted.web import http
 from twisted.web.iweb import UNKNOWN_LENGTH, IBodyProducer
 from twisted.web.client import (
-    Agent, ProxyAgent, ResponseDone, FileBodyProducer,
+    Agent, ProxyAgent, ResponseDone, FileBodyProducer, HTTPConnectionPool,
 )
 from twisted.web.http import OK, NO_CONTENT, PotentialDataLoss
 from twisted.web.http_headers import Headers
@@ -41,6 +42,10 @@ from txaws.exception import AWSResponseParseError
 from txaws.service import AWSServiceEndpoint
 from txaws.client.ssl import VerifyingContextFactory
 from txaws.client._validators import list_of as _list_of
+from txaws.client.instrumentation import SIGNING, _timer
+from txaws.client.request_log import _DEFAULT_REQUEST_LOG
+from txaws.client._chunked import SignedChunkProducer
+from txaws.client.retry import _rewinder
 from txaws import _auth_v4
 
 def error_wrapper(error, errorClass):
@@ -107,6 +112,12 @@ class StreamingError(Exception):
     """
 
 
+class ResponseTooLarge(StreamingError):
+    """
+    Raised if a response body is larger than a receiver allows.
+    """
+
+
 class StreamingBodyReceiver(Protocol):
     """
     Streaming HTTP response body receiver.
@@ -114,35 +125,66 @@ class StreamingBodyReceiver(Protocol):
     TODO: perhaps there should be an interface specifying why
     finished (Deferred) and content_length are necessary and
     how to used them; eg. callback/errback finished on completion.
+
+    @ivar max_size: The largest number of body bytes to accept or C{None}
+        for no limit.  If the body grows larger than this the connection
+        is dropped and C{finished} fails with L{ResponseTooLarge}.
     """
     finished = None
     content_length = None
 
-    def __init__(self, fd=None, readback=True):
+    def __init__(self, fd=None, readback=True, max_size=None):
         """
         @param fd: a file descriptor to write to
         @param readback: if True read back data from fd to callback finished
-            with, otherwise we call back finish with fd itself
-        with
+            with, otherwise we call back finish with fd itself, rewound to
+            its start
+        @param max_size: the largest body to accept, or None for no limit
         """
         if fd is None:
-            fd = StringIO()
+            fd = BytesIO()
         self._fd = fd
         self._received = 0
         self._readback = readback
+        self.max_size = max_size
+
+    def connectionMade(self):
+        streaming = self.content_length is UNKNOWN_LENGTH
+        if not streaming and self._too_large(self.content_length):
+            self._abort(self.content_length)
 
     def dataReceived(self, bytes):
+        if self.finished is None:
+            # Already given up on this response.
+            return
         streaming = self.content_length is UNKNOWN_LENGTH
         if not streaming and (self._received > self.content_length):
             self.transport.loseConnection()
             raise StreamingError(
                 "Buffer overflow - received more data than "
                 "Content-Length dictated: %d" % self.content_length)
-        # TODO should be some limit on how much we receive
+        if self._too_large(self._received + len(bytes)):
+            self._abort(self._received + len(bytes))
+            return
         self._fd.write(bytes)
         self._received += len(bytes)
 
+    def _too_large(self, size):
+        return self.max_size is not None and size > self.max_size
+
+    def _abort(self, size):
+        d = self.finished
+        self.finished = None
+        self._fd.close()
+        self.transport.loseConnection()
+        d.errback(ResponseTooLarge(
+            "Response body of at least %d bytes exceeds the limit of %d "
+            "bytes" % (size, self.max_size)))
+
     def connectionLost(self, reason):
+        if self.finished is None:
+            # The body was too large and finished has already failed.
+            return
         reason.trap(ResponseDone, PotentialDataLoss)
         d = self.finished
         self.finished = None
@@ -155,6 +197,7 @@ class StreamingBodyReceiver(Protocol):
                 self._fd = None
                 d.callback(data)
             else:
+                self._fd.seek(0)
                 d.callback(self._fd)
         else:
             f = failure.Failure(StreamingError("Connection lost before "
@@ -162,6 +205,86 @@ class StreamingBodyReceiver(Protocol):
             d.errback(f)
 
 
+def spooling_receiver_factory(max_memory=2 ** 20, max_size=None,
+                              readback=True):
+    """
+    Create a receiver factory for bodies which may be too large to hold
+    comfortably in memory.
+
+    Each body is kept in memory until it grows past C{max_memory} bytes
+    and is then moved to a temporary file on disk.
+
+    @param max_memory: The number of bytes to keep in memory before
+        spilling to disk.
+    @type max_memory: L{int}
+
+    @param max_size: The largest body to accept at all, or C{None} for no
+        limit.  See L{StreamingBodyReceiver.max_size}.
+    @type max_size: L{int} or L{NoneType}
+
+    @param readback: If C{True}, the received body is read back and
+        delivered as L{bytes}.  Otherwise, the temporary file itself is
+        delivered, positioned at its start; the caller must close it.
+
+    @return: A no-argument callable suitable for use as the
+        C{receiver_factory} of L{query} or L{txaws.s3.client.S3Client}.
+    """
+    def factory():
+        return StreamingBodyReceiver(
+            SpooledTemporaryFile(max_size=max_memory),
+            readback=readback,
+            max_size=max_size,
+        )
+    return factory
+
+
+class ConsumerBodyReceiver(Protocol):
+    """
+    Streaming HTTP response body receiver which writes the body to an
+    L{IConsumer} as it arrives instead of collecting it.
+
+    The response transport is registered with the consumer as a
+    streaming producer so a consumer which cannot keep up can pause the
+    transfer.  Only a single chunk of the body is held in memory at a
+    time.
+
+    Like L{StreamingBodyReceiver}, C{finished} is fired (with C{None})
+    when the whole body has been written to the consumer or failed if
+    the transfer does not complete.
+    """
+    finished = None
+    content_length = None
+
+    def __init__(self, consumer):
+        """
+        @param consumer: The consumer to which to write the body.
+        @type consumer: L{IConsumer} provider
+        """
+        self._consumer = consumer
+        self._received = 0
+
+    def connectionMade(self):
+        self._consumer.registerProducer(self.transport, True)
+
+    def dataReceived(self, bytes):
+        self._received += len(bytes)
+        self._consumer.write(bytes)
+
+    def connectionLost(self, reason):
+        self._consumer.unregisterProducer()
+        d = self.finished
+        self.finished = None
+        if not reason.check(ResponseDone, PotentialDataLoss):
+            d.errback(reason)
+            return
+        streaming = self.content_length is UNKNOWN_LENGTH
+        if streaming or (self._received == self.content_length):
+            d.callback(None)
+        else:
+            d.errback(failure.Failure(StreamingError(
+                "Connection lost before receiving all data")))
+
+
 class WebClientContextFactory(ClientContextFactory):
 
     def getContext(self, hostname, port):
@@ -174,7 +297,7 @@ class WebVerifyingContextFactory(VerifyingContextFactory):
         return VerifyingContextFactory.getContext(self)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class _QueryArgument:
     """
     Representation of a single URL query argument, eg I{foo=bar}.
@@ -184,7 +307,7 @@ class _QueryArgument:
 
     def url_encode(self):
         def q(t):
-            return quote(t.encode("utf-8"), safe=b"")
+            return quote(t, safe="").encode("ascii")
 
         if self.value is None:
             return q(self.name)
@@ -231,7 +354,7 @@ def url_context(**kw):
     return _URLContext(**kw)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class _URLContext:
     """
     A description of the URL involved in an AWS request.
@@ -266,7 +389,7 @@ class _URLContext:
         @rtype: L{bytes}
         """
         return b"/" + b"/".join(
-            quote(segment.encode("utf-8"), safe=b"") for segment in self.path
+            quote(segment, safe="").encode("ascii") for segment in self.path
         )
 
 
@@ -283,33 +406,39 @@ class _URLContext:
         @return: The complete, encoded URL.
         @rtype: L{bytes}
         """
-        params = dict(
-            scheme=self.scheme.encode("ascii"),
-            host=self.get_encoded_host(),
-            path=self.get_encoded_path(),
-            query=b"",
-        )
+        params = {
+            b"scheme": self.scheme.encode("ascii"),
+            b"host": self.get_encoded_host(),
+            b"path": self.get_encoded_path(),
+            b"query": b"",
+        }
         query = self.get_encoded_query()
         if query:
             params[b"query"] = b"?" + query
         if self.port is None:
             return b"%(scheme)s://%(host)s%(path)s%(query)s" % params
-        params["port"] = self.port
+        params[b"port"] = self.port
         return b"%(scheme)s://%(host)s:%(port)d%(path)s%(query)s" % params
 
 
-def _get_joined_path(ctx):
+# Shared by the many requests which have no metadata or AMZ headers.
+_EMPTY_PMAP = pmap()
+
+
+def _freeze(value):
     """
-    @type ctx: L{_URLContext}
-    @param ctx: A URL context.
+    Freeze the metadata or AMZ headers of a request.
 
-    @return: The path component, un-urlencoded, but joined by slashes.
-    @rtype: L{bytes}
+    Freezing an empty L{dict} costs about as much as the rest of building
+    a L{RequestDetails}, so empty mappings are all given the same empty
+    L{PMap} instead.
     """
-    return b'/' + b'/'.join(seg.encode('utf-8') for seg in ctx.path)
+    if isinstance(value, (dict, PMap)) and not value:
+        return _EMPTY_PMAP
+    return freeze(value)
 
 
-@attr.s
+@attr.s(slots=True)
 class RequestDetails:
     """
     Describe an AWS request in sufficient detail to sign and submit
@@ -354,7 +483,10 @@ class RequestDetails:
         produce C{b""}, this must be hashed and included here.  If the
         hash cannot be computed, C{None} (which corresponds to a
         request with an unsigned payload - ie, with a payload
-        unprotected from tampering by a signature).
+        unprotected from tampering by a signature) or
+        L{txaws._auth_v4.STREAMING_PAYLOAD} to sign the bytes a chunk at
+        a time as they are sent, if the length of C{body_producer} is
+        known.
     @ivar content_sha256: L{str}
     """
     region = attr.ib(validator=validators.instance_of(bytes))
@@ -370,13 +502,13 @@ class RequestDetails:
         validator=validators.optional(validators.provides(IBodyProducer)),
     )
     metadata = attr.ib(
-        default=pmap(),
-        converter=freeze,
+        default=_EMPTY_PMAP,
+        converter=_freeze,
         validator=validators.instance_of(PMap),
     )
     amz_headers = attr.ib(
-        default=pmap(),
-        converter=freeze,
+        default=_EMPTY_PMAP,
+        converter=_freeze,
         validator=validators.instance_of(PMap),
     )
     content_sha256 = attr.ib(
@@ -403,6 +535,42 @@ def query(**kw):
     @param cooperator: A cooperator to use for large uploads or
         C{None} for the global cooperator (recommended).
     @type cooperator: L{Cooperator}.
+
+    @param connection_pool: The connection pool from which to get an
+        agent if none is passed to C{submit} or C{None} for the
+        reactor's default pool.
+    @type connection_pool: L{_ConnectionPool}
+
+    @param retry_policy: The policy deciding whether and when to retry
+        the request if it fails or C{None} to never retry it.
+    @type retry_policy: L{txaws.client.retry._RetryPolicy}
+
+    @param scheduler: The scheduler which decides when the request may be
+        issued or C{None} to issue it immediately.
+    @type scheduler: L{txaws.client.scheduler._RequestScheduler}
+
+    @param priority: The priority of the request with C{scheduler}.
+        Requests with lower values are issued first.
+    @type priority: L{int}
+
+    @param request_log: The policy deciding which requests to log and at
+        what level.  By default every request is logged at I{info} level
+        and failures at I{warn} level.
+    @type request_log: L{txaws.client.request_log._RequestLog}
+
+    @param request_observer: An observer to tell how long each attempt at
+        the request spent in each phase or C{None} to not time requests.
+    @type request_observer: L{txaws.client.instrumentation.IRequestObserver}
+        provider
+
+    @param bucket: The S3 bucket the request is for, with which to tag its
+        timings, or C{None}.
+    @type bucket: L{str}
+
+    @param coalescer: The coalescer sharing one request among identical
+        I{GET} and I{HEAD} requests in flight at once or C{None} to always
+        issue the request.  Requests with a receiver are never coalesced.
+    @type coalescer: L{txaws.client.coalescing._RequestCoalescer}
     """
     return _Query(**kw)
 
@@ -412,29 +580,33 @@ class _Query:
     """
     Representation of enough information to submit an AWS request.
     """
-    _log = Logger()
-
     _credentials = attr.ib()
     _details = attr.ib()
     _reactor = attr.ib(default=attr.Factory(lambda: namedAny("twisted.internet.reactor")))
     _ok_status = attr.ib(default=(OK,), validator=validators.instance_of(tuple))
-
-    def _canonical_request(self, headers):
-        return _auth_v4._CanonicalRequest.from_request_components(
+    _connection_pool = attr.ib(default=None)
+    _retry_policy = attr.ib(default=None)
+    _scheduler = attr.ib(default=None)
+    _priority = attr.ib(default=0, validator=validators.instance_of(int))
+    _request_log = attr.ib(default=_DEFAULT_REQUEST_LOG)
+    _request_observer = attr.ib(default=None)
+    _bucket = attr.ib(default=None)
+    _coalescer = attr.ib(default=None)
+
+    def _canonical_request(self, headers, streaming=False):
+        headers_to_sign = (b"host", b"x-amz-date")
+        if streaming:
+            headers_to_sign += _STREAMING_SIGNED_HEADERS
+        return _auth_v4._CanonicalRequest.from_url_context(
             method=self._details.method,
-            url=(
-                # We need to pass an unfortunate version of the path here: see
-                # https://github.com/twisted/txaws/issues/70
-                _get_joined_path(self._details.url_context) +
-                b"?" +
-                self._details.url_context.get_encoded_query()
-            ),
+            url_context=self._details.url_context,
             # _CanonicalRequest should work harder to do case
             # canonicalization so we don't have to do this
             # lowercasing.
             headers={k.lower(): vs for (k, vs) in headers.getAllRawHeaders()},
-            headers_to_sign=(b"host", b"x-amz-date"),
+            headers_to_sign=headers_to_sign,
             payload_hash=self._details.content_sha256,
+            service=self._details.service.decode("ascii"),
         )
 
     def _sign(self, instant, credentials, service, region, request):
@@ -458,11 +630,11 @@ class _Query:
 
         @return: A value for the I{Authorization} header of the
             request.
-        @rtype: L{bytes}
+        @rtype: L{str}
         """
         return _auth_v4._make_authorization_header(
-            region=region,
-            service=service,
+            region=region.decode("ascii"),
+            service=service.decode("ascii"),
             canonical_request=request,
             credentials=credentials,
             instant=instant,
@@ -500,32 +672,122 @@ class _Query:
         """
         Send this request to AWS.
 
-        @param agent: The agent to use to issue the request.
+        @param agent: The agent to use to issue the request or C{None}
+            to use one from the query's connection pool.
         @type agent: L{IAgent} provider
 
-        @param receiver_factory: Backwards compatibility only.  The
-            value is ignored.
+        @param receiver_factory: A no-argument callable which returns a
+            protocol (like L{StreamingBodyReceiver}) to which to deliver
+            the body of a successful response or C{None} to collect the
+            body into memory.  Error response bodies are always
+            collected, subject to the receiver's C{max_size} if it has
+            one.
 
         @param utcnow: A function like L{datetime.datetime.utcnow} to
             get the time as of the call.  This is used to provide a
             stable timestamp for signing purposes.
 
         @return: A L{twisted.internet.defer.Deferred} that fires with
-            the response body (L{bytes}) on success or with a
-            L{twisted.python.failure.Failure} on error.  Most
-            AWS-originated errors are represented as
-            L{twisted.web.error.Error} instances.
+            a two-tuple of the response and whatever the receiver
+            produced (the response body as L{bytes} by default) on
+            success or with a L{twisted.python.failure.Failure} on
+            error.  Most AWS-originated errors are represented as
+            L{twisted.web.error.Error} instances.  If the query has a
+            retry policy, these are the results of the last attempt.
+        """
+        if (
+            self._coalescer is not None
+            and receiver_factory is None
+            and self._details.method in (b"GET", b"HEAD")
+        ):
+            return self._coalescer.coalesce(
+                self._coalescing_key(), self._submit, agent, None, utcnow,
+            )
+        return self._submit(agent, receiver_factory, utcnow)
+
+    def _coalescing_key(self):
+        """
+        Get a value which is equal for identical requests.
         """
+        details = self._details
+        credentials = self._credentials
+        return (
+            None if credentials is None else credentials.access_key,
+            details.service,
+            details.region,
+            details.method,
+            details.url_context.scheme,
+            details.url_context.host,
+            details.url_context.port,
+            tuple(details.url_context.path),
+            details.url_context.get_encoded_query(),
+            tuple(sorted(
+                (name.lower(), tuple(values))
+                for (name, values) in details.headers.getAllRawHeaders()
+            )),
+            tuple(sorted(details.metadata.items())),
+            tuple(sorted(details.amz_headers.items())),
+            self._ok_status,
+        )
+
+    def _submit(self, agent, receiver_factory, utcnow):
         if utcnow is None:
             utcnow = datetime.utcnow
 
-        method = self._details.method
         url_context = self._details.url_context
-        headers = self._details.headers.copy()
+        if agent is None:
+            pool = self._connection_pool
+            if pool is None:
+                pool = default_connection_pool(self._reactor)
+            agent = pool.get_agent(
+                url_context.scheme, url_context.host, url_context.port,
+            )
+
         body_producer = self._details.body_producer
+        if self._retry_policy is not None:
+            body = _rewinder(body_producer)
+            if body is not None:
+                # Each attempt is signed anew with the time it is made and
+                # sends the body from its start.
+                d = self._retry_policy.call(
+                    lambda: self._send(
+                        agent, receiver_factory, utcnow, body.producer(),
+                    ),
+                )
+                d.addBoth(body.close)
+                return d
+        return self._send(agent, receiver_factory, utcnow, body_producer)
+
+    def _send(self, agent, receiver_factory, utcnow, body_producer):
+        """
+        Send this request to AWS once, when the scheduler allows.
+        """
+        if self._scheduler is None:
+            return self._submit_once(
+                agent, receiver_factory, utcnow, body_producer,
+            )
+        return self._scheduler.schedule(
+            self._details.url_context.host,
+            self._submit_once, agent, receiver_factory, utcnow, body_producer,
+            priority=self._priority,
+        )
 
-        if agent is None:
-            agent = _get_agent(url_context.scheme, url_context.get_encoded_host(), self._reactor)
+    def _submit_once(self, agent, receiver_factory, utcnow, body_producer):
+        """
+        Send this request to AWS once.
+
+        @see: L{submit}
+
+        @param body_producer: The producer of the request body or C{None}
+            for no body.
+        """
+        method = self._details.method
+        url_context = self._details.url_context
+        headers = self._details.headers.copy()
+        timer = _timer(
+            self._request_observer, self._reactor, self._details.service,
+            method, self._bucket, body_producer,
+        )
         instant = utcnow()
 
         extra_headers = self._get_headers(
@@ -543,31 +805,44 @@ class _Query:
             # something different if we just gave it the str.
             headers.setRawHeaders("host", [url_context.get_encoded_host()])
 
+        streaming = (
+            self._credentials is not None
+            and body_producer is not None
+            and self._details.content_sha256 == _auth_v4.STREAMING_PAYLOAD
+        )
+        if streaming:
+            _set_streaming_headers(headers, body_producer.length)
+
+        url = url_context.get_encoded_url()
+        sampled = self._request_log.sampled()
         if self._credentials is not None:
-            self._log.info(
-                "Computing authorization from "
-                "{service} {region} {method} {url} {headers}",
-                service=self._details.service,
-                region=self._details.region,
-                method=method,
-                url=url_context.get_encoded_url(),
-                headers=headers,
+            self._request_log.signing(
+                sampled, self._details.service, self._details.region, method,
+                url, headers,
             )
+            request = self._canonical_request(headers, streaming)
             headers.setRawHeaders("authorization", [self._sign(
                 instant,
                 self._credentials,
                 self._details.service,
                 self._details.region,
-                self._canonical_request(headers),
+                request,
             )])
-
-        url = url_context.get_encoded_url()
-        self._log.info(
-            "Submitting query: {method} {url} {headers}",
-            method=method,
-            url=url,
-            headers=headers,
-        )
+            if streaming:
+                # The chunks are signed as they are sent, starting from
+                # the signature of this attempt.
+                body_producer = SignedChunkProducer(
+                    body_producer,
+                    _auth_v4._make_chunk_signer(
+                        self._details.region.decode("ascii"),
+                        self._details.service.decode("ascii"),
+                        request, self._credentials, instant,
+                    ),
+                )
+
+        self._request_log.submitting(sampled, method, url, headers)
+        if timer is not None:
+            timer.lap(SIGNING)
         if body_producer is None:
             # Work around for https://twistedmatrix.com/trac/ticket/8984
             body_producer = FileBodyProducer(BytesIO(b""))
@@ -578,13 +853,23 @@ class _Query:
             headers,
             body_producer,
         )
-        d.addCallback(self._handle_response)
+        d.addCallback(self._handle_response, receiver_factory, timer)
+        if timer is not None:
+            d.addCallbacks(timer.finished, timer.failed)
+        d.addErrback(self._request_log.failed, method, url)
         return d
 
-    def _handle_response(self, response):
-        receiver = StreamingBodyReceiver()
+    def _handle_response(self, response, receiver_factory=None, timer=None):
+        if receiver_factory is None:
+            receiver_factory = StreamingBodyReceiver
+        receiver = receiver_factory()
+        if response.code not in self._ok_status:
+            receiver = _error_receiver(receiver)
         receiver.finished = d = Deferred()
         receiver.content_length = response.length
+        if timer is not None:
+            timer.responded(response)
+            receiver = timer.counting(receiver)
         response.deliverBody(receiver)
         d.addCallback(self._check_response, response)
         return d
@@ -595,28 +880,258 @@ class _Query:
         return (response, data)
 
 
+# Signed along with the host and date of a request whose body is signed a
+# chunk at a time.
+_STREAMING_SIGNED_HEADERS = (
+    b"content-encoding", b"x-amz-content-sha256",
+    b"x-amz-decoded-content-length",
+)
+
+
+def _set_streaming_headers(headers, length):
+    """
+    Set the headers of a request whose body is sent in I{aws-chunked}
+    encoding.
+
+    @param headers: The headers of the request.
+    @type headers: L{Headers}
+
+    @param length: The length of the body before it is encoded.
+    @type length: L{int}
+    """
+    encodings = headers.getRawHeaders("content-encoding", [])
+    # Any other encoding applies to the body inside the chunks.
+    headers.setRawHeaders(
+        "content-encoding", [",".join(["aws-chunked"] + encodings)],
+    )
+    headers.setRawHeaders("x-amz-decoded-content-length", [str(length)])
+
+
+def _error_receiver(receiver):
+    """
+    Get a receiver for an error response body.
+
+    Error bodies are parsed so they must be read back into memory.  Use
+    C{receiver} if it does that already, otherwise a plain
+    L{StreamingBodyReceiver} which keeps any size limit C{receiver} had.
+    """
+    if isinstance(receiver, StreamingBodyReceiver) and receiver._readback:
+        return receiver
+    return StreamingBodyReceiver(max_size=getattr(receiver, "max_size", None))
+
+
 # Something like this belongs in Twisted, perhaps.  At least, the
 # "give me an Agent and respect the OS conventions for proxy
 # configuration" logic.
-def _get_agent(scheme, host, reactor, contextFactory=None):
-    if scheme == b"https":
+def _get_agent(scheme, host, reactor, contextFactory=None, pool=None):
+    if isinstance(scheme, bytes):
+        scheme = scheme.decode("ascii")
+    if scheme == "https":
         proxy_endpoint = os.environ.get("https_proxy")
         if proxy_endpoint:
             proxy_url = urlparse(proxy_endpoint)
             endpoint = TCP4ClientEndpoint(reactor, proxy_url.hostname, proxy_url.port)
-            return ProxyAgent(endpoint)
+            return ProxyAgent(endpoint, reactor, pool=pool)
         else:
             if contextFactory is None:
                 contextFactory = WebVerifyingContextFactory(host)
-            return Agent(reactor, contextFactory)
+            return Agent(reactor, contextFactory, pool=pool)
     else:
         proxy_endpoint = os.environ.get("http_proxy")
         if proxy_endpoint:
             proxy_url = urlparse(proxy_endpoint)
             endpoint = TCP4ClientEndpoint(reactor, proxy_url.hostname, proxy_url.port)
-            return ProxyAgent(endpoint)
+            return ProxyAgent(endpoint, reactor, pool=pool)
         else:
-            return Agent(reactor)
+            return Agent(reactor, pool=pool)
+
+
+# The number of endpoints a connection pool keeps pools for by default.
+DEFAULT_MAX_ENDPOINTS = 256
+
+
+def connection_pool(**kw):
+    """
+    Create a new collection of persistent HTTP connection pools.
+
+    @param reactor: The reactor to use to establish connections.
+
+    @param max_persistent_per_host: The maximum number of idle
+        connections to keep open to a single host.
+    @type max_persistent_per_host: L{int}
+
+    @param idle_timeout: The number of seconds an idle connection is
+        kept open before it is closed.
+    @type idle_timeout: L{int} or L{float}
+
+    @param max_endpoints: The most endpoints to keep a pool and an agent
+        for.  The pool of the least recently used endpoint is forgotten,
+        and its idle connections closed, to make room for another.
+    @type max_endpoints: L{int}
+
+    @return: The new connection pool.
+    @rtype: L{_ConnectionPool}
+    """
+    return _ConnectionPool(**kw)
+
+
+@attr.s
+class _ConnectionPool:
+    """
+    A collection of L{HTTPConnectionPool} instances and the agents which
+    issue requests using them.
+
+    There is one pool and one agent for each combination of scheme,
+    host, port, proxy and certificate verification setting.  This lets
+    every request to an endpoint re-use an established (and, for
+    I{https}, already negotiated) connection instead of paying for a
+    new TCP and TLS handshake.
+
+    See parameter documentation for L{connection_pool} (the public
+    constructor) for details about attributes.
+
+    @ivar _pools: An L{OrderedDict} mapping the key of each endpoint to
+        its pool, least recently used first.
+
+    @ivar _agents: A L{dict} mapping the key of each endpoint with a pool
+        to its agent.
+    """
+    _reactor = attr.ib(
+        default=attr.Factory(lambda: namedAny("twisted.internet.reactor")),
+    )
+    max_persistent_per_host = attr.ib(
+        default=HTTPConnectionPool.maxPersistentPerHost,
+        validator=validators.instance_of(int),
+    )
+    idle_timeout = attr.ib(
+        default=HTTPConnectionPool.cachedConnectionTimeout,
+        validator=validators.instance_of((int, float)),
+    )
+    max_endpoints = attr.ib(
+        default=DEFAULT_MAX_ENDPOINTS,
+        validator=validators.instance_of(int),
+    )
+    _pools = attr.ib(init=False, default=attr.Factory(OrderedDict))
+    _agents = attr.ib(init=False, default=attr.Factory(dict))
+
+    def _key(self, scheme, host, port, verify):
+        if isinstance(scheme, bytes):
+            scheme = scheme.decode("ascii")
+        if isinstance(host, bytes):
+            host = host.decode("idna")
+        if port is None:
+            port = 443 if scheme == "https" else 80
+        proxy = os.environ.get(scheme + "_proxy") or None
+        return (scheme, host, port, proxy, verify)
+
+    def get_pool(self, scheme, host, port=None, verify=True):
+        """
+        Get the L{HTTPConnectionPool} for connections to an endpoint.
+
+        @param scheme: The scheme of the endpoint (C{"http"} or
+            C{"https"}).
+        @type scheme: L{str} or L{bytes}
+
+        @param host: The host name of the endpoint.
+        @type host: L{str} or L{bytes}
+
+        @param port: The port of the endpoint or C{None} for the scheme
+            default.
+        @type port: L{int} or L{NoneType}
+
+        @param verify: Whether the server certificate is verified for
+            connections in this pool.
+        @type verify: L{bool}
+
+        @rtype: L{HTTPConnectionPool}
+        """
+        key = self._key(scheme, host, port, verify)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = HTTPConnectionPool(self._reactor, persistent=True)
+            pool.maxPersistentPerHost = self.max_persistent_per_host
+            pool.cachedConnectionTimeout = self.idle_timeout
+            self._pools[key] = pool
+            self._evict()
+        else:
+            self._pools.move_to_end(key)
+        return pool
+
+    def _evict(self):
+        """
+        Forget the least recently used endpoints beyond C{max_endpoints}.
+
+        Requests in flight keep their connections.  Those are closed
+        when they have been idle for C{idle_timeout}, as in any pool.
+        """
+        while len(self._pools) > self.max_endpoints:
+            key, pool = self._pools.popitem(last=False)
+            self._agents.pop(key, None)
+            pool.closeCachedConnections()
+
+    def get_agent(self, scheme, host, port=None, verify=True):
+        """
+        Get an agent which issues requests to an endpoint over connections
+        from this pool.
+
+        @see: L{get_pool} for parameter documentation.
+
+        @rtype: L{IAgent} provider
+        """
+        key = self._key(scheme, host, port, verify)
+        agent = self._agents.get(key)
+        if agent is not None:
+            self._pools.move_to_end(key)
+        else:
+            scheme, host = key[:2]
+            if verify:
+                contextFactory = None
+            else:
+                contextFactory = WebClientContextFactory()
+            agent = _get_agent(
+                scheme, host, self._reactor, contextFactory,
+                pool=self.get_pool(scheme, host, port, verify),
+            )
+            self._agents[key] = agent
+        return agent
+
+    def close(self):
+        """
+        Close all of the idle connections in all of the pools and forget
+        about the pools.  Later requests will open new connections.
+
+        @return: A L{Deferred} that fires when all of the connections
+            have been closed.
+        """
+        pools = list(self._pools.values())
+        self._pools.clear()
+        self._agents.clear()
+        return gatherResults(
+            list(pool.closeCachedConnections() for pool in pools),
+        )
+
+
+_default_connection_pools = {}
+
+
+def default_connection_pool(reactor=None):
+    """
+    Get the connection pool clients share when they are not given one
+    explicitly.
+
+    @param reactor: The reactor the pool establishes connections with
+        or C{None} for the global reactor.
+
+    @rtype: L{_ConnectionPool}
+    """
+    if reactor is None:
+        reactor = namedAny("twisted.internet.reactor")
+    pool = _default_connection_pools.get(reactor)
+    if pool is None:
+        pool = _default_connection_pools[reactor] = connection_pool(
+            reactor=reactor,
+        )
+    return pool
 
 
 class FakeClient:
@@ -632,8 +1147,14 @@ class FakeClient:
 
 class BaseQuery:
 
+    # The name of the AWS service queries are for, with which to tag their
+    # timings.
+    service = None
+
     def __init__(self, action=None, creds=None, endpoint=None, reactor=None,
-        body_producer=None, receiver_factory=None):
+        body_producer=None, receiver_factory=None, connection_pool=None,
+        retry_policy=None, scheduler=None, request_observer=None,
+        coalescer=None):
         if not action:
             raise TypeError("The query requires an action parameter.")
         self.action = action
@@ -642,11 +1163,18 @@ class BaseQuery:
         if reactor is None:
             from twisted.internet import reactor
         self.reactor = reactor
+        if connection_pool is None:
+            connection_pool = default_connection_pool(reactor)
+        self.connection_pool = connection_pool
         self._client = None
         self.request_headers = None
         self.response_headers = None
         self.body_producer = body_producer
         self.receiver_factory = receiver_factory or StreamingBodyReceiver
+        self.retry_policy = retry_policy
+        self.scheduler = scheduler
+        self.request_observer = request_observer
+        self.coalescer = coalescer
 
     @property
     def client(self):
@@ -671,22 +1199,45 @@ class BaseQuery:
             * twisted.web.client.getPage
             * twisted.web.client._makeGetterFactory
         """
-        contextFactory = None
         scheme, host, port, path = parse(url)
         data = kwds.get('postdata', None)
         self._method = method = kwds.get('method', 'GET')
         self.request_headers = self._headers(kwds.get('headers', {}))
         if (self.body_producer is None) and (data is not None):
             self.body_producer = FileBodyProducer(StringIO(data))
-        if self.endpoint.ssl_hostname_verification:
-            contextFactory = None
-        else:
-            contextFactory = WebClientContextFactory()
-        agent = _get_agent(scheme, host, self.reactor, contextFactory)
+        agent = self.connection_pool.get_agent(
+            scheme, host, port, self.endpoint.ssl_hostname_verification,
+        )
         if scheme == "https":
             self.client.url = url
-        d = agent.request(method, url, self.request_headers, self.body_producer)
-        d.addCallback(self._handle_response)
+        if self.retry_policy is not None:
+            body = _rewinder(self.body_producer)
+            if body is not None:
+                d = self.retry_policy.call(
+                    lambda: self._request(
+                        agent, method, url, host, body.producer(),
+                    ),
+                )
+                d.addBoth(body.close)
+                return d
+        return self._request(agent, method, url, host, self.body_producer)
+
+    def _request(self, agent, method, url, host, body_producer):
+        if self.scheduler is not None:
+            return self.scheduler.schedule(
+                host, self._request_once, agent, method, url, body_producer,
+            )
+        return self._request_once(agent, method, url, body_producer)
+
+    def _request_once(self, agent, method, url, body_producer):
+        timer = _timer(
+            self.request_observer, self.reactor, self.service, self.action,
+            getattr(self, "bucket", None), body_producer,
+        )
+        d = agent.request(method, url, self.request_headers, body_producer)
+        d.addCallback(self._handle_response, timer)
+        if timer is not None:
+            d.addCallbacks(timer.finished, timer.failed)
         return d
 
     def _headers(self, headers_dict):
@@ -713,13 +1264,15 @@ class BaseQuery:
         if self.request_headers:
             return self._unpack_headers(self.request_headers)
 
-    def _handle_response(self, response):
+    def _handle_response(self, response, timer=None):
         """
         Handle the HTTP response by memoing the headers and then delivering
         bytes.
         """
         self.client.status = response.code
         self.response_headers = response.headers
+        if timer is not None:
+            timer.responded(response)
         # XXX This workaround (which needs to be improved at that) for possible
         # bug in Twisted with new client:
         # http://twistedmatrix.com/trac/ticket/5476
@@ -728,6 +1281,8 @@ class BaseQuery:
         receiver = self.receiver_factory()
         receiver.finished = d = Deferred()
         receiver.content_length = response.length
+        if timer is not None:
+            receiver = timer.counting(receiver)
         response.deliverBody(receiver)
         if response.code >= 400:
             d.addCallback(self._fail_response, response)
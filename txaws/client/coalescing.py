@@ -0,0 +1,111 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Coalescing of identical requests made while one is already in flight.
+
+When many callers ask for the same thing at once, only the first request
+is issued.  The others wait for it and are all given its result, or its
+failure.  Once it has finished the next identical request is issued
+anew, so nothing is cached beyond the life of one request.
+
+Only requests which read, and which deliver their response into memory,
+are coalesced.
+"""
+
+__all__ = [
+    "request_coalescer",
+]
+
+import attr
+
+from twisted.internet.defer import Deferred, maybeDeferred
+
+
+def request_coalescer():
+    """
+    Create a coalescer sharing one request among identical requests made
+    while it is in flight.
+
+    A coalescer may be shared by several clients.  Requests made with
+    different credentials are never coalesced.
+
+    @rtype: L{_RequestCoalescer}
+    """
+    return _RequestCoalescer()
+
+
+@attr.s
+class _InFlight:
+    """
+    A request in flight and the callers waiting for its result.
+
+    @ivar request: The L{Deferred} of the request issued.
+
+    @ivar waiting: A L{list} of the L{Deferred}s, one for each caller,
+        waiting for its result.
+    """
+    request = attr.ib(default=None)
+    waiting = attr.ib(default=attr.Factory(list))
+
+
+@attr.s
+class _RequestCoalescer:
+    """
+    @ivar coalesced: The number of requests which shared another's result
+        rather than being issued.
+    @type coalesced: L{int}
+
+    @ivar _in_flight: A L{dict} mapping the key of each request in flight
+        to its L{_InFlight}.
+    """
+    coalesced = attr.ib(default=0, init=False)
+    _in_flight = attr.ib(default=attr.Factory(dict), init=False)
+
+    def coalesce(self, key, f, *a, **kw):
+        """
+        Issue a request unless an identical one is in flight.
+
+        Each caller is given a L{Deferred} of its own.  Cancelling it
+        cancels only that caller's wait; the request itself is cancelled
+        once every caller waiting for it has cancelled.
+
+        @param key: A hashable value which is equal for identical requests.
+
+        @param f: A function to call to issue the request, returning a
+            L{Deferred} which fires with its result.
+
+        @return: A L{Deferred} which fires with the result of the request
+            or of the identical one in flight.
+        """
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return self._wait(key, in_flight)
+        in_flight = self._in_flight[key] = _InFlight()
+        # Waiting before issuing, in case the request finishes at once.
+        d = self._wait(key, in_flight)
+        in_flight.request = maybeDeferred(f, *a, **kw)
+        in_flight.request.addBoth(self._finished, key, in_flight)
+        return d
+
+    def _wait(self, key, in_flight):
+        d = Deferred(lambda d: self._cancelled(d, key, in_flight))
+        in_flight.waiting.append(d)
+        return d
+
+    def _cancelled(self, d, key, in_flight):
+        in_flight.waiting.remove(d)
+        if not in_flight.waiting:
+            # Nobody wants the result any more.  Identical requests made
+            # from now on are issued anew.
+            del self._in_flight[key]
+            in_flight.request.cancel()
+
+    def _finished(self, result, key, in_flight):
+        # Later requests are issued anew rather than given this result.
+        if self._in_flight.get(key) is in_flight:
+            del self._in_flight[key]
+        for d in in_flight.waiting:
+            d.callback(result)
+        # The result has been handed on to every caller.
+        return None
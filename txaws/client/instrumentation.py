@@ -0,0 +1,428 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Timing of the phases of each request a query issues.
+
+A query given a request observer tells it how long each attempt at a
+request spent in each phase:
+
+  - L{SIGNING}: computing the request's headers and signature.
+  - L{RESPONSE}: from issuing the request until the response headers
+    arrive.  This includes resolving the host name, connecting and
+    negotiating TLS if a new connection is needed, sending the request
+    and the time until the first byte of the response.
+  - L{BODY}: receiving the response body.
+
+L{latency_aggregator} is an observer which keeps histograms of these
+timings for each service and action.
+"""
+
+__all__ = [
+    "SIGNING", "RESPONSE", "BODY", "TOTAL",
+    "IRequestObserver", "RequestTiming", "latency_histogram",
+    "latency_aggregator",
+]
+
+from math import ceil, log
+
+import attr
+from attr import validators
+
+from pyrsistent import PMap, freeze, pmap
+
+from zope.interface import Interface, implementer
+
+from twisted.internet.protocol import Protocol
+from twisted.web.error import Error as TwistedWebError
+from twisted.web.iweb import UNKNOWN_LENGTH
+
+
+SIGNING = "signing"
+RESPONSE = "response"
+BODY = "body"
+
+# Not a phase itself: the time from the start of the first phase to the
+# end of the last.
+TOTAL = "total"
+
+
+class IRequestObserver(Interface):
+    """
+    An observer of the requests issued by queries.
+    """
+    def request_finished(timing):
+        """
+        Called once for each attempt at a request, when the response has
+        been received or the attempt has failed.
+
+        @param timing: A description of the attempt.
+        @type timing: L{RequestTiming}
+        """
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+@attr.s(frozen=True)
+class RequestTiming:
+    """
+    The timings of one attempt at a request.
+
+    @ivar service: The AWS service the request was for, eg C{"s3"}.
+    @type service: L{str} or L{NoneType}
+
+    @ivar action: The action requested, eg C{"DescribeInstances"}, or the
+        HTTP method if the service has no action names.
+    @type action: L{str}
+
+    @ivar bucket: The S3 bucket the request was for, if any.
+    @type bucket: L{str} or L{NoneType}
+
+    @ivar status: The HTTP status of the response or C{None} if there was
+        no response.
+    @type status: L{int} or L{NoneType}
+
+    @ivar bytes_out: The size of the request body or C{None} if it was not
+        known in advance.
+    @type bytes_out: L{int} or L{NoneType}
+
+    @ivar bytes_in: The number of bytes of response body received.
+    @type bytes_in: L{int}
+
+    @ivar phases: The seconds spent in each phase the attempt reached.
+    @type phases: L{PMap} of L{str} to L{float}
+
+    @ivar failed: Whether the attempt failed, including because of an
+        error response.
+    @type failed: L{bool}
+    """
+    service = attr.ib(converter=_text)
+    action = attr.ib(converter=_text)
+    bucket = attr.ib(default=None, converter=_text)
+    status = attr.ib(default=None)
+    bytes_out = attr.ib(default=None)
+    bytes_in = attr.ib(default=0)
+    phases = attr.ib(
+        default=pmap(), converter=freeze, validator=validators.instance_of(PMap),
+    )
+    failed = attr.ib(default=False)
+
+    @property
+    def total(self):
+        """
+        The seconds spent in all of the phases.
+        """
+        return sum(self.phases.values())
+
+
+class _RequestTimer:
+    """
+    Time one attempt at a request and tell an observer about it.
+    """
+    def __init__(self, observer, clock, service, action, bucket, body_producer):
+        self._observer = observer
+        self._clock = clock
+        self._last = clock.seconds()
+        self._tags = dict(service=service, action=action, bucket=bucket)
+        self._phases = {}
+        self.status = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        if body_producer is not None:
+            self.bytes_out = body_producer.length
+            if self.bytes_out is UNKNOWN_LENGTH:
+                self.bytes_out = None
+
+    def lap(self, phase):
+        """
+        Record the end of a phase which began when the last one ended.
+        """
+        now = self._clock.seconds()
+        self._phases[phase] = now - self._last
+        self._last = now
+
+    def responded(self, response):
+        """
+        Record that the response headers have arrived.
+        """
+        self.lap(RESPONSE)
+        self.status = response.code
+
+    def counting(self, receiver):
+        """
+        @return: A protocol to deliver the response body to which counts its
+            bytes and delivers it to C{receiver} in turn.
+        """
+        return _CountingProtocol(receiver, self)
+
+    def finished(self, result):
+        """
+        Record that the response body has arrived and tell the observer.
+
+        @return: C{result}
+        """
+        self.lap(BODY)
+        self._finish(False)
+        return result
+
+    def failed(self, reason):
+        """
+        Record that the attempt failed and tell the observer.
+
+        @return: C{reason}
+        """
+        if reason.check(TwistedWebError):
+            # An error response, which was received in full.
+            self.lap(BODY)
+        self._finish(True)
+        return reason
+
+    def _finish(self, failed):
+        self._observer.request_finished(RequestTiming(
+            status=self.status,
+            bytes_out=self.bytes_out,
+            bytes_in=self.bytes_in,
+            phases=self._phases,
+            failed=failed,
+            **self._tags
+        ))
+
+
+class _CountingProtocol(Protocol):
+    """
+    Deliver a response body to another protocol, counting its bytes.
+    """
+    def __init__(self, protocol, timer):
+        self._protocol = protocol
+        self._timer = timer
+
+    def makeConnection(self, transport):
+        self._protocol.makeConnection(transport)
+
+    def dataReceived(self, data):
+        self._timer.bytes_in += len(data)
+        self._protocol.dataReceived(data)
+
+    def connectionLost(self, reason):
+        self._protocol.connectionLost(reason)
+
+
+def _timer(observer, clock, service, action, bucket, body_producer):
+    """
+    @return: A L{_RequestTimer} for the attempt or C{None} if there is no
+        observer.
+    """
+    if observer is None:
+        return None
+    return _RequestTimer(observer, clock, service, action, bucket, body_producer)
+
+
+def latency_histogram(**kw):
+    """
+    Create a histogram of latencies with bounded relative error, like an
+    HdrHistogram.
+
+    Latencies are counted in buckets which are exact for the smallest
+    values and whose width grows with the value so that each bucket spans
+    only a small fraction of the values in it.  Memory use depends on the
+    range of values recorded, not on how many there are.
+
+    @param significant_figures: The number of significant decimal figures
+        to which recorded values are kept.
+    @type significant_figures: L{int}
+
+    @param unit: The smallest latency distinguished, in seconds.
+    @type unit: L{float}
+
+    @rtype: L{_LatencyHistogram}
+    """
+    return _LatencyHistogram(**kw)
+
+
+@attr.s
+class _LatencyHistogram:
+    """
+    @ivar _sub_bucket_bits: Values below C{2 ** _sub_bucket_bits} units
+        are counted exactly.  Larger values keep this many significant
+        bits.
+
+    @ivar _counts: A mapping from bucket index to the number of values
+        counted in that bucket.
+    """
+    significant_figures = attr.ib(
+        default=3, validator=validators.in_(range(1, 6)),
+    )
+    unit = attr.ib(default=1e-6, validator=validators.instance_of(float))
+    count = attr.ib(default=0, init=False)
+    total = attr.ib(default=0.0, init=False)
+    min = attr.ib(default=None, init=False)
+    max = attr.ib(default=None, init=False)
+    _sub_bucket_bits = attr.ib(init=False)
+    _counts = attr.ib(default=attr.Factory(dict), init=False)
+
+    def __attrs_post_init__(self):
+        self._sub_bucket_bits = int(
+            ceil(log(2 * 10 ** self.significant_figures, 2)),
+        )
+
+    def _index(self, units):
+        shift = units.bit_length() - self._sub_bucket_bits
+        if shift <= 0:
+            return units
+        half = 1 << (self._sub_bucket_bits - 1)
+        return (
+            (1 << self._sub_bucket_bits) + (shift - 1) * half
+            + (units >> shift) - half
+        )
+
+    def _highest(self, index):
+        """
+        @return: The largest value, in units, counted in a bucket.
+        """
+        if index < (1 << self._sub_bucket_bits):
+            return index
+        half = 1 << (self._sub_bucket_bits - 1)
+        shift, offset = divmod(index - (1 << self._sub_bucket_bits), half)
+        shift += 1
+        return ((half + offset + 1) << shift) - 1
+
+    def record(self, seconds):
+        """
+        Count a latency.
+
+        @param seconds: The latency.
+        @type seconds: L{float}
+        """
+        units = max(0, int(round(seconds / self.unit)))
+        index = self._index(units)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        """
+        The mean of the latencies counted or C{None} if there are none.
+        """
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def percentile(self, percent):
+        """
+        Find the latency which a given percentage of the latencies counted
+        are at or below.
+
+        @param percent: The percentage, eg C{99.9}.
+        @type percent: L{float}
+
+        @return: The latency, in seconds, to within the histogram's
+            precision, or C{None} if no latencies have been counted.
+        """
+        if self.count == 0:
+            return None
+        wanted = max(1, int(ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= wanted:
+                return min(self.max, self._highest(index) * self.unit)
+        return self.max
+
+
+def latency_aggregator(**kw):
+    """
+    Create a request observer which keeps a L{latency_histogram} of each
+    phase, and of the total, of the requests for each service and action.
+
+    @param histogram_factory: A no-argument callable returning a new
+        histogram.  Defaults to L{latency_histogram}.
+
+    @rtype: L{_LatencyAggregator}
+    """
+    return _LatencyAggregator(**kw)
+
+
+@attr.s
+class _ActionStats:
+    """
+    The requests for one service and action.
+    """
+    histograms = attr.ib()
+    requests = attr.ib(default=0)
+    failures = attr.ib(default=0)
+    bytes_in = attr.ib(default=0)
+    bytes_out = attr.ib(default=0)
+
+
+@implementer(IRequestObserver)
+@attr.s
+class _LatencyAggregator:
+    histogram_factory = attr.ib(default=latency_histogram)
+    _stats = attr.ib(default=attr.Factory(dict), init=False)
+
+    def request_finished(self, timing):
+        key = (timing.service, timing.action)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _ActionStats(histograms={})
+        stats.requests += 1
+        if timing.failed:
+            stats.failures += 1
+        stats.bytes_in += timing.bytes_in
+        if timing.bytes_out is not None:
+            stats.bytes_out += timing.bytes_out
+        for phase, seconds in timing.phases.items():
+            self._histogram(stats, phase).record(seconds)
+        self._histogram(stats, TOTAL).record(timing.total)
+
+    def _histogram(self, stats, phase):
+        histogram = stats.histograms.get(phase)
+        if histogram is None:
+            histogram = stats.histograms[phase] = self.histogram_factory()
+        return histogram
+
+    def keys(self):
+        """
+        @return: The (service, action) pairs for which requests have been
+            observed.
+        @rtype: L{list} of L{tuple} of L{str}
+        """
+        return sorted(self._stats, key=lambda k: tuple(map(str, k)))
+
+    def histogram(self, service, action, phase=TOTAL):
+        """
+        @param phase: L{SIGNING}, L{RESPONSE}, L{BODY} or L{TOTAL}.
+
+        @return: The histogram of the latencies of a phase of the requests
+            for a service and action or C{None} if none have been observed.
+        @rtype: L{_LatencyHistogram} or L{NoneType}
+        """
+        stats = self._stats.get((service, action))
+        if stats is None:
+            return None
+        return stats.histograms.get(phase)
+
+    def summary(self, service, action):
+        """
+        @return: The number of requests for a service and action, how many
+            failed and the bytes sent and received, as a L{dict} with keys
+            C{"requests"}, C{"failures"}, C{"bytes_in"} and
+            C{"bytes_out"}, or C{None} if none have been observed.
+        """
+        stats = self._stats.get((service, action))
+        if stats is None:
+            return None
+        return dict(
+            requests=stats.requests,
+            failures=stats.failures,
+            bytes_in=stats.bytes_in,
+            bytes_out=stats.bytes_out,
+        )
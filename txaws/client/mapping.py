@@ -0,0 +1,232 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Request bodies produced from files mapped into memory.
+
+A L{twisted.web.client.FileBodyProducer} reads each chunk of its file into
+new L{bytes} with a system call.  A producer of a mapped file instead
+copies each chunk out of the mapping.  Any number of producers of ranges
+of a file, such as the parts of a multipart upload, share one mapping.
+
+Twisted's transports only accept L{bytes}, so that is what a producer
+writes unless told its consumer takes L{memoryview}s, in which case the
+chunks are views of the mapping and nothing is copied before the
+consumer.
+
+The file must not be truncated while it is mapped: reading the pages
+beyond its new end kills the process with I{SIGBUS}.
+"""
+
+__all__ = [
+    "file_mapping",
+]
+
+import mmap
+import os
+import stat
+
+from zope.interface import implementer
+
+from twisted.internet import defer, task
+from twisted.web.iweb import IBodyProducer
+
+
+# The sizes between which the chunks written by a producer are kept.
+MIN_CHUNK_SIZE = 2 ** 14
+MAX_CHUNK_SIZE = 2 ** 20
+
+# The size of the first chunk a producer writes.
+_INITIAL_CHUNK_SIZE = 2 ** 16
+
+
+def file_mapping(source):
+    """
+    Map a regular file into memory to produce request bodies from it.
+
+    @param source: The path of the file or a file object open for reading
+        in binary mode.  A file object stays open and remains the caller's
+        to close.
+    @type source: L{str}, L{bytes} or a file object with a C{fileno}
+
+    @raise ValueError: If the file is not a regular file.
+
+    @rtype: L{_FileMapping}
+    """
+    if isinstance(source, (str, bytes)):
+        with open(source, "rb") as fileobj:
+            return _FileMapping.from_descriptor(fileobj.fileno())
+    return _FileMapping.from_descriptor(source.fileno())
+
+
+class _FileMapping:
+    """
+    A file mapped into memory.
+
+    The mapping holds its own reference to the file so the file can be
+    closed as soon as it is mapped.
+
+    @ivar size: The size of the file when it was mapped.
+    @type size: L{int}
+
+    @ivar _view: A L{memoryview} of the whole mapping or C{None} once the
+        mapping is closed.
+    """
+    def __init__(self, mapped, size):
+        """
+        @param mapped: The mapping or C{None} for an empty file, which
+            cannot be mapped.
+        @type mapped: L{mmap.mmap}
+
+        @param size: The size of the file.
+        @type size: L{int}
+        """
+        self.size = size
+        if mapped is None:
+            self._view = memoryview(b"")
+        else:
+            self._view = memoryview(mapped)
+
+    @classmethod
+    def from_descriptor(cls, fd):
+        """
+        Map the file open on a file descriptor.
+
+        @param fd: The file descriptor.
+        @type fd: L{int}
+
+        @rtype: L{_FileMapping}
+        """
+        status = os.fstat(fd)
+        if not stat.S_ISREG(status.st_mode):
+            raise ValueError("Only regular files can be mapped")
+        size = status.st_size
+        if size == 0:
+            return cls(None, 0)
+        mapped = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        if hasattr(mapped, "madvise"):
+            # The pages are read in order, each once.
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        return cls(mapped, size)
+
+    def producer(self, offset=0, length=None, cooperator=task,
+                 buffers=False):
+        """
+        Get a producer of a range of the file.
+
+        @param offset: The offset of the first byte to produce.
+        @type offset: L{int}
+
+        @param length: The number of bytes to produce or C{None} for the
+            rest of the file.
+        @type length: L{int} or L{NoneType}
+
+        @param cooperator: The L{Cooperator} with which to schedule the
+            writes (or anything with a C{cooperate} method).
+
+        @param buffers: Whether the consumer the producer will write to
+            accepts L{memoryview}s.  Transports, such as those an
+            L{twisted.web.client.Agent} writes request bodies to, do not.
+        @type buffers: L{bool}
+
+        @rtype: L{_MappedBodyProducer}
+        """
+        if self._view is None:
+            raise ValueError("The mapping is closed")
+        if length is None:
+            length = self.size - offset
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError(
+                "{} bytes from offset {} is not within a file of {} "
+                "bytes".format(length, offset, self.size),
+            )
+        return _MappedBodyProducer(
+            self._view[offset:offset + length], cooperator, buffers,
+        )
+
+    def close(self):
+        """
+        Give up the mapping.
+
+        It is unmapped once nothing written from it is still referenced,
+        which may be after the requests using it have finished.
+        """
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+
+
+@implementer(IBodyProducer)
+class _MappedBodyProducer:
+    """
+    A producer of a range of a mapped file.
+
+    One chunk is written each time its cooperative task runs.  The chunk
+    size doubles after each chunk the consumer takes without pausing the
+    producer, up to L{MAX_CHUNK_SIZE}, and halves whenever the consumer
+    pauses it, down to L{MIN_CHUNK_SIZE}.  A fast consumer is written to
+    in few large chunks while one whose buffer is full is not handed much
+    more than it can take.
+
+    A producer may be produced from again, by a copy, to retry a request.
+
+    @ivar _view: The L{memoryview} of the range.
+
+    @ivar _buffers: Whether to write L{memoryview}s of the range rather
+        than copies of it as L{bytes}.
+
+    @ivar _chunk_size: The size of the next chunk to write.
+
+    @ivar _paused: Whether the consumer paused the producer while it
+        took the last chunk.
+    """
+    def __init__(self, view, cooperator, buffers=False):
+        self._view = view
+        self._buffers = buffers
+        self._cooperate = cooperator.cooperate
+        self._chunk_size = _INITIAL_CHUNK_SIZE
+        self._paused = False
+        self.length = len(view)
+
+    def startProducing(self, consumer):
+        """
+        Start a cooperative task which writes the range to C{consumer}.
+
+        @return: A L{Deferred} which fires after all of it has been
+            written.
+        """
+        self._task = self._cooperate(self._writeloop(consumer))
+        d = self._task.whenDone()
+
+        def maybeStopped(reason):
+            # IBodyProducer.startProducing's Deferred isn't supposed to
+            # fire if stopProducing is called.
+            reason.trap(task.TaskStopped)
+            return defer.Deferred()
+        d.addCallbacks(lambda ignored: None, maybeStopped)
+        return d
+
+    def _writeloop(self, consumer):
+        view = self._view
+        offset = 0
+        while offset < len(view):
+            size = self._chunk_size
+            self._paused = False
+            chunk = view[offset:offset + size]
+            if not self._buffers:
+                chunk = chunk.tobytes()
+            consumer.write(chunk)
+            offset += size
+            if not self._paused:
+                self._chunk_size = min(size * 2, MAX_CHUNK_SIZE)
+            yield None
+
+    def pauseProducing(self):
+        self._paused = True
+        self._chunk_size = max(self._chunk_size // 2, MIN_CHUNK_SIZE)
+        self._task.pause()
+
+    def resumeProducing(self):
+        self._task.resume()
+
+    def stopProducing(self):
+        self._task.stop()
@@ -0,0 +1,153 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Logging of the requests issued by queries.
+
+By default every request is logged at I{info} level, as it always has
+been, and nothing more.  A deployment issuing many requests can log only
+some of them, or none, and can choose to log every request which fails.
+
+Nothing is done for a request which is not logged.  For one which is,
+the URL is the one already computed to issue the request and the headers
+are only rendered when an observer formats the event.
+"""
+
+__all__ = [
+    "request_log",
+]
+
+import attr
+from attr import validators
+
+from twisted.logger import Logger, LogLevel
+
+
+def request_log(**kw):
+    """
+    Create a policy for logging requests.
+
+    @param level: The level at which to log requests or C{None} to not log
+        them.
+    @type level: L{LogLevel} or L{NoneType}
+
+    @param sample: Log only one in this many requests.  C{1} logs every
+        request.
+    @type sample: L{int}
+
+    @param failure_level: The level at which to log requests which fail,
+        whether or not they were sampled, or C{None}, the default, to not
+        log them.
+    @type failure_level: L{LogLevel} or L{NoneType}
+
+    @param logger: The logger with which to emit events.
+
+    @rtype: L{_RequestLog}
+    """
+    return _RequestLog(**kw)
+
+
+_LEVEL = validators.optional(validators.in_(list(LogLevel.iterconstants())))
+
+
+def _positive(inst, a, value):
+    if value < 1:
+        raise ValueError("{} must be at least 1, not {}".format(a.name, value))
+
+
+@attr.s
+class _RequestLog:
+    """
+    @ivar _count: The number of requests considered for sampling so far.
+    """
+    level = attr.ib(default=LogLevel.info, validator=_LEVEL)
+    sample = attr.ib(
+        default=1, validator=[validators.instance_of(int), _positive],
+    )
+    failure_level = attr.ib(default=None, validator=_LEVEL)
+    _logger = attr.ib(
+        default=attr.Factory(
+            # The namespace queries have always logged to.
+            lambda: Logger(namespace="txaws.client.base._Query"),
+        ),
+    )
+    _count = attr.ib(default=0, init=False)
+
+    def sampled(self):
+        """
+        Decide whether to log the next request.
+
+        @return: C{True} if the request is one to log.
+        """
+        if self.level is None:
+            return False
+        if self.sample == 1:
+            return True
+        self._count += 1
+        if self._count >= self.sample:
+            self._count = 0
+            return True
+        return False
+
+    def signing(self, sampled, service, region, method, url, headers):
+        """
+        Log that a request is being signed.
+
+        @param sampled: The result of L{sampled} for the request.
+
+        @param url: The URL of the request.
+        @type url: L{bytes}
+        """
+        if sampled:
+            self._logger.emit(
+                self.level,
+                "Computing authorization from "
+                "{service} {region} {method} {url} {headers}",
+                service=service,
+                region=region,
+                method=method,
+                url=url,
+                headers=headers,
+            )
+
+    def submitting(self, sampled, method, url, headers):
+        """
+        Log that a request is being issued.
+
+        @param sampled: The result of L{sampled} for the request.
+
+        @param url: The URL of the request.
+        @type url: L{bytes}
+        """
+        if sampled:
+            self._logger.emit(
+                self.level,
+                "Submitting query: {method} {url} {headers}",
+                method=method,
+                url=url,
+                headers=headers,
+            )
+
+    def failed(self, reason, method, url):
+        """
+        Log that a request failed.
+
+        @param reason: Why the request failed.
+        @type reason: L{twisted.python.failure.Failure}
+
+        @return: C{reason}
+        """
+        if self.failure_level is not None:
+            # Not Logger.failure, which makes an error of the event whatever
+            # its level.
+            self._logger.emit(
+                self.failure_level,
+                "Query failed: {method} {url}: {reason.value!r}",
+                method=method,
+                url=url,
+                reason=reason,
+            )
+        return reason
+
+
+# Shared by queries created without a request log of their own.
+_DEFAULT_REQUEST_LOG = request_log()
@@ -0,0 +1,405 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Retrying of requests which fail because AWS is throttling them or because
+of a transient error.
+
+Retries are delayed using "decorrelated jitter" backoff so that many
+clients throttled at the same moment do not all retry at the same moment.
+They are also limited by a token bucket, a L{retry_budget}, so that a
+client facing an outage does not multiply the load on the service.
+"""
+
+__all__ = [
+    "THROTTLING", "TRANSIENT", "ERROR_CODES", "STATUS_CODES",
+    "retry_budget", "retry_policy",
+]
+
+from copy import copy
+from random import Random
+from xml.etree.ElementTree import ParseError
+
+import attr
+from attr import validators
+
+from pyrsistent import PMap, freeze
+
+from twisted.internet.error import ConnectError, TimeoutError
+from twisted.internet.task import deferLater
+from twisted.python.reflect import namedAny
+from twisted.web.client import FileBodyProducer, ResponseNeverReceived
+from twisted.web.error import Error as TwistedWebError
+
+from txaws.client.mapping import _MappedBodyProducer
+from txaws.exception import AWSError
+from txaws.util import XML
+
+
+# The kinds of retryable errors.  Throttling errors back off from a longer
+# base delay than transient ones.
+THROTTLING = "throttling"
+TRANSIENT = "transient"
+
+
+# AWS error codes and how to treat them.  An error code which maps to
+# None is not retried even if its HTTP status would be.
+ERROR_CODES = freeze({
+    # S3
+    "SlowDown": THROTTLING,
+    "InternalError": TRANSIENT,
+    "ServiceUnavailable": TRANSIENT,
+    "RequestTimeout": TRANSIENT,
+    # EC2
+    "RequestLimitExceeded": THROTTLING,
+    "Unavailable": TRANSIENT,
+    # Route53 and others
+    "Throttling": THROTTLING,
+    "ThrottlingException": THROTTLING,
+    "ThrottledException": THROTTLING,
+    "RequestThrottled": THROTTLING,
+    "RequestThrottledException": THROTTLING,
+    "TooManyRequestsException": THROTTLING,
+    "PriorRequestNotComplete": THROTTLING,
+    "BandwidthLimitExceeded": THROTTLING,
+    "ProvisionedThroughputExceededException": THROTTLING,
+    "InternalFailure": TRANSIENT,
+})
+
+
+# HTTP response codes and how to treat them when the response carries no
+# recognized error code.
+STATUS_CODES = freeze({
+    429: THROTTLING,
+    500: TRANSIENT,
+    502: TRANSIENT,
+    503: TRANSIENT,
+    504: TRANSIENT,
+})
+
+
+# Failures to get any response at all.  These are retried as transient
+# errors.
+_CONNECTION_ERRORS = (ConnectError, TimeoutError, ResponseNeverReceived)
+
+
+def _error_code(body):
+    """
+    Find the AWS error code in an error response body.
+
+    @param body: The body of the error response.
+    @type body: L{bytes} or L{NoneType}
+
+    @return: The text of the first I{Code} element in the body or C{None}
+        if there is none.
+    @rtype: L{str} or L{NoneType}
+    """
+    if not body:
+        return None
+    try:
+        root = XML(body)
+    except ParseError:
+        return None
+    for element in root.iter("Code"):
+        return element.text
+    return None
+
+
+def retry_budget(**kw):
+    """
+    Create a token bucket limiting how often requests may be retried.
+
+    Each retry withdraws one token.  A retry for which there is no token
+    is not made and the request fails with the error which prompted it.
+    Tokens are replaced continuously at a fixed rate up to a maximum.
+
+    Share one budget between all of the requests to a service, for
+    example by giving each client its own L{retry_policy}.
+
+    @param capacity: The most tokens the bucket holds.  It starts full.
+    @type capacity: L{int} or L{float}
+
+    @param rate: The number of tokens added to the bucket each second.
+    @type rate: L{int} or L{float}
+
+    @param clock: The clock with which to measure time or C{None} for the
+        global reactor.
+    @type clock: L{twisted.internet.interfaces.IReactorTime} provider
+
+    @rtype: L{_RetryBudget}
+    """
+    return _RetryBudget(**kw)
+
+
+@attr.s
+class _RetryBudget:
+    """
+    A token bucket of retries.
+
+    @ivar _tokens: The number of tokens in the bucket as of C{_updated}.
+
+    @ivar _updated: The time at which C{_tokens} was last computed.
+    """
+    capacity = attr.ib(default=10, validator=validators.instance_of((int, float)))
+    rate = attr.ib(default=1, validator=validators.instance_of((int, float)))
+    _clock = attr.ib(default=attr.Factory(lambda: namedAny("twisted.internet.reactor")))
+    _tokens = attr.ib(init=False)
+    _updated = attr.ib(init=False)
+
+    def __attrs_post_init__(self):
+        self._tokens = self.capacity
+        self._updated = self._clock.seconds()
+
+    def available(self):
+        """
+        @return: The number of tokens now in the bucket.
+        @rtype: L{float}
+        """
+        now = self._clock.seconds()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate,
+        )
+        self._updated = now
+        return self._tokens
+
+    def withdraw(self):
+        """
+        Take a token from the bucket if there is one.
+
+        @return: C{True} if a token was taken, C{False} otherwise.
+        """
+        if self.available() >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+def retry_policy(**kw):
+    """
+    Create a policy deciding which failed requests to retry and when.
+
+    @param max_attempts: The most times to issue a request, including the
+        first time.
+    @type max_attempts: L{int}
+
+    @param base_delay: The shortest delay, in seconds, before retrying a
+        request which failed with a transient error.
+    @type base_delay: L{int} or L{float}
+
+    @param throttling_base_delay: The shortest delay, in seconds, before
+        retrying a request which was throttled.
+    @type throttling_base_delay: L{int} or L{float}
+
+    @param max_delay: The longest delay, in seconds, before any retry.
+    @type max_delay: L{int} or L{float}
+
+    @param error_codes: A mapping from AWS error codes to L{THROTTLING},
+        L{TRANSIENT} or C{None} (to not retry).  Defaults to
+        L{ERROR_CODES}.
+
+    @param status_codes: A mapping from HTTP response codes to
+        L{THROTTLING} or L{TRANSIENT} for responses with no error code in
+        C{error_codes}.  Defaults to L{STATUS_CODES}.
+
+    @param budget: The L{retry_budget} from which retries are drawn.  If
+        not given, the policy has a budget of its own.
+
+    @param reactor: The reactor with which to delay retries or C{None} for
+        the global reactor.
+
+    @param random: A L{random.Random} with which to jitter delays.
+
+    @rtype: L{_RetryPolicy}
+    """
+    return _RetryPolicy(**kw)
+
+
+@attr.s(frozen=True)
+class _RetryPolicy:
+    max_attempts = attr.ib(default=4, validator=validators.instance_of(int))
+    base_delay = attr.ib(default=0.1, validator=validators.instance_of((int, float)))
+    throttling_base_delay = attr.ib(
+        default=0.5, validator=validators.instance_of((int, float)),
+    )
+    max_delay = attr.ib(default=20.0, validator=validators.instance_of((int, float)))
+    error_codes = attr.ib(
+        default=ERROR_CODES, converter=freeze,
+        validator=validators.instance_of(PMap),
+    )
+    status_codes = attr.ib(
+        default=STATUS_CODES, converter=freeze,
+        validator=validators.instance_of(PMap),
+    )
+    _reactor = attr.ib(
+        default=attr.Factory(lambda: namedAny("twisted.internet.reactor")),
+    )
+    budget = attr.ib(
+        default=attr.Factory(
+            lambda self: retry_budget(clock=self._reactor), takes_self=True,
+        ),
+    )
+    _random = attr.ib(default=attr.Factory(Random))
+
+    def classify(self, reason):
+        """
+        Decide whether a failed request may be retried.
+
+        @param reason: Why the request failed.
+        @type reason: L{twisted.python.failure.Failure}
+
+        @return: L{THROTTLING} or L{TRANSIENT} if the request may be
+            retried, otherwise C{None}.
+        """
+        if reason.check(TwistedWebError):
+            # The error a client wraps the response in keeps the body as
+            # its original rather than its response.
+            if reason.check(AWSError):
+                body = reason.value.original
+            else:
+                body = reason.value.response
+            code = _error_code(body)
+            if code in self.error_codes:
+                return self.error_codes[code]
+            try:
+                status = int(reason.value.status)
+            except (TypeError, ValueError):
+                return None
+            return self.status_codes.get(status)
+        if reason.check(*_CONNECTION_ERRORS):
+            return TRANSIENT
+        return None
+
+    def next_delay(self, kind, previous):
+        """
+        Pick how long to wait before the next retry.
+
+        This is the "decorrelated jitter" backoff: a delay chosen at random
+        between the base delay and three times the previous delay.
+
+        @param kind: The kind of error prompting the retry.
+
+        @param previous: The delay before the previous retry or C{None} if
+            this is the first.
+
+        @return: The delay in seconds.
+        @rtype: L{float}
+        """
+        if kind == THROTTLING:
+            base = self.throttling_base_delay
+        else:
+            base = self.base_delay
+        if previous is None:
+            previous = base
+        return min(
+            self.max_delay, self._random.uniform(base, max(base, previous * 3)),
+        )
+
+    def call(self, f, *args, **kwargs):
+        """
+        Call a function which issues a request, calling it again while its
+        result fails with a retryable error.
+
+        @param f: A function returning a L{Deferred} which fires with the
+            result of the request.
+
+        @return: A L{Deferred} which fires with the result of the last
+            call to C{f}.
+        """
+        return self._attempt(1, None, f, args, kwargs)
+
+    def _attempt(self, attempt, delay, f, args, kwargs):
+        d = f(*args, **kwargs)
+        d.addErrback(self._failed, attempt, delay, f, args, kwargs)
+        return d
+
+    def _failed(self, reason, attempt, delay, f, args, kwargs):
+        if attempt >= self.max_attempts:
+            return reason
+        kind = self.classify(reason)
+        if kind is None:
+            return reason
+        if not self.budget.withdraw():
+            return reason
+        delay = self.next_delay(kind, delay)
+        return deferLater(
+            self._reactor, delay,
+            self._attempt, attempt + 1, delay, f, args, kwargs,
+        )
+
+
+class _Unclosable:
+    """
+    A proxy for a file which ignores attempts to close it.
+    """
+    def __init__(self, fileobj):
+        self._file = fileobj
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def close(self):
+        pass
+
+
+def _rewinder(body_producer):
+    """
+    Get a L{_Rewinder} for a request body, if it can be rewound.
+
+    A L{FileBodyProducer} reading from a seekable file can be rewound, as
+    can a producer of a mapped file and the absence of a body.  Other
+    producers cannot.
+
+    @param body_producer: The L{IBodyProducer} of the request body or
+        C{None} if there is no body.
+
+    @rtype: L{_Rewinder} or L{NoneType}
+    """
+    if body_producer is None or isinstance(body_producer, _MappedBodyProducer):
+        return _Rewinder(body_producer, None, None)
+    if isinstance(body_producer, FileBodyProducer):
+        fileobj = body_producer._inputFile
+        try:
+            position = fileobj.tell()
+        except (AttributeError, IOError, OSError):
+            return None
+        return _Rewinder(body_producer, fileobj, position)
+    return None
+
+
+@attr.s
+class _Rewinder:
+    """
+    L{_Rewinder} produces the body of a request again for each time the
+    request is issued.
+
+    The file a L{FileBodyProducer} reads from is kept open until L{close}
+    is called rather than being closed after it has been read once.
+    """
+    _body_producer = attr.ib()
+    _file = attr.ib()
+    _position = attr.ib()
+
+    def producer(self):
+        """
+        @return: A body producer positioned at the start of the body or
+            C{None} if there is no body.
+        """
+        if self._file is None:
+            # There is nothing to rewind.  A mapped file is produced from
+            # the start of its range by a copy of its producer.
+            if self._body_producer is None:
+                return None
+            return copy(self._body_producer)
+        self._file.seek(self._position)
+        producer = copy(self._body_producer)
+        producer._inputFile = _Unclosable(self._file)
+        return producer
+
+    def close(self, passthrough=None):
+        """
+        Release the body once it will not be produced again.
+
+        @return: C{passthrough}
+        """
+        if self._file is not None:
+            self._file.close()
+        return passthrough
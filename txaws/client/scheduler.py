@@ -0,0 +1,289 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Scheduling of requests so that no more than a fixed number are in flight
+to any one host at a time.
+
+A scheduler can be shared by all of the clients in a process.  Requests
+beyond the limit wait in a queue, without blocking the reactor, until an
+earlier request to the same host finishes.
+"""
+
+__all__ = [
+    "request_scheduler", "SchedulerStats",
+]
+
+from collections import OrderedDict
+from heapq import heappush, heappop
+from itertools import count
+
+import attr
+from attr import validators
+
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.python.reflect import namedAny
+
+
+def request_scheduler(**kw):
+    """
+    Create a scheduler limiting the number of requests in flight to each
+    host.
+
+    @param max_in_flight_per_host: The most requests to one host which
+        may be in flight at a time.
+    @type max_in_flight_per_host: L{int}
+
+    @param max_hosts: The most hosts to keep the stats of separately.
+        Beyond it, the least recently used hosts with no requests in
+        flight or waiting are forgotten and their stats only counted in
+        the totals.
+    @type max_hosts: L{int}
+
+    @param reactor: The reactor with which to measure how long requests
+        wait or C{None} for the global reactor.
+
+    @rtype: L{_RequestScheduler}
+    """
+    return _RequestScheduler(**kw)
+
+
+@attr.s(frozen=True)
+class SchedulerStats:
+    """
+    A snapshot of a scheduler's queues.
+
+    @ivar in_flight: The number of requests started but not yet finished.
+    @type in_flight: L{int}
+
+    @ivar queued: The number of requests waiting to be started.
+    @type queued: L{int}
+
+    @ivar started: The number of requests started so far.
+    @type started: L{int}
+
+    @ivar total_wait: The total number of seconds requests have spent
+        waiting to be started.
+    @type total_wait: L{float}
+
+    @ivar max_wait: The longest number of seconds any request has spent
+        waiting to be started.
+    @type max_wait: L{float}
+    """
+    in_flight = attr.ib(default=0)
+    queued = attr.ib(default=0)
+    started = attr.ib(default=0)
+    total_wait = attr.ib(default=0.0)
+    max_wait = attr.ib(default=0.0)
+
+    @property
+    def mean_wait(self):
+        """
+        The mean number of seconds requests have spent waiting to be
+        started.
+        """
+        if self.started == 0:
+            return 0.0
+        return self.total_wait / self.started
+
+    def __add__(self, other):
+        return SchedulerStats(
+            in_flight=self.in_flight + other.in_flight,
+            queued=self.queued + other.queued,
+            started=self.started + other.started,
+            total_wait=self.total_wait + other.total_wait,
+            max_wait=max(self.max_wait, other.max_wait),
+        )
+
+
+@attr.s
+class _Waiting:
+    """
+    A request waiting to be started.
+
+    @ivar result: The L{Deferred} given to the caller for the result of the
+        request.
+
+    @ivar running: The L{Deferred} for the request once it has started.
+    """
+    enqueued = attr.ib()
+    f = attr.ib()
+    args = attr.ib()
+    kwargs = attr.ib()
+    result = attr.ib(default=None)
+    running = attr.ib(default=None)
+    cancelled = attr.ib(default=False)
+
+
+@attr.s
+class _Host:
+    """
+    The requests to one host.
+
+    @ivar queue: A heap of (priority, sequence number, L{_Waiting}).
+    """
+    in_flight = attr.ib(default=0)
+    queued = attr.ib(default=0)
+    started = attr.ib(default=0)
+    total_wait = attr.ib(default=0.0)
+    max_wait = attr.ib(default=0.0)
+    queue = attr.ib(default=attr.Factory(list))
+
+    def stats(self):
+        return SchedulerStats(
+            in_flight=self.in_flight,
+            queued=self.queued,
+            started=self.started,
+            total_wait=self.total_wait,
+            max_wait=self.max_wait,
+        )
+
+
+@attr.s
+class _RequestScheduler:
+    """
+    @ivar _hosts: An L{OrderedDict} mapping each host to its L{_Host},
+        least recently used first.
+
+    @ivar _forgotten: The L{SchedulerStats} of the hosts forgotten to keep
+        within C{max_hosts}.
+    """
+    max_in_flight_per_host = attr.ib(
+        default=16, validator=validators.instance_of(int),
+    )
+    max_hosts = attr.ib(default=1024, validator=validators.instance_of(int))
+    _reactor = attr.ib(
+        default=attr.Factory(lambda: namedAny("twisted.internet.reactor")),
+    )
+    _hosts = attr.ib(default=attr.Factory(OrderedDict), init=False)
+    _forgotten = attr.ib(default=attr.Factory(SchedulerStats), init=False)
+    _sequence = attr.ib(default=attr.Factory(count), init=False)
+
+    def _host(self, host):
+        host = _text(host)
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host()
+            self._forget()
+        else:
+            self._hosts.move_to_end(host)
+        return state
+
+    def _forget(self):
+        # Requests to one host per bucket, for instance, would otherwise
+        # keep a state for every bucket ever used.  Only idle hosts are
+        # forgotten, and never the one just added, so no request is left
+        # counted against a state which is no longer used.
+        excess = len(self._hosts) - self.max_hosts
+        for host in list(self._hosts)[:-1]:
+            if excess <= 0:
+                return
+            state = self._hosts[host]
+            if state.in_flight or state.queued:
+                continue
+            del self._hosts[host]
+            self._forgotten += state.stats()
+            excess -= 1
+
+    def schedule(self, host, f, *args, **kwargs):
+        """
+        Call a function which issues a request to a host once fewer than
+        C{max_in_flight_per_host} other requests to that host are in
+        flight.
+
+        The request is counted as in flight until the L{Deferred} C{f}
+        returns fires.  Requests waiting for the same host start in order
+        of priority and then in the order they were scheduled.
+
+        @param host: The host to which the request is issued.
+        @type host: L{str} or L{bytes}
+
+        @param f: A function returning a L{Deferred} which fires when the
+            request is finished.
+
+        @param priority: A keyword-only argument giving the priority of the
+            request.  Requests with lower values start first.  The default
+            is C{0}.
+        @type priority: L{int}
+
+        @return: A L{Deferred} which fires with the result of C{f}.
+            Cancelling it before the request starts removes the request
+            from the queue.
+        """
+        priority = kwargs.pop("priority", 0)
+        state = self._host(host)
+        if state.in_flight < self.max_in_flight_per_host and not state.queued:
+            return self._start(state, 0.0, f, args, kwargs)
+
+        waiting = _Waiting(self._reactor.seconds(), f, args, kwargs)
+        waiting.result = Deferred(lambda d: self._cancel(state, waiting))
+        heappush(state.queue, (priority, next(self._sequence), waiting))
+        state.queued += 1
+        return waiting.result
+
+    def _start(self, state, wait, f, args, kwargs):
+        state.in_flight += 1
+        state.started += 1
+        state.total_wait += wait
+        state.max_wait = max(state.max_wait, wait)
+        d = maybeDeferred(f, *args, **kwargs)
+        d.addBoth(self._finished, state)
+        return d
+
+    def _finished(self, result, state):
+        state.in_flight -= 1
+        self._next(state)
+        return result
+
+    def _next(self, state):
+        while state.queue and state.in_flight < self.max_in_flight_per_host:
+            _, _, waiting = heappop(state.queue)
+            if waiting.cancelled:
+                continue
+            state.queued -= 1
+            wait = self._reactor.seconds() - waiting.enqueued
+            waiting.running = self._start(
+                state, wait, waiting.f, waiting.args, waiting.kwargs,
+            )
+            waiting.running.chainDeferred(waiting.result)
+
+    def _cancel(self, state, waiting):
+        if waiting.running is not None:
+            waiting.running.cancel()
+        elif not waiting.cancelled:
+            # Leave it in the heap; it is skipped when it reaches the top.
+            waiting.cancelled = True
+            state.queued -= 1
+
+    def stats(self, host=None):
+        """
+        Describe the requests to a host or to all hosts.
+
+        @param host: The host or C{None} for all hosts.
+        @type host: L{str} or L{bytes} or L{NoneType}
+
+        @rtype: L{SchedulerStats}
+        """
+        if host is not None:
+            state = self._hosts.get(_text(host))
+            if state is None:
+                return SchedulerStats()
+            return state.stats()
+        total = self._forgotten
+        for state in self._hosts.values():
+            total += state.stats()
+        return total
+
+    def queue_depth(self, host=None):
+        """
+        @param host: The host or C{None} for all hosts.
+
+        @return: The number of requests waiting to be started.
+        @rtype: L{int}
+        """
+        return self.stats(host).queued
+
+
+def _text(host):
+    if isinstance(host, bytes):
+        return host.decode("ascii")
+    return host
@@ -6,17 +6,22 @@ Tests for L{txaws.client.base}.
 
 import os
 
-from io import StringIO
+from io import BytesIO, StringIO
 from datetime import datetime
 from hashlib import sha256
 
 from zope.interface import implementer
 
+from pyrsistent import pmap
+
 import attr
 
 from twisted.internet import reactor, ssl
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, fail, succeed
 from twisted.internet.error import ConnectionRefusedError
+from twisted.internet.interfaces import IConsumer
+from twisted.internet.protocol import Protocol
+from twisted.internet.task import Clock
 from twisted.protocols.policies import WrappingFactory
 from twisted.python import log
 from twisted.python.filepath import FilePath
@@ -25,19 +30,26 @@ from twisted.test.test_sslverify import makeCertificate
 from twisted.trial.unittest import TestCase
 from twisted.web import server, static
 from twisted.web.http_headers import Headers
-from twisted.web.client import ResponseDone
+from twisted.test.proto_helpers import StringTransport
+from twisted.web.client import FileBodyProducer, ResponseDone, ResponseFailed
 from twisted.web.resource import Resource
 from twisted.web.error import Error as TwistedWebError
-from twisted.web.iweb import IAgent
+from twisted.web.iweb import IAgent, UNKNOWN_LENGTH
 
 from txaws.service import REGION_US_EAST_1
 from txaws.credentials import AWSCredentials
 from txaws.client import base, ssl
+from txaws.client.coalescing import request_coalescer
 from txaws.client.base import (
     RequestDetails, BaseClient, BaseQuery, error_wrapper,
-    StreamingBodyReceiver, _URLContext, url_context,
+    StreamingBodyReceiver, ConsumerBodyReceiver, StreamingError,
+    ResponseTooLarge, _URLContext, url_context, connection_pool,
+    default_connection_pool, spooling_receiver_factory,
 )
-from txaws._auth_v4 import _CanonicalRequest
+from txaws.client.instrumentation import RESPONSE, BODY, _timer
+from txaws.client.retry import retry_policy
+from txaws.client.scheduler import request_scheduler
+from txaws._auth_v4 import STREAMING_PAYLOAD, _CanonicalRequest
 from txaws.service import AWSServiceEndpoint
 from txaws.testing.producers import StringBodyProducer
 
@@ -64,6 +76,51 @@ class URLContextTests(TestCase):
             url_context(**params),
         )
 
+    def test_slots(self):
+        """
+        URL contexts and their query arguments have no instance dictionary.
+        """
+        context = url_context(
+            scheme="https", host="example.invalid", port=None, path=[],
+            query=[("bar",)],
+        )
+        self.assertFalse(hasattr(context, "__dict__"))
+        self.assertFalse(hasattr(context.query[0], "__dict__"))
+
+
+class RequestDetailsTests(TestCase):
+    """
+    Tests for L{RequestDetails}.
+    """
+    def details(self, **kw):
+        return RequestDetails(
+            region=b"us-east-1", service=b"s3", method=b"GET",
+            url_context=None, **kw
+        )
+
+    def test_frozen(self):
+        """
+        The metadata and AMZ headers are frozen.
+        """
+        details = self.details(
+            metadata={"color": "blue"}, amz_headers={"acl": "private"},
+        )
+        self.assertEqual(
+            (pmap({"color": "blue"}), pmap({"acl": "private"})),
+            (details.metadata, details.amz_headers),
+        )
+
+    def test_empty_shared(self):
+        """
+        Empty metadata and AMZ headers, given or not, are all the same
+        empty L{PMap}.
+        """
+        first = self.details(metadata={}, amz_headers={})
+        second = self.details()
+        self.assertEqual(pmap(), first.metadata)
+        self.assertIdentical(first.metadata, first.amz_headers)
+        self.assertIdentical(first.metadata, second.metadata)
+
 
 class ErrorWrapperTestCase(TestCase):
 
@@ -310,10 +367,10 @@ class StreamingBodyReceiverTestCase(TestCase):
         receiver.finished = d
         receiver.content_length = 5
         fd = receiver._fd
-        receiver.dataReceived('hello')
+        receiver.dataReceived(b'hello')
         why = Failure(ResponseDone('done'))
         receiver.connectionLost(why)
-        self.assertEqual(d.result, 'hello')
+        self.assertEqual(d.result, b'hello')
         self.assert_(fd.closed)
 
     def test_readback_mode_off(self):
@@ -327,7 +384,7 @@ class StreamingBodyReceiverTestCase(TestCase):
         receiver.finished = d
         receiver.content_length = 5
         fd = receiver._fd
-        receiver.dataReceived('hello')
+        receiver.dataReceived(b'hello')
         why = Failure(ResponseDone('done'))
         receiver.connectionLost(why)
         self.assertIdentical(d.result, fd)
@@ -342,6 +399,182 @@ class StreamingBodyReceiverTestCase(TestCase):
         receiver = StreamingBodyReceiver(user_fd)
         self.assertIdentical(receiver._fd, user_fd)
 
+    def test_max_size_content_length(self):
+        """
+        If the Content-Length of the response exceeds C{max_size}, the
+        connection is dropped and C{finished} fails with
+        L{ResponseTooLarge} without waiting for the body.
+        """
+        receiver = StreamingBodyReceiver(max_size=4)
+        receiver.finished = d = Deferred()
+        receiver.content_length = 5
+        transport = StringTransport()
+        receiver.makeConnection(transport)
+        self.assertTrue(transport.disconnecting)
+        self.failureResultOf(d, ResponseTooLarge)
+        receiver.connectionLost(Failure(ResponseFailed([])))
+
+    def test_max_size_exceeded(self):
+        """
+        If more than C{max_size} bytes of a body of unknown length are
+        received, the connection is dropped, C{finished} fails with
+        L{ResponseTooLarge} and no more data is kept.
+        """
+        receiver = StreamingBodyReceiver(BytesIO(), max_size=4)
+        receiver.finished = d = Deferred()
+        receiver.content_length = UNKNOWN_LENGTH
+        transport = StringTransport()
+        receiver.makeConnection(transport)
+        receiver.dataReceived(b"abc")
+        self.assertNoResult(d)
+        receiver.dataReceived(b"de")
+        self.assertTrue(transport.disconnecting)
+        self.failureResultOf(d, ResponseTooLarge)
+        receiver.dataReceived(b"f")
+        receiver.connectionLost(Failure(ResponseDone()))
+
+    def test_max_size_reached(self):
+        """
+        A body of exactly C{max_size} bytes is accepted.
+        """
+        receiver = StreamingBodyReceiver(BytesIO(), max_size=4)
+        receiver.finished = d = Deferred()
+        receiver.content_length = 4
+        receiver.makeConnection(StringTransport())
+        receiver.dataReceived(b"abcd")
+        receiver.connectionLost(Failure(ResponseDone()))
+        self.assertEqual(b"abcd", self.successResultOf(d))
+
+
+class SpoolingReceiverFactoryTests(TestCase):
+    """
+    Tests for L{spooling_receiver_factory}.
+    """
+    def _receive(self, receiver, data):
+        receiver.finished = d = Deferred()
+        receiver.content_length = len(data)
+        receiver.makeConnection(StringTransport())
+        receiver.dataReceived(data)
+        receiver.connectionLost(Failure(ResponseDone()))
+        return d
+
+    def test_spills_to_disk(self):
+        """
+        A body larger than C{max_memory} is moved to disk and is still
+        delivered as L{bytes}.
+        """
+        receiver = spooling_receiver_factory(max_memory=4)()
+        fd = receiver._fd
+        d = self._receive(receiver, b"hello world")
+        self.assertTrue(fd._rolled)
+        self.assertEqual(b"hello world", self.successResultOf(d))
+        self.assertTrue(fd.closed)
+
+    def test_small_body_in_memory(self):
+        """
+        A body no larger than C{max_memory} is kept in memory.
+        """
+        receiver = spooling_receiver_factory(max_memory=64)()
+        fd = receiver._fd
+        d = self._receive(receiver, b"hello world")
+        self.assertFalse(fd._rolled)
+        self.assertEqual(b"hello world", self.successResultOf(d))
+
+    def test_readback_off(self):
+        """
+        If C{readback} is C{False}, the spooled file is delivered,
+        positioned at its start.
+        """
+        receiver = spooling_receiver_factory(max_memory=4, readback=False)()
+        d = self._receive(receiver, b"hello world")
+        fd = self.successResultOf(d)
+        self.addCleanup(fd.close)
+        self.assertEqual(b"hello world", fd.read())
+
+    def test_max_size(self):
+        """
+        C{max_size} is enforced by the receivers.
+        """
+        receiver = spooling_receiver_factory(max_memory=4, max_size=8)()
+        d = self._receive(receiver, b"hello world")
+        self.failureResultOf(d, ResponseTooLarge)
+
+
+
+@implementer(IConsumer)
+class RecordingConsumer:
+    """
+    An L{IConsumer} which records what happens to it.
+    """
+    def __init__(self):
+        self.producer = None
+        self.streaming = None
+        self.unregistered = False
+        self.data = []
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+        self.streaming = streaming
+
+    def unregisterProducer(self):
+        self.unregistered = True
+
+    def write(self, data):
+        self.data.append(data)
+
+
+class ConsumerBodyReceiverTestCase(TestCase):
+    """
+    Tests for L{ConsumerBodyReceiver}.
+    """
+    def setUp(self):
+        self.consumer = RecordingConsumer()
+        self.receiver = ConsumerBodyReceiver(self.consumer)
+        self.receiver.finished = self.finished = Deferred()
+        self.receiver.content_length = 10
+        self.transport = StringTransport()
+        self.receiver.makeConnection(self.transport)
+
+    def test_producer(self):
+        """
+        The response transport is registered with the consumer as a
+        streaming producer.
+        """
+        self.assertIs(self.transport, self.consumer.producer)
+        self.assertTrue(self.consumer.streaming)
+
+    def test_data_written(self):
+        """
+        Bytes are written to the consumer as they are received and
+        C{finished} fires with C{None} once they all have been.
+        """
+        self.receiver.dataReceived(b"hello")
+        self.assertEqual([b"hello"], self.consumer.data)
+        self.receiver.dataReceived(b"world")
+        self.assertEqual([b"hello", b"world"], self.consumer.data)
+        self.assertNoResult(self.finished)
+        self.receiver.connectionLost(Failure(ResponseDone()))
+        self.assertIs(None, self.successResultOf(self.finished))
+        self.assertTrue(self.consumer.unregistered)
+
+    def test_short_body(self):
+        """
+        If the response ends before C{content_length} bytes are received,
+        C{finished} fails with L{StreamingError}.
+        """
+        self.receiver.dataReceived(b"hello")
+        self.receiver.connectionLost(Failure(ResponseDone()))
+        self.failureResultOf(self.finished, StreamingError)
+        self.assertTrue(self.consumer.unregistered)
+
+    def test_connection_lost(self):
+        """
+        If the response fails, C{finished} fails with the reason.
+        """
+        self.receiver.dataReceived(b"hello")
+        self.receiver.connectionLost(Failure(ResponseFailed([])))
+        self.failureResultOf(self.finished, ResponseFailed)
+        self.assertTrue(self.consumer.unregistered)
 
 
 @attr.s
@@ -355,6 +588,17 @@ class StubAgent:
         return result
 
 
+@attr.s
+class StubResponse:
+    code = attr.ib()
+    length = attr.ib()
+    protocol = attr.ib(default=None)
+
+    def deliverBody(self, protocol):
+        self.protocol = protocol
+        protocol.makeConnection(StringTransport())
+
+
 class QueryTestCase(TestCase):
     """
     Tests for L{query}.
@@ -468,3 +712,413 @@ class QueryTestCase(TestCase):
         )
         # It's hard to make an assertion about the bodyProducer or I
         # would do that too.
+
+    def test_canonical_request_streaming(self):
+        """
+        The canonical request of a request whose body is signed a chunk at
+        a time signs the headers describing the chunks too.
+        """
+        details = RequestDetails(
+            region=b"us-east-1",
+            service=b"s3",
+            method=b"PUT",
+            url_context=base.url_context(
+                scheme="https", host="example.invalid", port=None, path=[],
+            ),
+            body_producer=StringBodyProducer(b"hello"),
+            content_sha256=STREAMING_PAYLOAD,
+        )
+        query = base.query(credentials=self.credentials, details=details)
+        headers = Headers({
+            b"host": [b"example.invalid"],
+            b"x-amz-date": [b"20090213T233130Z"],
+            b"x-amz-content-sha256": [STREAMING_PAYLOAD.encode("ascii")],
+            b"content-encoding": [b"gzip"],
+        })
+        base._set_streaming_headers(headers, 5)
+        self.assertEqual(
+            [b"aws-chunked,gzip"], headers.getRawHeaders(b"content-encoding"),
+        )
+        self.assertEqual(
+            [b"5"], headers.getRawHeaders(b"x-amz-decoded-content-length"),
+        )
+        request = query._canonical_request(headers, streaming=True)
+        self.assertEqual(
+            "content-encoding;host;x-amz-content-sha256;x-amz-date;"
+            "x-amz-decoded-content-length",
+            request.signed_headers,
+        )
+
+    def test_canonical_request_path(self):
+        """
+        The path of the canonical request is encoded once for S3, as it is
+        in the URL which is sent, and twice for any other service.
+        """
+        for service, canonical_uri in [
+            (b"s3", "/my%20bucket/a%20b"),
+            (b"route53", "/my%2520bucket/a%2520b"),
+        ]:
+            details = RequestDetails(
+                region=b"us-east-1",
+                service=service,
+                method=b"GET",
+                url_context=base.url_context(
+                    scheme="https", host="example.invalid", port=None,
+                    path=["my bucket", "a b"],
+                ),
+            )
+            query = base.query(credentials=self.credentials, details=details)
+            request = query._canonical_request(
+                Headers({b"host": [b"example.invalid"]}),
+            )
+            self.assertEqual(canonical_uri, request.canonical_uri)
+
+    def test_receiver_factory(self):
+        """
+        The body of a successful response is delivered to the protocol
+        created by the receiver factory passed to C{submit} and the
+        result of the request is the response and the result of the
+        protocol.
+        """
+        receivers = []
+
+        class Receiver(Protocol):
+            def connectionMade(self):
+                receivers.append(self)
+
+        response = StubResponse(code=200, length=0)
+        query = base.query(credentials=None, details=None)
+        d = query._handle_response(response, Receiver)
+        [receiver] = receivers
+        self.assertIs(receiver, response.protocol)
+        receiver.finished.callback("result")
+        self.assertEqual((response, "result"), self.successResultOf(d))
+
+    def test_request_timer(self):
+        """
+        If the query has a request timer, the response and the bytes of its
+        body are recorded by it.
+        """
+        clock = Clock()
+        timings = []
+
+        class Observer:
+            request_finished = timings.append
+
+        class Receiver(Protocol):
+            def connectionLost(self, reason):
+                self.finished.callback("result")
+
+        timer = _timer(Observer(), clock, b"s3", b"GET", None, None)
+        response = StubResponse(code=200, length=3)
+        query = base.query(credentials=None, details=None)
+        clock.advance(2)
+        d = query._handle_response(response, Receiver, timer)
+        d.addCallback(timer.finished)
+        response.protocol.dataReceived(b"abc")
+        clock.advance(1)
+        response.protocol.connectionLost(Failure(ResponseDone()))
+        self.assertEqual((response, "result"), self.successResultOf(d))
+        [timing] = timings
+        self.assertEqual(
+            (200, 3, {RESPONSE: 2, BODY: 1}),
+            (timing.status, timing.bytes_in, dict(timing.phases)),
+        )
+
+    def test_error_response_receiver(self):
+        """
+        The body of an error response is collected into memory even if
+        the receiver factory would not do so, keeping the size limit of
+        the receiver the factory creates.
+        """
+        response = StubResponse(code=404, length=0)
+        query = base.query(credentials=None, details=None)
+        query._handle_response(
+            response,
+            spooling_receiver_factory(max_size=10, readback=False),
+        )
+        self.assertIsInstance(response.protocol, StreamingBodyReceiver)
+        self.assertTrue(response.protocol._readback)
+        self.assertEqual(10, response.protocol.max_size)
+
+    def test_submit_retry(self):
+        """
+        If the query has a retry policy, a request failing with a retryable
+        error is issued again with its body rewound, and the file of the
+        body is closed once the query is done.
+        """
+        clock = Clock()
+        bodies = []
+        results = [
+            fail(TwistedWebError(b"503", response=b"")),
+            succeed("response"),
+        ]
+
+        def submit_once(self, agent, receiver_factory, utcnow, body_producer):
+            bodies.append(body_producer._inputFile.read())
+            return results.pop(0)
+        self.patch(base._Query, "_submit_once", submit_once)
+
+        fileobj = BytesIO(b"hello")
+        details = RequestDetails(
+            region=b"us-east-1",
+            service=b"s3",
+            method=b"PUT",
+            url_context=base.url_context(
+                scheme="https", host="example.invalid", port=None, path=[],
+            ),
+            body_producer=FileBodyProducer(fileobj),
+        )
+        query = base.query(
+            credentials=self.credentials,
+            details=details,
+            retry_policy=retry_policy(reactor=clock),
+        )
+        d = query.submit(self.agent, utcnow=self.utcnow)
+        self.assertEqual([b"hello"], bodies)
+        self.assertFalse(fileobj.closed)
+        clock.advance(60)
+        self.assertEqual([b"hello", b"hello"], bodies)
+        self.assertEqual("response", self.successResultOf(d))
+        self.assertTrue(fileobj.closed)
+
+    def test_submit_scheduler(self):
+        """
+        If the query has a scheduler, the request is issued when the
+        scheduler allows it.
+        """
+        started = []
+
+        def submit_once(self, agent, receiver_factory, utcnow, body_producer):
+            started.append(Deferred())
+            return started[-1]
+        self.patch(base._Query, "_submit_once", submit_once)
+
+        details = RequestDetails(
+            region=b"us-east-1",
+            service=b"s3",
+            method=b"GET",
+            url_context=base.url_context(
+                scheme="https", host="example.invalid", port=None, path=[],
+            ),
+        )
+        scheduler = request_scheduler(max_in_flight_per_host=1, reactor=Clock())
+        query = base.query(
+            credentials=self.credentials,
+            details=details,
+            scheduler=scheduler,
+        )
+        first = query.submit(self.agent, utcnow=self.utcnow)
+        second = query.submit(self.agent, utcnow=self.utcnow)
+        self.assertEqual(1, len(started))
+        self.assertEqual(1, scheduler.queue_depth("example.invalid"))
+        started[0].callback("first")
+        self.assertEqual("first", self.successResultOf(first))
+        self.assertEqual(2, len(started))
+        started[1].callback("second")
+        self.assertEqual("second", self.successResultOf(second))
+
+    def test_submit_coalescer(self):
+        """
+        If the query has a coalescer, a GET request made while an identical
+        one is in flight shares its result.  Requests which write and
+        requests with a receiver are each issued.
+        """
+        started = []
+
+        def submit_once(self, agent, receiver_factory, utcnow, body_producer):
+            started.append(Deferred())
+            return started[-1]
+        self.patch(base._Query, "_submit_once", submit_once)
+
+        def details(method):
+            return RequestDetails(
+                region=b"us-east-1",
+                service=b"s3",
+                method=method,
+                url_context=base.url_context(
+                    scheme="https", host="example.invalid", port=None,
+                    path=[],
+                ),
+            )
+        coalescer = request_coalescer()
+
+        def submit(method, receiver_factory=None):
+            query = base.query(
+                credentials=self.credentials,
+                details=details(method),
+                coalescer=coalescer,
+            )
+            return query.submit(
+                self.agent, receiver_factory=receiver_factory,
+                utcnow=self.utcnow,
+            )
+
+        first = submit(b"GET")
+        second = submit(b"GET")
+        self.assertEqual(1, len(started))
+        submit(b"PUT")
+        submit(b"PUT")
+        self.assertEqual(3, len(started))
+        submit(b"GET", receiver_factory=Protocol)
+        self.assertEqual(4, len(started))
+        started[0].callback("response")
+        self.assertEqual("response", self.successResultOf(first))
+        self.assertEqual("response", self.successResultOf(second))
+        self.assertEqual(1, coalescer.coalesced)
+
+    def test_submit_connection_pool(self):
+        """
+        If no agent is given to C{submit}, the request is issued using an
+        agent from the query's connection pool.
+        """
+        requested = []
+        agent = self.agent
+
+        class Pool:
+            def get_agent(self, scheme, host, port):
+                requested.append((scheme, host, port))
+                return agent
+
+        details = RequestDetails(
+            region=REGION_US_EAST_1.encode("ascii"),
+            service=b"iam",
+            method=b"GET",
+            url_context=base.url_context(
+                scheme="https", host="example.invalid", port=None, path=[],
+            ),
+        )
+        query = base.query(
+            credentials=self.credentials,
+            details=details,
+            connection_pool=Pool(),
+        )
+        self.assertNoResult(query.submit(utcnow=self.utcnow))
+        self.assertEqual([("https", "example.invalid", None)], requested)
+        self.assertEqual(1, len(self.agent._requests))
+
+
+class ConnectionPoolTests(TestCase):
+    """
+    Tests for L{txaws.client.base.connection_pool}.
+    """
+    def setUp(self):
+        self.reactor = Clock()
+        self.patch(os, "environ", {})
+
+    def test_pool_configuration(self):
+        """
+        The L{HTTPConnectionPool} instances created by the pool are
+        persistent and use the configured idle connection limit and
+        timeout.
+        """
+        pools = connection_pool(
+            reactor=self.reactor,
+            max_persistent_per_host=7,
+            idle_timeout=13,
+        )
+        pool = pools.get_pool("https", "example.invalid")
+        self.assertTrue(pool.persistent)
+        self.assertEqual(7, pool.maxPersistentPerHost)
+        self.assertEqual(13, pool.cachedConnectionTimeout)
+
+    def test_agent_reused(self):
+        """
+        L{_ConnectionPool.get_agent} returns the same agent each time it is
+        called for the same endpoint, regardless of whether the endpoint
+        is described using L{bytes} or L{str} or with an explicit default
+        port.
+        """
+        pools = connection_pool(reactor=self.reactor)
+        agent = pools.get_agent("https", "example.invalid")
+        self.assertIs(agent, pools.get_agent(b"https", b"example.invalid"))
+        self.assertIs(agent, pools.get_agent("https", "example.invalid", 443))
+
+    def test_distinct_endpoints(self):
+        """
+        L{_ConnectionPool.get_agent} returns different agents using
+        different L{HTTPConnectionPool} instances for endpoints which
+        differ in scheme, host, port or certificate verification.
+        """
+        pools = connection_pool(reactor=self.reactor)
+        endpoints = [
+            ("https", "example.invalid", None, True),
+            ("http", "example.invalid", None, True),
+            ("https", "example.com", None, True),
+            ("https", "example.invalid", 8443, True),
+            ("https", "example.invalid", None, False),
+        ]
+        agents = list(pools.get_agent(*e) for e in endpoints)
+        self.assertEqual(len(endpoints), len(set(map(id, agents))))
+        self.assertEqual(
+            len(endpoints),
+            len(set(id(pools.get_pool(*e)) for e in endpoints)),
+        )
+
+    def test_proxy(self):
+        """
+        If a proxy is configured in the environment, requests are issued
+        through it using a different agent and pool than requests issued
+        directly.
+        """
+        pools = connection_pool(reactor=self.reactor)
+        direct = pools.get_agent("http", "example.invalid")
+        os.environ["http_proxy"] = "http://proxy.invalid:3128/"
+        proxied = pools.get_agent("http", "example.invalid")
+        self.assertIsNot(direct, proxied)
+        self.assertIsNot(
+            direct._pool, proxied._pool,
+        )
+
+    def test_close(self):
+        """
+        L{_ConnectionPool.close} closes the cached connections of every
+        L{HTTPConnectionPool} and later requests get new agents.
+        """
+        pools = connection_pool(reactor=self.reactor)
+        agent = pools.get_agent("https", "example.invalid")
+        closed = []
+        pool = pools.get_pool("https", "example.invalid")
+        self.patch(
+            pool, "closeCachedConnections",
+            lambda: closed.append(pool) or succeed(None),
+        )
+        self.successResultOf(pools.close())
+        self.assertEqual([pool], closed)
+        self.assertIsNot(agent, pools.get_agent("https", "example.invalid"))
+
+    def test_max_endpoints(self):
+        """
+        Beyond C{max_endpoints} endpoints, the pool of the least recently
+        used is forgotten and its idle connections are closed.
+        """
+        pools = connection_pool(reactor=self.reactor, max_endpoints=2)
+        agents = [
+            pools.get_agent("https", host)
+            for host in ["a.invalid", "b.invalid"]
+        ]
+        pool = pools.get_pool("https", "b.invalid")
+        closed = []
+        self.patch(
+            pool, "closeCachedConnections",
+            lambda: closed.append(pool) or succeed(None),
+        )
+        pools.get_agent("https", "a.invalid")
+        pools.get_agent("https", "c.invalid")
+        self.assertEqual([pool], closed)
+        self.assertIs(agents[0], pools.get_agent("https", "a.invalid"))
+        self.assertIsNot(agents[1], pools.get_agent("https", "b.invalid"))
+
+    def test_default(self):
+        """
+        L{default_connection_pool} returns the same pool each time it is
+        called for a reactor.
+        """
+        self.assertIs(
+            default_connection_pool(self.reactor),
+            default_connection_pool(self.reactor),
+        )
+        self.assertIsNot(
+            default_connection_pool(self.reactor),
+            default_connection_pool(Clock()),
+        )
@@ -0,0 +1,161 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client._chunked}.
+"""
+
+from twisted.internet.defer import Deferred
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import TestCase
+from twisted.web.iweb import UNKNOWN_LENGTH
+
+from txaws.client._chunked import (
+    MIN_CHUNK_SIZE, SignedChunkProducer, encoded_length,
+)
+from txaws.testing.producers import StringBodyProducer
+
+
+class NumberingSigner:
+    """
+    A chunk signer giving each chunk its number and length, padded like a
+    real signature.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def sign(self, chunk):
+        self.chunks.append(bytes(chunk))
+        return "{}-{}".format(len(self.chunks), len(chunk)).ljust(64, "x")
+
+
+class PiecewiseProducer:
+    """
+    A producer writing its body in pieces when the test asks.
+    """
+    def __init__(self, length):
+        self.length = length
+        self.finished = Deferred()
+        self.consumer = None
+        self.calls = []
+
+    def startProducing(self, consumer):
+        self.consumer = consumer
+        return self.finished
+
+    def pauseProducing(self):
+        self.calls.append("pause")
+
+    def resumeProducing(self):
+        self.calls.append("resume")
+
+    def stopProducing(self):
+        self.calls.append("stop")
+
+
+def chunk(number, data):
+    signature = "{}-{}".format(number, len(data)).ljust(64, "x")
+    return b"%x;chunk-signature=%s\r\n%s\r\n" % (
+        len(data), signature.encode("ascii"), data,
+    )
+
+
+class EncodedLengthTests(TestCase):
+    """
+    Tests for L{encoded_length}.
+    """
+    def test_example(self):
+        """
+        The encoded length of the example body in the S3 documentation is
+        the one given there.
+        """
+        self.assertEqual(66824, encoded_length(66560, 65536))
+
+    def test_empty(self):
+        """
+        An empty body is encoded as only the final chunk.
+        """
+        self.assertEqual(len(chunk(1, b"")), encoded_length(0, 65536))
+
+
+class SignedChunkProducerTests(TestCase):
+    """
+    Tests for L{SignedChunkProducer}.
+    """
+    def setUp(self):
+        self.signer = NumberingSigner()
+        self.transport = StringTransport()
+
+    def test_chunks(self):
+        """
+        The body is written in signed chunks of the chunk size, then the
+        rest, then an empty chunk, and is as long as the producer says.
+        """
+        data = b"".join(
+            bytes([i]) * MIN_CHUNK_SIZE for i in range(2)
+        ) + b"rest"
+        producer = SignedChunkProducer(
+            StringBodyProducer(data), self.signer, MIN_CHUNK_SIZE,
+        )
+        self.successResultOf(producer.startProducing(self.transport))
+        expected = b"".join([
+            chunk(1, data[:MIN_CHUNK_SIZE]),
+            chunk(2, data[MIN_CHUNK_SIZE:2 * MIN_CHUNK_SIZE]),
+            chunk(3, b"rest"),
+            chunk(4, b""),
+        ])
+        self.assertEqual(expected, self.transport.value())
+        self.assertEqual(len(expected), producer.length)
+
+    def test_streamed(self):
+        """
+        Each chunk is written as soon as it is complete, holding no more
+        than one chunk.
+        """
+        body = PiecewiseProducer(MIN_CHUNK_SIZE + 10)
+        producer = SignedChunkProducer(body, self.signer, MIN_CHUNK_SIZE)
+        d = producer.startProducing(self.transport)
+        body.consumer.write(b"a" * (MIN_CHUNK_SIZE - 1))
+        self.assertEqual(b"", self.transport.value())
+        body.consumer.write(b"a" * 11)
+        self.assertEqual(
+            chunk(1, b"a" * MIN_CHUNK_SIZE), self.transport.value(),
+        )
+        self.assertEqual(10, len(producer._buffer))
+        self.assertNoResult(d)
+        body.finished.callback(None)
+        self.assertIdentical(None, self.successResultOf(d))
+        self.assertEqual(
+            [b"a" * MIN_CHUNK_SIZE, b"a" * 10, b""], self.signer.chunks,
+        )
+
+    def test_flow_control(self):
+        """
+        Pausing, resuming and stopping the producer does the same to the
+        producer of the body.
+        """
+        body = PiecewiseProducer(0)
+        producer = SignedChunkProducer(body, self.signer)
+        producer.startProducing(self.transport)
+        producer.pauseProducing()
+        producer.resumeProducing()
+        producer.stopProducing()
+        self.assertEqual(["pause", "resume", "stop"], body.calls)
+
+    def test_unknown_length(self):
+        """
+        A body of unknown length cannot be chunked, since the length must
+        be declared before it is sent.
+        """
+        self.assertRaises(
+            ValueError, SignedChunkProducer, PiecewiseProducer(UNKNOWN_LENGTH),
+            self.signer,
+        )
+
+    def test_chunk_size(self):
+        """
+        A chunk size smaller than S3 accepts is refused.
+        """
+        self.assertRaises(
+            ValueError, SignedChunkProducer, PiecewiseProducer(0),
+            self.signer, MIN_CHUNK_SIZE - 1,
+        )
@@ -0,0 +1,123 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.coalescing}.
+"""
+
+from twisted.internet.defer import CancelledError, Deferred
+from twisted.trial.unittest import TestCase
+
+from txaws.client.coalescing import request_coalescer
+
+
+class RequestCoalescerTests(TestCase):
+    """
+    Tests for L{request_coalescer}.
+    """
+    def setUp(self):
+        self.coalescer = request_coalescer()
+        self.requests = []
+        self.cancelled = []
+
+    def request(self, name):
+        d = Deferred(lambda d: self.cancelled.append(name))
+        self.requests.append((name, d))
+        return d
+
+    def test_shared(self):
+        """
+        A request made while an identical one is in flight is not issued
+        and is given the result of the one in flight.
+        """
+        first = self.coalescer.coalesce("key", self.request, "first")
+        second = self.coalescer.coalesce("key", self.request, "second")
+        self.assertEqual(["first"], [name for (name, d) in self.requests])
+        self.assertNoResult(second)
+        self.requests[0][1].callback("result")
+        self.assertEqual("result", self.successResultOf(first))
+        self.assertEqual("result", self.successResultOf(second))
+        self.assertEqual(1, self.coalescer.coalesced)
+
+    def test_distinct(self):
+        """
+        Requests with different keys are each issued.
+        """
+        self.coalescer.coalesce("a", self.request, "first")
+        self.coalescer.coalesce("b", self.request, "second")
+        self.assertEqual(
+            ["first", "second"], [name for (name, d) in self.requests],
+        )
+        self.assertEqual(0, self.coalescer.coalesced)
+
+    def test_failure(self):
+        """
+        If the request in flight fails, the requests sharing it fail the
+        same way.
+        """
+        first = self.coalescer.coalesce("key", self.request, "first")
+        second = self.coalescer.coalesce("key", self.request, "second")
+        self.requests[0][1].errback(ValueError("broken"))
+        self.failureResultOf(first, ValueError)
+        self.failureResultOf(second, ValueError)
+
+    def test_synchronous_exception(self):
+        """
+        If issuing the request raises an exception, the result fails with
+        it.
+        """
+        def broken():
+            raise ValueError("broken")
+        self.failureResultOf(self.coalescer.coalesce("key", broken), ValueError)
+        # Nothing is left in flight.
+        d = self.coalescer.coalesce("key", self.request, "again")
+        self.assertEqual(["again"], [name for (name, d) in self.requests])
+        self.assertNoResult(d)
+
+    def test_issued_again(self):
+        """
+        Once a request has finished an identical one is issued anew.
+        """
+        first = self.coalescer.coalesce("key", self.request, "first")
+        self.requests[0][1].callback("old")
+        self.assertEqual("old", self.successResultOf(first))
+        second = self.coalescer.coalesce("key", self.request, "second")
+        self.assertEqual(
+            ["first", "second"], [name for (name, d) in self.requests],
+        )
+        self.requests[1][1].callback("new")
+        self.assertEqual("new", self.successResultOf(second))
+        self.assertEqual(0, self.coalescer.coalesced)
+
+    def test_cancel_one(self):
+        """
+        Cancelling one caller's result, even the first's, cancels only
+        that caller's wait and not the request the others share.
+        """
+        first = self.coalescer.coalesce("key", self.request, "first")
+        second = self.coalescer.coalesce("key", self.request, "second")
+        first.cancel()
+        self.failureResultOf(first, CancelledError)
+        self.assertNoResult(second)
+        self.assertEqual([], self.cancelled)
+        self.requests[0][1].callback("result")
+        self.assertEqual("result", self.successResultOf(second))
+
+    def test_cancel_all(self):
+        """
+        Once every caller has cancelled, the request is cancelled and the
+        next identical request is issued anew.
+        """
+        first = self.coalescer.coalesce("key", self.request, "first")
+        second = self.coalescer.coalesce("key", self.request, "second")
+        second.cancel()
+        self.assertEqual([], self.cancelled)
+        first.cancel()
+        self.failureResultOf(first, CancelledError)
+        self.failureResultOf(second, CancelledError)
+        self.assertEqual(["first"], self.cancelled)
+        third = self.coalescer.coalesce("key", self.request, "third")
+        self.assertEqual(
+            ["first", "third"], [name for (name, d) in self.requests],
+        )
+        self.requests[1][1].callback("result")
+        self.assertEqual("result", self.successResultOf(third))
@@ -0,0 +1,165 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client._consumers}.
+"""
+
+from io import BytesIO
+
+from zope.interface.verify import verifyObject
+
+from twisted.internet.interfaces import IConsumer
+from twisted.trial.unittest import TestCase
+
+from txaws.client._consumers import FileConsumer
+
+
+class ManualThreadPool:
+    """
+    A thread pool stand-in which runs functions only when told to.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        self.calls.append((onResult, f, a, kw))
+
+    def run_one(self):
+        onResult, f, a, kw = self.calls.pop(0)
+        try:
+            result = f(*a, **kw)
+        except Exception as e:
+            onResult(False, e)
+        else:
+            onResult(True, result)
+
+
+class ImmediateReactor:
+    def callFromThread(self, f, *a, **kw):
+        f(*a, **kw)
+
+
+class RecordingProducer:
+    def __init__(self):
+        self.events = []
+
+    def pauseProducing(self):
+        self.events.append("pause")
+
+    def resumeProducing(self):
+        self.events.append("resume")
+
+    def stopProducing(self):
+        self.events.append("stop")
+
+
+class BrokenFile:
+    def write(self, data):
+        raise IOError("disk full")
+
+
+class FileConsumerTests(TestCase):
+    """
+    Tests for L{FileConsumer}.
+    """
+    def setUp(self):
+        self.threadpool = ManualThreadPool()
+        self.producer = RecordingProducer()
+
+    def consumer(self, fileobj, **kw):
+        consumer = FileConsumer(
+            fileobj, ImmediateReactor(), self.threadpool, **kw
+        )
+        consumer.registerProducer(self.producer, True)
+        return consumer
+
+    def test_interface(self):
+        """
+        L{FileConsumer} provides L{IConsumer}.
+        """
+        self.assertTrue(verifyObject(IConsumer, self.consumer(BytesIO())))
+
+    def test_write_in_threadpool(self):
+        """
+        Bytes given to L{FileConsumer.write} are written to the file in the
+        thread pool.
+        """
+        fileobj = BytesIO()
+        consumer = self.consumer(fileobj)
+        consumer.write(b"hello")
+        self.assertEqual(b"", fileobj.getvalue())
+        self.threadpool.run_one()
+        self.assertEqual(b"hello", fileobj.getvalue())
+
+    def test_coalesce(self):
+        """
+        Bytes written while a write is in progress are written to the file
+        together by the next write.
+        """
+        fileobj = BytesIO()
+        consumer = self.consumer(fileobj)
+        consumer.write(b"a")
+        consumer.write(b"b")
+        consumer.write(b"c")
+        self.assertEqual(1, len(self.threadpool.calls))
+        self.threadpool.run_one()
+        self.assertEqual(1, len(self.threadpool.calls))
+        self.threadpool.run_one()
+        self.assertEqual(b"abc", fileobj.getvalue())
+        self.assertEqual([], self.threadpool.calls)
+
+    def test_backpressure(self):
+        """
+        The producer is paused when more than C{buffer_size} bytes are
+        waiting to be written and resumed once they have drained.
+        """
+        fileobj = BytesIO()
+        consumer = self.consumer(fileobj, buffer_size=4)
+        consumer.write(b"abc")
+        consumer.write(b"de")
+        self.assertEqual(["pause"], self.producer.events)
+        self.threadpool.run_one()
+        self.assertEqual(["pause", "resume"], self.producer.events)
+        self.threadpool.run_one()
+        self.assertEqual(b"abcde", fileobj.getvalue())
+
+    def test_finish(self):
+        """
+        L{FileConsumer.finish} returns a L{Deferred} which fires once all
+        of the bytes written so far have been written to the file.
+        """
+        fileobj = BytesIO()
+        consumer = self.consumer(fileobj)
+        self.successResultOf(consumer.finish())
+        consumer.write(b"a")
+        consumer.write(b"b")
+        d = consumer.finish()
+        self.threadpool.run_one()
+        self.assertNoResult(d)
+        self.threadpool.run_one()
+        self.successResultOf(d)
+        self.assertEqual(b"ab", fileobj.getvalue())
+
+    def test_write_failed(self):
+        """
+        If writing to the file fails the producer is stopped and
+        L{FileConsumer.finish} fails with the reason.
+        """
+        consumer = self.consumer(BrokenFile())
+        consumer.write(b"a")
+        d = consumer.finish()
+        self.threadpool.run_one()
+        self.failureResultOf(d, IOError)
+        self.failureResultOf(consumer.finish(), IOError)
+        self.assertEqual(["stop"], self.producer.events)
+        consumer.write(b"b")
+        self.assertEqual([], self.threadpool.calls)
+
+    def test_non_streaming_producer(self):
+        """
+        L{FileConsumer} does not support non-streaming producers.
+        """
+        consumer = FileConsumer(BytesIO(), ImmediateReactor(), self.threadpool)
+        self.assertRaises(
+            ValueError, consumer.registerProducer, self.producer, False,
+        )
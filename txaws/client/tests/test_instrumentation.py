@@ -0,0 +1,221 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.instrumentation}.
+"""
+
+from io import BytesIO
+
+from zope.interface.verify import verifyObject
+
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import TestCase
+from twisted.web.client import FileBodyProducer
+from twisted.web.error import Error as TwistedWebError
+
+from txaws.client.instrumentation import (
+    SIGNING, RESPONSE, BODY, TOTAL, IRequestObserver, RequestTiming,
+    latency_aggregator, latency_histogram, _timer,
+)
+
+
+class Response:
+    code = 200
+
+
+class Receiver:
+    def __init__(self):
+        self.received = []
+
+    def makeConnection(self, transport):
+        self.transport = transport
+
+    def dataReceived(self, data):
+        self.received.append(data)
+
+    def connectionLost(self, reason):
+        self.reason = reason
+
+
+class LatencyHistogramTests(TestCase):
+    """
+    Tests for L{latency_histogram}.
+    """
+    def test_empty(self):
+        """
+        An empty histogram has no percentiles or mean.
+        """
+        histogram = latency_histogram()
+        self.assertEqual(
+            (0, None, None, None),
+            (histogram.count, histogram.mean, histogram.min,
+             histogram.percentile(50)),
+        )
+
+    def test_exact(self):
+        """
+        Small latencies are counted exactly.
+        """
+        histogram = latency_histogram(unit=0.001)
+        for ms in [1, 2, 3, 4]:
+            histogram.record(ms / 1000.0)
+        self.assertAlmostEqual(0.002, histogram.percentile(50))
+        self.assertAlmostEqual(0.003, histogram.percentile(75))
+        self.assertAlmostEqual(0.004, histogram.percentile(100))
+        self.assertAlmostEqual(0.0025, histogram.mean)
+        self.assertEqual((0.001, 0.004), (histogram.min, histogram.max))
+
+    def test_relative_error(self):
+        """
+        Large latencies are kept to the histogram's significant figures.
+        """
+        histogram = latency_histogram(significant_figures=2)
+        values = [0.123456, 1.5, 12.34567, 98.7654]
+        for value in values:
+            histogram.record(value)
+        for n, value in enumerate(values, 1):
+            found = histogram.percentile(100.0 * n / len(values))
+            self.assertTrue(
+                value <= found <= value * 1.01,
+                "{} not within 1% of {}".format(found, value),
+            )
+
+    def test_bounded_memory(self):
+        """
+        The number of buckets depends on the range of latencies, not the
+        number of them.
+        """
+        histogram = latency_histogram()
+        for i in range(10000):
+            histogram.record(5.0 + i / 100000.0)
+        self.assertEqual(10000, histogram.count)
+        # 0.1s of values at about 5s, in buckets about 4ms wide.
+        self.assertTrue(len(histogram._counts) <= 26)
+
+
+class RequestTimerTests(TestCase):
+    """
+    Tests for L{_timer}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.timings = []
+
+    def timer(self, body_producer=None):
+        class Observer:
+            request_finished = self.timings.append
+        return _timer(
+            Observer(), self.clock, b"s3", b"PUT", "mybucket", body_producer,
+        )
+
+    def test_no_observer(self):
+        """
+        There is no timer if there is no observer.
+        """
+        self.assertIdentical(
+            None, _timer(None, self.clock, b"s3", b"GET", None, None),
+        )
+
+    def test_phases(self):
+        """
+        The observer is told the time spent in each phase, the status and
+        the bytes sent and received.
+        """
+        timer = self.timer(FileBodyProducer(BytesIO(b"hello")))
+        self.clock.advance(1)
+        timer.lap(SIGNING)
+        self.clock.advance(2)
+        timer.responded(Response())
+        receiver = Receiver()
+        protocol = timer.counting(receiver)
+        protocol.makeConnection(StringTransport())
+        protocol.dataReceived(b"abc")
+        protocol.dataReceived(b"de")
+        self.clock.advance(3)
+        self.assertEqual("result", timer.finished("result"))
+        self.assertEqual([b"abc", b"de"], receiver.received)
+        self.assertEqual(
+            [RequestTiming(
+                service="s3", action="PUT", bucket="mybucket", status=200,
+                bytes_out=5, bytes_in=5,
+                phases={SIGNING: 1, RESPONSE: 2, BODY: 3},
+            )],
+            self.timings,
+        )
+        self.assertEqual(6, self.timings[0].total)
+
+    def test_error_response(self):
+        """
+        An error response is timed in full and reported as a failure.
+        """
+        timer = self.timer()
+        timer.lap(SIGNING)
+        timer.responded(Response())
+        self.clock.advance(1)
+        reason = Failure(TwistedWebError(b"500"))
+        self.assertIdentical(reason, timer.failed(reason))
+        [timing] = self.timings
+        self.assertTrue(timing.failed)
+        self.assertEqual(
+            {SIGNING: 0, RESPONSE: 0, BODY: 1}, dict(timing.phases),
+        )
+
+    def test_no_response(self):
+        """
+        An attempt which got no response reports only the phases it
+        reached.
+        """
+        timer = self.timer()
+        timer.lap(SIGNING)
+        self.clock.advance(1)
+        timer.failed(Failure(ValueError()))
+        [timing] = self.timings
+        self.assertEqual(
+            (True, None, 0), (timing.failed, timing.status, timing.bytes_out),
+        )
+        self.assertEqual({SIGNING: 0}, dict(timing.phases))
+
+
+class LatencyAggregatorTests(TestCase):
+    """
+    Tests for L{latency_aggregator}.
+    """
+    def test_interface(self):
+        """
+        The aggregator is an L{IRequestObserver}.
+        """
+        verifyObject(IRequestObserver, latency_aggregator())
+
+    def test_aggregate(self):
+        """
+        The aggregator keeps histograms of each phase and of the total for
+        each service and action, and counts requests, failures and bytes.
+        """
+        aggregator = latency_aggregator()
+        aggregator.request_finished(RequestTiming(
+            service="s3", action="GET", status=200, bytes_in=10,
+            bytes_out=0, phases={SIGNING: 0.001, RESPONSE: 0.02, BODY: 0.1},
+        ))
+        aggregator.request_finished(RequestTiming(
+            service="s3", action="GET", status=503, bytes_in=100,
+            bytes_out=None, phases={SIGNING: 0.001, RESPONSE: 0.5},
+            failed=True,
+        ))
+        aggregator.request_finished(RequestTiming(
+            service="ec2", action="DescribeInstances", phases={SIGNING: 1.0},
+        ))
+        self.assertEqual(
+            [("ec2", "DescribeInstances"), ("s3", "GET")], aggregator.keys(),
+        )
+        self.assertEqual(
+            dict(requests=2, failures=1, bytes_in=110, bytes_out=0),
+            aggregator.summary("s3", "GET"),
+        )
+        self.assertEqual(2, aggregator.histogram("s3", "GET", RESPONSE).count)
+        self.assertEqual(1, aggregator.histogram("s3", "GET", BODY).count)
+        total = aggregator.histogram("s3", "GET", TOTAL)
+        self.assertAlmostEqual(0.501, total.max)
+        self.assertIdentical(None, aggregator.histogram("s3", "PUT"))
+        self.assertIdentical(None, aggregator.summary("s3", "PUT"))
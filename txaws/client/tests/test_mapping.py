@@ -0,0 +1,262 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.mapping}.
+"""
+
+import os
+
+from zope.interface.verify import verifyObject
+
+from twisted.internet import reactor
+from twisted.internet.task import Cooperator
+from twisted.trial.unittest import TestCase
+from twisted.web.client import Agent, HTTPConnectionPool, readBody
+from twisted.web.iweb import IBodyProducer
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from txaws.client.mapping import (
+    MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, file_mapping,
+)
+
+
+class RecordingConsumer:
+    """
+    A consumer recording what it is written, pausing its producer after
+    each write if told to.
+    """
+    def __init__(self, pause=False):
+        self.writes = []
+        self.pause = pause
+        self.producer = None
+
+    def write(self, data):
+        self.writes.append(data)
+        if self.pause:
+            self.producer.pauseProducing()
+
+    def value(self):
+        return b"".join(self.writes)
+
+
+def manual_cooperator():
+    """
+    Make a L{Cooperator} which runs one step of its tasks each time the
+    test calls C{run}.
+    """
+    calls = []
+    cooperator = Cooperator(
+        terminationPredicateFactory=lambda: lambda: True,
+        scheduler=calls.append,
+    )
+
+    def run():
+        while calls:
+            calls.pop(0)()
+    cooperator.run = run
+    return cooperator
+
+
+class FileMappingTests(TestCase):
+    """
+    Tests for L{file_mapping}.
+    """
+    def setUp(self):
+        self.path = self.mktemp()
+        self.data = os.urandom(3 * MAX_CHUNK_SIZE + 123)
+        with open(self.path, "wb") as f:
+            f.write(self.data)
+        self.cooperator = manual_cooperator()
+
+    def produce(self, producer, consumer):
+        consumer.producer = producer
+        d = producer.startProducing(consumer)
+        self.cooperator.run()
+        return d
+
+    def test_producer(self):
+        """
+        The producer of a range of a mapped file writes the range to its
+        consumer as L{bytes}.
+        """
+        mapping = file_mapping(self.path)
+        self.assertEqual(len(self.data), mapping.size)
+        producer = mapping.producer(10, 200000, cooperator=self.cooperator)
+        verifyObject(IBodyProducer, producer)
+        self.assertEqual(200000, producer.length)
+        consumer = RecordingConsumer()
+        d = self.produce(producer, consumer)
+        self.assertIdentical(None, self.successResultOf(d))
+        self.assertTrue(all(
+            isinstance(write, bytes) for write in consumer.writes
+        ))
+        self.assertEqual(self.data[10:200010], consumer.value())
+        mapping.close()
+
+    def test_buffers(self):
+        """
+        With C{buffers} true, the producer writes L{memoryview}s of the
+        mapping.
+        """
+        producer = file_mapping(self.path).producer(
+            10, 200000, cooperator=self.cooperator, buffers=True,
+        )
+        consumer = RecordingConsumer()
+        self.successResultOf(self.produce(producer, consumer))
+        self.assertTrue(all(
+            isinstance(write, memoryview) for write in consumer.writes
+        ))
+        self.assertEqual(self.data[10:200010], consumer.value())
+
+    def test_rest(self):
+        """
+        Without a length, the range runs to the end of the file.
+        """
+        with open(self.path, "rb") as f:
+            mapping = file_mapping(f)
+        producer = mapping.producer(
+            len(self.data) - 5, cooperator=self.cooperator,
+        )
+        consumer = RecordingConsumer()
+        self.successResultOf(self.produce(producer, consumer))
+        self.assertEqual(self.data[-5:], consumer.value())
+
+    def test_growing(self):
+        """
+        The chunks written to a consumer which does not pause the producer
+        double up to L{MAX_CHUNK_SIZE}.
+        """
+        producer = file_mapping(self.path).producer(
+            cooperator=self.cooperator,
+        )
+        consumer = RecordingConsumer()
+        self.successResultOf(self.produce(producer, consumer))
+        self.assertEqual(
+            [2 ** 16, 2 ** 17, 2 ** 18, 2 ** 19, MAX_CHUNK_SIZE,
+             MAX_CHUNK_SIZE],
+            [len(write) for write in consumer.writes[:6]],
+        )
+        self.assertEqual(self.data, consumer.value())
+
+    def test_shrinking(self):
+        """
+        The chunks written to a consumer which pauses the producer halve
+        down to L{MIN_CHUNK_SIZE}, and no more is written until it is
+        resumed.
+        """
+        producer = file_mapping(self.path).producer(
+            cooperator=self.cooperator,
+        )
+        consumer = RecordingConsumer(pause=True)
+        d = self.produce(producer, consumer)
+        sizes = []
+        for i in range(4):
+            self.assertEqual(i + 1, len(consumer.writes))
+            sizes.append(len(consumer.writes[-1]))
+            producer.resumeProducing()
+            self.cooperator.run()
+        self.assertEqual(
+            [2 ** 16, 2 ** 15, MIN_CHUNK_SIZE, MIN_CHUNK_SIZE], sizes,
+        )
+        consumer.pause = False
+        producer.resumeProducing()
+        self.cooperator.run()
+        self.successResultOf(d)
+        self.assertEqual(self.data, consumer.value())
+
+    def test_stop(self):
+        """
+        A stopped producer writes no more and its L{Deferred} never fires.
+        """
+        producer = file_mapping(self.path).producer(
+            cooperator=self.cooperator,
+        )
+        consumer = RecordingConsumer(pause=True)
+        d = self.produce(producer, consumer)
+        producer.stopProducing()
+        self.cooperator.run()
+        self.assertEqual(1, len(consumer.writes))
+        self.assertNoResult(d)
+
+    def test_shared(self):
+        """
+        Producers of several ranges share the mapping and each may be
+        produced from after the mapping is closed.
+        """
+        mapping = file_mapping(self.path)
+        producers = [
+            mapping.producer(offset, 1000, cooperator=self.cooperator)
+            for offset in (0, 1000, 2000)
+        ]
+        mapping.close()
+        self.assertRaises(ValueError, mapping.producer)
+        consumer = RecordingConsumer()
+        for producer in producers:
+            self.successResultOf(self.produce(producer, consumer))
+        self.assertEqual(self.data[:3000], consumer.value())
+
+    def test_out_of_range(self):
+        """
+        A range which is not within the file is refused.
+        """
+        mapping = file_mapping(self.path)
+        self.assertRaises(ValueError, mapping.producer, -1)
+        self.assertRaises(ValueError, mapping.producer, 0, -1)
+        self.assertRaises(ValueError, mapping.producer, 1, len(self.data))
+
+    def test_empty(self):
+        """
+        An empty file, which cannot be mapped, produces an empty body.
+        """
+        path = self.mktemp()
+        open(path, "wb").close()
+        producer = file_mapping(path).producer(cooperator=self.cooperator)
+        self.assertEqual(0, producer.length)
+        consumer = RecordingConsumer()
+        self.successResultOf(self.produce(producer, consumer))
+        self.assertEqual([], consumer.writes)
+
+    def test_not_regular(self):
+        """
+        Only a regular file can be mapped.
+        """
+        read, write = os.pipe()
+        self.addCleanup(os.close, write)
+        with os.fdopen(read, "rb") as f:
+            self.assertRaises(ValueError, file_mapping, f)
+
+
+class EchoResource(Resource):
+    isLeaf = True
+
+    def render_PUT(self, request):
+        return request.content.read()
+
+
+class TransportTests(TestCase):
+    """
+    Tests for producers of mapped files writing to real transports.
+    """
+    def test_agent(self):
+        """
+        An L{Agent} sends the body a producer writes over a TCP connection.
+        """
+        path = self.mktemp()
+        data = os.urandom(3 * MAX_CHUNK_SIZE + 123)
+        with open(path, "wb") as f:
+            f.write(data)
+        port = reactor.listenTCP(
+            0, Site(EchoResource()), interface="127.0.0.1",
+        )
+        self.addCleanup(port.stopListening)
+        pool = HTTPConnectionPool(reactor, persistent=False)
+        agent = Agent(reactor, pool=pool)
+        url = "http://127.0.0.1:{}/".format(port.getHost().port)
+        d = agent.request(
+            b"PUT", url.encode("ascii"),
+            bodyProducer=file_mapping(path).producer(),
+        )
+        d.addCallback(readBody)
+        d.addCallback(lambda body: self.assertEqual(data, body))
+        return d
@@ -0,0 +1,120 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.request_log}.
+"""
+
+from twisted.logger import Logger, LogLevel, formatEvent
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+from twisted.web.http_headers import Headers
+
+from txaws.client.request_log import request_log
+
+
+class RequestLogTests(TestCase):
+    """
+    Tests for L{request_log}.
+    """
+    def setUp(self):
+        self.events = []
+        self.logger = Logger(observer=self.events.append)
+        self.headers = Headers({b"host": [b"example.invalid"]})
+
+    def request(self, log):
+        """
+        Log the events for one request as a query does.
+        """
+        sampled = log.sampled()
+        log.signing(
+            sampled, b"s3", b"us-east-1", b"GET", b"https://example.invalid/",
+            self.headers,
+        )
+        log.submitting(
+            sampled, b"GET", b"https://example.invalid/", self.headers,
+        )
+
+    def test_every_request(self):
+        """
+        By default every request is logged at I{info} level.
+        """
+        log = request_log(logger=self.logger)
+        self.request(log)
+        self.request(log)
+        self.assertEqual(
+            [LogLevel.info] * 4,
+            [event["log_level"] for event in self.events],
+        )
+        self.assertEqual(
+            "Submitting query: b'GET' b'https://example.invalid/' "
+            "{!r}".format(self.headers),
+            formatEvent(self.events[1]),
+        )
+
+    def test_headers_not_rendered(self):
+        """
+        The headers are not rendered until the event is formatted.
+        """
+        log = request_log(logger=self.logger)
+        self.request(log)
+        self.assertIdentical(self.headers, self.events[0]["headers"])
+
+    def test_sample(self):
+        """
+        With C{sample} greater than one, only one in that many requests is
+        logged.
+        """
+        log = request_log(logger=self.logger, sample=3, level=LogLevel.debug)
+        for i in range(7):
+            self.request(log)
+        self.assertEqual(
+            [LogLevel.debug] * 4,
+            [event["log_level"] for event in self.events],
+        )
+
+    def test_no_level(self):
+        """
+        With a C{level} of C{None}, no request is logged.
+        """
+        log = request_log(logger=self.logger, level=None)
+        self.request(log)
+        self.assertEqual([], self.events)
+
+    def test_failure(self):
+        """
+        Every failed request is logged at C{failure_level}, whether or not
+        it was sampled, and the failure is passed on.
+        """
+        log = request_log(
+            logger=self.logger, level=None, failure_level=LogLevel.warn,
+        )
+        reason = Failure(ValueError("broken"))
+        result = log.failed(reason, b"GET", b"https://example.invalid/")
+        self.assertIdentical(reason, result)
+        [event] = self.events
+        self.assertEqual(LogLevel.warn, event["log_level"])
+        self.assertEqual(
+            "Query failed: b'GET' b'https://example.invalid/': "
+            "ValueError('broken')",
+            formatEvent(event),
+        )
+
+    def test_no_failure_level(self):
+        """
+        By default, or with a C{failure_level} of C{None}, failures are not
+        logged.
+        """
+        for log in [
+            request_log(logger=self.logger),
+            request_log(logger=self.logger, failure_level=None),
+        ]:
+            log.failed(
+                Failure(ValueError()), b"GET", b"https://example.invalid/",
+            )
+        self.assertEqual([], self.events)
+
+    def test_invalid_sample(self):
+        """
+        C{sample} must be at least one.
+        """
+        self.assertRaises(ValueError, request_log, sample=0)
@@ -0,0 +1,319 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.retry}.
+"""
+
+from io import BytesIO
+
+from twisted.internet.defer import fail, succeed
+from twisted.internet.error import ConnectionRefusedError
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+from twisted.web.client import FileBodyProducer
+from twisted.web.error import Error as TwistedWebError
+
+from txaws.client.mapping import file_mapping
+from txaws.s3.exception import S3Error
+from txaws.client.retry import (
+    THROTTLING, TRANSIENT, retry_budget, retry_policy, _rewinder,
+)
+from txaws.testing.producers import StringBodyProducer
+
+
+def aws_error(status, code):
+    """
+    Make a failure like the one a query fails with for an AWS error
+    response.
+    """
+    body = (
+        b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+        b"<Error><Code>" + code + b"</Code>"
+        b"<Message>Something went wrong.</Message></Error>"
+    )
+    return Failure(TwistedWebError(status, response=body))
+
+
+class FixedRandom:
+    """
+    A stand-in for L{random.Random} which always picks the upper bound.
+    """
+    def uniform(self, a, b):
+        return b
+
+
+class RetryBudgetTests(TestCase):
+    """
+    Tests for L{retry_budget}.
+    """
+    def test_withdraw(self):
+        """
+        A token can be withdrawn for each of the budget's capacity and then
+        no more.
+        """
+        budget = retry_budget(capacity=2, rate=1, clock=Clock())
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+    def test_refill(self):
+        """
+        Tokens are replaced at the budget's rate, up to its capacity.
+        """
+        clock = Clock()
+        budget = retry_budget(capacity=2, rate=0.5, clock=clock)
+        budget.withdraw()
+        budget.withdraw()
+        clock.advance(1)
+        self.assertFalse(budget.withdraw())
+        clock.advance(1)
+        self.assertTrue(budget.withdraw())
+        clock.advance(100)
+        self.assertEqual(2, budget.available())
+
+
+class ClassifyTests(TestCase):
+    """
+    Tests for L{_RetryPolicy.classify}.
+    """
+    def setUp(self):
+        self.policy = retry_policy(reactor=Clock())
+
+    def test_throttling_code(self):
+        """
+        Errors with a throttling error code are L{THROTTLING}.
+        """
+        self.assertEqual(
+            THROTTLING, self.policy.classify(aws_error(b"503", b"SlowDown")),
+        )
+        self.assertEqual(
+            THROTTLING,
+            self.policy.classify(aws_error(b"400", b"Throttling")),
+        )
+        self.assertEqual(
+            THROTTLING,
+            self.policy.classify(aws_error(b"503", b"RequestLimitExceeded")),
+        )
+
+    def test_wrapped_error(self):
+        """
+        The error code of an error a client has wrapped in an
+        L{txaws.exception.AWSError} is found in the body it keeps.
+        """
+        body = b"<Error><Code>SlowDown</Code><Message>Slow</Message></Error>"
+        self.assertEqual(
+            THROTTLING, self.policy.classify(Failure(S3Error(body, b"503"))),
+        )
+
+    def test_status(self):
+        """
+        Errors with no error code in the table are classified by their
+        HTTP status.
+        """
+        self.assertEqual(
+            TRANSIENT,
+            self.policy.classify(Failure(TwistedWebError(b"503", response=b""))),
+        )
+        self.assertEqual(
+            TRANSIENT,
+            self.policy.classify(aws_error(b"500", b"SomethingElse")),
+        )
+
+    def test_not_retryable(self):
+        """
+        Client errors are not retryable.
+        """
+        self.assertIdentical(
+            None, self.policy.classify(aws_error(b"403", b"AccessDenied")),
+        )
+
+    def test_error_code_overrides_status(self):
+        """
+        An error code mapped to C{None} is not retried whatever its status.
+        """
+        policy = retry_policy(reactor=Clock(), error_codes={"Busy": None})
+        self.assertIdentical(
+            None, policy.classify(aws_error(b"503", b"Busy")),
+        )
+
+    def test_connection_error(self):
+        """
+        Failures to connect are L{TRANSIENT}.
+        """
+        self.assertEqual(
+            TRANSIENT, self.policy.classify(Failure(ConnectionRefusedError())),
+        )
+
+    def test_other_error(self):
+        """
+        Other failures are not retryable.
+        """
+        self.assertIdentical(
+            None, self.policy.classify(Failure(ValueError())),
+        )
+
+
+class NextDelayTests(TestCase):
+    """
+    Tests for L{_RetryPolicy.next_delay}.
+    """
+    def test_decorrelated(self):
+        """
+        Each delay is at most three times the previous one.
+        """
+        policy = retry_policy(
+            reactor=Clock(), random=FixedRandom(), base_delay=1,
+            max_delay=100,
+        )
+        delay = policy.next_delay(TRANSIENT, None)
+        self.assertEqual(3, delay)
+        self.assertEqual(9, policy.next_delay(TRANSIENT, delay))
+
+    def test_throttling_base(self):
+        """
+        Throttled requests back off from C{throttling_base_delay}.
+        """
+        policy = retry_policy(
+            reactor=Clock(), random=FixedRandom(), throttling_base_delay=2,
+        )
+        self.assertEqual(6, policy.next_delay(THROTTLING, None))
+
+    def test_max_delay(self):
+        """
+        No delay is longer than C{max_delay}.
+        """
+        policy = retry_policy(
+            reactor=Clock(), random=FixedRandom(), max_delay=5,
+        )
+        self.assertEqual(5, policy.next_delay(TRANSIENT, 4))
+
+    def test_jitter(self):
+        """
+        Delays fall between the base delay and three times the previous
+        delay.
+        """
+        policy = retry_policy(reactor=Clock(), base_delay=1, max_delay=100)
+        for i in range(100):
+            self.assertTrue(1 <= policy.next_delay(TRANSIENT, 2) <= 6)
+
+
+class CallTests(TestCase):
+    """
+    Tests for L{_RetryPolicy.call}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.results = []
+        self.calls = 0
+
+    def request(self):
+        self.calls += 1
+        return self.results.pop(0)
+
+    def policy(self, **kw):
+        return retry_policy(reactor=self.clock, random=FixedRandom(), **kw)
+
+    def test_retry(self):
+        """
+        A request failing with a retryable error is retried after a delay.
+        """
+        self.results = [fail(aws_error(b"503", b"SlowDown")), succeed("ok")]
+        d = self.policy(throttling_base_delay=1).call(self.request)
+        self.assertNoResult(d)
+        self.assertEqual(1, self.calls)
+        self.clock.advance(3)
+        self.assertEqual(2, self.calls)
+        self.assertEqual("ok", self.successResultOf(d))
+
+    def test_max_attempts(self):
+        """
+        A request is made no more than C{max_attempts} times and then fails
+        with the last error.
+        """
+        self.results = [
+            fail(aws_error(b"500", b"InternalError")) for i in range(2)
+        ]
+        d = self.policy(max_attempts=2).call(self.request)
+        self.clock.advance(100)
+        self.assertEqual(2, self.calls)
+        self.failureResultOf(d, TwistedWebError)
+
+    def test_not_retryable(self):
+        """
+        A request failing with an error which is not retryable is not
+        retried.
+        """
+        self.results = [fail(aws_error(b"403", b"AccessDenied"))]
+        d = self.policy().call(self.request)
+        self.assertEqual(1, self.calls)
+        self.failureResultOf(d, TwistedWebError)
+
+    def test_budget(self):
+        """
+        A request is not retried if the budget has no tokens left.
+        """
+        self.results = [
+            fail(aws_error(b"500", b"InternalError")) for i in range(2)
+        ]
+        budget = retry_budget(capacity=1, rate=0, clock=self.clock)
+        d = self.policy(budget=budget).call(self.request)
+        self.clock.advance(100)
+        self.assertEqual(2, self.calls)
+        self.failureResultOf(d, TwistedWebError)
+
+
+class RewinderTests(TestCase):
+    """
+    Tests for L{_rewinder}.
+    """
+    def test_file_body_producer(self):
+        """
+        A L{FileBodyProducer} is rewound to where its file was positioned
+        for each attempt and its file is only closed by C{close}.
+        """
+        fileobj = BytesIO(b"xxhello")
+        fileobj.seek(2)
+        body = _rewinder(FileBodyProducer(fileobj))
+        for i in range(2):
+            producer = body.producer()
+            self.assertEqual(5, producer.length)
+            self.assertEqual(b"hello", producer._inputFile.read())
+            # As the producer does when it has read everything.
+            producer._inputFile.close()
+            self.assertFalse(fileobj.closed)
+        body.close()
+        self.assertTrue(fileobj.closed)
+
+    def test_no_body(self):
+        """
+        A request with no body can be retried, still with no body.
+        """
+        body = _rewinder(None)
+        self.assertIdentical(None, body.producer())
+        body.close()
+
+    def test_mapped_producer(self):
+        """
+        A producer of a mapped file is produced from the start of its range
+        for each attempt, by a copy.
+        """
+        path = self.mktemp()
+        with open(path, "wb") as f:
+            f.write(b"xxhello")
+        producer = file_mapping(path).producer(2)
+        body = _rewinder(producer)
+        first, second = body.producer(), body.producer()
+        self.assertIsNot(first, second)
+        self.assertEqual(
+            [5, 5, b"hello"],
+            [first.length, second.length, bytes(second._view)],
+        )
+        body.close()
+
+    def test_other_producer(self):
+        """
+        Other producers cannot be rewound.
+        """
+        self.assertIdentical(None, _rewinder(StringBodyProducer(b"hello")))
+
@@ -0,0 +1,177 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.scheduler}.
+"""
+
+from twisted.internet.defer import CancelledError, Deferred
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.client.scheduler import SchedulerStats, request_scheduler
+
+
+class RequestSchedulerTests(TestCase):
+    """
+    Tests for L{request_scheduler}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.scheduler = request_scheduler(
+            max_in_flight_per_host=2, reactor=self.clock,
+        )
+        self.requests = []
+
+    def request(self, name):
+        d = Deferred()
+        self.requests.append((name, d))
+        return d
+
+    def started(self):
+        return [name for (name, d) in self.requests]
+
+    def finish(self, name, result=None):
+        for (n, d) in self.requests:
+            if n == name:
+                d.callback(result)
+                return
+        self.fail("{} was not started".format(name))
+
+    def test_immediate(self):
+        """
+        Requests are started immediately while there are fewer than the
+        limit in flight and the result is that of the request.
+        """
+        first = self.scheduler.schedule("a.invalid", self.request, "first")
+        self.scheduler.schedule("a.invalid", self.request, "second")
+        self.assertEqual(["first", "second"], self.started())
+        self.finish("first", "result")
+        self.assertEqual("result", self.successResultOf(first))
+
+    def test_queued(self):
+        """
+        Requests beyond the limit wait until an earlier request to the
+        same host finishes, in the order they were scheduled.
+        """
+        for name in ["a", "b", "c", "d"]:
+            self.scheduler.schedule("a.invalid", self.request, name)
+        self.assertEqual(["a", "b"], self.started())
+        self.assertEqual(2, self.scheduler.queue_depth("a.invalid"))
+        self.finish("b")
+        self.assertEqual(["a", "b", "c"], self.started())
+        self.finish("a")
+        self.assertEqual(["a", "b", "c", "d"], self.started())
+        self.assertEqual(0, self.scheduler.queue_depth())
+
+    def test_hosts_independent(self):
+        """
+        The limit applies to each host separately.
+        """
+        for name in ["a1", "a2", "a3"]:
+            self.scheduler.schedule("a.invalid", self.request, name)
+        self.scheduler.schedule(b"b.invalid", self.request, "b1")
+        self.assertEqual(["a1", "a2", "b1"], self.started())
+
+    def test_priority(self):
+        """
+        Waiting requests with lower priority values start first.
+        """
+        self.scheduler.schedule("a.invalid", self.request, "a")
+        self.scheduler.schedule("a.invalid", self.request, "b")
+        self.scheduler.schedule("a.invalid", self.request, "low", priority=5)
+        self.scheduler.schedule("a.invalid", self.request, "high", priority=-5)
+        self.finish("a")
+        self.assertEqual(["a", "b", "high"], self.started())
+
+    def test_failure_frees_slot(self):
+        """
+        A request which fails stops counting against the limit and its
+        failure is the result.
+        """
+        first = self.scheduler.schedule("a.invalid", self.request, "a")
+        self.scheduler.schedule("a.invalid", self.request, "b")
+        self.scheduler.schedule("a.invalid", self.request, "c")
+        self.requests[0][1].errback(ValueError())
+        self.failureResultOf(first, ValueError)
+        self.assertEqual(["a", "b", "c"], self.started())
+
+    def test_synchronous_exception(self):
+        """
+        A request function which raises an exception results in a failure
+        and frees its slot.
+        """
+        def broken():
+            raise ValueError()
+        d = self.scheduler.schedule("a.invalid", broken)
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(0, self.scheduler.stats().in_flight)
+
+    def test_cancel_queued(self):
+        """
+        Cancelling a waiting request removes it from the queue.
+        """
+        self.scheduler.schedule("a.invalid", self.request, "a")
+        self.scheduler.schedule("a.invalid", self.request, "b")
+        d = self.scheduler.schedule("a.invalid", self.request, "c")
+        self.scheduler.schedule("a.invalid", self.request, "d")
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual(1, self.scheduler.queue_depth())
+        self.finish("a")
+        self.assertEqual(["a", "b", "d"], self.started())
+
+    def test_cancel_started(self):
+        """
+        Cancelling a request which waited and then started cancels the
+        request itself.
+        """
+        self.scheduler.schedule("a.invalid", self.request, "a")
+        self.scheduler.schedule("a.invalid", self.request, "b")
+        d = self.scheduler.schedule("a.invalid", self.request, "c")
+        self.finish("a")
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual(1, self.scheduler.stats().in_flight)
+
+    def test_stats(self):
+        """
+        The stats describe the requests in flight, those waiting and how
+        long requests waited to start.
+        """
+        self.scheduler.schedule("a.invalid", self.request, "a")
+        self.scheduler.schedule("a.invalid", self.request, "b")
+        self.scheduler.schedule("a.invalid", self.request, "c")
+        self.scheduler.schedule("b.invalid", self.request, "d")
+        self.clock.advance(4)
+        self.finish("a")
+        self.assertEqual(
+            SchedulerStats(
+                in_flight=2, queued=0, started=3, total_wait=4.0,
+                max_wait=4.0,
+            ),
+            self.scheduler.stats("a.invalid"),
+        )
+        stats = self.scheduler.stats()
+        self.assertEqual((3, 4), (stats.in_flight, stats.started))
+        self.assertEqual(1.0, stats.mean_wait)
+
+    def test_max_hosts(self):
+        """
+        Beyond C{max_hosts}, the least recently used hosts with no requests
+        in flight or waiting are forgotten, and their stats are still
+        counted in the totals.
+        """
+        scheduler = request_scheduler(
+            max_in_flight_per_host=2, max_hosts=2, reactor=self.clock,
+        )
+        scheduler.schedule("a.invalid", self.request, "a")
+        scheduler.schedule("b.invalid", self.request, "b")
+        self.finish("b")
+        scheduler.schedule("c.invalid", self.request, "c")
+        self.assertEqual(
+            [1, 0, 1],
+            [scheduler.stats(host).started
+             for host in ["a.invalid", "b.invalid", "c.invalid"]],
+        )
+        stats = scheduler.stats()
+        self.assertEqual((2, 3), (stats.in_flight, stats.started))
@@ -0,0 +1,106 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client._validators}.
+"""
+
+import attr
+from attr import validators
+
+from twisted.trial.unittest import TestCase
+
+from txaws.client._validators import list_of, unvalidated
+
+
+@attr.s(slots=True)
+class Thing:
+    name = attr.ib(validator=validators.instance_of(str))
+    tags = attr.ib(
+        default=attr.Factory(list),
+        converter=list,
+        validator=list_of(validators.instance_of(str)),
+    )
+    size = attr.ib(default=0, validator=validators.instance_of(int))
+    _private = attr.ib(default=None)
+
+
+class ListOfTests(TestCase):
+    """
+    Tests for L{list_of}.
+    """
+    def test_valid(self):
+        """
+        A list of valid elements is accepted.
+        """
+        self.assertEqual(["b", "a"], Thing(name="x", tags=["b", "a"]).tags)
+
+    def test_invalid_element(self):
+        """
+        The error for an invalid element identifies it.
+        """
+        exc = self.assertRaises(
+            ValueError, list_of(validators.in_(["a", "b"])),
+            None, attr.fields(Thing).tags, ["b", "c", "a"],
+        )
+        self.assertIn("sorted(tags)[2]", str(exc))
+
+    def test_not_list(self):
+        """
+        A value which is not a list is rejected.
+        """
+        self.assertRaises(
+            TypeError, list_of(validators.instance_of(str)),
+            None, attr.fields(Thing).tags, ("a",),
+        )
+
+
+class UnvalidatedTests(TestCase):
+    """
+    Tests for L{unvalidated}.
+    """
+    def test_no_validation(self):
+        """
+        Invalid values are not rejected.
+        """
+        thing = unvalidated(Thing, name=b"x", size="big")
+        self.assertEqual((b"x", "big"), (thing.name, thing.size))
+
+    def test_defaults(self):
+        """
+        Attributes not given get their defaults and each instance gets its
+        own value from a factory.
+        """
+        first = unvalidated(Thing, name="x")
+        second = unvalidated(Thing, name="y")
+        self.assertEqual(Thing(name="x"), first)
+        self.assertIsNot(first.tags, second.tags)
+
+    def test_converter(self):
+        """
+        Converters are applied.
+        """
+        self.assertEqual(
+            ["a"], unvalidated(Thing, name="x", tags=("a",)).tags,
+        )
+
+    def test_private(self):
+        """
+        Private attributes are initialized without their leading
+        underscore, as with the attrs initializer.
+        """
+        self.assertEqual(
+            Thing(name="x", private=3),
+            unvalidated(Thing, name="x", private=3),
+        )
+
+    def test_missing(self):
+        """
+        L{TypeError} is raised if a mandatory argument is missing.
+        """
+        self.assertRaises(TypeError, unvalidated, Thing)
+
+    def test_unexpected(self):
+        """
+        L{TypeError} is raised for arguments which are not attributes.
+        """
+        self.assertRaises(TypeError, unvalidated, Thing, name="x", color=3)
@@ -6,6 +6,7 @@
 """EC2 client support."""
 
 from datetime import datetime
+from functools import partial
 from urllib.parse import quote
 from base64 import b64encode
 
@@ -26,12 +27,47 @@ def ec2_error_wrapper(error):
 
 
 class EC2Client(BaseClient):
-    """A client for EC2."""
+    """A client for EC2.
+
+    @param retry_policy: The policy deciding whether and when to retry
+        failed requests or C{None} to never retry them.  It is passed to
+        C{query_factory}.
+    @type retry_policy: L{txaws.client.retry._RetryPolicy}
+
+    @param scheduler: The scheduler, possibly shared with other clients,
+        which limits how many requests are in flight to each host or
+        C{None} to issue requests immediately.  It is passed to
+        C{query_factory}.
+    @type scheduler: L{txaws.client.scheduler._RequestScheduler}
+
+    @param request_observer: An observer to tell how long each request
+        spent in each phase or C{None} to not time requests.  It is passed
+        to C{query_factory}.
+    @type request_observer: L{txaws.client.instrumentation.IRequestObserver}
+        provider
+
+    @param coalescer: The coalescer, possibly shared with other clients,
+        which shares one request among identical I{Describe} requests in
+        flight at once or C{None} to issue every request.  It is passed to
+        C{query_factory}.
+    @type coalescer: L{txaws.client.coalescing._RequestCoalescer}
+    """
 
     def __init__(self, creds=None, endpoint=None, query_factory=None,
-                 parser=None):
+                 parser=None, retry_policy=None, scheduler=None,
+                 request_observer=None, coalescer=None):
         if query_factory is None:
             query_factory = Query
+        if retry_policy is not None:
+            query_factory = partial(query_factory, retry_policy=retry_policy)
+        if scheduler is not None:
+            query_factory = partial(query_factory, scheduler=scheduler)
+        if request_observer is not None:
+            query_factory = partial(
+                query_factory, request_observer=request_observer,
+            )
+        if coalescer is not None:
+            query_factory = partial(query_factory, coalescer=coalescer)
         if parser is None:
             parser = Parser()
         super(EC2Client, self).__init__(creds, endpoint, query_factory, parser)
@@ -989,6 +1025,7 @@ class Parser:
 class Query(BaseQuery):
     """A query that may be submitted to EC2."""
 
+    service = "ec2"
     timeout = 30
 
     def __init__(self, other_params=None, time_tuple=None, api_version=None,
@@ -1030,8 +1067,32 @@ class Query(BaseQuery):
     def submit(self):
         """Submit this query.
 
+        If the query has a coalescer and describes something, it shares
+        the request of an identical query in flight if there is one.
+
         @return: A deferred from get_page
         """
+        if self.coalescer is not None and self.action.startswith("Describe"):
+            return self.coalescer.coalesce(self._coalescing_key(), self._submit)
+        return self._submit()
+
+    def _coalescing_key(self):
+        """
+        Get a value which is equal for identical queries.
+        """
+        # Signing adds the signature, and the timestamp differs from one
+        # query to the next.
+        params = {
+            name: value for (name, value) in self.params.items()
+            if name not in ("Timestamp", "Signature", "SignatureMethod")
+        }
+        return (
+            self.endpoint.get_uri(),
+            self.endpoint.method,
+            tuple(sorted(params.items())),
+        )
+
+    def _submit(self):
         self.sign()
         url = self.endpoint.get_uri()
         method = self.endpoint.method
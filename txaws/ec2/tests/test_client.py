@@ -9,7 +9,7 @@ import os
 from dateutil.zoneinfo import gettz
 
 from twisted.internet import reactor
-from twisted.internet.defer import succeed, fail
+from twisted.internet.defer import Deferred, succeed, fail
 from twisted.internet.error import ConnectionRefusedError
 from twisted.protocols.policies import WrappingFactory
 from twisted.python.failure import Failure
@@ -18,6 +18,7 @@ from twisted.trial.unittest import TestCase
 from twisted.web import server, static, util
 from twisted.web.error import Error as TwistedWebError
 
+from txaws.client.coalescing import request_coalescer
 from txaws.util import iso8601time
 from txaws.credentials import ENV_ACCESS_KEY, ENV_SECRET_KEY, AWSCredentials
 from txaws.ec2 import client
@@ -1102,14 +1103,14 @@ class EC2ClientEBSTestCase(TestCase):
         self.assertEquals(volume.status, "in-use")
         self.assertEquals(volume.availability_zone, "us-east-1a")
         self.assertEquals(volume.snapshot_id, "snap-12345678")
-        create_time = datetime(2008, 05, 07, 11, 51, 50)
+        create_time = datetime(2008, 5, 7, 11, 51, 50)
         self.assertEquals(volume.create_time, create_time)
         self.assertEquals(len(volume.attachments), 1)
         attachment = volume.attachments[0]
         self.assertEquals(attachment.instance_id, "i-6058a509")
         self.assertEquals(attachment.status, "attached")
         self.assertEquals(attachment.device, "/dev/sdh")
-        attach_time = datetime(2008, 05, 07, 12, 51, 50)
+        attach_time = datetime(2008, 5, 7, 12, 51, 50)
         self.assertEquals(attachment.attach_time, attach_time)
 
     def test_describe_volumes(self):
@@ -1150,7 +1151,7 @@ class EC2ClientEBSTestCase(TestCase):
         self.assertEquals(snapshot.id, "snap-78a54011")
         self.assertEquals(snapshot.volume_id, "vol-4d826724")
         self.assertEquals(snapshot.status, "pending")
-        start_time = datetime(2008, 05, 07, 12, 51, 50)
+        start_time = datetime(2008, 5, 7, 12, 51, 50)
         self.assertEquals(snapshot.start_time, start_time)
         self.assertEquals(snapshot.progress, 0.8)
 
@@ -1200,7 +1201,7 @@ class EC2ClientEBSTestCase(TestCase):
             self.assertEquals(volume.id, "vol-4d826724")
             self.assertEquals(volume.size, 800)
             self.assertEquals(volume.snapshot_id, "")
-            create_time = datetime(2008, 05, 07, 11, 51, 50)
+            create_time = datetime(2008, 5, 7, 11, 51, 50)
             self.assertEquals(volume.create_time, create_time)
 
         ec2 = client.EC2Client(creds=self.creds, endpoint=self.endpoint,
@@ -1223,7 +1224,7 @@ class EC2ClientEBSTestCase(TestCase):
         def check_parsed_volume(volume):
             self.assertEquals(volume.id, "vol-4d826724")
             self.assertEquals(volume.size, 800)
-            create_time = datetime(2008, 05, 07, 11, 51, 50)
+            create_time = datetime(2008, 5, 7, 11, 51, 50)
             self.assertEquals(volume.create_time, create_time)
 
         ec2 = client.EC2Client(creds=self.creds, endpoint=self.endpoint,
@@ -1277,7 +1278,7 @@ class EC2ClientEBSTestCase(TestCase):
             self.assertEquals(snapshot.id, "snap-78a54011")
             self.assertEquals(snapshot.volume_id, "vol-4d826724")
             self.assertEquals(snapshot.status, "pending")
-            start_time = datetime(2008, 05, 07, 12, 51, 50)
+            start_time = datetime(2008, 5, 7, 12, 51, 50)
             self.assertEquals(snapshot.start_time, start_time)
             self.assertEquals(snapshot.progress, 0)
 
@@ -1318,7 +1319,7 @@ class EC2ClientEBSTestCase(TestCase):
             self.assertEquals(
                 response,
                 {"status": "attaching",
-                 "attach_time": datetime(2008, 05, 07, 11, 51, 50)})
+                 "attach_time": datetime(2008, 5, 7, 11, 51, 50)})
 
         ec2 = client.EC2Client(creds=self.creds, endpoint=self.endpoint,
                                query_factory=factory)
@@ -1693,6 +1694,43 @@ class QueryTestCase(TestCase):
         d = query.submit()
         return d
 
+    def test_submit_coalescer(self):
+        """
+        If the query has a coalescer, a I{Describe} query made while an
+        identical one is in flight shares its result even though it is
+        made at a different time.  Other queries are each issued.
+        """
+        pages = []
+
+        def get_page(query, url, **kwargs):
+            pages.append(Deferred())
+            return pages[-1]
+        self.patch(client.Query, "get_page", get_page)
+        coalescer = request_coalescer()
+
+        def submit(action, time_tuple, **params):
+            return client.Query(
+                action=action, creds=self.creds, endpoint=self.endpoint,
+                other_params=params, time_tuple=time_tuple,
+                coalescer=coalescer,
+            ).submit()
+
+        first = submit("DescribeVolumes", (2007, 11, 12, 13, 14, 15, 0, 0, 0))
+        second = submit("DescribeVolumes", (2007, 11, 12, 13, 14, 16, 0, 0, 0))
+        self.assertEqual(1, len(pages))
+        submit(
+            "DescribeVolumes", (2007, 11, 12, 13, 14, 16, 0, 0, 0),
+            **{"VolumeId.1": "vol-1"}
+        )
+        self.assertEqual(2, len(pages))
+        submit("DeleteVolume", None, VolumeId="vol-1")
+        submit("DeleteVolume", None, VolumeId="vol-1")
+        self.assertEqual(4, len(pages))
+        pages[0].callback("volumes")
+        self.assertEqual("volumes", self.successResultOf(first))
+        self.assertEqual("volumes", self.successResultOf(second))
+        self.assertEqual(1, coalescer.coalesced)
+
     def test_submit_400(self):
         """A 4xx response status from EC2 should raise a txAWS EC2Error."""
         status = "400"
@@ -55,7 +55,9 @@ def route53_error_wrapper(error):
     error_wrapper(error, Route53Error)
 
 
-def get_route53_client(agent, region, cooperator=None):
+def get_route53_client(agent, region, cooperator=None, connection_pool=None,
+                       retry_policy=None, scheduler=None, request_log=None,
+                       request_observer=None, coalescer=None):
     """
     Get a non-registration Route53 client.
     """
@@ -68,6 +70,12 @@ def get_route53_client(agent, region, cooperator=None):
         region=REGION_US_EAST_1,
         endpoint=AWSServiceEndpoint(_OTHER_ENDPOINT),
         cooperator=cooperator,
+        connection_pool=connection_pool,
+        retry_policy=retry_policy,
+        scheduler=scheduler,
+        request_log=request_log,
+        request_observer=request_observer,
+        coalescer=coalescer,
     )
 
 
@@ -91,7 +99,8 @@ RECORD_TYPES = {
 @attr.s(frozen=True)
 class _Route53Client:
     """
-    @ivar agent: An agent to use to issue HTTP(S) requests.
+    @ivar agent: An agent to use to issue HTTP(S) requests or C{None} to
+        use one from C{connection_pool}.
     @type agent: L{IAgent} provider
 
     @ivar creds: The AWS credentials to use to authenticate requests.
@@ -105,12 +114,44 @@ class _Route53Client:
 
     @ivar cooperator: The scheduler to use for streaming large request bodies.
     @type cooperator: L{twisted.internet.task.Cooperator}
+
+    @ivar connection_pool: The connection pool from which to get agents if
+        C{agent} is C{None} or C{None} for the reactor's default pool.
+    @type connection_pool: L{txaws.client.base._ConnectionPool}
+
+    @ivar retry_policy: The policy deciding whether and when to retry
+        failed requests or C{None} to never retry them.
+    @type retry_policy: L{txaws.client.retry._RetryPolicy}
+
+    @ivar scheduler: The scheduler which limits how many requests are in
+        flight to each host or C{None} to issue requests immediately.
+    @type scheduler: L{txaws.client.scheduler._RequestScheduler}
+
+    @ivar request_log: The policy deciding which requests to log or
+        C{None} to log them all.
+    @type request_log: L{txaws.client.request_log._RequestLog}
+
+    @ivar request_observer: An observer to tell how long each request spent
+        in each phase or C{None} to not time requests.
+    @type request_observer: L{txaws.client.instrumentation.IRequestObserver}
+        provider
+
+    @ivar coalescer: The coalescer which shares one request among identical
+        reads, such as the C{list_*} operations, in flight at once or
+        C{None} to issue every request.
+    @type coalescer: L{txaws.client.coalescing._RequestCoalescer}
     """
     agent = attr.ib()
     creds = attr.ib()
     region = attr.ib()
     endpoint = attr.ib()
     cooperator = attr.ib()
+    connection_pool = attr.ib(default=None)
+    retry_policy = attr.ib(default=None)
+    scheduler = attr.ib(default=None)
+    request_log = attr.ib(default=None)
+    request_observer = attr.ib(default=None)
+    coalescer = attr.ib(default=None)
 
     def _details(self, op):
         content_sha256 = sha256(op.body).hexdigest().decode("ascii")
@@ -133,7 +174,20 @@ class _Route53Client:
         )
 
     def _submit(self, details, ok_status):
-        q = query(credentials=self.creds, details=details, ok_status=ok_status)
+        kw = {}
+        if self.request_log is not None:
+            kw["request_log"] = self.request_log
+        q = query(
+            credentials=self.creds,
+            details=details,
+            ok_status=ok_status,
+            connection_pool=self.connection_pool,
+            retry_policy=self.retry_policy,
+            scheduler=self.scheduler,
+            request_observer=self.request_observer,
+            coalescer=self.coalescer,
+            **kw
+        )
         d = q.submit(self.agent)
         d.addErrback(route53_error_wrapper)
         d.addCallback(itemgetter(1))
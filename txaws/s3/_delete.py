@@ -0,0 +1,129 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Deletion of any number of objects in batches deleted concurrently, built
+on the multi-object delete of L{txaws.s3.client.S3Client}.
+"""
+
+from itertools import islice
+
+from twisted.internet.defer import DeferredLock, ensureDeferred, succeed
+
+from txaws.s3._transfer import _workers
+from txaws.s3.model import BucketItem, DeleteResult
+
+
+# S3 refuses to delete more objects than this in one request.
+MAX_DELETE_KEYS = 1000
+
+DEFAULT_DELETE_CONCURRENCY = 4
+
+
+def _key(entry):
+    if isinstance(entry, BucketItem):
+        return entry.key
+    return entry
+
+
+async def _take_async(listing, count):
+    batch = []
+    while len(batch) < count:
+        try:
+            entry = await listing.__anext__()
+        except StopAsyncIteration:
+            break
+        batch.append(_key(entry))
+    return batch
+
+
+class _BatchDelete:
+    """
+    The deletion of the objects named by an iterable, a batch at a time.
+
+    @ivar _lock: A L{DeferredLock} held while a batch is taken from the
+        objects so that workers take them in turn.
+
+    @ivar _exhausted: Whether every object has been taken.
+
+    @ivar _result: The L{DeleteResult} for the batches deleted so far.
+
+    @ivar _failure: The L{Failure} of the first batch which could not be
+        deleted, after which no more are started.
+    """
+    def __init__(self, client, bucket, keys, batch_size, quiet):
+        self._client = client
+        self._bucket = bucket
+        if hasattr(keys, "__anext__"):
+            self._take = lambda: ensureDeferred(_take_async(keys, batch_size))
+        else:
+            keys = iter(keys)
+            self._take = lambda: succeed(
+                [_key(entry) for entry in islice(keys, batch_size)],
+            )
+        self._quiet = quiet
+        self._lock = DeferredLock()
+        self._exhausted = False
+        self._result = DeleteResult()
+        self._failure = None
+
+    def start(self, cooperator, concurrency):
+        d = _workers(cooperator, self._work(), concurrency)
+        d.addCallback(self._deleted)
+        return d
+
+    def _work(self):
+        # Shared by all of the workers so each batch is deleted by one of
+        # them.
+        while self._failure is None and not self._exhausted:
+            d = self._lock.run(self._take)
+            d.addCallback(self._delete)
+            d.addErrback(self._failed)
+            yield d
+
+    def _delete(self, batch):
+        if not batch:
+            self._exhausted = True
+            return None
+        if self._failure is not None:
+            return None
+        d = self._client.delete_objects(self._bucket, batch, quiet=self._quiet)
+        d.addCallback(self._batch_deleted)
+        return d
+
+    def _batch_deleted(self, result):
+        self._result.deleted.extend(result.deleted)
+        self._result.errors.extend(result.errors)
+
+    def _failed(self, reason):
+        if self._failure is None:
+            self._failure = reason
+        return reason
+
+    def _deleted(self, results):
+        # Every worker has finished, so no batch is still being deleted.
+        if self._failure is not None:
+            return self._failure
+        return self._result
+
+
+def delete_keys(client, bucket, keys, batch_size, concurrency, quiet,
+                cooperator):
+    """
+    Delete the objects named by an iterable in batches deleted several at
+    a time.
+
+    See L{txaws.s3.client.S3Client.delete_keys}.
+    """
+    if not 1 <= batch_size <= MAX_DELETE_KEYS:
+        raise ValueError(
+            "batch_size must be between 1 and {}, not {}".format(
+                MAX_DELETE_KEYS, batch_size,
+            ),
+        )
+    if concurrency < 1:
+        raise ValueError(
+            "concurrency must be at least 1, not {}".format(concurrency),
+        )
+    return _BatchDelete(client, bucket, keys, batch_size, quiet).start(
+        cooperator, concurrency,
+    )
@@ -0,0 +1,47 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Hashing of the bodies of requests made by L{txaws.s3.client.S3Client}.
+
+Hashing a large body takes long enough to hold up every other connection
+if it is done in the reactor thread.  C{hashlib} releases the GIL while
+it hashes so the reactor keeps running while a thread does it.
+"""
+
+from base64 import b64encode
+from hashlib import md5, sha256
+
+
+# Bodies larger than this are hashed in a thread by default.
+DEFAULT_HASH_THRESHOLD = 2 ** 20
+
+# Both digests are updated from each chunk while it is still in the CPU's
+# cache.
+_CHUNK_SIZE = 2 ** 18
+
+
+def payload_digests(body, content_md5):
+    """
+    Hash a request body for signing and, if wanted, for its I{Content-MD5}
+    header, reading it once.
+
+    @param body: The body.
+    @type body: L{bytes}
+
+    @param content_md5: Whether to compute the MD5 digest too.
+    @type content_md5: L{bool}
+
+    @return: A two-tuple of the hex SHA-256 digest and the base64 MD5
+        digest, or C{None} if it was not wanted, both as L{str}.
+    """
+    view = memoryview(body)
+    content_sha256 = sha256()
+    digest = md5() if content_md5 else None
+    for offset in range(0, len(view), _CHUNK_SIZE):
+        chunk = view[offset:offset + _CHUNK_SIZE]
+        content_sha256.update(chunk)
+        if digest is not None:
+            digest.update(chunk)
+    if digest is not None:
+        digest = b64encode(digest.digest()).decode("ascii")
+    return content_sha256.hexdigest(), digest
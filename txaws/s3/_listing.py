@@ -0,0 +1,592 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Parsing of bucket listings, iteration over the objects in a bucket across
+the pages of its listing, compact listings of a whole bucket and listing
+of a bucket's key hierarchy by concurrent requests.
+"""
+
+import re
+from collections import deque
+from datetime import datetime
+from heapq import merge
+from html import unescape
+from xml.etree.ElementTree import XMLPullParser
+
+from dateutil.parser import parse as parseTime
+from dateutil.tz import tzutc
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import deferLater
+from twisted.python.failure import Failure
+from twisted.python.reflect import namedAny
+
+from txaws.s3.model import (
+    BucketItem, BucketListing, CompactListing, ItemOwner,
+)
+
+
+DEFAULT_PREFETCH = 2
+DEFAULT_MAX_BUFFERED = 10000
+
+
+_TRUNCATED = re.compile(br"<IsTruncated>\s*true\s*</IsTruncated>")
+
+
+def _text_before(xml_bytes, tag):
+    """
+    Find the text of the last element with a given tag in a document,
+    without parsing it.
+
+    @rtype: L{str} or L{NoneType}
+    """
+    start = xml_bytes.rfind(b"<" + tag + b">")
+    if start == -1:
+        return None
+    start += len(tag) + 2
+    end = xml_bytes.find(b"</" + tag + b">", start)
+    if end == -1:
+        return None
+    return unescape(xml_bytes[start:end].decode("utf-8"))
+
+
+def _next_marker(xml_bytes):
+    """
+    Find the marker from which the page after a page of a bucket listing
+    begins, without parsing the page.
+
+    This is the page's I{NextMarker} if it has one, otherwise the key of
+    its last object.
+
+    @param xml_bytes: The body of a I{ListBucketResult} response.
+    @type xml_bytes: L{bytes}
+
+    @return: The marker or C{None} if this is the last page.
+    @rtype: L{str} or L{NoneType}
+    """
+    if _TRUNCATED.search(xml_bytes) is None:
+        return None
+    marker = _text_before(xml_bytes, b"NextMarker")
+    if marker is None:
+        marker = _text_before(xml_bytes, b"Key")
+    return marker
+
+
+# The form S3 gives every LastModified in, for example
+# 2009-10-12T17:50:30.000Z.
+_TIMESTAMP = re.compile(
+    r"(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?Z\Z",
+)
+
+_UTC = tzutc()
+
+# The amount of a listing given to the parser at a time.  Elements are
+# discarded once handled so the tree built never grows much beyond this.
+_FEED_SIZE = 2 ** 14
+
+
+def _parse_timestamp(text):
+    """
+    Parse a timestamp from a bucket listing.
+
+    Timestamps in the form S3 uses are parsed directly, anything else by
+    L{dateutil}.
+
+    @type text: L{str}
+    @rtype: L{datetime}
+    """
+    match = _TIMESTAMP.match(text)
+    if match is None:
+        return parseTime(text)
+    year, month, day, hour, minute, second, fraction = match.groups()
+    return datetime(
+        int(year), int(month), int(day), int(hour), int(minute),
+        int(second), int(fraction.ljust(6, "0")) if fraction else 0, _UTC,
+    )
+
+
+def _local_name(tag):
+    return tag.rpartition("}")[2]
+
+
+def _texts(element):
+    """
+    Get the text of each child of an element by its name.
+    """
+    # Like findtext, an element without text has the empty string.
+    return {
+        _local_name(child.tag): child.text or "" for child in element
+    }
+
+
+def _bucket_item(element):
+    fields = {}
+    owner = {}
+    for child in element:
+        name = _local_name(child.tag)
+        if name == "Owner":
+            owner = _texts(child)
+        else:
+            fields[name] = child.text or ""
+    return BucketItem(
+        fields.get("Key"),
+        _parse_timestamp(fields.get("LastModified")),
+        fields.get("ETag"),
+        fields.get("Size"),
+        fields.get("StorageClass"),
+        ItemOwner(owner.get("ID"), owner.get("DisplayName")),
+    )
+
+
+def _events(xml_bytes):
+    """
+    Parse a document a part at a time.
+
+    @return: An iterator of the C{start} and C{end} events of its elements,
+        each given as soon as the part of the document it is in is parsed.
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    for offset in range(0, len(xml_bytes), _FEED_SIZE):
+        parser.feed(xml_bytes[offset:offset + _FEED_SIZE])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def parse_listing(xml_bytes):
+    """
+    Parse a page of a bucket listing.
+
+    The document is parsed a part at a time and each object is made as
+    soon as its element is complete, after which the element is discarded.
+
+    @param xml_bytes: The body of a I{ListBucketResult} response to a
+        version 1 or version 2 listing request.
+    @type xml_bytes: L{bytes}
+
+    @rtype: L{BucketListing}
+    """
+    fields = {}
+    contents = []
+    common_prefixes = []
+    root = None
+    depth = 0
+    for event, element in _events(xml_bytes):
+        if event == "start":
+            depth += 1
+            if root is None:
+                root = element
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        name = _local_name(element.tag)
+        if name == "Contents":
+            contents.append(_bucket_item(element))
+        elif name == "CommonPrefixes":
+            common_prefixes.append(_texts(element).get("Prefix"))
+        else:
+            fields[name] = element.text or ""
+        root.clear()
+    return BucketListing(
+        fields.get("Name"),
+        fields.get("Prefix"),
+        # Version 2 listings start after a key rather than a marker.
+        fields.get("Marker", fields.get("StartAfter")),
+        fields.get("MaxKeys"),
+        fields.get("IsTruncated"),
+        contents,
+        common_prefixes,
+        next_continuation_token=fields.get("NextContinuationToken"),
+    )
+
+
+class _BucketIterator:
+    """
+    The objects in a bucket, got a page at a time, with pages fetched
+    ahead of those being consumed.
+
+    As soon as a page arrives the marker for the next page is found in
+    it and, if prefetching is allowed, the next page is requested before
+    this one is parsed.  Parsing waits for the next turn of the reactor
+    so the request is on its way meanwhile.
+
+    @ivar _pages: A L{deque} of L{deque}s of the L{BucketItem}s of each
+        page parsed but not yet consumed.
+
+    @ivar _buffered: The number of items in C{_pages}.
+
+    @ivar _parsing: The number of pages received but not yet parsed.
+
+    @ivar _requesting: Whether a request for a page is in progress.
+
+    @ivar _marker: The marker for the next page to request.
+
+    @ivar _done: Whether the last page has been requested.
+
+    @ivar _closed: Whether the consumer has stopped iterating.
+
+    @ivar _failure: The L{Failure} of the request which failed, after
+        which no more pages are requested.
+
+    @ivar _waiting: A L{Deferred} given to the consumer for an item not
+        yet received, or C{None}.
+    """
+    def __init__(self, client, bucket, prefix, page_size, prefetch,
+                 max_buffered, reactor):
+        if prefetch < 0:
+            raise ValueError(
+                "prefetch must be at least 0, not {}".format(prefetch),
+            )
+        if max_buffered < 1:
+            raise ValueError(
+                "max_buffered must be at least 1, not {}".format(max_buffered),
+            )
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix
+        self._page_size = page_size
+        self._prefetch = prefetch
+        self._max_buffered = max_buffered
+        self._reactor = reactor
+        self._pages = deque()
+        self._buffered = 0
+        self._parsing = 0
+        self._requesting = False
+        self._marker = None
+        self._done = False
+        self._closed = False
+        self._failure = None
+        self._waiting = None
+
+    def next(self):
+        """
+        Get the next object in the bucket.
+
+        @return: A L{Deferred} that fires with the next L{BucketItem} or
+            C{None} if there are no more, or fails if a page could not be
+            listed.  If the object has already been received the
+            L{Deferred} has already fired.
+        """
+        if self._waiting is not None:
+            raise ValueError("Already waiting for the next object")
+        if self._pages:
+            item = self._take()
+            self._fetch()
+            return succeed(item)
+        if self._failure is not None and not self._parsing:
+            return fail(self._failure)
+        if self._closed or (
+            self._done and not self._requesting and not self._parsing
+        ):
+            return succeed(None)
+        self._waiting = Deferred()
+        self._fetch()
+        return self._waiting
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        d = self.next()
+        d.addCallback(_stop_at_end)
+        return d
+
+    def close(self):
+        """
+        Stop requesting pages and discard those not yet consumed.
+        """
+        self._closed = True
+        self._done = True
+        self._pages.clear()
+        self._buffered = 0
+        self._deliver()
+
+    def _take(self):
+        page = self._pages[0]
+        item = page.popleft()
+        if not page:
+            self._pages.popleft()
+        self._buffered -= 1
+        return item
+
+    def _fetch(self):
+        """
+        Request the next page if there is one and it is allowed.
+        """
+        if self._requesting or self._done or self._failure is not None:
+            return
+        pending = len(self._pages) + self._parsing
+        # The first of these is the page being consumed, not one fetched
+        # ahead.
+        if pending and (
+            pending - 1 >= self._prefetch
+            or self._buffered >= self._max_buffered
+        ):
+            return
+        self._requesting = True
+        d = self._client._get_bucket_response(
+            self._bucket, marker=self._marker, max_keys=self._page_size,
+            prefix=self._prefix,
+        )
+        d.addCallbacks(self._received, self._request_failed)
+
+    def _received(self, response):
+        self._requesting = False
+        self._parsing += 1
+        self._marker = _next_marker(response[1])
+        if self._marker is None:
+            self._done = True
+        else:
+            self._fetch()
+        d = deferLater(
+            self._reactor, 0, self._client._parse_get_bucket, response,
+        )
+        d.addCallbacks(self._parsed, self._parse_failed)
+
+    def _parsed(self, listing):
+        self._parsing -= 1
+        if self._closed:
+            return
+        if listing.contents:
+            self._pages.append(deque(listing.contents))
+            self._buffered += len(listing.contents)
+        self._deliver()
+        self._fetch()
+
+    def _request_failed(self, reason):
+        self._requesting = False
+        self._failed(reason)
+
+    def _parse_failed(self, reason):
+        self._parsing -= 1
+        self._failed(reason)
+
+    def _failed(self, reason):
+        if self._failure is None:
+            self._failure = reason
+        self._deliver()
+
+    def _deliver(self):
+        """
+        Give the waiting consumer its object if it has been received, the
+        end of the bucket or the failure if not.
+        """
+        waiting = self._waiting
+        if waiting is None:
+            return
+        if self._pages:
+            result = self._take()
+        elif self._parsing:
+            # Items received before the failure are given first.
+            return
+        elif self._failure is not None:
+            result = self._failure
+        elif self._closed or (
+            self._done and not self._requesting and not self._parsing
+        ):
+            result = None
+        else:
+            return
+        self._waiting = None
+        if isinstance(result, Failure):
+            waiting.errback(result)
+        else:
+            waiting.callback(result)
+
+
+def _stop_at_end(item):
+    if item is None:
+        raise StopAsyncIteration()
+    return item
+
+
+def iter_bucket(client, bucket, prefix, page_size, prefetch, max_buffered,
+                reactor):
+    """
+    Iterate over the objects in a bucket.
+
+    See L{txaws.s3.client.S3Client.iter_bucket}.
+    """
+    if reactor is None:
+        reactor = namedAny("twisted.internet.reactor")
+    return _BucketIterator(
+        client, bucket, prefix, page_size, prefetch, max_buffered, reactor,
+    )
+
+
+def compact_listing(client, bucket, prefix, page_size, listing):
+    """
+    List a bucket into a L{CompactListing}.
+
+    See L{txaws.s3.client.S3Client.compact_listing}.
+    """
+    if listing is None:
+        listing = CompactListing()
+
+    def request(token):
+        return client.list_objects(
+            bucket, prefix=prefix, continuation_token=token,
+            max_keys=page_size,
+        )
+
+    def listed(page):
+        # The next page is on its way while this one is added, after which
+        # this one is discarded.
+        following = None
+        if page.is_truncated == "true":
+            following = request(page.next_continuation_token)
+        try:
+            listing.add(page.contents)
+        except Exception:
+            if following is not None:
+                following.addErrback(lambda reason: None)
+            raise
+        if following is None:
+            return listing
+        return following.addCallback(listed)
+
+    return request(None).addCallback(listed)
+
+
+DEFAULT_WALK_CONCURRENCY = 8
+
+
+class _Prefix:
+    """
+    One common prefix of a bucket, listed with a delimiter.
+
+    @ivar entries: The L{BucketItem}s and the L{_Prefix}es for the
+        common prefixes listed so far, in key order.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.entries = []
+
+    def add(self, items, children):
+        # Each page's objects and common prefixes are in order and come
+        # after those of the pages before it.
+        self.entries.extend(
+            merge(items, children, key=_entry_key),
+        )
+
+    def flatten(self, into):
+        """
+        Add the objects under this prefix to a list, in key order.
+        """
+        stack = [iter(self.entries)]
+        while stack:
+            for entry in stack[-1]:
+                if isinstance(entry, _Prefix):
+                    stack.append(iter(entry.entries))
+                    break
+                into.append(entry)
+            else:
+                stack.pop()
+        return into
+
+
+def _entry_key(entry):
+    if isinstance(entry, _Prefix):
+        return entry.prefix
+    return entry.key
+
+
+class _BucketWalker:
+    """
+    The listing of a bucket's key hierarchy by a bounded number of
+    concurrent requests.
+
+    @ivar _queue: A L{deque} of C{(_Prefix, continuation_token)} for the
+        pages waiting to be listed.
+
+    @ivar _running: The number of requests in progress.
+
+    @ivar _items: The objects listed so far, in the order they arrived,
+        if they are not to be ordered.
+
+    @ivar _failure: The L{Failure} of the first request which failed,
+        after which no more are made.
+    """
+    def __init__(self, client, bucket, prefix, delimiter, concurrency,
+                 ordered, page_size):
+        if concurrency < 1:
+            raise ValueError(
+                "concurrency must be at least 1, not {}".format(concurrency),
+            )
+        self._client = client
+        self._bucket = bucket
+        self._delimiter = delimiter
+        self._concurrency = concurrency
+        self._ordered = ordered
+        self._page_size = page_size
+        self._root = _Prefix(prefix)
+        self._queue = deque([(self._root, None)])
+        self._running = 0
+        self._items = []
+        self._failure = None
+        self._done = Deferred()
+
+    def start(self):
+        self._pump()
+        return self._done
+
+    def _pump(self):
+        while (
+            self._failure is None
+            and self._queue
+            and self._running < self._concurrency
+        ):
+            node, token = self._queue.popleft()
+            self._running += 1
+            d = self._client.list_objects(
+                self._bucket, prefix=node.prefix, delimiter=self._delimiter,
+                continuation_token=token, max_keys=self._page_size,
+            )
+            d.addCallback(self._listed, node)
+            d.addErrback(self._failed)
+            d.addBoth(self._finished)
+
+    def _listed(self, listing, node):
+        children = [_Prefix(prefix) for prefix in listing.common_prefixes]
+        if listing.is_truncated == "true":
+            # The rest of this prefix goes ahead of the prefixes it
+            # contains so the earlier parts of the hierarchy finish first.
+            self._queue.appendleft((node, listing.next_continuation_token))
+        self._queue.extend((child, None) for child in children)
+        if self._ordered:
+            node.add(listing.contents, children)
+        else:
+            self._items.extend(listing.contents)
+
+    def _failed(self, reason):
+        if self._failure is None:
+            self._failure = reason
+
+    def _finished(self, ignored):
+        self._running -= 1
+        self._pump()
+        # A client which answers synchronously finishes the walk from
+        # inside _pump, so an outer call may find it already done.
+        if self._running or self._done.called:
+            return
+        if self._failure is not None:
+            self._done.errback(self._failure)
+        elif not self._queue:
+            if self._ordered:
+                self._done.callback(self._root.flatten([]))
+            else:
+                self._done.callback(self._items)
+
+
+def walk_bucket(client, bucket, prefix, delimiter, concurrency, ordered,
+                page_size):
+    """
+    List the objects in a bucket by listing the parts of its key hierarchy
+    concurrently.
+
+    See L{txaws.s3.client.S3Client.walk_bucket}.
+    """
+    return _BucketWalker(
+        client, bucket, prefix, delimiter, concurrency, ordered, page_size,
+    ).start()
@@ -0,0 +1,297 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Syncing of a local directory to a bucket, built on the listings and
+transfers of L{txaws.s3.client.S3Client}.
+
+The files of the directory are walked in the order S3 lists the keys
+they are synced to, so the walk and the listing are merged as they go
+without either being held in memory.
+"""
+
+import mimetypes
+import os
+from itertools import islice
+
+from twisted.internet.defer import DeferredLock, ensureDeferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.reflect import namedAny
+
+from txaws.s3._delete import MAX_DELETE_KEYS
+from txaws.s3._transfer import _matches_etag, _part_size, _workers
+from txaws.s3.model import SyncResult
+
+
+DEFAULT_SYNC_CONCURRENCY = 8
+
+# The files walked in the thread pool at a time.
+_WALK_BATCH = 1000
+
+
+def _order(key):
+    """
+    Get the value by which S3 orders a key.
+    """
+    # S3 lists keys in the order of their UTF-8 encodings.
+    return key.encode("utf-8", "surrogateescape")
+
+
+class _LocalFile:
+    """
+    A file to be synced.
+
+    @ivar key: The name of the object the file is synced to.
+    @ivar mtime: The time the file was last modified, in seconds since
+        the epoch.
+    """
+    __slots__ = ("key", "path", "size", "mtime")
+
+    def __init__(self, key, path, size, mtime):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+
+
+def _local_files(directory, prefix):
+    """
+    Walk the files in a directory and in the directories beneath it, in
+    the order of the keys they are synced to.
+
+    Symbolic links to files are followed but those to directories are not.
+
+    @return: An iterator of L{_LocalFile}.
+    """
+    entries = []
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if entry.is_dir(follow_symlinks=False):
+                # Each key beneath a directory continues with a slash after
+                # its name.
+                entries.append((_order(entry.name + "/"), entry, True))
+            elif entry.is_file():
+                entries.append((_order(entry.name), entry, False))
+    entries.sort(key=lambda sorted_entry: sorted_entry[0])
+    for ignored, entry, is_dir in entries:
+        if is_dir:
+            yield from _local_files(entry.path, prefix + entry.name + "/")
+        else:
+            stat = entry.stat()
+            yield _LocalFile(
+                prefix + entry.name, entry.path, stat.st_size, stat.st_mtime,
+            )
+
+
+class _Sync:
+    """
+    The sync of one directory to a bucket, several files at a time.
+
+    The walk of the directory and the listing of the bucket are advanced
+    together.  A file with no object is uploaded and an object with no
+    file is deleted.  A file and object of different sizes, or of the same
+    size when the file was modified after the object and its contents do
+    not match the object's ETag, is uploaded.
+
+    @ivar _lock: A L{DeferredLock} held while the next thing to do is
+        found so that workers take them in turn.
+
+    @ivar _local: The L{_LocalFile}s walked but not yet merged.
+    @ivar _local_done: Whether the whole directory has been walked.
+    @ivar _remote: The L{BucketItem} listed but not yet merged or C{None}.
+    @ivar _remote_done: Whether the whole bucket has been listed.
+
+    @ivar _deletes: The names of the objects to delete in the next batch.
+
+    @ivar _exhausted: Whether everything has been merged.
+
+    @ivar _failure: The L{Failure} of the first thing which could not be
+        done, after which no more are started.
+    """
+    def __init__(self, client, directory, bucket, prefix, delete, part_size,
+                 part_concurrency, reactor):
+        self._client = client
+        self._bucket = bucket
+        self._delete = delete
+        self._part_size = part_size
+        self._part_concurrency = part_concurrency
+        self._reactor = reactor
+        self._walk = _local_files(directory, prefix)
+        self._listing = client.iter_bucket(bucket, prefix=prefix or None)
+        self._local = []
+        self._local_done = False
+        self._remote = None
+        self._remote_done = False
+        self._deletes = []
+        self._lock = DeferredLock()
+        self._exhausted = False
+        self._result = SyncResult()
+        self._failure = None
+
+    def start(self, cooperator, concurrency):
+        d = _workers(cooperator, self._work(), concurrency)
+        d.addCallback(self._synced)
+        return d
+
+    def _work(self):
+        # Shared by all of the workers so each thing is done by one of
+        # them.
+        while self._failure is None and not self._exhausted:
+            d = self._lock.run(lambda: ensureDeferred(self._next()))
+            d.addCallback(self._do)
+            d.addErrback(self._failed)
+            yield d
+
+    def _in_thread(self, f, *a):
+        return deferToThreadPool(
+            self._reactor, self._reactor.getThreadPool(), f, *a
+        )
+
+    async def _peek_local(self):
+        if not self._local and not self._local_done:
+            batch = await self._in_thread(
+                lambda: list(islice(self._walk, _WALK_BATCH)),
+            )
+            # Taken from the end as they are merged.
+            batch.reverse()
+            self._local = batch
+            self._local_done = len(batch) < _WALK_BATCH
+        if self._local:
+            return self._local[-1]
+        return None
+
+    async def _peek_remote(self):
+        if self._remote is None and not self._remote_done:
+            self._remote = await self._listing.next()
+            self._remote_done = self._remote is None
+        return self._remote
+
+    async def _next(self):
+        """
+        Merge the walk and the listing up to the next thing to do.
+
+        @return: A no-argument callable doing it, returning a L{Deferred},
+            or C{None} if there is nothing more to do.
+        """
+        while True:
+            local = await self._peek_local()
+            remote = await self._peek_remote()
+            if local is None and remote is None:
+                return self._take_deletes(0)
+            if remote is not None and (
+                local is None or _order(remote.key) < _order(local.key)
+            ):
+                self._remote = None
+                if self._delete:
+                    self._deletes.append(remote.key)
+                    delete = self._take_deletes(MAX_DELETE_KEYS)
+                    if delete is not None:
+                        return delete
+                continue
+            self._local.pop()
+            if remote is None or _order(local.key) < _order(remote.key):
+                return lambda: self._upload(local)
+            self._remote = None
+            if local.size != int(remote.size):
+                return lambda: self._upload(local)
+            if local.mtime <= remote.modification_date.timestamp():
+                self._result.unchanged += 1
+                continue
+            return lambda: self._compare(local, remote)
+
+    def _take_deletes(self, count):
+        """
+        Take the batch of objects to delete if it has at least C{count}.
+        """
+        if not self._deletes or len(self._deletes) < count:
+            return None
+        keys, self._deletes = self._deletes, []
+        return lambda: self._delete_keys(keys)
+
+    def _do(self, action):
+        if action is None:
+            self._exhausted = True
+            return None
+        if self._failure is not None:
+            return None
+        return action()
+
+    def _upload(self, local):
+        content_type, encoding = mimetypes.guess_type(
+            local.path, strict=False,
+        )
+        d = self._client.upload_file(
+            local.path, self._bucket, local.key, part_size=self._part_size,
+            concurrency=self._part_concurrency, content_type=content_type,
+        )
+        d.addCallback(lambda ignored: self._result.uploaded.append(local.key))
+        return d
+
+    def _compare(self, local, remote):
+        # A file touched since it was uploaded need not be uploaded again.
+        # Its contents are hashed to find out, away from the reactor.  If
+        # the part size of a multipart ETag cannot be guessed the file is
+        # uploaded.
+        d = self._in_thread(
+            _matches_etag, local.path, local.size, remote.etag,
+            _part_size(local.size, self._part_size), False,
+        )
+        d.addCallback(self._compared, local)
+        return d
+
+    def _compared(self, matches, local):
+        if matches:
+            self._result.unchanged += 1
+            return None
+        return self._upload(local)
+
+    def _delete_keys(self, keys):
+        d = self._client.delete_objects(self._bucket, keys, quiet=True)
+        d.addCallback(self._deleted, keys)
+        return d
+
+    def _deleted(self, result, keys):
+        failed = {error.key for error in result.errors}
+        self._result.deleted.extend(key for key in keys if key not in failed)
+        self._result.errors.extend(result.errors)
+
+    def _failed(self, reason):
+        if self._failure is None:
+            self._failure = reason
+        return reason
+
+    def _synced(self, results):
+        # Every worker has finished, so nothing is still being done.
+        self._listing.close()
+        self._walk.close()
+        if self._failure is not None:
+            return self._failure
+        return self._result
+
+
+def sync(client, directory, bucket, prefix, delete, concurrency, part_size,
+         part_concurrency, reactor, cooperator):
+    """
+    Sync a local directory to a bucket.
+
+    See L{txaws.s3.client.S3Client.sync}.
+    """
+    if concurrency < 1:
+        raise ValueError(
+            "concurrency must be at least 1, not {}".format(concurrency),
+        )
+    if part_concurrency < 1:
+        raise ValueError(
+            "part_concurrency must be at least 1, not {}".format(
+                part_concurrency,
+            ),
+        )
+    # Checked now rather than by the first upload of a large file.
+    _part_size(0, part_size)
+    if not os.path.isdir(directory):
+        raise ValueError("{!r} is not a directory".format(directory))
+    if reactor is None:
+        reactor = namedAny("twisted.internet.reactor")
+    return _Sync(
+        client, directory, bucket, prefix, delete, part_size,
+        part_concurrency, reactor,
+    ).start(cooperator, concurrency)
@@ -0,0 +1,580 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Transfers of whole files to and from S3 built on the requests of
+L{txaws.s3.client.S3Client}.
+"""
+
+import os
+from hashlib import md5
+
+from twisted.internet.defer import DeferredList
+from twisted.internet.task import deferLater
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.reflect import namedAny
+from twisted.web.client import FileBodyProducer
+
+from txaws.client._consumers import FileConsumer
+from txaws.client import retry as _retry
+from txaws.s3.exception import ETagMismatch, S3Error
+
+
+# S3 refuses parts smaller than this, other than the last.
+MIN_PART_SIZE = 5 * 2 ** 20
+
+# And uploads of more parts than this.
+MAX_PARTS = 10000
+
+DEFAULT_PART_SIZE = 8 * 2 ** 20
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PART_ATTEMPTS = 3
+
+
+class _FileSegment:
+    """
+    A read-only file-like view of part of a file.
+
+    Segments of one file may be read in turn by producers working
+    concurrently: each keeps its own position and seeks the file to it
+    before reading.  Closing a segment leaves the file open.
+    """
+    def __init__(self, fileobj, offset, length):
+        self._file = fileobj
+        self._offset = offset
+        self._length = length
+        self._position = 0
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._length
+        self._position = max(0, min(offset, self._length))
+        return self._position
+
+    def read(self, size=-1):
+        remaining = self._length - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size == 0:
+            return b""
+        self._file.seek(self._offset + self._position)
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
+def _size(fileobj):
+    """
+    @return: The number of bytes from the file's current position to its
+        end.
+    """
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    end = fileobj.tell()
+    fileobj.seek(position)
+    return end - position
+
+
+def _header(headers, name):
+    """
+    Find a header among the headers of a response, as returned by
+    L{txaws.s3.client.S3Client.head_object}.
+
+    @return: The value of the header as L{str} or C{None} if there is none.
+    """
+    for key, value in headers.items():
+        if isinstance(key, bytes):
+            key = key.decode("ascii")
+        if key.lower() == name:
+            if isinstance(value, bytes):
+                value = value.decode("ascii")
+            return value
+    return None
+
+
+def _etag(headers):
+    """
+    Find the ETag among the headers of a response.
+    """
+    etag = _header(headers, "etag")
+    if etag is None:
+        raise ValueError("Response has no ETag: {!r}".format(headers))
+    return etag
+
+
+def _workers(cooperator, work, concurrency):
+    """
+    Run C{concurrency} workers taking their tasks from one iterator of
+    L{Deferred}s.
+
+    @return: A L{DeferredList} which fires when every worker has finished.
+    """
+    return DeferredList(
+        [cooperator.coiterate(work) for i in range(concurrency)],
+        consumeErrors=True,
+    )
+
+
+def _part_retryable(reason):
+    """
+    Decide whether a part whose upload failed should be uploaded again.
+
+    Errors S3 reports as the fault of the request, other than timeouts
+    and throttling, would only fail again.
+    """
+    if reason.check(S3Error):
+        try:
+            status = int(reason.value.status)
+        except (TypeError, ValueError):
+            return True
+        return status >= 500 or status in (408, 429)
+    return True
+
+
+def _part_size(size, part_size):
+    """
+    Pick the size of the parts of an upload, growing C{part_size} if
+    needed to keep within L{MAX_PARTS}.
+    """
+    if part_size < MIN_PART_SIZE:
+        raise ValueError(
+            "part_size must be at least {}, not {}".format(
+                MIN_PART_SIZE, part_size,
+            ),
+        )
+    smallest = -(-size // MAX_PARTS)
+    return max(part_size, smallest)
+
+
+class _MultipartUpload:
+    """
+    The upload of one file in parts, several at a time.
+
+    @ivar _parts: The parts yet to be uploaded as a L{list} of
+        C{(part_number, offset, length)} in the order to upload them.
+
+    @ivar _etags: A L{dict} mapping the number of each part uploaded to
+        its ETag.
+
+    @ivar _failure: The L{Failure} which ended the upload or C{None}.
+
+    @ivar _retry_policy: The L{txaws.client.retry._RetryPolicy} whose
+        backoff delays the retries of a part and whose budget limits them.
+    """
+    def __init__(self, client, fileobj, bucket, object_name, parts,
+                 concurrency, part_attempts, retry_policy, reactor,
+                 cooperator):
+        self._client = client
+        self._file = fileobj
+        self._bucket = bucket
+        self._object_name = object_name
+        self._parts = parts
+        self._concurrency = concurrency
+        self._part_attempts = part_attempts
+        self._retry_policy = retry_policy
+        self._reactor = reactor
+        self._cooperator = cooperator
+        self._etags = {}
+        self._failure = None
+        self._upload_id = None
+
+    def start(self, content_type, metadata, amz_headers):
+        d = self._client.init_multipart_upload(
+            self._bucket, self._object_name, content_type=content_type,
+            metadata=metadata, amz_headers=amz_headers,
+        )
+        d.addCallback(self._initiated)
+        return d
+
+    def _initiated(self, response):
+        self._upload_id = response.upload_id
+        d = _workers(
+            self._cooperator, self._work(),
+            min(self._concurrency, len(self._parts)),
+        )
+        d.addCallback(self._uploaded)
+        return d
+
+    def _work(self):
+        # Shared by all of the workers so each part is uploaded by one of
+        # them.  Once one part has failed for good, no more are started.
+        for part in self._parts:
+            if self._failure is not None:
+                return
+            yield self._upload_part(*part)
+
+    def _upload_part(self, part_number, offset, length, attempt=1,
+                     delay=None):
+        producer = FileBodyProducer(
+            _FileSegment(self._file, offset, length),
+            cooperator=self._cooperator,
+        )
+        d = self._client.upload_part(
+            self._bucket, self._object_name, self._upload_id, part_number,
+            body_producer=producer,
+        )
+        d.addCallback(self._part_uploaded, part_number)
+        d.addErrback(
+            self._part_failed, part_number, offset, length, attempt, delay,
+        )
+        return d
+
+    def _part_uploaded(self, headers, part_number):
+        self._etags[part_number] = _etag(headers)
+
+    def _part_failed(self, reason, part_number, offset, length, attempt,
+                     delay):
+        if (
+            self._failure is None
+            and attempt < self._part_attempts
+            and _part_retryable(reason)
+            and self._retry_policy.budget.withdraw()
+        ):
+            # Back off, for longer if S3 is throttling, so that parts
+            # failing together are not all retried together.
+            kind = self._retry_policy.classify(reason) or _retry.TRANSIENT
+            delay = self._retry_policy.next_delay(kind, delay)
+            return deferLater(
+                self._reactor, delay, self._retry_part, reason,
+                part_number, offset, length, attempt + 1, delay,
+            )
+        if self._failure is None:
+            self._failure = reason
+        return reason
+
+    def _retry_part(self, reason, part_number, offset, length, attempt,
+                    delay):
+        # Another part may have failed for good while this one waited.
+        if self._failure is not None:
+            return reason
+        return self._upload_part(part_number, offset, length, attempt, delay)
+
+    def _uploaded(self, results):
+        # Every worker has finished, so no part is still being uploaded
+        # when the upload is completed or aborted.
+        for success, result in results:
+            if not success and self._failure is None:
+                self._failure = result
+        if self._failure is not None:
+            return self._abort(self._failure)
+        d = self._client.complete_multipart_upload(
+            self._bucket, self._object_name, self._upload_id,
+            sorted(self._etags.items()),
+        )
+        d.addCallbacks(lambda ignored: None, self._abort)
+        return d
+
+    def _abort(self, reason):
+        d = self._client.abort_multipart_upload(
+            self._bucket, self._object_name, self._upload_id,
+        )
+        # The upload failing is what matters to the caller.  Parts left
+        # behind by an abort which failed too are for a bucket lifecycle
+        # rule to clean up.
+        d.addBoth(lambda ignored: reason)
+        return d
+
+
+def upload_file(client, source, bucket, object_name, part_size,
+                concurrency, part_attempts, content_type, metadata,
+                amz_headers, retry_policy, reactor, cooperator):
+    """
+    Upload a file to S3, in parts uploaded several at a time if it is
+    larger than one part.
+
+    See L{txaws.s3.client.S3Client.upload_file}.
+
+    @param retry_policy: The policy with which to delay and limit the
+        retries of parts or C{None} for a default policy of the upload's
+        own.
+
+    @param reactor: The reactor with which to delay retries or C{None} for
+        the global reactor.
+    """
+    if concurrency < 1:
+        raise ValueError(
+            "concurrency must be at least 1, not {}".format(concurrency),
+        )
+    if part_attempts < 1:
+        raise ValueError(
+            "part_attempts must be at least 1, not {}".format(part_attempts),
+        )
+    if reactor is None:
+        reactor = namedAny("twisted.internet.reactor")
+    if retry_policy is None:
+        retry_policy = _retry.retry_policy(reactor=reactor)
+    if isinstance(source, (str, bytes)):
+        fileobj = owned = open(source, "rb")
+    else:
+        fileobj = source
+        owned = None
+
+    def close(result):
+        if owned is not None:
+            owned.close()
+        return result
+
+    try:
+        start = fileobj.tell()
+        size = _size(fileobj)
+        part_size = _part_size(size, part_size)
+    except Exception:
+        close(None)
+        raise
+
+    if size <= part_size:
+        d = client.put_object(
+            bucket, object_name, content_type=content_type,
+            metadata=metadata, amz_headers=amz_headers,
+            body_producer=FileBodyProducer(
+                _FileSegment(fileobj, start, size), cooperator=cooperator,
+            ),
+        )
+        d.addCallback(lambda ignored: None)
+    else:
+        parts = [
+            (number, start + offset, min(part_size, size - offset))
+            for (number, offset) in enumerate(range(0, size, part_size), 1)
+        ]
+        upload = _MultipartUpload(
+            client, fileobj, bucket, object_name, parts, concurrency,
+            part_attempts, retry_policy, reactor, cooperator,
+        )
+        d = upload.start(content_type, metadata, amz_headers)
+    d.addBoth(close)
+    return d
+
+
+class _OffsetWriter:
+    """
+    A file-like object writing to a file descriptor from an offset on.
+
+    Writers of one file at different offsets may write from different
+    threads at the same time: each write says where it goes rather than
+    relying on the position of the file.
+    """
+    def __init__(self, fd, offset):
+        self._fd = fd
+        self._offset = offset
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self._fd, view, self._offset)
+            self._offset += written
+            view = view[written:]
+
+
+def _md5_etag(path, size, part_size):
+    """
+    Compute the ETag S3 gives an object with the contents of a file, if
+    it was uploaded in one request or in parts of a given size.
+
+    @param part_size: The size of the parts or C{None} for one request.
+
+    @rtype: L{str}
+    """
+    digests = []
+    with open(path, "rb") as fileobj:
+        for offset in range(0, size, part_size or size or 1):
+            length = min(part_size or size, size - offset)
+            digest = md5()
+            while length:
+                data = fileobj.read(min(length, 2 ** 20))
+                if not data:
+                    break
+                digest.update(data)
+                length -= len(data)
+            digests.append(digest)
+    if part_size is None:
+        return (digests[0] if digests else md5()).hexdigest()
+    combined = md5(b"".join(digest.digest() for digest in digests))
+    return "{}-{}".format(combined.hexdigest(), len(digests))
+
+
+def _etag_part_sizes(size, count, part_size):
+    """
+    Guess the part sizes an object with a multipart ETag may have been
+    uploaded with.
+
+    The ETag says how many parts there were but not how large they were.
+    Try the size the object is downloaded in, the default upload part
+    size and the smallest whole number of MiB giving as many parts.
+
+    @rtype: L{list} of L{int}
+    """
+    mib = 2 ** 20
+    smallest = -(-size // count)
+    candidates = [part_size, DEFAULT_PART_SIZE, -(-smallest // mib) * mib]
+    sizes = []
+    for candidate in candidates:
+        if candidate not in sizes and -(-size // candidate) == count:
+            sizes.append(candidate)
+    return sizes
+
+
+def _matches_etag(path, size, etag, part_size, uncheckable=True):
+    """
+    Check the contents of a file against an ETag.
+
+    @param uncheckable: The result if the ETag cannot be checked.
+
+    @return: C{True} if the file matches the ETag, C{False} if it does not
+        match or C{uncheckable} if the ETag cannot be checked.
+    """
+    etag = etag.strip('"')
+    if "-" not in etag:
+        return _md5_etag(path, size, None) == etag
+    try:
+        count = int(etag.rsplit("-", 1)[1])
+    except ValueError:
+        return uncheckable
+    sizes = _etag_part_sizes(size, count, part_size)
+    if not sizes:
+        return uncheckable
+    return any(
+        _md5_etag(path, size, candidate) == etag for candidate in sizes
+    )
+
+
+class _Download:
+    """
+    The download of one object in ranges, several at a time, into a file.
+
+    @ivar _failure: The L{Failure} which ended the download or C{None}.
+    """
+    def __init__(self, client, bucket, object_name, path, part_size,
+                 concurrency, verify, reactor, cooperator):
+        self._client = client
+        self._bucket = bucket
+        self._object_name = object_name
+        self._path = path
+        self._part_size = part_size
+        self._concurrency = concurrency
+        self._verify = verify
+        self._reactor = reactor
+        self._cooperator = cooperator
+        self._failure = None
+
+    def start(self, headers):
+        self._headers = headers
+        size = int(_header(headers, "content-length"))
+        etag = _header(headers, "etag")
+        ranges = [
+            (first, min(first + self._part_size, size) - 1)
+            for first in range(0, size, self._part_size)
+        ]
+        self._file = open(self._path, "wb")
+        try:
+            # Allocate the whole file up front so each range can be written
+            # in place as it arrives.
+            self._file.truncate(size)
+        except Exception:
+            self._remove(None)
+            raise
+        d = _workers(
+            self._cooperator, self._work(ranges, etag),
+            min(self._concurrency, len(ranges)),
+        )
+        d.addCallback(self._downloaded, size, etag)
+        d.addErrback(self._remove)
+        return d
+
+    def _work(self, ranges, etag):
+        for first, last in ranges:
+            if self._failure is not None:
+                return
+            yield self._get_range(first, last, etag)
+
+    def _get_range(self, first, last, etag):
+        consumer = FileConsumer(
+            _OffsetWriter(self._file.fileno(), first), self._reactor,
+        )
+        # If-Match fails the request if the object has been replaced
+        # since it was first looked at, rather than mixing two versions.
+        d = self._client.get_object_range(
+            self._bucket, self._object_name, consumer, first, last,
+            if_match=etag,
+        )
+        d.addCallback(lambda ignored: consumer.finish())
+        d.addErrback(self._range_failed, consumer)
+        return d
+
+    def _range_failed(self, reason, consumer):
+        if self._failure is None:
+            self._failure = reason
+        # Some of the range may have arrived before it failed.  The file
+        # is not to be closed or removed while that is still being
+        # written to it.
+        d = consumer.finish()
+        d.addBoth(lambda ignored: reason)
+        return d
+
+    def _downloaded(self, results, size, etag):
+        self._file.close()
+        for success, result in results:
+            if not success and self._failure is None:
+                self._failure = result
+        if self._failure is not None:
+            return self._failure
+        if not self._verify or etag is None:
+            return self._headers
+        d = deferToThreadPool(
+            self._reactor, self._reactor.getThreadPool(),
+            _matches_etag, self._path, size, etag, self._part_size,
+        )
+        d.addCallback(self._verified, etag)
+        return d
+
+    def _verified(self, matches, etag):
+        if not matches:
+            raise ETagMismatch(
+                "Contents of {} do not match ETag {}".format(
+                    self._object_name, etag,
+                ),
+            )
+        return self._headers
+
+    def _remove(self, reason):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+        return reason
+
+
+def download_file(client, bucket, object_name, path, part_size, concurrency,
+                  verify, reactor, cooperator):
+    """
+    Download an object to a file in ranges downloaded several at a time.
+
+    See L{txaws.s3.client.S3Client.download_file}.
+    """
+    if concurrency < 1:
+        raise ValueError(
+            "concurrency must be at least 1, not {}".format(concurrency),
+        )
+    if part_size < 1:
+        raise ValueError(
+            "part_size must be at least 1, not {}".format(part_size),
+        )
+    if reactor is None:
+        reactor = namedAny("twisted.internet.reactor")
+    download = _Download(
+        client, bucket, object_name, path, part_size, concurrency, verify,
+        reactor, cooperator,
+    )
+    # Every range is got on the condition the object still has the ETag
+    # this finds, so it must not be stale.
+    d = client.head_object(bucket, object_name, cached=False)
+    d.addCallback(download.start)
+    return d
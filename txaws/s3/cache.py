@@ -0,0 +1,369 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Caching of the objects an L{S3Client} gets.
+
+A client with an object cache remembers the body, ETag and Last-Modified
+time of the objects it gets.  Getting one again is a conditional request
+which S3 answers without the body if the object has not changed, and the
+remembered body is used.  Bodies are held in memory up to a number of
+bytes, the least recently used discarded first.  Larger ones may be kept
+in files in a directory instead.
+
+The headers of the objects the client heads are reused without a request
+for a while after they are got, for up to a number of objects.
+
+Only changes made through the client itself are noticed before a
+conditional request or the expiry of remembered headers finds them.
+
+A cache may be shared by several clients, so it is not closed by any of
+them.  Whoever made it closes it once they are done with it, which removes
+the files it kept.
+"""
+
+__all__ = [
+    "object_cache",
+]
+
+import os
+import shutil
+from collections import OrderedDict
+from tempfile import mkdtemp
+
+import attr
+from attr import validators
+
+from twisted.internet.defer import succeed
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.reflect import namedAny
+
+
+def object_cache(**kw):
+    """
+    Create a cache of the objects an L{S3Client} gets.
+
+    @param max_bytes: The most bytes of bodies to hold in memory.
+    @type max_bytes: L{int}
+
+    @param head_ttl: The seconds for which to reuse the headers of an
+        object got by L{S3Client.head_object}, or C{0} to always make the
+        request.
+    @type head_ttl: L{int} or L{float}
+
+    @param max_heads: The most objects whose headers to remember.  The
+        least recently remembered are forgotten first.
+    @type max_heads: L{int}
+
+    @param directory: The path of a directory in which to keep the bodies
+        larger than C{disk_threshold} or C{None} to keep all bodies in
+        memory.  The cache makes a new subdirectory of its own there for
+        the files, which L{_ObjectCache.close} removes, and leaves anything
+        else in the directory alone.
+    @type directory: L{str} or L{NoneType}
+
+    @param disk_threshold: The size in bytes above which bodies are kept
+        in C{directory}.
+    @type disk_threshold: L{int}
+
+    @param max_disk_bytes: The most bytes of bodies to keep in
+        C{directory}.
+    @type max_disk_bytes: L{int}
+
+    @param reactor: The reactor whose time decides the freshness of headers
+        and in whose thread pool files are read and written, or C{None}
+        for the global reactor.
+
+    @rtype: L{_ObjectCache}
+    """
+    return _ObjectCache(**kw)
+
+
+def _positive(inst, a, value):
+    if value < 1:
+        raise ValueError("{} must be at least 1, not {}".format(a.name, value))
+
+
+def _not_negative(inst, a, value):
+    if value < 0:
+        raise ValueError("{} must be at least 0, not {}".format(a.name, value))
+
+
+@attr.s
+class _Body:
+    """
+    A remembered object body.
+
+    @ivar data: The body if it is held in memory, otherwise C{None}.
+    @ivar path: The path of the file the body is kept in if it is not held
+        in memory, otherwise C{None}.
+    """
+    etag = attr.ib()
+    last_modified = attr.ib()
+    size = attr.ib()
+    data = attr.ib(default=None)
+    path = attr.ib(default=None)
+
+
+@attr.s
+class _ObjectCache:
+    """
+    @ivar _memory: An L{OrderedDict} mapping C{(bucket, object_name)} to
+        the L{_Body}s held in memory, least recently used first.
+
+    @ivar _disk: The same for the bodies kept in files.
+
+    @ivar _writing: A L{dict} mapping C{(bucket, object_name)} to the
+        L{_Body} whose file is being written.
+
+    @ivar _files: The number of files written, from which each is named.
+
+    @ivar _heads: An L{OrderedDict} mapping C{(bucket, object_name)} to
+        the time until which an object's headers may be reused and the
+        headers, least recently remembered first.
+
+    @ivar _files_directory: The subdirectory of C{directory} in which the
+        cache keeps files or C{None} if it has not made one yet.
+    """
+    max_bytes = attr.ib(
+        default=64 * 2 ** 20,
+        validator=[validators.instance_of(int), _positive],
+    )
+    head_ttl = attr.ib(
+        default=60,
+        validator=[validators.instance_of((int, float)), _not_negative],
+    )
+    max_heads = attr.ib(
+        default=10000, validator=[validators.instance_of(int), _positive],
+    )
+    directory = attr.ib(
+        default=None, validator=validators.optional(validators.instance_of(str)),
+    )
+    disk_threshold = attr.ib(
+        default=2 ** 20, validator=[validators.instance_of(int), _not_negative],
+    )
+    max_disk_bytes = attr.ib(
+        default=2 ** 30,
+        validator=[validators.instance_of(int), _positive],
+    )
+    _reactor = attr.ib(default=None)
+    _memory = attr.ib(default=attr.Factory(OrderedDict), init=False)
+    _memory_bytes = attr.ib(default=0, init=False)
+    _disk = attr.ib(default=attr.Factory(OrderedDict), init=False)
+    _disk_bytes = attr.ib(default=0, init=False)
+    _writing = attr.ib(default=attr.Factory(dict), init=False)
+    _files = attr.ib(default=0, init=False)
+    _heads = attr.ib(default=attr.Factory(OrderedDict), init=False)
+    _files_directory = attr.ib(default=None, init=False)
+
+    def __attrs_post_init__(self):
+        if self._reactor is None:
+            self._reactor = namedAny("twisted.internet.reactor")
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def head(self, bucket, object_name):
+        """
+        Get the remembered headers of an object.
+
+        @return: The L{dict} of headers or C{None} if there are none fresh
+            enough to reuse.
+        """
+        entry = self._heads.get((bucket, object_name))
+        if entry is None:
+            return None
+        expires, headers = entry
+        if self._reactor.seconds() >= expires:
+            del self._heads[bucket, object_name]
+            return None
+        return dict(headers)
+
+    def remember_head(self, bucket, object_name, headers):
+        """
+        Remember the headers of an object.
+
+        @param headers: The L{dict} of headers L{S3Client.head_object}
+            gives.
+        """
+        if self.head_ttl:
+            key = (bucket, object_name)
+            self._heads[key] = (
+                self._reactor.seconds() + self.head_ttl, dict(headers),
+            )
+            self._heads.move_to_end(key)
+            while len(self._heads) > self.max_heads:
+                self._heads.popitem(last=False)
+
+    def conditions(self, bucket, object_name):
+        """
+        Get the headers which make a request for an object conditional on
+        it having changed since its body was remembered.
+
+        @return: A L{dict} mapping header names to values, empty if no body
+            is remembered.
+        """
+        body = self._body(bucket, object_name)
+        if body is None:
+            return {}
+        conditions = {"if-none-match": body.etag}
+        if body.last_modified is not None:
+            conditions["if-modified-since"] = body.last_modified
+        return conditions
+
+    def body(self, bucket, object_name, etag):
+        """
+        Get the remembered body of an object.
+
+        @param etag: The ETag S3 gave for the object.
+
+        @return: A L{Deferred} that fires with the body as L{bytes}, or with
+            C{None} if the body remembered is not the one with this ETag or
+            is no longer remembered.
+        """
+        key = (bucket, object_name)
+        body = self._body(bucket, object_name)
+        etag = _text(etag)
+        if body is None or (etag is not None and etag != body.etag):
+            return succeed(None)
+        if body.data is not None:
+            self._memory.move_to_end(key)
+            return succeed(body.data)
+        self._disk.move_to_end(key)
+        d = self._in_thread(_read, body.path)
+        # A file discarded while it was read is just no longer remembered.
+        d.addErrback(lambda reason: None)
+        return d
+
+    def store(self, bucket, object_name, headers, data):
+        """
+        Remember the body of an object.
+
+        @param headers: The response headers S3 gave with the body.
+        @type headers: L{twisted.web.http_headers.Headers}
+
+        @param data: The body.
+        @type data: L{bytes}
+        """
+        self.discard(bucket, object_name)
+        [etag] = headers.getRawHeaders(b"etag", [None])
+        if etag is None or not isinstance(data, bytes):
+            return
+        [last_modified] = headers.getRawHeaders(b"last-modified", [None])
+        body = _Body(
+            _text(etag), _text(last_modified), len(data), data=data,
+        )
+        key = (bucket, object_name)
+        if self.directory is not None and body.size > self.disk_threshold:
+            if body.size <= self.max_disk_bytes:
+                self._write(key, body)
+        elif body.size <= self.max_bytes:
+            self._memory[key] = body
+            self._memory_bytes += body.size
+            while self._memory_bytes > self.max_bytes:
+                ignored, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.size
+
+    def discard(self, bucket, object_name):
+        """
+        Forget an object, for example because it has been changed.
+        """
+        key = (bucket, object_name)
+        self._heads.pop(key, None)
+        self._writing.pop(key, None)
+        body = self._memory.pop(key, None)
+        if body is not None:
+            self._memory_bytes -= body.size
+        body = self._disk.pop(key, None)
+        if body is not None:
+            self._disk_bytes -= body.size
+            self._in_thread(_remove, body.path)
+
+    def close(self):
+        """
+        Forget every remembered body and header and remove the files the
+        cache kept, with its subdirectory of C{directory}.
+
+        The cache may still be used afterwards.  It makes a new
+        subdirectory if it is to keep more files.
+
+        @return: A L{Deferred} that fires when the files have been removed.
+        """
+        self._memory.clear()
+        self._memory_bytes = 0
+        self._disk.clear()
+        self._disk_bytes = 0
+        self._writing.clear()
+        self._heads.clear()
+        files_directory, self._files_directory = self._files_directory, None
+        if files_directory is None:
+            return succeed(None)
+        return self._in_thread(shutil.rmtree, files_directory, True)
+
+    def _body(self, bucket, object_name):
+        key = (bucket, object_name)
+        body = self._memory.get(key)
+        if body is None:
+            body = self._disk.get(key)
+        return body
+
+    def _write(self, key, body):
+        if self._files_directory is None:
+            # A directory of its own, so that the files the cache names
+            # never clash with, nor replace, those of anything else using
+            # the directory, including other caches.
+            self._files_directory = mkdtemp(
+                prefix="txaws-s3-cache-", dir=self.directory,
+            )
+        self._files += 1
+        body.path = os.path.join(self._files_directory, "%d" % (self._files,))
+        data, body.data = body.data, None
+        self._writing[key] = body
+        d = self._in_thread(_write, body.path, data)
+        d.addCallbacks(
+            lambda ignored: self._written(key, body),
+            lambda reason: None,
+        )
+
+    def _written(self, key, body):
+        if self._writing.get(key) is not body:
+            # The object was forgotten while this was written.
+            self._in_thread(_remove, body.path)
+            return
+        del self._writing[key]
+        self._disk[key] = body
+        self._disk_bytes += body.size
+        while self._disk_bytes > self.max_disk_bytes:
+            ignored, evicted = self._disk.popitem(last=False)
+            self._disk_bytes -= evicted.size
+            self._in_thread(_remove, evicted.path)
+
+    def _in_thread(self, f, *a):
+        return deferToThreadPool(
+            self._reactor, self._reactor.getThreadPool(), f, *a
+        )
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode("latin-1")
+    return value
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write(path, data):
+    # Written aside and renamed into place so a reader never sees part of
+    # a body.
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.rename(temporary, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
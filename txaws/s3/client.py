@@ -16,33 +16,49 @@ functionality in this wrapper.
 from io import BytesIO
 import datetime
 import mimetypes
+import os
 import warnings
 from operator import itemgetter
+from uuid import uuid4
 
 from incremental import Version
 
 from twisted.python.deprecate import deprecatedModuleAttribute
-from twisted.web.http import datetimeToString
+from twisted.python.failure import Failure
+from twisted.web.http import (
+    NOT_MODIFIED, OK, PARTIAL_CONTENT, datetimeToString,
+)
 from twisted.web.http_headers import Headers
 from twisted.web.client import FileBodyProducer
+from twisted.web.iweb import UNKNOWN_LENGTH
 from twisted.internet import task
+from twisted.internet.defer import succeed
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.reflect import namedAny
 
 import hashlib
 from hashlib import sha256
 
-from urllib import urlencode, unquote
+import attr
+
+from urllib.parse import urlencode, unquote
+from xml.sax.saxutils import escape
 from dateutil.parser import parse as parseTime
 
 from txaws.client.base import (
-    _URLContext, BaseClient, BaseQuery, error_wrapper,
-    RequestDetails, query,
+    _URLContext, BaseClient, BaseQuery, ConsumerBodyReceiver, error_wrapper,
+    RequestDetails, query, default_connection_pool,
 )
+from txaws.client._consumers import FileConsumer
+from txaws.client._validators import unvalidated
+from txaws.s3 import _delete, _hashing, _listing, _sync, _transfer
+from txaws.s3 import regions as _regions
 from txaws.s3.acls import AccessControlPolicy
 from txaws.s3.model import (
     Bucket, BucketItem, BucketListing, ItemOwner, LifecycleConfiguration,
     LifecycleConfigurationRule, NotificationConfiguration, RequestPayment,
     VersioningConfiguration, WebsiteConfiguration, MultipartInitiationResponse,
-    MultipartCompletionResponse)
+    MultipartCompletionResponse, DeleteResult)
 from txaws import _auth_v4
 from txaws.s3.exception import S3Error
 from txaws.service import AWSServiceEndpoint, REGION_US_EAST_1, S3_ENDPOINT
@@ -57,11 +73,76 @@ def s3_error_wrapper(error):
 
 
 class S3Client(BaseClient):
-    """A client for S3."""
+    """A client for S3.
+
+    @param agent: The agent to use to issue requests or C{None} to use
+        agents from C{connection_pool}.
+
+    @param connection_pool: The pool of persistent connections to issue
+        requests over or C{None} to share the reactor's default pool.
+    @type connection_pool: L{txaws.client.base._ConnectionPool}
+
+    @param receiver_factory: A no-argument callable which returns the
+        protocol to which response bodies are delivered or C{None} to
+        collect them into memory.  For example,
+        L{txaws.client.base.spooling_receiver_factory} bounds the memory
+        used by large responses.  Most methods expect the body to be
+        delivered as L{bytes}.
+
+    @param retry_policy: The policy deciding whether and when to retry
+        failed requests or C{None} to never retry them.  The client's
+        retries are limited by the policy's budget.
+    @type retry_policy: L{txaws.client.retry._RetryPolicy}
+
+    @param scheduler: The scheduler, possibly shared with other clients,
+        which limits how many requests are in flight to each host or
+        C{None} to issue requests immediately.
+    @type scheduler: L{txaws.client.scheduler._RequestScheduler}
+
+    @param request_log: The policy deciding which requests to log or
+        C{None} to log them all.
+    @type request_log: L{txaws.client.request_log._RequestLog}
+
+    @param request_observer: An observer to tell how long each request
+        spent in each phase or C{None} to not time requests.  For example,
+        L{txaws.client.instrumentation.latency_aggregator}.
+    @type request_observer: L{txaws.client.instrumentation.IRequestObserver}
+        provider
+
+    @param object_cache: The cache of the objects the client gets and the
+        headers of those it heads or C{None} to not cache them.
+    @type object_cache: L{txaws.s3.cache._ObjectCache}
+
+    @param coalescer: The coalescer, possibly shared with other clients,
+        which shares one request among identical I{GET} and I{HEAD}
+        requests in flight at once or C{None} to issue every request.
+        Requests which stream their response elsewhere are not coalesced.
+    @type coalescer: L{txaws.client.coalescing._RequestCoalescer}
+
+    @param hash_threshold: The size in bytes above which the bodies given
+        to L{put_object}, L{upload_part} and L{put_object_acl} are hashed
+        in the reactor's thread pool rather than its thread, or C{None} to
+        hash them all in the reactor thread.
+    @type hash_threshold: L{int} or L{NoneType}
+
+    @param reactor: The reactor in whose thread pool to hash bodies or
+        C{None} for the global reactor.
+
+    @param bucket_regions: The cache, possibly shared with other clients,
+        of the regions of buckets or C{None} to send every request to
+        C{endpoint} signed for its first region.  If C{endpoint} is AWS's,
+        requests about a bucket whose region is known are sent to that
+        region's endpoint and signed for it.  See L{txaws.s3.regions}.
+    @type bucket_regions: L{txaws.s3.regions._BucketRegions}
+    """
 
     def __init__(self, creds=None, endpoint=None, query_factory=None,
                  receiver_factory=None, agent=None, utcnow=None,
-                 cooperator=None):
+                 cooperator=None, connection_pool=None, retry_policy=None,
+                 scheduler=None, request_log=None, request_observer=None,
+                 object_cache=None, coalescer=None,
+                 hash_threshold=_hashing.DEFAULT_HASH_THRESHOLD,
+                 reactor=None, bucket_regions=None):
         if query_factory is None:
             query_factory = query
         self.agent = agent
@@ -69,16 +150,87 @@ class S3Client(BaseClient):
         if cooperator is None:
             cooperator = task
         self._cooperator = cooperator
+        if connection_pool is None:
+            connection_pool = default_connection_pool()
+        self.connection_pool = connection_pool
+        self.retry_policy = retry_policy
+        self.scheduler = scheduler
+        self.request_log = request_log
+        self.request_observer = request_observer
+        self.object_cache = object_cache
+        self.coalescer = coalescer
+        self.hash_threshold = hash_threshold
+        self._reactor = reactor
+        self.bucket_regions = bucket_regions
+        if bucket_regions is not None:
+            self._regional_agent = _regions._RegionalAgent(
+                self._host_agent, bucket_regions,
+            )
         super(S3Client, self).__init__(creds, endpoint, query_factory,
                                        receiver_factory=receiver_factory)
 
-    def _submit(self, query):
-        d = query.submit(self.agent, self.receiver_factory, self.utcnow)
+    def _routes(self):
+        """
+        @return: Whether requests about buckets are routed to the regions
+            the cache of bucket regions knows, which is only done if the
+            client's endpoint is AWS's.
+        """
+        if self.bucket_regions is None:
+            return False
+        # An endpoint with no host is the default one, which is AWS's.
+        host = self.endpoint.get_host()
+        return not host or _regions._is_aws_host(host)
+
+    def _get_agent(self):
+        if self._routes():
+            # Requests are routed to the endpoints of buckets' regions.
+            return self._regional_agent
+        return self._host_agent(
+            self.endpoint.scheme, self.endpoint.get_host(), self.endpoint.port,
+        )
+
+    def _host_agent(self, scheme, host, port):
+        if self.agent is not None:
+            return self.agent
+        return self.connection_pool.get_agent(
+            scheme, host, port, self.endpoint.ssl_hostname_verification,
+        )
+
+    def _submit(self, query, receiver_factory=None):
+        if receiver_factory is None:
+            receiver_factory = self.receiver_factory
+        d = query.submit(self._get_agent(), receiver_factory, self.utcnow)
         d.addErrback(s3_error_wrapper)
         return d
 
 
     def _query_factory(self, details, **kw):
+        if self.retry_policy is not None:
+            kw["retry_policy"] = self.retry_policy
+        if self.scheduler is not None:
+            kw["scheduler"] = self.scheduler
+        if self.request_log is not None:
+            kw["request_log"] = self.request_log
+        if self.coalescer is not None:
+            kw["coalescer"] = self.coalescer
+        bucket = details.url_context.path[0]
+        if self.request_observer is not None:
+            kw["request_observer"] = self.request_observer
+            if bucket:
+                kw["bucket"] = bucket
+        if bucket and self._routes():
+            region = self.bucket_regions.get(bucket)
+            if region is not None:
+                details = unvalidated(
+                    RequestDetails,
+                    **dict(
+                        attr.asdict(details, recurse=False),
+                        region=region.encode("ascii"),
+                        url_context=_regions._route(
+                            details.url_context, region,
+                        ),
+                    )
+                )
         return self.query_factory(credentials=self.creds, details=details, **kw)
 
 
@@ -86,6 +238,9 @@ class S3Client(BaseClient):
         body = kw.pop("body", None)
         body_producer = kw.pop("body_producer", None)
         amz_headers = kw.pop("amz_headers", {})
+        content_md5 = kw.pop("content_md5", False)
+        digests = kw.pop("digests", None)
+        sign_payload = kw.pop("sign_payload", False)
 
         # It makes no sense to specify both.  That makes it ambiguous
         # what data should make up the request body.
@@ -107,18 +262,37 @@ class S3Client(BaseClient):
         # (included in the signature) more than 15 minutes in the past
         # are rejected. :/
         if body is not None:
-            content_sha256 = sha256(body).hexdigest().decode("ascii")
+            if digests is None:
+                digests = _hashing.payload_digests(body, content_md5)
+            content_sha256, content_md5 = digests
+            if content_md5:
+                headers = kw.get("headers")
+                headers = Headers() if headers is None else headers.copy()
+                headers.setRawHeaders("content-md5", [content_md5])
+                kw["headers"] = headers
             body_producer = FileBodyProducer(BytesIO(body), cooperator=self._cooperator)
         elif body_producer is None:
             # Just as important is to include the empty content hash
             # for all no-body requests.
-            content_sha256 = sha256(b"").hexdigest().decode("ascii")
+            content_sha256 = sha256(b"").hexdigest()
+        elif sign_payload:
+            # Unless the producer's length is known, in which case it can
+            # be signed a chunk at a time as it is sent.
+            if body_producer.length is UNKNOWN_LENGTH:
+                raise ValueError(
+                    "Cannot sign the payload of a body_producer of unknown "
+                    "length"
+                )
+            content_sha256 = _auth_v4.STREAMING_PAYLOAD
         else:
             # Tell AWS we're not trying to sign the payload.
             content_sha256 = None
 
-        return RequestDetails(
-            region=REGION_US_EAST_1,
+        # These are only ever built by S3Client methods from values known
+        # to be valid so skip validating them again for every request.
+        return unvalidated(
+            RequestDetails,
+            region=REGION_US_EAST_1.encode("ascii"),
             service=b"s3",
             body_producer=body_producer,
             amz_headers=amz_headers,
@@ -127,6 +301,29 @@ class S3Client(BaseClient):
         )
 
 
+    def _hashed_details(self, **kw):
+        """
+        Like L{_details} but hash a body larger than C{hash_threshold} in
+        the reactor's thread pool.
+
+        @return: A L{Deferred} that fires with the L{RequestDetails}.
+        """
+        body = kw.get("body")
+        threshold = self.hash_threshold
+        if body is None or threshold is None or len(body) <= threshold:
+            return succeed(self._details(**kw))
+        if kw.get("body_producer") is not None:
+            raise ValueError("data and body_producer are mutually exclusive")
+        reactor = self._reactor
+        if reactor is None:
+            reactor = namedAny("twisted.internet.reactor")
+        d = deferToThreadPool(
+            reactor, reactor.getThreadPool(), _hashing.payload_digests,
+            body, kw.get("content_md5", False),
+        )
+        d.addCallback(lambda digests: self._details(digests=digests, **kw))
+        return d
+
     def _url_context(self, *a, **kw):
         return s3_url_context(self.endpoint, *a, **kw)
 
@@ -192,7 +389,8 @@ class S3Client(BaseClient):
         query = self._query_factory(details)
         return self._submit(query)
 
-    def get_bucket(self, bucket, marker=None, max_keys=None, prefix=None):
+    def get_bucket(self, bucket, marker=None, max_keys=None, prefix=None,
+                   receiver_factory=None, delimiter=None):
         """
         Get a list of all the objects in a bucket.
 
@@ -213,11 +411,35 @@ class S3Client(BaseClient):
             beginning with this value should be returned.
         @type prefix: L{bytes} or L{NoneType}
 
+        @param receiver_factory: If given, the receiver factory to use for
+            this request instead of the client's.  It must deliver the
+            body as L{bytes}.
+
+        @param delimiter: If given, keys which contain this value after the
+            prefix are not listed.  Instead each distinct part of those
+            keys up to the first delimiter is listed as a common prefix.
+        @type delimiter: L{str} or L{NoneType}
+
         @return: A L{Deferred} that fires with a L{BucketListing}
             describing the result.
 
         @see: U{http://docs.aws.amazon.com/AmazonS3/latest/API/RESTBucketGET.html}
         """
+        d = self._get_bucket_response(
+            bucket, marker, max_keys, prefix, receiver_factory, delimiter,
+        )
+        d.addCallback(self._parse_get_bucket)
+        return d
+
+    def _get_bucket_response(self, bucket, marker=None, max_keys=None,
+                             prefix=None, receiver_factory=None,
+                             delimiter=None):
+        """
+        Get a page of the list of the objects in a bucket without parsing
+        it.
+
+        @return: A L{Deferred} that fires with the response and its body.
+        """
         args = []
         if marker is not None:
             args.append(("marker", marker))
@@ -225,6 +447,11 @@ class S3Client(BaseClient):
             args.append(("max-keys", "%d" % (max_keys,)))
         if prefix is not None:
             args.append(("prefix", prefix))
+        if delimiter is not None:
+            args.append(("delimiter", delimiter))
+        return self._list_bucket(bucket, args, receiver_factory)
+
+    def _list_bucket(self, bucket, args, receiver_factory):
         if args:
             object_name = "?" + urlencode(args)
         else:
@@ -233,45 +460,225 @@ class S3Client(BaseClient):
             method=b"GET",
             url_context=self._url_context(bucket=bucket, object_name=object_name),
         )
-        d = self._submit(self._query_factory(details))
-        d.addCallback(self._parse_get_bucket)
-        return d
+        return self._submit(self._query_factory(details), receiver_factory)
 
     def _parse_get_bucket(self, response):
         status, xml_bytes = response
-        root = XML(xml_bytes)
-        name = root.findtext("Name")
-        prefix = root.findtext("Prefix")
-        marker = root.findtext("Marker")
-        max_keys = root.findtext("MaxKeys")
-        is_truncated = root.findtext("IsTruncated")
-        contents = []
-
-        for content_data in root.findall("Contents"):
-            key = content_data.findtext("Key")
-            date_text = content_data.findtext("LastModified")
-            modification_date = parseTime(date_text)
-            etag = content_data.findtext("ETag")
-            size = content_data.findtext("Size")
-            storage_class = content_data.findtext("StorageClass")
-            owner_id = content_data.findtext("Owner/ID")
-            owner_display_name = content_data.findtext("Owner/DisplayName")
-            owner = ItemOwner(owner_id, owner_display_name)
-            content_item = BucketItem(key, modification_date, etag, size,
-                                      storage_class, owner)
-            contents.append(content_item)
-
-        common_prefixes = []
-        for prefix_data in root.findall("CommonPrefixes"):
-            common_prefixes.append(prefix_data.text)
-
-        return BucketListing(name, prefix, marker, max_keys, is_truncated,
-                             contents, common_prefixes)
+        return _listing.parse_listing(xml_bytes)
+
+    def list_objects(self, bucket, prefix=None, delimiter=None,
+                     continuation_token=None, start_after=None,
+                     max_keys=None, fetch_owner=False,
+                     receiver_factory=None):
+        """
+        Get a page of the list of the objects in a bucket using version 2
+        of the listing API.
+
+        @param bucket: The name of the bucket from which to retrieve objects.
+        @type bucket: L{str}
+
+        @param prefix: If given, only objects with keys beginning with this
+            value are listed.
+        @type prefix: L{str} or L{NoneType}
+
+        @param delimiter: If given, keys which contain this value after the
+            prefix are not listed.  Instead each distinct part of those
+            keys up to the first delimiter is listed as a common prefix.
+        @type delimiter: L{str} or L{NoneType}
+
+        @param continuation_token: If given, the
+            C{next_continuation_token} of the previous page, to get the
+            page after it.
+        @type continuation_token: L{str} or L{NoneType}
+
+        @param start_after: If given, only keys which sort after this value
+            are listed.
+        @type start_after: L{str} or L{NoneType}
+
+        @param max_keys: If given, the maximum number of objects and common
+            prefixes to list.
+        @type max_keys: L{int} or L{NoneType}
+
+        @param fetch_owner: Whether to include the owner of each object.
+            Listings are smaller and quicker without.
+        @type fetch_owner: L{bool}
+
+        @param receiver_factory: If given, the receiver factory to use for
+            this request instead of the client's.  It must deliver the
+            body as L{bytes}.
+
+        @return: A L{Deferred} that fires with a L{BucketListing}
+            describing the result.  Its C{marker} is the C{start_after}
+            given and its C{next_continuation_token} is the token for the
+            next page if it C{is_truncated}.
+
+        @see: U{https://docs.aws.amazon.com/AmazonS3/latest/API/API_ListObjectsV2.html}
+        """
+        d = self._list_objects_response(
+            bucket, prefix, delimiter, continuation_token, start_after,
+            max_keys, fetch_owner, receiver_factory,
+        )
+        d.addCallback(self._parse_list_objects)
+        return d
+
+    def _list_objects_response(self, bucket, prefix=None, delimiter=None,
+                               continuation_token=None, start_after=None,
+                               max_keys=None, fetch_owner=False,
+                               receiver_factory=None):
+        args = [("list-type", "2")]
+        if continuation_token is not None:
+            args.append(("continuation-token", continuation_token))
+        if delimiter is not None:
+            args.append(("delimiter", delimiter))
+        if fetch_owner:
+            args.append(("fetch-owner", "true"))
+        if max_keys is not None:
+            args.append(("max-keys", "%d" % (max_keys,)))
+        if prefix is not None:
+            args.append(("prefix", prefix))
+        if start_after is not None:
+            args.append(("start-after", start_after))
+        return self._list_bucket(bucket, args, receiver_factory)
+
+    def _parse_list_objects(self, response):
+        status, xml_bytes = response
+        return _listing.parse_listing(xml_bytes)
+
+    def walk_bucket(self, bucket, prefix=None, delimiter="/",
+                    concurrency=_listing.DEFAULT_WALK_CONCURRENCY,
+                    ordered=False, page_size=None):
+        """
+        List all the objects in a bucket by listing the parts of its key
+        hierarchy concurrently.
+
+        The prefix is listed with the delimiter.  Each common prefix found
+        is then listed in the same way, so separate branches of the
+        hierarchy are listed at the same time by up to C{concurrency}
+        requests.  The pages of any one prefix are still listed in turn.
+
+        @param bucket: The name of the bucket.
+        @type bucket: L{str}
+
+        @param prefix: If given, only objects with keys beginning with this
+            value are listed.
+        @type prefix: L{str} or L{NoneType}
+
+        @param delimiter: The value separating the levels of the hierarchy.
+        @type delimiter: L{str}
+
+        @param concurrency: The most listing requests to make at a time.
+        @type concurrency: L{int}
+
+        @param ordered: Whether to give the objects in key order, as a
+            single listing would.  Otherwise they are given in the order
+            their pages arrived.
+        @type ordered: L{bool}
+
+        @param page_size: If given, the most objects and common prefixes to
+            request in each page.
+        @type page_size: L{int} or L{NoneType}
+
+        @return: A L{Deferred} that fires with a L{list} of the
+            L{BucketItem}s, or fails with the error of the first listing
+            request which failed.
+        """
+        return _listing.walk_bucket(
+            self, bucket, prefix, delimiter, concurrency, ordered, page_size,
+        )
+
+    def iter_bucket(self, bucket, prefix=None, page_size=None,
+                    prefetch=_listing.DEFAULT_PREFETCH,
+                    max_buffered=_listing.DEFAULT_MAX_BUFFERED, reactor=None):
+        """
+        Iterate over the objects in a bucket, across all the pages of its
+        listing.
+
+        Pages are requested ahead of the objects being consumed.  Each
+        next page is requested as soon as the previous one arrives, before
+        that one is parsed, so the round trip overlaps with parsing and
+        with the consumer's work.
+
+        Use it with C{async for}::
+
+            async for item in s3.iter_bucket("mybucket"):
+                ...
+
+        or call C{next} until it gives C{None}::
+
+            listing = s3.iter_bucket("mybucket")
+            item = yield listing.next()
+
+        @param bucket: The name of the bucket.
+        @type bucket: L{str}
+
+        @param prefix: If given, only objects with keys beginning with this
+            value are listed.
+        @type prefix: L{str} or L{NoneType}
+
+        @param page_size: If given, the most objects to request in each
+            page.  By default S3 gives up to 1000.
+        @type page_size: L{int} or L{NoneType}
+
+        @param prefetch: The most pages to request ahead of the one being
+            consumed.  C{0} requests each page only once the previous one
+            has been consumed.
+        @type prefetch: L{int}
+
+        @param max_buffered: No page is requested ahead while at least this
+            many objects have been received and not consumed.
+        @type max_buffered: L{int}
+
+        @param reactor: The reactor with which to delay parsing a page until
+            the request for the next is under way, or C{None} for the
+            global reactor.
+
+        @return: An asynchronous iterator of L{BucketItem}s.  Its C{next}
+            method returns a L{Deferred} that fires with the next item or
+            C{None} after the last, and its C{close} method stops it
+            requesting more pages.
+        """
+        return _listing.iter_bucket(
+            self, bucket, prefix, page_size, prefetch, max_buffered, reactor,
+        )
+
+    def compact_listing(self, bucket, prefix=None, page_size=None,
+                        listing=None):
+        """
+        List all the objects in a bucket into a L{CompactListing}.
+
+        The pages of the listing are requested in turn, each as soon as the
+        previous one arrives, and their objects are added to the compact
+        listing as they arrive so no more than two pages are held at once.
+
+        @param bucket: The name of the bucket.
+        @type bucket: L{str}
+
+        @param prefix: If given, only objects with keys beginning with this
+            value are listed.
+        @type prefix: L{str} or L{NoneType}
+
+        @param page_size: If given, the most objects to request in each
+            page.  By default S3 gives up to 1000.
+        @type page_size: L{int} or L{NoneType}
+
+        @param listing: If given, the listing to add the objects to.  Its
+            objects must come before the bucket's, for example those of
+            another prefix which sorts before C{prefix}.
+        @type listing: L{CompactListing} or L{NoneType}
+
+        @return: A L{Deferred} that fires with the L{CompactListing}.
+        """
+        return _listing.compact_listing(
+            self, bucket, prefix, page_size, listing,
+        )
 
     def get_bucket_location(self, bucket):
         """
         Get the location (region) of a bucket.
 
+        If the client has a cache of bucket regions, the bucket's region is
+        remembered in it.
+
         @param bucket: The name of the bucket.
         @return: A C{Deferred} that will fire with the bucket's region.
         """
@@ -281,8 +688,16 @@ class S3Client(BaseClient):
         )
         d = self._submit(self._query_factory(details))
         d.addCallback(self._parse_bucket_location)
+        if self.bucket_regions is not None:
+            d.addCallback(self._remember_location, bucket)
         return d
 
+    def _remember_location(self, location, bucket):
+        self.bucket_regions.remember(
+            bucket, _regions._location_region(location),
+        )
+        return location
+
     def _parse_bucket_location(self, response):
         """Parse a C{LocationConstraint} XML document."""
         status, xml_bytes = response
@@ -430,7 +845,8 @@ class S3Client(BaseClient):
         return AccessControlPolicy.from_xml(xml_bytes)
 
     def put_object(self, bucket, object_name, data=None, content_type=None,
-                   metadata={}, amz_headers={}, body_producer=None):
+                   metadata={}, amz_headers={}, body_producer=None,
+                   content_md5=False, sign_payload=False):
         """
         Put an object in a bucket.
 
@@ -443,9 +859,19 @@ class S3Client(BaseClient):
         @param content_type: The type of data being written.
         @param metadata: A C{dict} used to build C{x-amz-meta-*} headers.
         @param amz_headers: A C{dict} used to build C{x-amz-*} headers.
+        @param content_md5: Whether to send the MD5 digest of C{data} for S3
+            to check it against what it receives.
+        @type content_md5: L{bool}
+        @param body_producer: The producer of the data to write instead of
+            C{data}.
+        @param sign_payload: Whether to sign the data from C{body_producer}
+            a chunk at a time as it is sent, for S3 to check it against
+            what it receives.  The length of C{body_producer} must be
+            known.  C{data} is always signed.
+        @type sign_payload: L{bool}
         @return: A C{Deferred} that will fire with the result of request.
         """
-        details = self._details(
+        d = self._hashed_details(
             method=b"PUT",
             url_context=self._url_context(bucket=bucket, object_name=object_name),
             headers=self._headers(content_type),
@@ -453,9 +879,14 @@ class S3Client(BaseClient):
             amz_headers=amz_headers,
             body=data,
             body_producer=body_producer,
+            content_md5=content_md5,
+            sign_payload=sign_payload,
+        )
+        d.addCallback(
+            lambda details: self._submit(self._query_factory(details)),
         )
-        d = self._submit(self._query_factory(details))
         d.addCallback(itemgetter(1))
+        d.addBoth(self._forget, bucket, [object_name])
         return d
 
     def copy_object(self, source_bucket, source_object_name, dest_bucket=None,
@@ -487,32 +918,361 @@ class S3Client(BaseClient):
             amz_headers=amz_headers,
         )
         d = self._submit(self._query_factory(details))
+        d.addBoth(self._forget, dest_bucket, [dest_object_name])
         return d
 
-    def get_object(self, bucket, object_name):
+    def get_object(self, bucket, object_name, receiver_factory=None):
         """
         Get an object from a bucket.
+
+        @param receiver_factory: If given, the receiver factory to use for
+            this request instead of the client's.  For example, one from
+            L{txaws.client.base.spooling_receiver_factory} to bound the
+            memory used by a large object.
+
+        @return: A L{Deferred} that fires with whatever the receiver
+            produced, the object's contents as L{bytes} by default.
+
+        If the client has an object cache and no C{receiver_factory} is
+        given, an object whose body is remembered is only got again if it
+        has changed.
         """
+        if self.object_cache is not None and receiver_factory is None:
+            return self._get_cached_object(bucket, object_name)
         details = self._details(
             method=b"GET",
             url_context=self._url_context(bucket=bucket, object_name=object_name),
         )
-        d = self._submit(self._query_factory(details))
+        d = self._submit(self._query_factory(details), receiver_factory)
         d.addCallback(itemgetter(1))
         return d
 
-    def head_object(self, bucket, object_name):
+    def _get_cached_object(self, bucket, object_name, conditional=True):
+        cache = self.object_cache
+        headers = Headers()
+        if conditional:
+            for name, value in cache.conditions(bucket, object_name).items():
+                headers.setRawHeaders(name, [value])
+        details = self._details(
+            method=b"GET",
+            url_context=self._url_context(bucket=bucket, object_name=object_name),
+            headers=headers,
+        )
+        d = self._submit(
+            self._query_factory(details, ok_status=(OK, NOT_MODIFIED)),
+        )
+
+        def got(response):
+            response, body = response
+            if response.code != NOT_MODIFIED:
+                cache.store(
+                    bucket, object_name, response.responseHeaders, body,
+                )
+                return body
+            [etag] = response.responseHeaders.getRawHeaders(b"etag", [None])
+            d = cache.body(bucket, object_name, etag)
+            d.addCallback(remembered)
+            return d
+
+        def remembered(body):
+            if body is None:
+                # It was forgotten while S3 was asked whether it changed.
+                return self._get_cached_object(
+                    bucket, object_name, conditional=False,
+                )
+            return body
+
+        d.addCallback(got)
+        return d
+
+    def get_object_stream(self, bucket, object_name, consumer):
+        """
+        Get an object from a bucket, writing its contents to a consumer as
+        they arrive.
+
+        The response is registered with the consumer as a streaming
+        producer so a slow consumer can pause the transfer.  The object
+        is never held in memory in its entirety.
+
+        @param bucket: The name of the bucket.
+        @param object_name: The name of the object.
+        @param consumer: The consumer to which to write the object.
+        @type consumer: L{IConsumer} provider
+
+        @return: A C{Deferred} that fires with the response headers (as
+            for L{head_object}) after the whole object has been written
+            to C{consumer}.
+        """
+        details = self._details(
+            method=b"GET",
+            url_context=self._url_context(bucket=bucket, object_name=object_name),
+        )
+        d = self._submit(
+            self._query_factory(details),
+            receiver_factory=lambda: ConsumerBodyReceiver(consumer),
+        )
+        d.addCallback(lambda response: _to_dict(response[0].responseHeaders))
+        return d
+
+    def get_object_to_file(self, bucket, object_name, destination,
+                           reactor=None):
+        """
+        Get an object from a bucket, writing its contents to a file as they
+        arrive.
+
+        Writes are performed in the reactor's thread pool.  The transfer
+        is paused while the disk falls behind.
+
+        @param bucket: The name of the bucket.
+        @param object_name: The name of the object.
+        @param destination: The path of the file to create (or replace)
+            or an open file object to write to.  A file object is left
+            open.  The object is written to a temporary file beside a path,
+            which replaces the path once the whole object is written and
+            is removed if it is not.
+        @param reactor: The reactor to use to write in its thread pool or
+            C{None} for the global reactor.
+
+        @return: A C{Deferred} that fires with the response headers (as
+            for L{head_object}) after the whole object has been written
+            to the file.
+        """
+        if isinstance(destination, (str, bytes)):
+            # Written aside so a failed download neither leaves part of
+            # the object nor destroys the file it was to replace.
+            path = os.fsdecode(destination)
+            temporary = "{}.{}.tmp".format(path, uuid4().hex)
+            fileobj = open(temporary, "xb")
+        else:
+            fileobj = None
+        consumer = FileConsumer(fileobj or destination, reactor)
+        d = self.get_object_stream(bucket, object_name, consumer)
+
+        def written(result):
+            # Let any writes still in progress finish (or fail) before
+            # reporting the result and closing the file.
+            finished = consumer.finish()
+            finished.addCallback(lambda ignored: result)
+            return finished
+
+        def close(result):
+            if fileobj is None:
+                return result
+            fileobj.close()
+            if not isinstance(result, Failure):
+                try:
+                    os.replace(temporary, path)
+                except OSError:
+                    result = Failure()
+                else:
+                    return result
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            return result
+
+        d.addBoth(written)
+        d.addBoth(close)
+        return d
+
+    def get_object_range(self, bucket, object_name, consumer, first, last,
+                         if_match=None):
+        """
+        Get a range of the bytes of an object from a bucket, writing them
+        to a consumer as they arrive.
+
+        @param bucket: The name of the bucket.
+        @param object_name: The name of the object.
+        @param consumer: The consumer to which to write the bytes.
+        @type consumer: L{IConsumer} provider
+        @param first: The offset of the first byte to get.
+        @type first: L{int}
+        @param last: The offset of the last byte to get.
+        @type last: L{int}
+        @param if_match: If given, the request fails unless the object's
+            ETag is this one.
+
+        @return: A C{Deferred} that fires with the response headers (as
+            for L{head_object}) after the bytes have been written to
+            C{consumer}.  It fails if S3 does not respond with just the
+            range asked for.
+        """
+        headers = Headers({"range": ["bytes=%d-%d" % (first, last)]})
+        if if_match is not None:
+            headers.setRawHeaders("if-match", [if_match])
+        details = self._details(
+            method=b"GET",
+            url_context=self._url_context(bucket=bucket, object_name=object_name),
+            headers=headers,
+        )
+        d = self._submit(
+            self._query_factory(details, ok_status=(PARTIAL_CONTENT,)),
+            receiver_factory=lambda: ConsumerBodyReceiver(consumer),
+        )
+        d.addCallback(lambda response: _to_dict(response[0].responseHeaders))
+        return d
+
+    def download_file(self, bucket, object_name, path,
+                      part_size=_transfer.DEFAULT_PART_SIZE,
+                      concurrency=_transfer.DEFAULT_CONCURRENCY,
+                      verify=True, reactor=None):
+        """
+        Download an object to a file, in ranges downloaded several at a
+        time.
+
+        The size of the object is found with a I{HEAD} request, made even
+        if the client's object cache remembers the object's headers, and
+        the file is created at that size.  The object is then got in
+        ranges of C{part_size} bytes, C{concurrency} at a time, each
+        written in place in the file as it arrives.  Every range is got from the
+        version of the object the I{HEAD} request found.  Writes are
+        performed in the reactor's thread pool.
+
+        If the download fails the file is removed.
+
+        @param bucket: The name of the bucket.
+        @param object_name: The name of the object.
+        @param path: The path of the file to create (or replace).
+        @param part_size: The size in bytes of each range.
+        @type part_size: L{int}
+        @param concurrency: The most ranges to get at a time.
+        @type concurrency: L{int}
+        @param verify: Whether to check the file against the object's ETag
+            once it is written.  The ETag of an object encrypted with a
+            KMS or customer-provided key is not a digest of its contents
+            so this must be C{False} for those.  A multipart ETag is
+            checked if the part size used to upload the object can be
+            guessed.
+        @type verify: L{bool}
+        @param reactor: The reactor to use to write and verify the file in
+            its thread pool or C{None} for the global reactor.
+
+        @return: A C{Deferred} that fires with the response headers of the
+            I{HEAD} request (as for L{head_object}) after the whole object
+            has been written to the file.  It fails with
+            L{txaws.s3.exception.ETagMismatch} if the file does not match
+            the ETag.
+        """
+        return _transfer.download_file(
+            self, bucket, object_name, path, part_size, concurrency, verify,
+            reactor, self._cooperator,
+        )
+
+    def _presigner(self, bucket, expires):
+        """
+        @return: A two-tuple of a L{_auth_v4._QueryStringSigner} of URLs of
+            objects in C{bucket} and the prefix of their paths.
+        """
+        utcnow = self.utcnow
+        if utcnow is None:
+            utcnow = datetime.datetime.utcnow
+        region = None
+        if self._routes():
+            region = self.bucket_regions.get(bucket)
+        if region is None:
+            region = REGION_US_EAST_1
+            host = self.endpoint.get_canonical_host()
+            prefix = "/" + bucket + "/"
+        else:
+            host, virtual = _regions._bucket_host(bucket, region)
+            prefix = "/" if virtual else "/" + bucket + "/"
+        signer = _auth_v4._QueryStringSigner(
+            self.creds, region, "s3", self.endpoint.scheme, host, utcnow(),
+            expires,
+        )
+        return signer, prefix
+
+    def presign(self, method, bucket, object_name, expires, query=None):
+        """
+        Create a URL with which anyone can make a request of an object, on
+        behalf of this client's credentials, until it expires.
+
+        No request is made to create it.  If the client has a cache of
+        bucket regions which knows the bucket's, the URL is for its
+        region's endpoint.
+
+        @param method: The HTTP method of the request (e.g. C{"GET"}).
+        @type method: L{str}
+        @param bucket: The name of the bucket.
+        @type bucket: L{str}
+        @param object_name: The name of the object.
+        @type object_name: L{str}
+        @param expires: The number of seconds from now the URL is valid
+            for, at most a week.
+        @type expires: L{int}
+        @param query: Other query arguments of the request, unquoted, such
+            as C{[("response-content-disposition", "attachment")]}, or
+            C{None}.
+        @type query: L{list} of two-L{tuple}s of L{str}
+
+        @return: The URL.
+        @rtype: L{str}
+        """
+        signer, prefix = self._presigner(bucket, expires)
+        return signer.sign(method, prefix + object_name, query)
+
+    def presign_many(self, method, bucket, object_names, expires,
+                     query=None):
+        """
+        Create a URL for each of several objects, as L{presign} does.
+
+        All of the URLs are signed for the same time with the same key,
+        which is much cheaper than creating each on its own.
+
+        @param object_names: The names of the objects.
+        @type object_names: An iterable of L{str}
+
+        @see: L{presign} for the other parameters.
+
+        @return: The URLs, in the order of C{object_names}.
+        @rtype: L{list} of L{str}
+        """
+        signer, prefix = self._presigner(bucket, expires)
+        sign = signer.sign
+        return [
+            sign(method, prefix + object_name, query)
+            for object_name in object_names
+        ]
+
+    def head_object(self, bucket, object_name, cached=True):
         """
         Retrieve object metadata only.
+
+        If the client has an object cache, the metadata of an object headed
+        recently is given without a request.
+
+        @param cached: Whether metadata remembered by the object cache may
+            be given.  If C{False} a request is always made.
+        @type cached: L{bool}
         """
+        cache = self.object_cache
+        if cache is not None and cached:
+            headers = cache.head(bucket, object_name)
+            if headers is not None:
+                return succeed(headers)
         details = self._details(
             method=b"HEAD",
             url_context=self._url_context(bucket=bucket, object_name=object_name),
         )
         d = self._submit(self._query_factory(details))
         d.addCallback(lambda response: _to_dict(response[0].responseHeaders))
+        if cache is not None:
+            d.addCallback(self._remember_head, bucket, object_name)
         return d
 
+    def _remember_head(self, headers, bucket, object_name):
+        self.object_cache.remember_head(bucket, object_name, headers)
+        return headers
+
+    def _forget(self, result, bucket, object_names):
+        # Whether or not the change succeeded, what was remembered may no
+        # longer be right.
+        if self.object_cache is not None:
+            for object_name in object_names:
+                self.object_cache.discard(bucket, object_name)
+        return result
+
     def delete_object(self, bucket, object_name):
         """
         Delete an object from a bucket.
@@ -524,22 +1284,95 @@ class S3Client(BaseClient):
             url_context=self._url_context(bucket=bucket, object_name=object_name),
         )
         d = self._submit(self._query_factory(details))
+        d.addBoth(self._forget, bucket, [object_name])
         return d
 
+    def delete_objects(self, bucket, keys, quiet=False):
+        """
+        Delete several objects from a bucket in one request.
+
+        @param bucket: The name of the bucket.
+        @param keys: The names of the objects to delete, no more than
+            1000.
+        @type keys: L{list} of L{str}
+        @param quiet: Whether S3 should only report the objects it could
+            not delete rather than every object.
+        @type quiet: L{bool}
+
+        @return: A C{Deferred} that fires with a L{DeleteResult}.  Objects
+            which could not be deleted are reported in it rather than
+            failing the C{Deferred}.
+        """
+        keys = list(keys)
+        if not keys:
+            raise ValueError("No objects to delete")
+        if len(keys) > _delete.MAX_DELETE_KEYS:
+            raise ValueError(
+                "Cannot delete more than %d objects in one request, not %d"
+                % (_delete.MAX_DELETE_KEYS, len(keys))
+            )
+        data = self._build_delete_xml(keys, quiet)
+        details = self._details(
+            method=b"POST",
+            url_context=self._url_context(bucket=bucket, object_name="?delete"),
+            body=data,
+            # S3 requires this for a multi-object delete.
+            content_md5=True,
+        )
+        d = self._submit(self._query_factory(details))
+        d.addBoth(self._forget, bucket, keys)
+        d.addCallback(lambda response: DeleteResult.from_xml(response[1]))
+        return d
+
+    def delete_keys(self, bucket, keys,
+                    batch_size=_delete.MAX_DELETE_KEYS,
+                    concurrency=_delete.DEFAULT_DELETE_CONCURRENCY,
+                    quiet=True):
+        """
+        Delete any number of objects from a bucket, several batches at a
+        time.
+
+        The objects are taken from C{keys} as they are needed, a batch at a
+        time, so a large listing need not be held in memory.  Each batch is
+        deleted by L{delete_objects} and up to C{concurrency} batches are
+        deleted at a time.  If a batch cannot be deleted, no more are
+        started.
+
+        @param bucket: The name of the bucket.
+        @param keys: The objects to delete, as an iterable of their names or
+            of L{BucketItem}s, or as a listing from L{iter_bucket}.
+        @param batch_size: The most objects to delete in each request.
+        @type batch_size: L{int}
+        @param concurrency: The most batches to delete at a time.
+        @type concurrency: L{int}
+        @param quiet: Whether S3 should only report the objects it could
+            not delete.
+        @type quiet: L{bool}
+
+        @return: A C{Deferred} that fires with a L{DeleteResult} for all of
+            the objects once every batch has been deleted, or fails with the
+            error of the first batch which could not be.
+        """
+        return _delete.delete_keys(
+            self, bucket, keys, batch_size, concurrency, quiet,
+            self._cooperator,
+        )
+
     def put_object_acl(self, bucket, object_name, access_control_policy):
         """
         Set access control policy on an object.
         """
         data = access_control_policy.to_xml()
-        details = self._details(
+        d = self._hashed_details(
             method=b"PUT",
             url_context=self._url_context(
                 bucket=bucket, object_name='%s?acl' % (object_name,),
             ),
             body=data,
         )
-        query = self._query_factory(details)
-        d = self._submit(query)
+        d.addCallback(
+            lambda details: self._submit(self._query_factory(details)),
+        )
         d.addCallback(self._parse_acl)
         return d
 
@@ -623,7 +1456,8 @@ class S3Client(BaseClient):
 
     def upload_part(self, bucket, object_name, upload_id, part_number,
                     data=None, content_type=None, metadata={},
-                    body_producer=None):
+                    body_producer=None, content_md5=False,
+                    sign_payload=False):
         """
         Upload a part of data corresponding to a multipart upload.
 
@@ -636,18 +1470,27 @@ class S3Client(BaseClient):
         @param metadata: Additional metadata
         @param body_producer: an C{IBodyProducer} (optional, requires data if
             not specified)
+        @param content_md5: Whether to send the MD5 digest of C{data} for S3
+            to check it against what it receives.
+        @param sign_payload: Whether to sign the data from C{body_producer}
+            a chunk at a time as it is sent.  See L{put_object}.
         @return: the C{Deferred} from underlying query.submit() call
         """
         parms = 'partNumber=%s&uploadId=%s' % (str(part_number), upload_id)
         objectname_plus = '%s?%s' % (object_name, parms)
-        details = self._details(
+        d = self._hashed_details(
             method=b"PUT",
             url_context=self._url_context(bucket=bucket, object_name=objectname_plus),
             headers=self._headers(content_type),
             metadata=metadata,
             body=data,
+            body_producer=body_producer,
+            content_md5=content_md5,
+            sign_payload=sign_payload,
+        )
+        d.addCallback(
+            lambda details: self._submit(self._query_factory(details)),
         )
-        d = self._submit(self._query_factory(details))
         d.addCallback(lambda response: _to_dict(response[0].responseHeaders))
         return d
 
@@ -677,12 +1520,126 @@ class S3Client(BaseClient):
             body=data,
         )
         d = self._submit(self._query_factory(details))
+        d.addBoth(self._forget, bucket, [object_name])
         # TODO - handle error responses
         d.addCallback(
             lambda response: MultipartCompletionResponse.from_xml(response[1])
         )
         return d
 
+    def abort_multipart_upload(self, bucket, object_name, upload_id):
+        """
+        Abort a multipart upload, discarding the parts uploaded so far.
+
+        @param bucket: The bucket name
+        @param object_name: The object name
+        @param upload_id: The multipart upload id
+        @return: a C{Deferred} that fires after request is complete
+        """
+        objectname_plus = '%s?uploadId=%s' % (object_name, upload_id)
+        details = self._details(
+            method=b"DELETE",
+            url_context=self._url_context(bucket=bucket, object_name=objectname_plus),
+        )
+        d = self._submit(self._query_factory(details))
+        return d
+
+    def upload_file(self, source, bucket, object_name,
+                    part_size=_transfer.DEFAULT_PART_SIZE,
+                    concurrency=_transfer.DEFAULT_CONCURRENCY,
+                    part_attempts=_transfer.DEFAULT_PART_ATTEMPTS,
+                    content_type=None, metadata={}, amz_headers={}):
+        """
+        Upload a file as an object, in parts uploaded several at a time if
+        it is larger than one part.
+
+        A file no larger than C{part_size} is put in one request.  A larger
+        one is split into parts of C{part_size} bytes which are uploaded
+        C{concurrency} at a time, each streamed from the file rather than
+        held in memory.  A part whose upload fails is uploaded again, up to
+        C{part_attempts} times in all, after a jittered backoff delay and
+        only while the budget of the client's C{retry_policy} (or of a
+        default policy) allows.  If a part cannot be uploaded, no
+        more are started and the multipart upload is aborted once those in
+        progress are done.
+
+        @param source: The path of the file to upload or an open, seekable
+            file object to upload from its current position.  A file object
+            is left open.
+        @param bucket: The name of the bucket.
+        @param object_name: The name of the object.
+        @param part_size: The size of each part in bytes.  It is increased
+            if the file would otherwise have more parts than S3 allows.
+        @type part_size: L{int}
+        @param concurrency: The most parts to upload at a time.
+        @type concurrency: L{int}
+        @param part_attempts: The most times to try to upload each part.
+        @type part_attempts: L{int}
+        @param content_type: The type of data being written.
+        @param metadata: A C{dict} used to build C{x-amz-meta-*} headers.
+        @param amz_headers: A C{dict} used to build C{x-amz-*} headers.
+
+        @return: A C{Deferred} that fires with C{None} once the object has
+            been created, or fails with the error which ended the upload.
+        """
+        return _transfer.upload_file(
+            self, source, bucket, object_name, part_size, concurrency,
+            part_attempts, content_type, metadata, amz_headers,
+            self.retry_policy, self._reactor, self._cooperator,
+        )
+
+    def sync(self, directory, bucket, prefix="", delete=False,
+             concurrency=_sync.DEFAULT_SYNC_CONCURRENCY,
+             part_size=_transfer.DEFAULT_PART_SIZE,
+             part_concurrency=_transfer.DEFAULT_CONCURRENCY, reactor=None):
+        """
+        Make the objects under a prefix of a bucket match the files in a
+        local directory, transferring only the differences.
+
+        Each file is synced to the object named by C{prefix} followed by the
+        path of the file relative to C{directory}, with slashes between
+        directories.  The directory is walked in the order the bucket is
+        listed so the two are compared as they go, neither held in memory.
+
+        A file with no object, or with an object of a different size, is
+        uploaded by L{upload_file}.  So is one modified after its object
+        was, unless its contents match the object's ETag.  Files are hashed
+        to find out in the reactor's thread pool, as is the directory
+        walked.  The ETag of an object encrypted with a KMS or
+        customer-provided key never matches, nor does a multipart ETag
+        whose part size cannot be guessed.
+
+        Up to C{concurrency} files are uploaded at a time.  If one cannot
+        be, no more are started.
+
+        @param directory: The path of the directory.
+        @type directory: L{str}
+        @param bucket: The name of the bucket.
+        @param prefix: The beginning of the names of the objects to sync,
+            usually ending with a slash.
+        @type prefix: L{str}
+        @param delete: Whether to delete the objects under C{prefix} with no
+            file, in batches by L{delete_objects}.
+        @type delete: L{bool}
+        @param concurrency: The most files to upload at a time.
+        @type concurrency: L{int}
+        @param part_size: The size of each part of a file uploaded in parts.
+        @type part_size: L{int}
+        @param part_concurrency: The most parts of each file to upload at a
+            time.
+        @type part_concurrency: L{int}
+        @param reactor: The reactor in whose thread pool to walk the
+            directory and hash files, or C{None} for the global reactor.
+
+        @return: A C{Deferred} that fires with a L{SyncResult} once the
+            bucket has been synced, or fails with the error of the first
+            thing which could not be done.
+        """
+        return _sync.sync(
+            self, directory, bucket, prefix, delete, concurrency, part_size,
+            part_concurrency, reactor, self._cooperator,
+        )
+
     def _build_complete_multipart_upload_xml(self, parts_list):
         xml = []
         parts_list.sort(key=lambda p: int(p[0]))
@@ -696,9 +1653,21 @@ class S3Client(BaseClient):
         return '\n'.join(xml)
 
 
+    def _build_delete_xml(self, keys, quiet):
+        xml = ['<Delete>']
+        if quiet:
+            xml.append('<Quiet>true</Quiet>')
+        for key in keys:
+            xml.append('<Object><Key>%s</Key></Object>' % escape(key))
+        xml.append('</Delete>')
+        return ''.join(xml).encode("utf-8")
+
+
 class Query(BaseQuery):
     """A query for submission to the S3 service."""
 
+    service = "s3"
+
     def __init__(self, bucket=None, object_name=None, data="",
                  content_type=None, metadata={}, amz_headers={},
                  body_producer=None, *args, **kwargs):
@@ -887,9 +1856,16 @@ def s3_url_context(service_endpoint, bucket=None, object_name=None):
                 path.extend(object_name_components)
             else:
                 path.append("")
-    return _S3URLContext(
-        scheme=service_endpoint.scheme.decode("utf-8"),
-        host=service_endpoint.get_host().decode("utf-8"),
+    scheme = service_endpoint.scheme
+    if isinstance(scheme, bytes):
+        scheme = scheme.decode("utf-8")
+    host = service_endpoint.get_host()
+    if isinstance(host, bytes):
+        host = host.decode("utf-8")
+    return unvalidated(
+        _S3URLContext,
+        scheme=scheme,
+        host=host,
         port=service_endpoint.port,
         path=path,
         query=query,
@@ -900,6 +1876,8 @@ class _S3URLContext(_URLContext):
     # Backwards compatibility layer.  For deprecation.  s3_url_context
     # should just return an _URLContext and application code should
     # interact with that interface.
+    __slots__ = ()
+
     def get_host(self):
         return self.get_encoded_host()
 
@@ -914,8 +1892,10 @@ class _S3URLContext(_URLContext):
 def URLContext(service_endpoint, bucket=None, object_name=None):
     args = (service_endpoint,)
     for s in (bucket, object_name):
+        if isinstance(s, bytes):
+            s = s.decode("utf-8")
         if s is not None:
-            args += (s.decode("utf-8"),)
+            args += (s,)
     return s3_url_context(*args)
 
 
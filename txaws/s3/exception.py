@@ -19,3 +19,9 @@ class S3Error(AWSError):
 
     def get_error_message(self, *args, **kwargs):
         return super(S3Error, self).get_error_messages(*args, **kwargs)
+
+
+class ETagMismatch(Exception):
+    """
+    The contents of a downloaded object do not match its ETag.
+    """
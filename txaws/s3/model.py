@@ -4,10 +4,13 @@
 # Copyright (C) 2012 New Dream Network (DreamHost)
 # Licenced under the txaws licence available at /LICENSE in the txaws source.
 
+from array import array
+from calendar import timegm
 from datetime import datetime
 
 import attr
 from attr import validators
+from dateutil.tz import tzutc
 
 from txaws.util import XML
 
@@ -58,6 +61,7 @@ class BucketListing:
     is_truncated = attr.ib()
     contents = attr.ib(default=None)
     common_prefixes = attr.ib(default=None)
+    next_continuation_token = attr.ib(default=None)
 
 
 class LifecycleConfiguration:
@@ -219,3 +223,271 @@ class MultipartCompletionResponse:
                    root.findtext('Key'),
                    root.findtext('ETag'))
 
+
+
+@attr.s
+class DeleteError:
+    """
+    An object which a multi-object delete could not delete.
+
+    @ivar key: The name of the object.
+    @ivar code: The S3 error code, for example C{"AccessDenied"}.
+    @ivar message: A description of the error.
+    """
+    key = attr.ib()
+    code = attr.ib()
+    message = attr.ib()
+
+
+@attr.s
+class DeleteResult:
+    """
+    The outcome of a multi-object delete.
+
+    @ivar deleted: The names of the objects deleted.  Only objects which
+        could not be deleted are reported by a quiet delete so this is
+        empty for one.
+    @type deleted: L{list} of L{str}
+
+    @ivar errors: The objects which could not be deleted.
+    @type errors: L{list} of L{DeleteError}
+    """
+    deleted = attr.ib(default=attr.Factory(list))
+    errors = attr.ib(default=attr.Factory(list))
+
+    @classmethod
+    def from_xml(cls, xml_bytes):
+        """
+        Create an instance from a C{DeleteResult} XML document.
+        """
+        root = XML(xml_bytes)
+        return cls(
+            deleted=[
+                node.findtext("Key") for node in root.findall("Deleted")
+            ],
+            errors=[
+                DeleteError(
+                    node.findtext("Key"),
+                    node.findtext("Code"),
+                    node.findtext("Message"),
+                )
+                for node in root.findall("Error")
+            ],
+        )
+
+
+@attr.s
+class SyncResult:
+    """
+    The outcome of syncing a directory to a bucket.
+
+    @ivar uploaded: The names of the objects uploaded.
+    @type uploaded: L{list} of L{str}
+
+    @ivar deleted: The names of the objects deleted.
+    @type deleted: L{list} of L{str}
+
+    @ivar unchanged: The number of files whose objects were left as they
+        were.
+    @type unchanged: L{int}
+
+    @ivar errors: The objects which could not be deleted.
+    @type errors: L{list} of L{DeleteError}
+    """
+    uploaded = attr.ib(default=attr.Factory(list))
+    deleted = attr.ib(default=attr.Factory(list))
+    unchanged = attr.ib(default=0)
+    errors = attr.ib(default=attr.Factory(list))
+
+
+class CompactListing:
+    """
+    The objects in a bucket, in key order, held compactly enough that a
+    listing of millions of them fits in memory.
+
+    Each attribute of the objects is held in its own column.  The keys are
+    encoded into one L{bytes} blob with an array of the offset of each,
+    sizes and modification times (in whole seconds since the epoch) are
+    arrays of 64 bit integers, and storage classes and owners are arrays
+    of indexes into tables of the distinct values.  ETags are not kept.
+
+    A listing is built by adding the objects of the pages of a bucket
+    listing in turn, as L{S3Client.list_objects} or L{S3Client.get_bucket}
+    gives them.  Iterating over it or indexing it gives L{BucketItem}s made
+    from the columns.
+
+    @ivar storage_classes: The distinct storage classes of the objects,
+        indexed by their codes.
+    @type storage_classes: L{list} of L{str}
+
+    @ivar owners: The distinct owners of the objects, indexed by their
+        codes.
+    @type owners: L{list} of L{ItemOwner}
+    """
+    def __init__(self):
+        self._keys = bytearray()
+        self._offsets = array("q", [0])
+        self._sizes = array("q")
+        self._mtimes = array("q")
+        self._storage_class_codes = array("H")
+        self._owner_codes = array("I")
+        self.storage_classes = []
+        self.owners = []
+        self._storage_class_index = {}
+        self._owner_index = {}
+
+    def add(self, items):
+        """
+        Add objects to the end of this listing.
+
+        @param items: The objects, in key order and after any already
+            added.
+        @type items: An iterable of L{BucketItem}
+
+        @raise ValueError: If the objects are not in key order.
+        """
+        for item in items:
+            key = item.key.encode("utf-8")
+            # Keys are compared as S3 lists them, by their UTF-8 bytes.
+            if len(self) and key <= self._key_bytes(len(self) - 1):
+                raise ValueError(
+                    "Objects must be added in key order: {!r}".format(
+                        item.key,
+                    ),
+                )
+            self._keys += key
+            self._offsets.append(len(self._keys))
+            self._sizes.append(int(item.size))
+            self._mtimes.append(timegm(item.modification_date.utctimetuple()))
+            self._storage_class_codes.append(_intern(
+                item.storage_class, self.storage_classes,
+                self._storage_class_index,
+            ))
+            owner = item.owner
+            if owner is None:
+                owner = ItemOwner(None, None)
+            self._owner_codes.append(_intern(
+                (owner.id, owner.display_name), self.owners,
+                self._owner_index, owner,
+            ))
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        """
+        Get one of the objects.
+
+        @type index: L{int}
+        @rtype: L{BucketItem}
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CompactListing index out of range")
+        return BucketItem(
+            self._key_bytes(index).decode("utf-8"),
+            datetime.fromtimestamp(self._mtimes[index], _UTC),
+            None,
+            "%d" % (self._sizes[index],),
+            self.storage_classes[self._storage_class_codes[index]],
+            self.owners[self._owner_codes[index]],
+        )
+
+    def _key_bytes(self, index):
+        return bytes(
+            self._keys[self._offsets[index]:self._offsets[index + 1]],
+        )
+
+    def _bisect(self, low, high, before):
+        """
+        Find the first of a range of objects whose key is not C{before}.
+
+        @param before: A function of a key's L{bytes} which is true for
+            the keys at the start of the range and false for the rest.
+        """
+        while low < high:
+            middle = (low + high) // 2
+            if before(self._key_bytes(middle)):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def with_prefix(self, prefix):
+        """
+        Get the objects whose keys begin with a prefix.
+
+        They are found by binary search rather than by looking at every
+        object.
+
+        @type prefix: L{str}
+        @rtype: L{CompactListing}
+        """
+        prefix = prefix.encode("utf-8")
+        start = self._bisect(0, len(self), lambda key: key < prefix)
+        end = self._bisect(
+            start, len(self), lambda key: key.startswith(prefix),
+        )
+        listing = CompactListing()
+        first = self._offsets[start]
+        listing._keys = self._keys[first:self._offsets[end]]
+        listing._offsets = array(
+            "q", (offset - first for offset in self._offsets[start:end + 1]),
+        )
+        listing._sizes = self._sizes[start:end]
+        listing._mtimes = self._mtimes[start:end]
+        listing._storage_class_codes = self._storage_class_codes[start:end]
+        listing._owner_codes = self._owner_codes[start:end]
+        # The tables are shared, so codes mean the same in both listings.
+        listing.storage_classes = self.storage_classes
+        listing.owners = self.owners
+        listing._storage_class_index = self._storage_class_index
+        listing._owner_index = self._owner_index
+        return listing
+
+    def to_numpy(self):
+        """
+        Copy the columns of this listing into NumPy arrays.
+
+        This requires NumPy, which txAWS does not otherwise depend on.
+
+        @return: A L{dict} mapping column names to arrays.  C{"keys"} is
+            the L{numpy.uint8} blob of UTF-8 encoded keys and
+            C{"key_offsets"} the L{numpy.int64} offsets of the start of
+            each key in it, with the end of the blob last.  C{"size"} and
+            C{"mtime"} are L{numpy.int64}, the latter in seconds since the
+            epoch.  C{"storage_class"} and C{"owner"} are codes indexing
+            L{storage_classes} and L{owners}.
+        """
+        import numpy
+        return {
+            "keys": numpy.frombuffer(bytes(self._keys), dtype=numpy.uint8),
+            "key_offsets": numpy.array(self._offsets, dtype=numpy.int64),
+            "size": numpy.array(self._sizes, dtype=numpy.int64),
+            "mtime": numpy.array(self._mtimes, dtype=numpy.int64),
+            "storage_class": numpy.array(
+                self._storage_class_codes, dtype=numpy.uint16,
+            ),
+            "owner": numpy.array(self._owner_codes, dtype=numpy.uint32),
+        }
+
+
+_UTC = tzutc()
+
+
+def _intern(value, table, index, entry=None):
+    """
+    Get the code for a value in a table of distinct values, adding it if
+    it is new.
+    """
+    try:
+        return index[value]
+    except KeyError:
+        index[value] = code = len(table)
+        table.append(value if entry is None else entry)
+        return code
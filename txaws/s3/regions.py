@@ -0,0 +1,242 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Routing of the requests an L{S3Client} makes to the region of each bucket.
+
+Requests about a bucket must be signed for the region the bucket is in.
+Sent to another region's endpoint they fail or are redirected.  A client
+with a cache of bucket regions sends the requests about a bucket whose
+region it knows to that region's endpoint, signed for that region, using
+virtual-hosted-style addressing (I{bucket.s3.region.amazonaws.com}) so
+that each bucket's requests have their own pool of connections.
+
+The cache learns the region of a bucket from
+L{S3Client.get_bucket_location} and from the I{x-amz-bucket-region} header
+of any response about the bucket, including the error or redirect
+response to a request sent to the wrong region.  A request about a bucket
+whose region is not yet known is sent to the client's endpoint as it
+would be without the cache.
+
+Only a client whose endpoint is AWS's own routes requests.  One with
+another endpoint, such as a service compatible with S3, sends every
+request to it.
+"""
+
+__all__ = [
+    "bucket_regions",
+]
+
+import re
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+import attr
+from attr import validators
+
+from zope.interface import implementer
+
+from twisted.web.iweb import IAgent
+
+from txaws.client._validators import unvalidated
+
+
+def bucket_regions(**kw):
+    """
+    Create a cache of the regions of buckets.
+
+    @param max_size: The most buckets whose regions to remember.  The
+        least recently used are forgotten first.
+    @type max_size: L{int}
+
+    @rtype: L{_BucketRegions}
+    """
+    return _BucketRegions(**kw)
+
+
+def _positive(inst, a, value):
+    if value < 1:
+        raise ValueError("{} must be at least 1, not {}".format(a.name, value))
+
+
+@attr.s
+class _BucketRegions:
+    """
+    @ivar _regions: An L{OrderedDict} mapping the name of each bucket to
+        its region, least recently used first.
+    """
+    max_size = attr.ib(
+        default=10000, validator=[validators.instance_of(int), _positive],
+    )
+    _regions = attr.ib(init=False, default=attr.Factory(OrderedDict))
+
+    def get(self, bucket):
+        """
+        @return: The region of a bucket or C{None} if it is not known.
+        @rtype: L{str} or L{NoneType}
+        """
+        region = self._regions.get(bucket)
+        if region is not None:
+            self._regions.move_to_end(bucket)
+        return region
+
+    def remember(self, bucket, region):
+        """
+        Remember the region of a bucket.
+        """
+        self._regions[bucket] = region
+        self._regions.move_to_end(bucket)
+        while len(self._regions) > self.max_size:
+            self._regions.popitem(last=False)
+
+    def discard(self, bucket):
+        """
+        Forget the region of a bucket.
+        """
+        self._regions.pop(bucket, None)
+
+
+def _location_region(location):
+    """
+    Get the region of a bucket from its location constraint.
+    """
+    # Buckets in the first region have none and the oldest in Ireland have
+    # the region's old name.
+    if not location:
+        return "us-east-1"
+    if location == "EU":
+        return "eu-west-1"
+    return location
+
+
+# The hosts of AWS's own endpoints.
+_AWS_HOST = re.compile(r"(^|\.)amazonaws\.com(\.cn)?$")
+
+
+def _is_aws_host(host):
+    """
+    Decide whether a host is one of AWS's, whose requests may be routed to
+    the regions of buckets.
+
+    @type host: L{str} or L{bytes}
+
+    @rtype: L{bool}
+    """
+    if isinstance(host, bytes):
+        host = host.decode("ascii")
+    return _AWS_HOST.search(host.lower()) is not None
+
+
+def _regional_host(region):
+    """
+    Get the host of the S3 endpoint of a region.
+    """
+    if region.startswith("cn-"):
+        return "s3.{}.amazonaws.com.cn".format(region)
+    return "s3.{}.amazonaws.com".format(region)
+
+
+# Bucket names which are also a single host label.  Those with dots are
+# addressed path-style since the endpoints' wildcard certificates do not
+# cover them.
+_VIRTUAL_HOSTABLE = re.compile(r"^[a-z0-9][a-z0-9-]{1,61}[a-z0-9]$")
+
+# The hosts of virtual-hosted-style URLs.
+_VIRTUAL_HOST = re.compile(
+    r"^([a-z0-9][a-z0-9-]{1,61}[a-z0-9])\.s3\.[a-z0-9-]+\.amazonaws\.com"
+    r"(\.cn)?$"
+)
+
+
+def _bucket_host(bucket, region):
+    """
+    Get the host to which to send requests about a bucket in a region.
+
+    @return: A two-tuple of the host and whether the bucket is addressed
+        by it, virtual-hosted-style, rather than by the path.
+    """
+    host = _regional_host(region)
+    if _VIRTUAL_HOSTABLE.match(bucket):
+        return bucket + "." + host, True
+    return host, False
+
+
+def _route(url_context, region):
+    """
+    Get the URL with which to make a request about a bucket in a region.
+
+    @param url_context: The path-style URL of the request at the client's
+        endpoint.  The first segment of its path is the bucket.
+    @type url_context: L{txaws.s3.client._S3URLContext}
+
+    @param region: The region of the bucket.
+    @type region: L{str}
+
+    @return: The URL at the region's endpoint.
+    @rtype: L{txaws.s3.client._S3URLContext}
+    """
+    host, virtual = _bucket_host(url_context.path[0], region)
+    path = url_context.path
+    if virtual:
+        path = path[1:]
+    return unvalidated(
+        type(url_context),
+        scheme=url_context.scheme,
+        host=host,
+        port=None,
+        path=path,
+        query=[(argument.name, argument.value) for argument in url_context.query],
+    )
+
+
+def _bucket_of(url):
+    """
+    Get the bucket a request is about from its URL.
+
+    @param url: The URL, as built by L{_route} or
+        L{txaws.s3.client.s3_url_context}.
+    @type url: L{bytes}
+
+    @return: The name of the bucket or C{None} if the request is about
+        no bucket.
+    @rtype: L{str} or L{NoneType}
+    """
+    parts = urlsplit(url.decode("ascii"))
+    virtual = _VIRTUAL_HOST.match(parts.hostname or "")
+    if virtual is not None:
+        return virtual.group(1)
+    bucket = unquote(parts.path.split("/")[1])
+    return bucket or None
+
+
+@implementer(IAgent)
+class _RegionalAgent:
+    """
+    An agent which issues each request with the agent for its URL's host
+    and learns the regions of buckets from the responses.
+    """
+    def __init__(self, get_agent, regions):
+        """
+        @param get_agent: A callable taking the scheme, host and port of an
+            endpoint and returning the L{IAgent} provider to issue requests
+            to it with.
+
+        @param regions: The cache of bucket regions to teach.
+        @type regions: L{_BucketRegions}
+        """
+        self._get_agent = get_agent
+        self._regions = regions
+
+    def request(self, method, uri, headers=None, bodyProducer=None):
+        parts = urlsplit(uri)
+        agent = self._get_agent(parts.scheme, parts.hostname, parts.port)
+        d = agent.request(method, uri, headers, bodyProducer)
+        d.addCallback(self._responded, uri)
+        return d
+
+    def _responded(self, response, uri):
+        regions = response.headers.getRawHeaders(b"x-amz-bucket-region")
+        if regions:
+            bucket = _bucket_of(uri)
+            if bucket is not None:
+                self._regions.remember(bucket, regions[0].decode("ascii"))
+        return response
@@ -0,0 +1,278 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3.cache}.
+"""
+
+import os
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+from twisted.web.http_headers import Headers
+
+from txaws.s3.cache import object_cache
+
+
+class ImmediateThreadPool:
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        try:
+            result = f(*a, **kw)
+        except Exception as e:
+            onResult(False, e)
+        else:
+            onResult(True, result)
+
+
+class ImmediateReactor(Clock):
+    """
+    A clock running thread pool work as soon as it is given.
+    """
+    def getThreadPool(self):
+        return ImmediateThreadPool()
+
+    def callFromThread(self, f, *a, **kw):
+        f(*a, **kw)
+
+
+def headers(etag, last_modified="Wed, 12 Oct 2009 17:50:00 GMT"):
+    headers = Headers({b"etag": [etag]})
+    if last_modified is not None:
+        headers.setRawHeaders(b"last-modified", [last_modified])
+    return headers
+
+
+class ObjectCacheTests(TestCase):
+    """
+    Tests for the cache made by L{object_cache}.
+    """
+    def setUp(self):
+        self.reactor = ImmediateReactor()
+
+    def cache(self, **kw):
+        return object_cache(reactor=self.reactor, **kw)
+
+    def test_conditions(self):
+        """
+        Once a body is remembered, requests for it are conditional on its
+        ETag and Last-Modified time.
+        """
+        cache = self.cache()
+        self.assertEqual({}, cache.conditions("bucket", "key"))
+        cache.store("bucket", "key", headers('"abc"'), b"hello")
+        self.assertEqual(
+            {"if-none-match": '"abc"',
+             "if-modified-since": "Wed, 12 Oct 2009 17:50:00 GMT"},
+            cache.conditions("bucket", "key"),
+        )
+        cache.store("bucket", "other", headers('"def"', None), b"hello")
+        self.assertEqual(
+            {"if-none-match": '"def"'}, cache.conditions("bucket", "other"),
+        )
+
+    def test_body(self):
+        """
+        The remembered body is given for the ETag it was remembered with.
+        """
+        cache = self.cache()
+        cache.store("bucket", "key", headers('"abc"'), b"hello")
+        self.assertEqual(
+            b"hello", self.successResultOf(cache.body("bucket", "key", b'"abc"')),
+        )
+        self.assertIdentical(
+            None, self.successResultOf(cache.body("bucket", "key", b'"def"')),
+        )
+        self.assertIdentical(
+            None, self.successResultOf(cache.body("bucket", "x", b'"abc"')),
+        )
+
+    def test_no_etag(self):
+        """
+        A body without an ETag is not remembered.
+        """
+        cache = self.cache()
+        cache.store("bucket", "key", Headers(), b"hello")
+        self.assertEqual({}, cache.conditions("bucket", "key"))
+
+    def test_least_recently_used(self):
+        """
+        Once more than C{max_bytes} are held, the least recently used
+        bodies are discarded.
+        """
+        cache = self.cache(max_bytes=10)
+        cache.store("bucket", "a", headers('"a"'), b"aaaa")
+        cache.store("bucket", "b", headers('"b"'), b"bbbb")
+        cache.body("bucket", "a", b'"a"')
+        cache.store("bucket", "c", headers('"c"'), b"cccc")
+        self.assertEqual(
+            [True, False, True],
+            [bool(cache.conditions("bucket", key)) for key in "abc"],
+        )
+        # Too large to hold at all.
+        cache.store("bucket", "d", headers('"d"'), b"d" * 11)
+        self.assertEqual({}, cache.conditions("bucket", "d"))
+
+    def test_discard(self):
+        """
+        A discarded object's body and headers are forgotten.
+        """
+        cache = self.cache()
+        cache.store("bucket", "key", headers('"abc"'), b"hello")
+        cache.remember_head("bucket", "key", {b"Etag": b'"abc"'})
+        cache.discard("bucket", "key")
+        self.assertEqual({}, cache.conditions("bucket", "key"))
+        self.assertIdentical(None, cache.head("bucket", "key"))
+
+    def test_head_ttl(self):
+        """
+        Remembered headers are given until C{head_ttl} seconds have passed.
+        """
+        cache = self.cache(head_ttl=10)
+        cache.remember_head("bucket", "key", {b"Etag": b'"abc"'})
+        self.reactor.advance(9)
+        self.assertEqual({b"Etag": b'"abc"'}, cache.head("bucket", "key"))
+        self.reactor.advance(1)
+        self.assertIdentical(None, cache.head("bucket", "key"))
+
+    def test_no_head_ttl(self):
+        """
+        With a C{head_ttl} of C{0}, headers are not remembered.
+        """
+        cache = self.cache(head_ttl=0)
+        cache.remember_head("bucket", "key", {b"Etag": b'"abc"'})
+        self.assertIdentical(None, cache.head("bucket", "key"))
+
+    def test_max_heads(self):
+        """
+        Beyond C{max_heads} objects, the headers least recently remembered
+        are forgotten.
+        """
+        cache = self.cache(max_heads=2)
+        for key in "abc":
+            cache.remember_head("bucket", key, {b"Etag": key.encode("ascii")})
+        cache.remember_head("bucket", "b", {b"Etag": b"b"})
+        cache.remember_head("bucket", "d", {b"Etag": b"d"})
+        self.assertEqual(
+            [None, {b"Etag": b"b"}, None, {b"Etag": b"d"}],
+            [cache.head("bucket", key) for key in "abcd"],
+        )
+
+    def files(self, directory):
+        """
+        @return: The names of the files the cache keeps in its subdirectory
+            of C{directory}.
+        """
+        [subdirectory] = os.listdir(directory)
+        return os.listdir(os.path.join(directory, subdirectory))
+
+    def test_disk(self):
+        """
+        Bodies larger than C{disk_threshold} are kept in files in
+        C{directory}, the least recently used discarded once more than
+        C{max_disk_bytes} are kept.
+        """
+        directory = self.mktemp()
+        cache = self.cache(
+            directory=directory, disk_threshold=4, max_disk_bytes=12,
+        )
+        cache.store("bucket", "small", headers('"s"'), b"sss")
+        cache.store("bucket", "a", headers('"a"'), b"aaaaa")
+        cache.store("bucket", "b", headers('"b"'), b"bbbbb")
+        self.assertEqual(2, len(self.files(directory)))
+        self.assertEqual(
+            b"aaaaa", self.successResultOf(cache.body("bucket", "a", b'"a"')),
+        )
+        cache.store("bucket", "c", headers('"c"'), b"ccccc")
+        self.assertEqual(2, len(self.files(directory)))
+        self.assertEqual(
+            [True, False, True],
+            [bool(cache.conditions("bucket", key)) for key in "abc"],
+        )
+        self.assertEqual(
+            b"sss", self.successResultOf(cache.body("bucket", "small", None)),
+        )
+        cache.discard("bucket", "a")
+        self.assertEqual(1, len(self.files(directory)))
+
+    def test_disk_missing(self):
+        """
+        A body whose file has gone is no longer remembered.
+        """
+        directory = self.mktemp()
+        cache = self.cache(directory=directory, disk_threshold=0)
+        cache.store("bucket", "a", headers('"a"'), b"aaaaa")
+        [subdirectory] = os.listdir(directory)
+        [name] = os.listdir(os.path.join(directory, subdirectory))
+        os.remove(os.path.join(directory, subdirectory, name))
+        self.assertIdentical(
+            None, self.successResultOf(cache.body("bucket", "a", b'"a"')),
+        )
+
+    def test_directory_shared(self):
+        """
+        Files already in C{directory}, including those of another cache,
+        are left alone.
+        """
+        directory = self.mktemp()
+        os.makedirs(directory)
+        path = os.path.join(directory, "1")
+        with open(path, "wb") as f:
+            f.write(b"mine")
+        first = self.cache(directory=directory, disk_threshold=0)
+        first.store("bucket", "a", headers('"a"'), b"aaaaa")
+        second = self.cache(directory=directory, disk_threshold=0)
+        second.store("bucket", "b", headers('"b"'), b"bbbbb")
+        with open(path, "rb") as f:
+            self.assertEqual(b"mine", f.read())
+        self.assertEqual(
+            b"aaaaa", self.successResultOf(first.body("bucket", "a", b'"a"')),
+        )
+        self.assertEqual(
+            b"bbbbb", self.successResultOf(second.body("bucket", "b", b'"b"')),
+        )
+
+    def test_close(self):
+        """
+        L{_ObjectCache.close} forgets everything and removes the cache's
+        subdirectory of C{directory}, leaving the rest of C{directory}
+        alone.  A cache used after it is closed makes a new subdirectory.
+        """
+        directory = self.mktemp()
+        os.makedirs(directory)
+        path = os.path.join(directory, "1")
+        with open(path, "wb") as f:
+            f.write(b"mine")
+        cache = self.cache(directory=directory, disk_threshold=4)
+        cache.store("bucket", "small", headers('"s"'), b"sss")
+        cache.store("bucket", "a", headers('"a"'), b"aaaaa")
+        cache.remember_head("bucket", "a", {"Etag": '"a"'})
+        self.successResultOf(cache.close())
+        self.assertEqual(["1"], os.listdir(directory))
+        self.assertEqual(
+            [{}, {}],
+            [cache.conditions("bucket", key) for key in ["small", "a"]],
+        )
+        self.assertIdentical(None, cache.head("bucket", "a"))
+        cache.store("bucket", "b", headers('"b"'), b"bbbbb")
+        self.assertEqual(2, len(os.listdir(directory)))
+        self.assertEqual(
+            b"bbbbb", self.successResultOf(cache.body("bucket", "b", b'"b"')),
+        )
+
+    def test_close_memory(self):
+        """
+        Closing a cache without a directory just forgets everything.
+        """
+        cache = self.cache()
+        cache.store("bucket", "a", headers('"a"'), b"aaaaa")
+        self.successResultOf(cache.close())
+        self.assertEqual({}, cache.conditions("bucket", "a"))
+
+    def test_invalid(self):
+        """
+        The sizes and C{max_heads} must be positive and the C{head_ttl}
+        not negative.
+        """
+        self.assertRaises(ValueError, self.cache, max_bytes=0)
+        self.assertRaises(ValueError, self.cache, max_disk_bytes=0)
+        self.assertRaises(ValueError, self.cache, max_heads=0)
+        self.assertRaises(ValueError, self.cache, head_ttl=-1)
@@ -1,20 +1,41 @@
 import datetime
+import os
 from hashlib import sha256
+from io import BytesIO
 import warnings
 from urllib.parse import quote
 
 from attr import assoc
 
-from twisted.internet.defer import succeed
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.error import ConnectionLost
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
 from twisted.trial.unittest import TestCase
+from twisted.web.client import ResponseDone
 from twisted.web.http_headers import Headers
+from twisted.web.iweb import UNKNOWN_LENGTH
 
+from txaws import _auth_v4
 from txaws.credentials import AWSCredentials
-from txaws.client.base import RequestDetails
+from txaws.client.base import (
+    RequestDetails, ResponseTooLarge, connection_pool,
+    default_connection_pool, spooling_receiver_factory,
+)
+from txaws.client._consumers import FileConsumer
+from txaws.client.coalescing import request_coalescer
+from txaws.client.instrumentation import latency_aggregator
+from txaws.client.retry import retry_policy
+from txaws.client.request_log import request_log
+from txaws.client.scheduler import request_scheduler
 from txaws.s3 import client
 from txaws.s3.acls import AccessControlPolicy
+from txaws.s3.cache import object_cache
+from txaws.s3.regions import bucket_regions
 from txaws.s3.model import (RequestPayment, MultipartInitiationResponse,
-                            MultipartCompletionResponse)
+                            MultipartCompletionResponse, DeleteError,
+                            DeleteResult)
 from txaws.testing.producers import StringBodyProducer
 from txaws.testing.s3_tests import s3_integration_tests
 from txaws.service import AWSServiceEndpoint, REGION_US_EAST_1
@@ -23,7 +44,7 @@ from txaws.testing.integration import get_live_service
 from txaws.util import calculate_md5
 
 
-EMPTY_CONTENT_SHA256 = sha256(b"").hexdigest().decode("ascii")
+EMPTY_CONTENT_SHA256 = sha256(b"").hexdigest()
 
 
 class URLContextTestCase(TestCase):
@@ -161,6 +182,29 @@ def mock_query_factory(response_body):
     return MockQuery
 
 
+def streaming_query_factory(response_body, reason=None):
+    class Response:
+        code = 200
+        responseHeaders = Headers({"etag": ['"abc"']})
+
+    class StreamingQuery:
+        def __init__(self, credentials, details, **kw):
+            self.__class__.credentials = credentials
+            self.__class__.details = details
+            self.__class__.kw = kw
+
+        def submit(self, agent, receiver_factory, utcnow):
+            receiver = receiver_factory()
+            receiver.finished = d = Deferred()
+            receiver.content_length = len(response_body)
+            receiver.makeConnection(StringTransport())
+            receiver.dataReceived(response_body)
+            receiver.connectionLost(Failure(reason or ResponseDone()))
+            d.addCallback(lambda result: (Response(), result))
+            return d
+    return StreamingQuery
+
+
 class S3ClientTestCase(TestCase):
 
     def setUp(self):
@@ -175,7 +219,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -210,7 +254,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(self.endpoint, "mybucket"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -235,7 +279,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -311,6 +355,91 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_query_args)
         return d
 
+    def test_get_bucket_delimiter(self):
+        """
+        L{S3Client.get_bucket} accepts a C{delimiter} argument and gives the
+        common prefixes listed.
+        """
+        query_factory = mock_query_factory(payload.sample_list_objects_v2_result)
+        def check_query_args(passthrough):
+            self.assertEqual(
+                b"http:///mybucket/?prefix=photos%2F&delimiter=%2F",
+                query_factory.details.url_context.get_encoded_url(),
+            )
+            return passthrough
+
+        def check_results(listing):
+            self.assertEqual(
+                ["photos/2006/", "photos/2007/"], listing.common_prefixes,
+            )
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.get_bucket("mybucket", prefix="photos/", delimiter="/")
+        d.addCallback(check_query_args)
+        d.addCallback(check_results)
+        return d
+
+    def test_list_objects(self):
+        """
+        L{S3Client.list_objects} lists a page of the objects in a bucket with
+        version 2 of the listing API.
+        """
+        query_factory = mock_query_factory(payload.sample_list_objects_v2_result)
+        def check_query_args(passthrough):
+            self.assertEqual(
+                b"http:///mybucket/?list-type=2&continuation-token=abc"
+                b"&delimiter=%2F&max-keys=3&prefix=photos%2F"
+                b"&start-after=photos%2Fa",
+                query_factory.details.url_context.get_encoded_url(),
+            )
+            return passthrough
+
+        def check_results(listing):
+            self.assertEqual("mybucket", listing.name)
+            self.assertEqual("photos/", listing.prefix)
+            self.assertEqual("photos/a", listing.marker)
+            self.assertEqual("true", listing.is_truncated)
+            self.assertEqual(
+                "1ueGcxLPRx1Tr/XYExHnhbYLgveDs2J/wm36Hy4vbOwM=",
+                listing.next_continuation_token,
+            )
+            self.assertEqual(
+                ["photos/b.jpg"], [item.key for item in listing.contents],
+            )
+            self.assertEqual(
+                ["photos/2006/", "photos/2007/"], listing.common_prefixes,
+            )
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.list_objects(
+            "mybucket", prefix="photos/", delimiter="/",
+            continuation_token="abc", start_after="photos/a", max_keys=3,
+        )
+        d.addCallback(check_query_args)
+        d.addCallback(check_results)
+        return d
+
+    def test_list_objects_fetch_owner(self):
+        """
+        L{S3Client.list_objects} asks for the owners of objects only if
+        C{fetch_owner} is true.
+        """
+        query_factory = mock_query_factory(payload.sample_list_objects_v2_result)
+        def check_query_args(passthrough):
+            self.assertEqual(
+                b"http:///mybucket/?list-type=2&fetch-owner=true",
+                query_factory.details.url_context.get_encoded_url(),
+            )
+            return passthrough
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.list_objects("mybucket", fetch_owner=True)
+        d.addCallback(check_query_args)
+        return d
+
     def test_get_bucket_location(self):
         """
         L{S3Client.get_bucket_location} creates a L{Query} to get a bucket's
@@ -325,7 +454,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?location"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -358,7 +487,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?lifecycle"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -396,7 +525,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?lifecycle"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -433,7 +562,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?website"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -467,7 +596,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?website"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -501,7 +630,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?notification"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -535,7 +664,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?notification"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -572,7 +701,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?versioning"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -606,7 +735,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?versioning"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -640,7 +769,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?versioning"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -667,7 +796,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"DELETE",
                     url_context=client.s3_url_context(self.endpoint, "mybucket"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -690,12 +819,12 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?acl"),
                     content_sha256=sha256(
                         payload.sample_access_control_policy_result
-                    ).hexdigest().decode("ascii"),
+                    ).hexdigest(),
                 ),
                 assoc(query_factory.details, body_producer=None),
             )
@@ -721,7 +850,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?acl"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -758,10 +887,10 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?requestPayment"),
-                    content_sha256=sha256(xml).hexdigest().decode("ascii"),
+                    content_sha256=sha256(xml).hexdigest(),
                 ),
                 assoc(query_factory.details, body_producer=None),
             )
@@ -787,7 +916,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "?requestPayment"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -814,7 +943,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "objectname"),
                     headers=Headers({"content-type": ["text/plain"]}),
@@ -822,7 +951,7 @@ class S3ClientTestCase(TestCase):
                     amz_headers={
                         "acl": "public-read",
                     },
-                    content_sha256=sha256(b"some data").hexdigest().decode("ascii"),
+                    content_sha256=sha256(b"some data").hexdigest(),
                 ),
                 assoc(query_factory.details, body_producer=None),
             )
@@ -847,7 +976,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "objectname"),
                     headers=Headers({"content-type": ["text/plain"]}),
@@ -885,7 +1014,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(self.endpoint, "newbucket", "newobjectname"),
                     metadata={"key": "some meta data"},
@@ -916,7 +1045,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "objectname"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -931,6 +1060,167 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_query_args)
         return d
 
+    def test_get_object_receiver_factory(self):
+        """
+        L{S3Client.get_object} uses the receiver factory given to it in
+        preference to the client's.
+        """
+        query_factory = streaming_query_factory(b"object data")
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(
+            creds, query_factory=query_factory,
+            receiver_factory=spooling_receiver_factory(max_size=4),
+        )
+        d = s3.get_object(
+            "mybucket", "objectname",
+            receiver_factory=spooling_receiver_factory(max_memory=4),
+        )
+        self.assertEqual(b"object data", self.successResultOf(d))
+
+    def test_client_receiver_factory(self):
+        """
+        L{S3Client} uses the receiver factory it was created with when a
+        call is not given one.
+        """
+        query_factory = streaming_query_factory(b"object data")
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(
+            creds, query_factory=query_factory,
+            receiver_factory=spooling_receiver_factory(max_size=4),
+        )
+        d = s3.get_object("mybucket", "objectname")
+        self.failureResultOf(d, ResponseTooLarge)
+
+    def test_get_object_stream(self):
+        """
+        L{S3Client.get_object_stream} issues a I{GET} for the object and
+        writes the response body to the given consumer as it arrives.
+        """
+        query_factory = streaming_query_factory(b"object data")
+        consumer = FileConsumer(BytesIO())
+        writes = []
+        self.patch(consumer, "write", writes.append)
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.get_object_stream("mybucket", "objectname", consumer)
+        self.assertEqual(
+            RequestDetails(
+                service=b"s3",
+                region=REGION_US_EAST_1.encode("ascii"),
+                method=b"GET",
+                url_context=client.s3_url_context(self.endpoint, "mybucket", "objectname"),
+                content_sha256=EMPTY_CONTENT_SHA256,
+            ),
+            query_factory.details,
+        )
+        self.assertEqual(
+            {b"ETag": b'"abc"'},
+            self.successResultOf(d),
+        )
+        self.assertEqual([b"object data"], writes)
+
+    def test_get_object_range(self):
+        """
+        L{S3Client.get_object_range} issues a I{GET} for a range of the
+        object, accepting only a partial content response, and writes the
+        response body to the given consumer as it arrives.
+        """
+        query_factory = streaming_query_factory(b"ject")
+        consumer = FileConsumer(BytesIO())
+        writes = []
+        self.patch(consumer, "write", writes.append)
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.get_object_range(
+            "mybucket", "objectname", consumer, 2, 5, if_match='"abc"',
+        )
+        self.assertEqual(
+            RequestDetails(
+                service=b"s3",
+                region=REGION_US_EAST_1.encode("ascii"),
+                method=b"GET",
+                url_context=client.s3_url_context(self.endpoint, "mybucket", "objectname"),
+                headers=Headers({
+                    "range": ["bytes=2-5"],
+                    "if-match": ['"abc"'],
+                }),
+                content_sha256=EMPTY_CONTENT_SHA256,
+            ),
+            query_factory.details,
+        )
+        self.assertEqual({"ok_status": (206,)}, query_factory.kw)
+        self.assertEqual({b"ETag": b'"abc"'}, self.successResultOf(d))
+        self.assertEqual([b"ject"], writes)
+
+    def test_get_object_to_file(self):
+        """
+        L{S3Client.get_object_to_file} writes the object to the file at the
+        given path.
+        """
+        path = self.mktemp()
+        query_factory = streaming_query_factory(b"object data")
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.get_object_to_file("mybucket", "objectname", path)
+
+        def check(headers):
+            self.assertEqual({b"ETag": b'"abc"'}, headers)
+            with open(path, "rb") as f:
+                self.assertEqual(b"object data", f.read())
+        d.addCallback(check)
+        return d
+
+    def test_get_object_to_file_replaces(self):
+        """
+        L{S3Client.get_object_to_file} replaces the file at the given path
+        once the whole object has been written, leaving nothing else in
+        its directory.
+        """
+        directory = self.mktemp()
+        os.makedirs(directory)
+        path = os.path.join(directory, "object")
+        with open(path, "wb") as f:
+            f.write(b"old data")
+        query_factory = streaming_query_factory(b"object data")
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.get_object_to_file("mybucket", "objectname", path)
+
+        def check(headers):
+            self.assertEqual(["object"], os.listdir(directory))
+            with open(path, "rb") as f:
+                self.assertEqual(b"object data", f.read())
+        d.addCallback(check)
+        return d
+
+    def test_get_object_to_file_failure(self):
+        """
+        If the object cannot be got, L{S3Client.get_object_to_file} leaves
+        the file at the given path as it was and removes what it wrote of
+        the object.
+        """
+        directory = self.mktemp()
+        os.makedirs(directory)
+        path = os.path.join(directory, "object")
+        with open(path, "wb") as f:
+            f.write(b"old data")
+        query_factory = streaming_query_factory(
+            b"object", ConnectionLost("gone"),
+        )
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.get_object_to_file("mybucket", "objectname", path)
+        d = self.assertFailure(d, ConnectionLost)
+
+        def check(ignored):
+            self.assertEqual(["object"], os.listdir(directory))
+            with open(path, "rb") as f:
+                self.assertEqual(b"old data", f.read())
+        d.addCallback(check)
+        return d
+
     def test_head_object(self):
         query_factory = mock_query_factory(None)
         def check_query_args(passthrough):
@@ -939,7 +1229,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"HEAD",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "objectname"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -962,7 +1252,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"DELETE",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "objectname"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -985,12 +1275,12 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "myobject?acl"),
                     content_sha256=sha256(
                         payload.sample_access_control_policy_result
-                    ).hexdigest().decode("ascii"),
+                    ).hexdigest(),
                 ),
                 assoc(query_factory.details, body_producer=None),
             )
@@ -1016,7 +1306,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"GET",
                     url_context=client.s3_url_context(self.endpoint, "mybucket", "myobject?acl"),
                     content_sha256=EMPTY_CONTENT_SHA256,
@@ -1043,7 +1333,7 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"POST",
                     url_context=client.s3_url_context(
                         self.endpoint, "example-bucket", "example-object?uploads",
@@ -1079,12 +1369,12 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"PUT",
                     url_context=client.s3_url_context(
                         self.endpoint, "example-bucket", "example-object?partNumber=3&uploadId=testid"
                     ),
-                    content_sha256=sha256(b"some data").hexdigest().decode("ascii"),
+                    content_sha256=sha256(b"some data").hexdigest(),
                 ),
                 assoc(query_factory.details, body_producer=None),
             )
@@ -1098,6 +1388,116 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_query_args)
         return d
 
+    def test_upload_part_body_producer(self):
+        """
+        L{S3Client.upload_part} sends the body of a body producer it is
+        given, without a content hash.
+        """
+        query_factory = mock_query_factory(None)
+        producer = StringBodyProducer(b"some data")
+
+        def check_query_args(passthrough):
+            self.assertIdentical(producer, query_factory.details.body_producer)
+            self.assertIdentical(None, query_factory.details.content_sha256)
+            return passthrough
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.upload_part(
+            "example-bucket", "example-object", "testid", 3,
+            body_producer=producer,
+        )
+        d.addCallback(check_query_args)
+        return d
+
+    def test_abort_multipart_upload(self):
+        query_factory = mock_query_factory(None)
+        def check_query_args(passthrough):
+            self.assertEqual(
+                RequestDetails(
+                    service=b"s3",
+                    region=REGION_US_EAST_1.encode("ascii"),
+                    method=b"DELETE",
+                    url_context=client.s3_url_context(
+                        self.endpoint, "example-bucket", "example-object?uploadId=testid"
+                    ),
+                    content_sha256=EMPTY_CONTENT_SHA256,
+                ),
+                query_factory.details,
+            )
+            return passthrough
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.abort_multipart_upload(
+            "example-bucket", "example-object", "testid",
+        )
+        d.addCallback(check_query_args)
+        return d
+
+    def test_delete_objects(self):
+        """
+        L{S3Client.delete_objects} posts the names of the objects with the
+        I{Content-MD5} of the request and parses the result.
+        """
+        query_factory = mock_query_factory(payload.sample_delete_objects_result)
+        def check_query_args(passthrough):
+            xml = (
+                b"<Delete><Quiet>true</Quiet>"
+                b"<Object><Key>sample1.txt</Key></Object>"
+                b"<Object><Key>a&amp;b</Key></Object></Delete>"
+            )
+            self.assertEqual(
+                RequestDetails(
+                    service=b"s3",
+                    region=REGION_US_EAST_1.encode("ascii"),
+                    method=b"POST",
+                    url_context=client.s3_url_context(
+                        self.endpoint, "example-bucket", "?delete"
+                    ),
+                    headers=Headers(
+                        {"content-md5": [calculate_md5(xml).decode("ascii")]},
+                    ),
+                    content_sha256=sha256(xml).hexdigest(),
+                ),
+                assoc(query_factory.details, body_producer=None),
+            )
+            return passthrough
+
+        def check_result(result):
+            self.assertEqual(
+                DeleteResult(
+                    deleted=["sample1.txt"],
+                    errors=[
+                        DeleteError(
+                            "sample2.txt", "AccessDenied", "Access Denied",
+                        ),
+                    ],
+                ),
+                result,
+            )
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.delete_objects(
+            "example-bucket", ["sample1.txt", "a&b"], quiet=True,
+        )
+        d.addCallback(check_query_args)
+        d.addCallback(check_result)
+        return d
+
+    def test_delete_objects_limit(self):
+        """
+        L{S3Client.delete_objects} refuses to delete no objects or more than
+        S3 allows in one request.
+        """
+        s3 = client.S3Client(AWSCredentials("foo", "bar"))
+        self.assertRaises(ValueError, s3.delete_objects, "example-bucket", [])
+        self.assertRaises(
+            ValueError, s3.delete_objects, "example-bucket",
+            ["key%d" % (i,) for i in range(1001)],
+        )
+
     def test_complete_multipart_upload(self):
         query_factory = mock_query_factory(payload.sample_s3_complete_multipart_upload_result)
         def check_query_args(passthrough):
@@ -1112,12 +1512,12 @@ class S3ClientTestCase(TestCase):
             self.assertEqual(
                 RequestDetails(
                     service=b"s3",
-                    region=REGION_US_EAST_1,
+                    region=REGION_US_EAST_1.encode("ascii"),
                     method=b"POST",
                     url_context=client.s3_url_context(
                         self.endpoint, "example-bucket", "example-object?uploadId=testid"
                     ),
-                    content_sha256=sha256(xml).hexdigest().decode("ascii"),
+                    content_sha256=sha256(xml).hexdigest(),
                 ),
                 assoc(query_factory.details, body_producer=None),
             )
@@ -1145,6 +1545,723 @@ class S3ClientTestCase(TestCase):
 
 
 
+class StubResponse:
+    """
+    A response whose whole body is delivered as soon as it is asked for.
+    """
+    phrase = b"OK"
+
+    def __init__(self, code, body):
+        self.code = code
+        self.headers = Headers()
+        self.length = len(body)
+        self._body = body
+
+    def deliverBody(self, protocol):
+        protocol.makeConnection(StringTransport())
+        protocol.dataReceived(self._body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+class StubAgent:
+    """
+    An agent which records its requests and answers each with the same
+    response.
+    """
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def request(self, method, uri, headers=None, bodyProducer=None):
+        self.requests.append((method, uri, headers, bodyProducer))
+        return succeed(self.response)
+
+
+class S3ClientAgentTestCase(TestCase):
+    """
+    Tests for requests made by L{client.S3Client} with its real query
+    factory, signed and issued with an agent.
+    """
+    def setUp(self):
+        self.now = datetime.datetime(2013, 5, 24)
+
+    def test_delete_objects(self):
+        """
+        L{client.S3Client.delete_objects} signs a I{POST} of the names of the
+        objects with the hash and I{Content-MD5} of its body and parses the
+        result.
+        """
+        agent = StubAgent(StubResponse(
+            200, payload.sample_delete_objects_result.encode("utf-8"),
+        ))
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"),
+            AWSServiceEndpoint("https://s3.example.invalid/"),
+            agent=agent, utcnow=lambda: self.now,
+        )
+        result = self.successResultOf(
+            s3.delete_objects("mybucket", ["sample1.txt", "sample2.txt"]),
+        )
+        self.assertEqual(
+            DeleteResult(
+                deleted=["sample1.txt"],
+                errors=[
+                    DeleteError(
+                        "sample2.txt", "AccessDenied", "Access Denied",
+                    ),
+                ],
+            ),
+            result,
+        )
+        xml = (
+            b"<Delete>"
+            b"<Object><Key>sample1.txt</Key></Object>"
+            b"<Object><Key>sample2.txt</Key></Object></Delete>"
+        )
+        [(method, uri, headers, body_producer)] = agent.requests
+        self.assertEqual(
+            (b"POST", b"https://s3.example.invalid/mybucket/?delete",
+             [sha256(xml).hexdigest().encode("ascii")],
+             [calculate_md5(xml)], len(xml)),
+            (method, uri, headers.getRawHeaders(b"x-amz-content-sha256"),
+             headers.getRawHeaders(b"content-md5"), body_producer.length),
+        )
+        [authorization] = headers.getRawHeaders(b"authorization")
+        self.assertTrue(authorization.startswith(
+            b"AWS4-HMAC-SHA256 Credential=foo/20130524/us-east-1/s3/",
+        ))
+
+
+class S3ClientConnectionPoolTestCase(TestCase):
+    """
+    Tests for the connection pool used by L{client.S3Client}.
+    """
+    def setUp(self):
+        self.agents = []
+        agents = self.agents
+
+        class RecordingQuery:
+            def __init__(self, credentials, details):
+                pass
+
+            def submit(self, agent, receiver_factory, utcnow):
+                agents.append(agent)
+                return succeed((None, b""))
+
+        self.query_factory = RecordingQuery
+
+    def test_default_pool(self):
+        """
+        By default, L{client.S3Client} issues requests using an agent from
+        the default connection pool for the endpoint.
+        """
+        endpoint = AWSServiceEndpoint("https://s3.example.invalid/")
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), endpoint,
+            query_factory=self.query_factory,
+        )
+        s3.delete_object("mybucket", "objectname")
+        s3.delete_object("mybucket", "otherobject")
+        expected = default_connection_pool().get_agent(
+            "https", "s3.example.invalid",
+        )
+        self.assertEqual([expected, expected], self.agents)
+
+    def test_custom_pool(self):
+        """
+        If a connection pool is given to L{client.S3Client}, requests are
+        issued using an agent from it.
+        """
+        endpoint = AWSServiceEndpoint("https://s3.example.invalid/")
+        pool = connection_pool(reactor=Clock())
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), endpoint,
+            query_factory=self.query_factory, connection_pool=pool,
+        )
+        s3.delete_object("mybucket", "objectname")
+        self.assertEqual(
+            [pool.get_agent("https", "s3.example.invalid")], self.agents,
+        )
+
+    def test_agent(self):
+        """
+        If an agent is given to L{client.S3Client}, requests are issued
+        using it instead of one from the connection pool.
+        """
+        agent = object()
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=self.query_factory,
+            agent=agent,
+        )
+        s3.delete_object("mybucket", "objectname")
+        self.assertEqual([agent], self.agents)
+
+
+class S3ClientRetryPolicyTestCase(TestCase):
+    """
+    Tests for the retry policy used by L{client.S3Client}.
+    """
+    def setUp(self):
+        self.policies = []
+        policies = self.policies
+
+        class RecordingQuery:
+            def __init__(self, credentials, details, retry_policy=None):
+                policies.append(retry_policy)
+
+            def submit(self, agent, receiver_factory, utcnow):
+                return succeed((None, b""))
+
+        self.query_factory = RecordingQuery
+
+    def test_no_policy(self):
+        """
+        By default, L{client.S3Client} does not give its queries a retry
+        policy.
+        """
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=self.query_factory,
+        )
+        s3.delete_object("mybucket", "objectname")
+        self.assertEqual([None], self.policies)
+
+    def test_policy(self):
+        """
+        If a retry policy is given to L{client.S3Client}, it is given to
+        each of the client's queries so they share its budget.
+        """
+        policy = retry_policy(reactor=Clock())
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=self.query_factory,
+            retry_policy=policy,
+        )
+        s3.delete_object("mybucket", "objectname")
+        s3.delete_object("mybucket", "otherobject")
+        self.assertEqual([policy, policy], self.policies)
+
+
+class S3ClientSchedulerTestCase(TestCase):
+    """
+    Tests for the request scheduler used by L{client.S3Client}.
+    """
+    def test_scheduler(self):
+        """
+        If a scheduler is given to L{client.S3Client}, it is given to each
+        of the client's queries.
+        """
+        schedulers = []
+
+        class RecordingQuery:
+            def __init__(self, credentials, details, scheduler=None):
+                schedulers.append(scheduler)
+
+            def submit(self, agent, receiver_factory, utcnow):
+                return succeed((None, b""))
+
+        scheduler = request_scheduler(reactor=Clock())
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=RecordingQuery,
+            scheduler=scheduler,
+        )
+        s3.delete_object("mybucket", "objectname")
+        self.assertEqual([scheduler], schedulers)
+
+
+class S3ClientCoalescerTestCase(TestCase):
+    """
+    Tests for the request coalescer used by L{client.S3Client}.
+    """
+    def test_coalescer(self):
+        """
+        If a coalescer is given to L{client.S3Client}, it is given to each
+        of the client's queries.
+        """
+        coalescers = []
+
+        class RecordingQuery:
+            def __init__(self, credentials, details, coalescer=None):
+                coalescers.append(coalescer)
+
+            def submit(self, agent, receiver_factory, utcnow):
+                return succeed((None, b""))
+
+        coalescer = request_coalescer()
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=RecordingQuery,
+            coalescer=coalescer,
+        )
+        s3.delete_object("mybucket", "objectname")
+        self.assertEqual([coalescer], coalescers)
+
+
+class RecordingThreadPool:
+    def __init__(self):
+        self.calls = []
+
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        self.calls.append((onResult, f, a, kw))
+
+    def run(self):
+        """
+        Run the work given to the pool so far.
+        """
+        calls, self.calls = self.calls, []
+        for onResult, f, a, kw in calls:
+            onResult(True, f(*a, **kw))
+
+
+class ThreadPoolReactor:
+    def __init__(self):
+        self.pool = RecordingThreadPool()
+
+    def getThreadPool(self):
+        return self.pool
+
+    def callFromThread(self, f, *a, **kw):
+        f(*a, **kw)
+
+
+class S3ClientHashingTestCase(TestCase):
+    """
+    Tests for the hashing of large bodies by L{client.S3Client}.
+    """
+    def setUp(self):
+        self.reactor = ThreadPoolReactor()
+        self.query_factory = mock_query_factory(None)
+        self.query_factory.details = None
+        self.s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=self.query_factory,
+            hash_threshold=8, reactor=self.reactor,
+        )
+
+    def test_put_object(self):
+        """
+        L{client.S3Client.put_object} hashes a body larger than the hash
+        threshold in the reactor's thread pool before making the request.
+        """
+        d = self.s3.put_object("mybucket", "objectname", b"some data")
+        self.assertIdentical(None, self.query_factory.details)
+        self.assertEqual(1, len(self.reactor.pool.calls))
+        self.reactor.pool.run()
+        self.successResultOf(d)
+        details = self.query_factory.details
+        self.assertEqual(
+            sha256(b"some data").hexdigest(), details.content_sha256,
+        )
+        self.assertFalse(details.headers.hasHeader("content-md5"))
+
+    def test_content_md5(self):
+        """
+        L{client.S3Client.upload_part} sends the MD5 digest of its data
+        when asked, computed along with the hash for signing.
+        """
+        d = self.s3.upload_part(
+            "mybucket", "objectname", "upload-id", 1, b"some data",
+            content_type="text/plain", content_md5=True,
+        )
+        self.reactor.pool.run()
+        self.successResultOf(d)
+        headers = self.query_factory.details.headers
+        self.assertEqual(
+            [calculate_md5(b"some data").decode("ascii")],
+            headers.getRawHeaders("content-md5"),
+        )
+        self.assertEqual(["text/plain"], headers.getRawHeaders("content-type"))
+
+    def test_body_producer(self):
+        """
+        Giving both data and a body producer is refused before anything is
+        hashed.
+        """
+        self.assertRaises(
+            ValueError, self.s3.put_object, "mybucket", "objectname",
+            b"some data", body_producer=StringBodyProducer(b"other data"),
+        )
+        self.assertEqual([], self.reactor.pool.calls)
+
+
+class S3ClientSignPayloadTestCase(TestCase):
+    """
+    Tests for the signing of streamed bodies by L{client.S3Client}.
+    """
+    def setUp(self):
+        self.query_factory = mock_query_factory(None)
+        self.s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=self.query_factory,
+        )
+
+    def test_put_object(self):
+        """
+        L{client.S3Client.put_object} asks for the body from its producer to
+        be signed a chunk at a time if C{sign_payload} is true.
+        """
+        self.successResultOf(self.s3.put_object(
+            "mybucket", "objectname",
+            body_producer=StringBodyProducer(b"some data"), sign_payload=True,
+        ))
+        self.assertEqual(
+            _auth_v4.STREAMING_PAYLOAD,
+            self.query_factory.details.content_sha256,
+        )
+
+    def test_unsigned(self):
+        """
+        The body from a producer is not signed unless asked.
+        """
+        self.successResultOf(self.s3.upload_part(
+            "mybucket", "objectname", "upload-id", 1,
+            body_producer=StringBodyProducer(b"some data"),
+        ))
+        self.assertIdentical(None, self.query_factory.details.content_sha256)
+
+    def test_unknown_length(self):
+        """
+        The body from a producer of unknown length cannot be signed.
+        """
+        producer = StringBodyProducer(b"some data")
+        producer.length = UNKNOWN_LENGTH
+        self.assertRaises(
+            ValueError, self.s3.upload_part, "mybucket", "objectname",
+            "upload-id", 1, body_producer=producer, sign_payload=True,
+        )
+
+
+class S3ClientPresignTestCase(TestCase):
+    """
+    Tests for L{client.S3Client.presign} and
+    L{client.S3Client.presign_many}.
+    """
+    def setUp(self):
+        self.now = datetime.datetime(2013, 5, 24)
+        self.creds = AWSCredentials("foo", "bar")
+        self.s3 = client.S3Client(
+            self.creds, AWSServiceEndpoint("https://s3.example.invalid:8443/"),
+            utcnow=lambda: self.now,
+        )
+
+    def test_presign(self):
+        """
+        L{client.S3Client.presign} signs a path-style URL of the object at
+        the client's endpoint, valid from now.
+        """
+        signer = _auth_v4._QueryStringSigner(
+            self.creds, "us-east-1", "s3", "https", "s3.example.invalid:8443",
+            self.now, 60,
+        )
+        self.assertEqual(
+            signer.sign("GET", "/mybucket/some dir/object"),
+            self.s3.presign("GET", "mybucket", "some dir/object", 60),
+        )
+
+    def test_presign_many(self):
+        """
+        L{client.S3Client.presign_many} signs the same URLs as
+        L{client.S3Client.presign}, in order.
+        """
+        query = [("response-content-disposition", "attachment")]
+        self.assertEqual(
+            [self.s3.presign("PUT", "mybucket", name, 3600, query)
+             for name in ["b", "a", "c/d"]],
+            self.s3.presign_many("PUT", "mybucket", ["b", "a", "c/d"], 3600,
+                                 query),
+        )
+
+    def test_expires(self):
+        """
+        A URL valid for more than a week is refused.
+        """
+        self.assertRaises(
+            ValueError, self.s3.presign_many, "GET", "mybucket", ["a"],
+            7 * 24 * 60 * 60 + 1,
+        )
+
+
+class S3ClientBucketRegionsTestCase(TestCase):
+    """
+    Tests for the routing of requests by L{client.S3Client} to the regions
+    of buckets.
+    """
+    def setUp(self):
+        self.regions = bucket_regions()
+        self.query_factory = mock_query_factory(
+            b"<LocationConstraint>EU</LocationConstraint>",
+        )
+        self.agent = object()
+        self.s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=self.query_factory,
+            agent=self.agent, bucket_regions=self.regions,
+        )
+
+    def test_unknown(self):
+        """
+        A request about a bucket whose region is not known is sent to the
+        client's endpoint.
+        """
+        self.successResultOf(self.s3.head_object("mybucket", "key"))
+        details = self.query_factory.details
+        self.assertEqual(
+            (self.s3.endpoint.get_host(), ["mybucket", "key"]),
+            (details.url_context.host, details.url_context.path),
+        )
+
+    def test_known(self):
+        """
+        A request about a bucket whose region is known is sent to the
+        bucket's host at its region's endpoint, signed for its region.
+        """
+        self.regions.remember("mybucket", "eu-west-1")
+        self.successResultOf(self.s3.head_object("mybucket", "key"))
+        details = self.query_factory.details
+        self.assertEqual(
+            (b"eu-west-1", "mybucket.s3.eu-west-1.amazonaws.com", ["key"]),
+            (details.region, details.url_context.host,
+             details.url_context.path),
+        )
+
+    def test_custom_endpoint(self):
+        """
+        A client whose endpoint is not AWS's sends requests about a bucket
+        to its endpoint even if it knows the bucket's region.
+        """
+        self.regions.remember("mybucket", "eu-west-1")
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"),
+            AWSServiceEndpoint("http://s3.example.invalid:8080/"),
+            query_factory=self.query_factory, agent=self.agent,
+            bucket_regions=self.regions,
+        )
+        self.successResultOf(s3.head_object("mybucket", "key"))
+        details = self.query_factory.details
+        self.assertEqual(
+            (b"us-east-1", "s3.example.invalid", ["mybucket", "key"]),
+            (details.region, details.url_context.host,
+             details.url_context.path),
+        )
+        self.assertIdentical(self.agent, s3._get_agent())
+        url = s3.presign("GET", "mybucket", "key", 60)
+        self.assertTrue(
+            url.startswith("http://s3.example.invalid:8080/mybucket/key?"),
+            url,
+        )
+
+    def test_get_bucket_location(self):
+        """
+        L{client.S3Client.get_bucket_location} remembers the region of the
+        bucket.
+        """
+        self.assertEqual(
+            "EU",
+            self.successResultOf(self.s3.get_bucket_location("mybucket")),
+        )
+        self.assertEqual("eu-west-1", self.regions.get("mybucket"))
+
+    def test_agent(self):
+        """
+        Requests are issued with an agent routing each to the agent for its
+        host.
+        """
+        agent = self.s3._get_agent()
+        self.assertIdentical(
+            self.agent,
+            agent._get_agent(b"https", b"mybucket.s3.amazonaws.com", None),
+        )
+
+    def test_presign(self):
+        """
+        L{client.S3Client.presign} signs a URL at the region's endpoint for
+        a bucket whose region is known.
+        """
+        self.regions.remember("mybucket", "eu-west-1")
+        url = self.s3.presign("GET", "mybucket", "key", 60)
+        self.assertTrue(
+            url.startswith("http://mybucket.s3.eu-west-1.amazonaws.com/key?"),
+            url,
+        )
+        self.assertIn("%2Feu-west-1%2Fs3%2F", url)
+
+
+class S3ClientObjectCacheTestCase(TestCase):
+    """
+    Tests for the object cache used by L{client.S3Client}.
+    """
+    def setUp(self):
+        self.requests = []
+        self.responses = []
+        requests = self.requests
+        responses = self.responses
+
+        class Response:
+            def __init__(self, code, headers):
+                self.code = code
+                self.responseHeaders = Headers(headers)
+
+        self.Response = Response
+
+        class RecordingQuery:
+            def __init__(self, credentials, details, ok_status=None):
+                requests.append((details, ok_status))
+
+            def submit(self, agent, receiver_factory, utcnow):
+                return succeed(responses.pop(0))
+
+        self.cache = object_cache(reactor=Clock())
+        self.s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=RecordingQuery,
+            object_cache=self.cache,
+        )
+
+    def respond(self, code, body=b"", etag=b'"abc"'):
+        self.responses.append(
+            (self.Response(code, {b"etag": [etag]}), body),
+        )
+
+    def test_conditional_get(self):
+        """
+        An object got again is requested on the condition it has changed
+        and the remembered body is given if it has not.
+        """
+        self.respond(200, b"hello")
+        self.respond(304)
+        self.assertEqual(
+            b"hello", self.successResultOf(self.s3.get_object("b", "k")),
+        )
+        self.assertEqual(
+            b"hello", self.successResultOf(self.s3.get_object("b", "k")),
+        )
+        [(first, first_status), (second, second_status)] = self.requests
+        self.assertEqual([(200, 304)] * 2, [first_status, second_status])
+        self.assertIdentical(
+            None, first.headers.getRawHeaders("if-none-match"),
+        )
+        self.assertEqual(
+            ['"abc"'], second.headers.getRawHeaders("if-none-match"),
+        )
+
+    def test_changed(self):
+        """
+        If the object has changed, its new body is given and remembered.
+        """
+        self.respond(200, b"hello")
+        self.respond(200, b"goodbye", etag=b'"def"')
+        self.s3.get_object("b", "k")
+        self.assertEqual(
+            b"goodbye", self.successResultOf(self.s3.get_object("b", "k")),
+        )
+        self.assertEqual(
+            {"if-none-match": '"def"'}, self.cache.conditions("b", "k"),
+        )
+
+    def test_forgotten(self):
+        """
+        If the body is forgotten before S3 says it has not changed, the
+        object is got again without conditions.
+        """
+        self.respond(200, b"hello")
+        self.respond(304, etag=b'"other"')
+        self.respond(200, b"hello")
+        self.s3.get_object("b", "k")
+        self.assertEqual(
+            b"hello", self.successResultOf(self.s3.get_object("b", "k")),
+        )
+        self.assertIdentical(
+            None, self.requests[2][0].headers.getRawHeaders("if-none-match"),
+        )
+
+    def test_head(self):
+        """
+        The headers of an object headed recently are given without a
+        request.
+        """
+        self.respond(200)
+        first = self.successResultOf(self.s3.head_object("b", "k"))
+        second = self.successResultOf(self.s3.head_object("b", "k"))
+        self.assertEqual(first, second)
+        self.assertEqual(1, len(self.requests))
+
+    def test_head_uncached(self):
+        """
+        With C{cached} false, an object is headed with a request even if
+        its headers are remembered, and the new headers are remembered.
+        """
+        self.respond(200)
+        self.respond(200, etag=b'"def"')
+        self.s3.head_object("b", "k")
+        headers = self.successResultOf(
+            self.s3.head_object("b", "k", cached=False),
+        )
+        self.assertEqual(2, len(self.requests))
+        self.assertEqual(headers, self.cache.head("b", "k"))
+
+    def test_forget_on_change(self):
+        """
+        An object changed through the client is forgotten.
+        """
+        self.respond(200, b"hello")
+        self.respond(200)
+        self.respond(200)
+        self.s3.get_object("b", "k")
+        self.s3.head_object("b", "k")
+        self.s3.delete_object("b", "k")
+        self.assertEqual({}, self.cache.conditions("b", "k"))
+        self.assertIdentical(None, self.cache.head("b", "k"))
+
+
+class S3ClientRequestLogTestCase(TestCase):
+    """
+    Tests for the request log used by L{client.S3Client}.
+    """
+    def test_request_log(self):
+        """
+        If a request log is given to L{client.S3Client}, it is given to each
+        of the client's queries.
+        """
+        logs = []
+
+        class RecordingQuery:
+            def __init__(self, credentials, details, request_log=None):
+                logs.append(request_log)
+
+            def submit(self, agent, receiver_factory, utcnow):
+                return succeed((None, b""))
+
+        log = request_log(sample=100)
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=RecordingQuery,
+            request_log=log,
+        )
+        s3.delete_object("mybucket", "objectname")
+        self.assertEqual([log], logs)
+
+
+class S3ClientRequestObserverTestCase(TestCase):
+    """
+    Tests for the request observer used by L{client.S3Client}.
+    """
+    def test_request_observer(self):
+        """
+        If a request observer is given to L{client.S3Client}, it is given to
+        each of the client's queries along with the bucket of the request.
+        """
+        queries = []
+
+        class RecordingQuery:
+            def __init__(self, credentials, details, **kw):
+                queries.append(kw)
+
+            def submit(self, agent, receiver_factory, utcnow):
+                return succeed((None, b""))
+
+        observer = latency_aggregator()
+        s3 = client.S3Client(
+            AWSCredentials("foo", "bar"), query_factory=RecordingQuery,
+            request_observer=observer,
+        )
+        s3.delete_object("mybucket", "objectname")
+        self.assertEqual(
+            [dict(request_observer=observer, bucket="mybucket")], queries,
+        )
+
+
 class QueryTestCase(TestCase):
 
     creds = AWSCredentials(access_key="fookeyid", secret_key="barsecretkey")
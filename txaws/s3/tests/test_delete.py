@@ -0,0 +1,181 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3._delete}.
+"""
+
+from datetime import datetime
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Cooperator
+from twisted.trial.unittest import TestCase
+
+from txaws.credentials import AWSCredentials
+from txaws.s3 import _delete
+from txaws.s3.client import S3Client
+from txaws.s3.model import BucketItem, DeleteError, DeleteResult
+
+
+class DeletingS3:
+    """
+    The multi-object delete requests of an L{S3Client}, recorded and
+    answered by the test.
+
+    @ivar requests: A L{list} of C{(keys, quiet, Deferred)} for each
+        request made.
+    """
+    def __init__(self):
+        self.requests = []
+
+    def delete_objects(self, bucket, keys, quiet=False):
+        d = Deferred()
+        self.requests.append((keys, quiet, d))
+        return d
+
+    def respond(self, index, errors=()):
+        """
+        Answer a request, reporting every object deleted but those named
+        in C{errors}.
+        """
+        keys, quiet, d = self.requests[index]
+        d.callback(DeleteResult(
+            deleted=[] if quiet else [k for k in keys if k not in errors],
+            errors=[DeleteError(k, "AccessDenied", "Access Denied")
+                    for k in errors],
+        ))
+
+    def outstanding(self):
+        return [keys for (keys, quiet, d) in self.requests if not d.called]
+
+
+class Listing:
+    """
+    An asynchronous iterator over some objects, like the one
+    L{S3Client.iter_bucket} gives.
+    """
+    def __init__(self, items):
+        self._items = iter(items)
+
+    def __anext__(self):
+        for item in self._items:
+            return succeed(item)
+        return fail(StopAsyncIteration())
+
+
+class DeleteKeysTests(TestCase):
+    """
+    Tests for L{_delete.delete_keys}.
+    """
+    def setUp(self):
+        self.cooperator = Cooperator(scheduler=lambda f: f())
+        self.s3 = DeletingS3()
+
+    def delete(self, keys, batch_size=2, concurrency=2, quiet=False):
+        return _delete.delete_keys(
+            self.s3, "bucket", keys, batch_size, concurrency, quiet,
+            self.cooperator,
+        )
+
+    def test_batches(self):
+        """
+        The objects are deleted in batches, up to C{concurrency} at a time.
+        """
+        d = self.delete(iter(["a", "b", "c", "d", "e"]))
+        self.assertEqual([["a", "b"], ["c", "d"]], self.s3.outstanding())
+        self.s3.respond(1)
+        self.assertEqual([["a", "b"], ["e"]], self.s3.outstanding())
+        self.s3.respond(2)
+        self.s3.respond(0)
+        self.assertEqual(
+            DeleteResult(deleted=["c", "d", "e", "a", "b"], errors=[]),
+            self.successResultOf(d),
+        )
+        self.assertEqual(3, len(self.s3.requests))
+
+    def test_errors(self):
+        """
+        The objects which could not be deleted are reported in the result.
+        """
+        d = self.delete(["a", "b", "c"], quiet=True)
+        self.assertEqual(
+            [True, True], [quiet for (k, quiet, r) in self.s3.requests],
+        )
+        self.s3.respond(0, errors=["b"])
+        self.s3.respond(1, errors=["c"])
+        self.assertEqual(
+            DeleteResult(
+                deleted=[],
+                errors=[
+                    DeleteError("b", "AccessDenied", "Access Denied"),
+                    DeleteError("c", "AccessDenied", "Access Denied"),
+                ],
+            ),
+            self.successResultOf(d),
+        )
+
+    def test_bucket_items(self):
+        """
+        The objects may be given as the L{BucketItem}s of a listing.
+        """
+        self.delete([
+            BucketItem(key, datetime(2009, 10, 12), '"etag"', "1", "STANDARD")
+            for key in ["a", "b"]
+        ])
+        self.assertEqual([["a", "b"]], self.s3.outstanding())
+
+    def test_asynchronous_listing(self):
+        """
+        The objects may be taken from an asynchronous iterator.
+        """
+        d = self.delete(Listing(["a", "b", "c"]))
+        self.assertEqual([["a", "b"], ["c"]], self.s3.outstanding())
+        self.s3.respond(0)
+        self.s3.respond(1)
+        self.assertEqual(["a", "b", "c"], self.successResultOf(d).deleted)
+
+    def test_nothing(self):
+        """
+        No request is made if there are no objects.
+        """
+        d = self.delete([])
+        self.assertEqual(DeleteResult(), self.successResultOf(d))
+        self.assertEqual([], self.s3.requests)
+
+    def test_failure(self):
+        """
+        If a batch cannot be deleted, no more are started and the deletion
+        fails once those in progress are done.
+        """
+        d = self.delete(["a", "b", "c", "d", "e"])
+        self.s3.requests[0][2].errback(ValueError("broken"))
+        self.assertEqual([["c", "d"]], self.s3.outstanding())
+        self.assertNoResult(d)
+        self.s3.respond(1)
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(2, len(self.s3.requests))
+
+    def test_invalid(self):
+        """
+        A batch may not be empty or larger than S3 allows and at least one
+        batch must be deleted at a time.
+        """
+        self.assertRaises(ValueError, self.delete, [], batch_size=0)
+        self.assertRaises(ValueError, self.delete, [], batch_size=1001)
+        self.assertRaises(ValueError, self.delete, [], concurrency=0)
+
+
+class S3ClientDeleteKeysTests(TestCase):
+    """
+    Tests for L{S3Client.delete_keys}.
+    """
+    def test_delete_keys(self):
+        """
+        L{S3Client.delete_keys} deletes using the client's requests.
+        """
+        s3 = S3Client(AWSCredentials("foo", "bar"))
+        calls = []
+        self.patch(_delete, "delete_keys", lambda *a: calls.append(a))
+        s3.delete_keys("bucket", ["a"], concurrency=3)
+        self.assertEqual(
+            [(s3, "bucket", ["a"], 1000, 3, True, s3._cooperator)], calls,
+        )
@@ -0,0 +1,46 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3._hashing}.
+"""
+
+from hashlib import sha256
+
+from twisted.trial.unittest import TestCase
+
+from txaws.s3._hashing import _CHUNK_SIZE, payload_digests
+from txaws.util import calculate_md5
+
+
+class PayloadDigestsTests(TestCase):
+    """
+    Tests for L{payload_digests}.
+    """
+    def test_digests(self):
+        """
+        L{payload_digests} gives the hex SHA-256 and base64 MD5 digests of
+        a body longer than one chunk.
+        """
+        body = bytes(range(256)) * (_CHUNK_SIZE // 128 + 1)
+        self.assertEqual(
+            (sha256(body).hexdigest(), calculate_md5(body).decode("ascii")),
+            payload_digests(body, True),
+        )
+
+    def test_no_md5(self):
+        """
+        The MD5 digest is only computed if it is wanted.
+        """
+        self.assertEqual(
+            (sha256(b"hello").hexdigest(), None),
+            payload_digests(b"hello", False),
+        )
+
+    def test_empty(self):
+        """
+        The digests of an empty body are those of no bytes.
+        """
+        self.assertEqual(
+            (sha256(b"").hexdigest(), calculate_md5(b"").decode("ascii")),
+            payload_digests(b"", True),
+        )
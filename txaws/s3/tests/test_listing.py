@@ -0,0 +1,614 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3._listing}.
+"""
+
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from dateutil.tz import tzoffset, tzutc
+
+from twisted.internet.defer import Deferred, ensureDeferred, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.credentials import AWSCredentials
+from txaws.s3 import _listing
+from txaws.s3._listing import _next_marker
+from txaws.s3.client import S3Client
+from txaws.s3.model import (
+    BucketItem, BucketListing, CompactListing, ItemOwner,
+)
+from txaws.testing import payload
+
+
+def page(keys, truncated, next_marker=None):
+    """
+    Make the body of a I{ListBucketResult} response.
+    """
+    contents = "".join(
+        "<Contents><Key>{}</Key>"
+        "<LastModified>2009-10-12T17:50:30.000Z</LastModified>"
+        "<ETag>&quot;etag&quot;</ETag><Size>1</Size>"
+        "<StorageClass>STANDARD</StorageClass></Contents>".format(escape(key))
+        for key in keys
+    )
+    if next_marker is not None:
+        contents += "<NextMarker>{}</NextMarker>".format(escape(next_marker))
+    return (
+        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+        "<ListBucketResult><Name>mybucket</Name><Prefix></Prefix>"
+        "<Marker></Marker><MaxKeys>1000</MaxKeys>"
+        "<IsTruncated>{}</IsTruncated>{}</ListBucketResult>".format(
+            "true" if truncated else "false", contents,
+        )
+    ).encode("utf-8")
+
+
+class ListingS3:
+    """
+    The listing requests of an L{S3Client}, recorded and answered by the
+    test.
+
+    @ivar requests: A L{list} of C{(marker, Deferred)} for each page
+        requested.
+    """
+    _parse_get_bucket = S3Client._parse_get_bucket
+
+    def __init__(self):
+        self.requests = []
+
+    def _get_bucket_response(self, bucket, marker=None, max_keys=None,
+                             prefix=None):
+        d = Deferred()
+        self.requests.append((marker, d))
+        return d
+
+    def respond(self, body):
+        """
+        Answer the last page requested.
+        """
+        self.requests[-1][1].callback((None, body))
+
+
+class NextMarkerTests(TestCase):
+    """
+    Tests for L{_next_marker}.
+    """
+    def test_last_page(self):
+        """
+        There is no marker after a page which is not truncated.
+        """
+        self.assertIdentical(None, _next_marker(page(["a", "b"], False)))
+
+    def test_last_key(self):
+        """
+        The marker after a truncated page is its last key, unescaped.
+        """
+        self.assertEqual("b&<c>", _next_marker(page(["a", "b&<c>"], True)))
+
+    def test_next_marker(self):
+        """
+        The page's I{NextMarker} is used if it has one.
+        """
+        self.assertEqual(
+            "prefix/", _next_marker(page(["a"], True, next_marker="prefix/")),
+        )
+
+
+class ParseTimestampTests(TestCase):
+    """
+    Tests for L{_listing._parse_timestamp}.
+    """
+    def test_s3(self):
+        """
+        A timestamp in the form S3 gives is parsed to a UTC L{datetime}.
+        """
+        self.assertEqual(
+            datetime(2009, 10, 12, 17, 50, 30, 123000, tzutc()),
+            _listing._parse_timestamp("2009-10-12T17:50:30.123Z"),
+        )
+
+    def test_whole_seconds(self):
+        """
+        The fraction of a second may be left out.
+        """
+        self.assertEqual(
+            datetime(2009, 10, 12, 17, 50, 30, 0, tzutc()),
+            _listing._parse_timestamp("2009-10-12T17:50:30Z"),
+        )
+
+    def test_other(self):
+        """
+        A timestamp in another form is parsed by L{dateutil}.
+        """
+        self.assertEqual(
+            datetime(2009, 10, 12, 17, 50, 30, 0, tzoffset(None, 3600)),
+            _listing._parse_timestamp("2009-10-12T17:50:30+01:00"),
+        )
+
+
+class ParseListingTests(TestCase):
+    """
+    Tests for L{_listing.parse_listing}.
+    """
+    def test_get_bucket(self):
+        """
+        A version 1 listing is parsed to a L{BucketListing} of its objects.
+        """
+        listing = _listing.parse_listing(
+            payload.sample_get_bucket_result.encode("utf-8"),
+        )
+        self.assertEqual(
+            ("mybucket", "N", "Ned", "40", "false", [], None),
+            (listing.name, listing.prefix, listing.marker, listing.max_keys,
+             listing.is_truncated, listing.common_prefixes,
+             listing.next_continuation_token),
+        )
+        self.assertEqual(
+            [BucketItem(
+                "Nelson", datetime(2006, 1, 1, 12, 0, 0, 0, tzutc()),
+                '"828ef3fdfa96f00ad9f27c383fc9ac7f"', "5", "STANDARD",
+                ItemOwner(
+                    "bcaf1ffd86f41caff1a493dc2ad8c2c281e37522a640e161ca5fb16"
+                    "fd081034f",
+                    "webfile",
+                ),
+            ),
+             "Neo"],
+            [listing.contents[0], listing.contents[1].key],
+        )
+
+    def test_list_objects(self):
+        """
+        A version 2 listing is parsed to a L{BucketListing} with its common
+        prefixes and continuation token.
+        """
+        listing = _listing.parse_listing(
+            payload.sample_list_objects_v2_result.encode("utf-8"),
+        )
+        self.assertEqual(
+            ("photos/", "photos/a", "true", ["photos/2006/", "photos/2007/"],
+             "1ueGcxLPRx1Tr/XYExHnhbYLgveDs2J/wm36Hy4vbOwM=",
+             ["photos/b.jpg"], ItemOwner(None, None)),
+            (listing.prefix, listing.marker, listing.is_truncated,
+             listing.common_prefixes, listing.next_continuation_token,
+             [item.key for item in listing.contents],
+             listing.contents[0].owner),
+        )
+
+    def test_empty_text(self):
+        """
+        An element without text is parsed to the empty string.
+        """
+        listing = _listing.parse_listing(page([], False))
+        self.assertEqual(("", []), (listing.prefix, listing.contents))
+
+    def test_parts(self):
+        """
+        A listing is parsed the same however it is split into parts.
+        """
+        body = page(["a", "b&<c>", "d"], True, next_marker="d")
+        expected = _listing.parse_listing(body)
+        self.patch(_listing, "_FEED_SIZE", 7)
+        self.assertEqual(expected, _listing.parse_listing(body))
+        self.assertEqual(
+            ["a", "b&<c>", "d"], [item.key for item in expected.contents],
+        )
+
+
+class BucketIteratorTests(TestCase):
+    """
+    Tests for L{_listing.iter_bucket}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.s3 = ListingS3()
+
+    def iterate(self, prefetch=1, max_buffered=100):
+        return _listing.iter_bucket(
+            self.s3, "mybucket", None, None, prefetch, max_buffered,
+            self.clock,
+        )
+
+    def keys(self, listing, count):
+        keys = []
+        for i in range(count):
+            item = self.successResultOf(listing.next())
+            keys.append(item if item is None else item.key)
+        return keys
+
+    def test_pages(self):
+        """
+        The items of every page are given in turn and then C{None}.
+        """
+        listing = self.iterate()
+        first = listing.next()
+        self.s3.respond(page(["a", "b"], True))
+        self.clock.advance(0)
+        self.assertEqual("a", self.successResultOf(first).key)
+        self.assertEqual([None, "b"], [m for (m, d) in self.s3.requests])
+        self.s3.respond(page(["c"], False))
+        self.clock.advance(0)
+        self.assertEqual(["b", "c", None, None], self.keys(listing, 4))
+        self.assertEqual(2, len(self.s3.requests))
+
+    def test_request_before_parse(self):
+        """
+        The next page is requested as soon as a page arrives, before it is
+        parsed.
+        """
+        listing = self.iterate()
+        d = listing.next()
+        self.s3.respond(page(["a", "b"], True))
+        self.assertEqual(2, len(self.s3.requests))
+        self.assertNoResult(d)
+        self.clock.advance(0)
+        self.successResultOf(d)
+
+    def test_prefetch(self):
+        """
+        No more than C{prefetch} pages are requested ahead of the one being
+        consumed.
+        """
+        listing = self.iterate(prefetch=1)
+        listing.next()
+        self.s3.respond(page(["a", "b"], True))
+        self.s3.respond(page(["c", "d"], True))
+        self.clock.advance(0)
+        self.assertEqual(2, len(self.s3.requests))
+        # Once the first page is consumed, the second is the one being
+        # consumed and the third may be requested.
+        self.assertEqual(["b"], self.keys(listing, 1))
+        self.assertEqual(3, len(self.s3.requests))
+        self.assertEqual("d", self.s3.requests[-1][0])
+
+    def test_no_prefetch(self):
+        """
+        With C{prefetch} of C{0}, each page is requested once the previous
+        one has been consumed.
+        """
+        listing = self.iterate(prefetch=0)
+        listing.next()
+        self.s3.respond(page(["a", "b"], True))
+        self.clock.advance(0)
+        self.assertEqual(1, len(self.s3.requests))
+        self.keys(listing, 1)
+        d = listing.next()
+        self.assertEqual(2, len(self.s3.requests))
+        self.s3.respond(page(["c"], False))
+        self.clock.advance(0)
+        self.assertEqual("c", self.successResultOf(d).key)
+
+    def test_max_buffered(self):
+        """
+        No page is requested ahead while C{max_buffered} items are waiting
+        to be consumed.
+        """
+        listing = self.iterate(prefetch=5, max_buffered=2)
+        listing.next()
+        self.s3.respond(page(["a", "b", "c"], True))
+        self.clock.advance(0)
+        self.assertEqual(2, len(self.s3.requests))
+        self.s3.respond(page(["d", "e"], True))
+        self.clock.advance(0)
+        self.assertEqual(2, len(self.s3.requests))
+        self.keys(listing, 2)
+        self.assertEqual(2, len(self.s3.requests))
+        self.keys(listing, 1)
+        self.assertEqual(3, len(self.s3.requests))
+
+    def test_failure(self):
+        """
+        If a page cannot be listed, the consumer's L{Deferred} fails once it
+        has consumed the items received before it.
+        """
+        listing = self.iterate()
+        listing.next()
+        self.s3.respond(page(["a", "b"], True))
+        self.s3.requests[-1][1].errback(ValueError("broken"))
+        self.clock.advance(0)
+        self.assertEqual(["b"], self.keys(listing, 1))
+        self.failureResultOf(listing.next(), ValueError)
+
+    def test_close(self):
+        """
+        Once closed, no more pages are requested and the iteration ends.
+        """
+        listing = self.iterate()
+        d = listing.next()
+        listing.close()
+        self.assertIdentical(None, self.successResultOf(d))
+        self.s3.respond(page(["a", "b"], True))
+        self.clock.advance(0)
+        self.assertEqual(1, len(self.s3.requests))
+        self.assertIdentical(None, self.successResultOf(listing.next()))
+
+    def test_async_for(self):
+        """
+        The items can be iterated over with C{async for}.
+        """
+        listing = self.iterate()
+
+        async def collect():
+            return [item.key async for item in listing]
+
+        d = ensureDeferred(collect())
+        self.s3.respond(page(["a", "b"], True))
+        self.s3.respond(page(["c"], False))
+        self.clock.advance(0)
+        self.clock.advance(0)
+        self.assertEqual(["a", "b", "c"], self.successResultOf(d))
+
+
+class S3ClientIterBucketTests(TestCase):
+    """
+    Tests for L{S3Client.iter_bucket}.
+    """
+    def test_iter_bucket(self):
+        """
+        L{S3Client.iter_bucket} lists the bucket using the client's
+        requests.
+        """
+        s3 = S3Client(AWSCredentials("foo", "bar"))
+        calls = []
+        self.patch(_listing, "iter_bucket", lambda *a: calls.append(a))
+        s3.iter_bucket("mybucket", prefix="a/", prefetch=3)
+        self.assertEqual(
+            [(s3, "mybucket", "a/", None, 3, _listing.DEFAULT_MAX_BUFFERED,
+              None)],
+            calls,
+        )
+
+
+def item(key):
+    return BucketItem(
+        key, datetime(2009, 10, 12), '"etag"', "1", "STANDARD",
+    )
+
+
+class TreeS3:
+    """
+    The ListObjectsV2 requests of an L{S3Client}, recorded and answered by
+    the test.
+
+    @ivar requests: A L{list} of C{(prefix, continuation_token, Deferred)}
+        for each page requested.
+    """
+    def __init__(self):
+        self.requests = []
+
+    def list_objects(self, bucket, prefix=None, delimiter=None,
+                     continuation_token=None, max_keys=None):
+        d = Deferred()
+        self.requests.append((prefix, continuation_token, d))
+        return d
+
+    def respond(self, prefix, keys, prefixes=(), token=None):
+        """
+        Answer the first outstanding request for a prefix.
+        """
+        for i, (requested, ignored, d) in enumerate(self.requests):
+            if requested == prefix and not d.called:
+                d.callback(BucketListing(
+                    "mybucket", prefix, None, "1000",
+                    "true" if token else "false",
+                    [item(key) for key in keys], list(prefixes),
+                    next_continuation_token=token,
+                ))
+                return
+        raise AssertionError("No request for {!r}".format(prefix))
+
+    def outstanding(self):
+        return [
+            (prefix, token) for (prefix, token, d) in self.requests
+            if not d.called
+        ]
+
+
+class SynchronousTreeS3:
+    """
+    The ListObjectsV2 requests of an L{S3Client}, answered as soon as they
+    are made from a L{dict} mapping prefixes to their pages.
+    """
+    def __init__(self, pages):
+        self.pages = pages
+
+    def list_objects(self, bucket, prefix=None, delimiter=None,
+                     continuation_token=None, max_keys=None):
+        keys, prefixes = self.pages[prefix]
+        return succeed(BucketListing(
+            "mybucket", prefix, None, "1000", "false",
+            [item(key) for key in keys], list(prefixes),
+        ))
+
+
+class WalkBucketTests(TestCase):
+    """
+    Tests for L{_listing.walk_bucket}.
+    """
+    def setUp(self):
+        self.s3 = TreeS3()
+
+    def walk(self, concurrency=2, ordered=False, prefix=None):
+        return _listing.walk_bucket(
+            self.s3, "mybucket", prefix, "/", concurrency, ordered, None,
+        )
+
+    def test_fan_out(self):
+        """
+        The common prefixes found are listed concurrently, up to
+        C{concurrency} at a time.
+        """
+        d = self.walk()
+        self.assertEqual([(None, None)], self.s3.outstanding())
+        self.s3.respond(None, ["top"], ["a/", "b/", "c/"])
+        self.assertEqual([("a/", None), ("b/", None)], self.s3.outstanding())
+        self.s3.respond("b/", ["b/1"])
+        self.assertEqual([("a/", None), ("c/", None)], self.s3.outstanding())
+        self.s3.respond("c/", ["c/1"])
+        self.assertNoResult(d)
+        self.s3.respond("a/", ["a/1"])
+        self.assertEqual(
+            ["top", "b/1", "c/1", "a/1"],
+            [item.key for item in self.successResultOf(d)],
+        )
+
+    def test_pages(self):
+        """
+        The pages of a prefix are listed in turn, ahead of the prefixes
+        found in them.
+        """
+        d = self.walk(concurrency=1, prefix="")
+        self.s3.respond("", ["a"], ["b/"], token="next")
+        self.assertEqual([("", "next")], self.s3.outstanding())
+        self.s3.respond("", ["c"])
+        self.s3.respond("b/", ["b/1"])
+        self.assertEqual(
+            ["a", "c", "b/1"], [item.key for item in self.successResultOf(d)],
+        )
+
+    def test_ordered(self):
+        """
+        With C{ordered}, the objects are given in key order whatever order
+        their pages arrived in.
+        """
+        d = self.walk(concurrency=4, ordered=True)
+        self.s3.respond(None, ["a", "c"], ["b/", "d/"], token="next")
+        self.s3.respond("d/", ["d/1"], ["d/e/"])
+        self.s3.respond(None, ["e"], ["f/"])
+        self.s3.respond("d/e/", ["d/e/1"])
+        self.s3.respond("f/", ["f/1"])
+        self.s3.respond("b/", ["b/1", "b/2"])
+        self.assertEqual(
+            ["a", "b/1", "b/2", "c", "d/1", "d/e/1", "e", "f/1"],
+            [item.key for item in self.successResultOf(d)],
+        )
+
+    def test_failure(self):
+        """
+        If a listing request fails, no more are made and the walk fails
+        once those in progress are done.
+        """
+        d = self.walk()
+        self.s3.respond(None, [], ["a/", "b/", "c/"])
+        self.s3.requests[1][2].errback(ValueError("broken"))
+        self.assertEqual([("b/", None)], self.s3.outstanding())
+        self.assertNoResult(d)
+        self.s3.respond("b/", ["b/1"])
+        self.failureResultOf(d, ValueError)
+        self.assertEqual([], self.s3.outstanding())
+
+    def test_invalid_concurrency(self):
+        """
+        At least one request must be made at a time.
+        """
+        self.assertRaises(ValueError, self.walk, concurrency=0)
+
+    def test_synchronous(self):
+        """
+        The walk finishes once, with every object, if the client answers
+        each request as soon as it is made.
+        """
+        self.s3 = SynchronousTreeS3({
+            None: (["top"], ["a/", "b/"]),
+            "a/": (["a/1"], []),
+            "b/": (["b/1"], []),
+        })
+        d = self.walk()
+        self.assertEqual(
+            ["top", "a/1", "b/1"],
+            [item.key for item in self.successResultOf(d)],
+        )
+        d = self.walk(ordered=True)
+        self.assertEqual(
+            ["a/1", "b/1", "top"],
+            [item.key for item in self.successResultOf(d)],
+        )
+
+
+class CompactListingTests(TestCase):
+    """
+    Tests for L{_listing.compact_listing}.
+    """
+    def setUp(self):
+        self.s3 = TreeS3()
+
+    def test_pages(self):
+        """
+        The objects of every page are added to the listing, with the next
+        page requested before each is added.
+        """
+        d = _listing.compact_listing(self.s3, "mybucket", "p/", 2, None)
+        self.s3.respond("p/", ["p/a", "p/b"], token="next")
+        self.assertEqual([("p/", "next")], self.s3.outstanding())
+        self.assertNoResult(d)
+        self.s3.respond("p/", ["p/c"])
+        self.assertEqual(
+            ["p/a", "p/b", "p/c"],
+            [item.key for item in self.successResultOf(d)],
+        )
+
+    def test_existing(self):
+        """
+        The objects may be added to an existing listing.
+        """
+        listing = CompactListing()
+        listing.add([item("a")])
+        d = _listing.compact_listing(self.s3, "mybucket", "b/", None, listing)
+        self.s3.respond("b/", ["b/1"])
+        self.assertIdentical(listing, self.successResultOf(d))
+        self.assertEqual(["a", "b/1"], [item.key for item in listing])
+
+    def test_failure(self):
+        """
+        If a page cannot be listed, the listing fails.
+        """
+        d = _listing.compact_listing(self.s3, "mybucket", None, None, None)
+        self.s3.respond(None, ["a"], token="next")
+        self.s3.requests[-1][2].errback(ValueError("broken"))
+        self.failureResultOf(d, ValueError)
+
+    def test_out_of_order(self):
+        """
+        If the objects are not in order, the listing fails and the page
+        requested meanwhile is ignored.
+        """
+        listing = CompactListing()
+        listing.add([item("z")])
+        d = _listing.compact_listing(self.s3, "mybucket", None, None, listing)
+        self.s3.respond(None, ["a"], token="next")
+        self.failureResultOf(d, ValueError)
+        self.s3.requests[-1][2].errback(ValueError("broken"))
+
+    def test_s3client(self):
+        """
+        L{S3Client.compact_listing} lists the bucket using the client's
+        requests.
+        """
+        s3 = S3Client(AWSCredentials("foo", "bar"))
+        calls = []
+        self.patch(_listing, "compact_listing", lambda *a: calls.append(a))
+        s3.compact_listing("mybucket", prefix="a/", page_size=10)
+        self.assertEqual([(s3, "mybucket", "a/", 10, None)], calls)
+
+
+class S3ClientWalkBucketTests(TestCase):
+    """
+    Tests for L{S3Client.walk_bucket}.
+    """
+    def test_walk_bucket(self):
+        """
+        L{S3Client.walk_bucket} lists the bucket using the client's
+        requests.
+        """
+        s3 = S3Client(AWSCredentials("foo", "bar"))
+        calls = []
+        self.patch(_listing, "walk_bucket", lambda *a: calls.append(a))
+        s3.walk_bucket("mybucket", prefix="a/", ordered=True)
+        self.assertEqual(
+            [(s3, "mybucket", "a/", "/", _listing.DEFAULT_WALK_CONCURRENCY,
+              True, None)],
+            calls,
+        )
@@ -0,0 +1,127 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3.model}.
+"""
+
+from datetime import datetime
+
+from dateutil.tz import tzutc
+
+from twisted.trial.unittest import TestCase
+
+from txaws.s3.model import BucketItem, CompactListing, ItemOwner
+
+try:
+    import numpy
+except ImportError:
+    numpySkip = "NumPy is not installed"
+else:
+    numpySkip = None
+
+
+def item(key, size=1, second=0, storage_class="STANDARD", owner="me"):
+    return BucketItem(
+        key, datetime(2009, 10, 12, 17, 50, second, 0, tzutc()), '"etag"',
+        "%d" % (size,), storage_class, ItemOwner(owner, owner.upper()),
+    )
+
+
+class CompactListingTests(TestCase):
+    """
+    Tests for L{CompactListing}.
+    """
+    def listing(self, *keys):
+        listing = CompactListing()
+        listing.add(item(key) for key in keys)
+        return listing
+
+    def test_items(self):
+        """
+        The objects added are given back without their ETags, in order.
+        """
+        items = [
+            item("a", size=2 ** 40, second=1),
+            item("b\N{SNOWMAN}", storage_class="GLACIER", owner="you"),
+            item("c", owner="me"),
+        ]
+        listing = CompactListing()
+        listing.add(items[:1])
+        listing.add(items[1:])
+        self.assertEqual(3, len(listing))
+        self.assertEqual(
+            [i.__class__(i.key, i.modification_date, None, i.size,
+                         i.storage_class, i.owner) for i in items],
+            list(listing),
+        )
+        self.assertEqual(items[2].key, listing[-1].key)
+        self.assertRaises(IndexError, lambda: listing[3])
+
+    def test_interned(self):
+        """
+        Each distinct storage class and owner is held once.
+        """
+        listing = CompactListing()
+        listing.add([
+            item("a"), item("b", storage_class="GLACIER", owner="you"),
+            item("c"),
+        ])
+        self.assertEqual(["STANDARD", "GLACIER"], listing.storage_classes)
+        self.assertEqual(
+            [ItemOwner("me", "ME"), ItemOwner("you", "YOU")], listing.owners,
+        )
+
+    def test_order(self):
+        """
+        Objects must be added in key order.
+        """
+        listing = self.listing("a", "b")
+        self.assertRaises(ValueError, listing.add, [item("b")])
+        self.assertRaises(ValueError, listing.add, [item("aa")])
+        self.assertEqual(2, len(listing))
+
+    def test_with_prefix(self):
+        """
+        L{CompactListing.with_prefix} gives the objects whose keys begin
+        with a prefix.
+        """
+        listing = self.listing("a", "b/1", "b/2", "b0", "c/1")
+        self.assertEqual(
+            ["b/1", "b/2"],
+            [i.key for i in listing.with_prefix("b/")],
+        )
+        self.assertEqual(
+            ["b/1", "b/2", "b0"], [i.key for i in listing.with_prefix("b")],
+        )
+        self.assertEqual(
+            ["c/1"], [i.key for i in listing.with_prefix("c")],
+        )
+        self.assertEqual(0, len(listing.with_prefix("d")))
+        self.assertEqual(5, len(listing.with_prefix("")))
+
+    def test_with_prefix_add(self):
+        """
+        Objects may be added to the listing of a prefix.
+        """
+        part = self.listing("a", "b/1", "c").with_prefix("b/")
+        part.add([item("b/2", storage_class="GLACIER")])
+        self.assertEqual(
+            [("b/1", "STANDARD"), ("b/2", "GLACIER")],
+            [(i.key, i.storage_class) for i in part],
+        )
+
+    def test_to_numpy(self):
+        """
+        L{CompactListing.to_numpy} copies the columns into NumPy arrays.
+        """
+        listing = CompactListing()
+        listing.add([item("a", size=3), item("bc", size=2 ** 40, second=1)])
+        arrays = listing.to_numpy()
+        self.assertEqual(b"abc", arrays["keys"].tobytes())
+        self.assertEqual([0, 1, 3], arrays["key_offsets"].tolist())
+        self.assertEqual([3, 2 ** 40], arrays["size"].tolist())
+        self.assertEqual([1255369830, 1255369831], arrays["mtime"].tolist())
+        self.assertEqual([0, 0], arrays["storage_class"].tolist())
+        self.assertEqual([0, 0], arrays["owner"].tolist())
+        self.assertEqual(numpy.int64, arrays["size"].dtype)
+    test_to_numpy.skip = numpySkip
@@ -0,0 +1,229 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3.regions}.
+"""
+
+from twisted.internet.defer import succeed
+from twisted.trial.unittest import TestCase
+from twisted.web.http_headers import Headers
+
+from txaws.client.base import url_context
+from txaws.s3.regions import (
+    _RegionalAgent, _bucket_of, _is_aws_host, _location_region, _route,
+    bucket_regions,
+)
+
+
+class BucketRegionsTests(TestCase):
+    """
+    Tests for L{bucket_regions}.
+    """
+    def test_remember(self):
+        """
+        A region is known once it is remembered and until it is discarded.
+        """
+        regions = bucket_regions()
+        self.assertIdentical(None, regions.get("mybucket"))
+        regions.remember("mybucket", "eu-west-1")
+        self.assertEqual("eu-west-1", regions.get("mybucket"))
+        regions.discard("mybucket")
+        self.assertIdentical(None, regions.get("mybucket"))
+
+    def test_max_size(self):
+        """
+        Beyond C{max_size} buckets, the least recently used are forgotten.
+        """
+        regions = bucket_regions(max_size=2)
+        regions.remember("a", "eu-west-1")
+        regions.remember("b", "eu-west-2")
+        regions.get("a")
+        regions.remember("c", "eu-west-3")
+        self.assertEqual(
+            ["eu-west-1", None, "eu-west-3"],
+            [regions.get(bucket) for bucket in "abc"],
+        )
+
+    def test_invalid_max_size(self):
+        """
+        A C{max_size} less than 1 is refused.
+        """
+        self.assertRaises(ValueError, bucket_regions, max_size=0)
+
+    def test_location_region(self):
+        """
+        The location constraints of buckets in the first region and of the
+        oldest buckets in Ireland are translated to their regions.
+        """
+        self.assertEqual(
+            ["us-east-1", "eu-west-1", "ap-south-1"],
+            [_location_region(location)
+             for location in ["", "EU", "ap-south-1"]],
+        )
+
+
+class RouteTests(TestCase):
+    """
+    Tests for L{_route}.
+    """
+    def test_virtual_hosted(self):
+        """
+        A bucket whose name is a host label is addressed by the host of its
+        region's endpoint.
+        """
+        routed = _route(
+            url_context(
+                scheme="https", host="s3.amazonaws.com", port=443,
+                path=["mybucket", "some", "key"], query=[("uploads",)],
+            ),
+            "eu-west-1",
+        )
+        self.assertEqual(
+            ("https", "mybucket.s3.eu-west-1.amazonaws.com", None,
+             ["some", "key"], [("uploads", None)]),
+            (routed.scheme, routed.host, routed.port, routed.path,
+             [(argument.name, argument.value) for argument in routed.query]),
+        )
+
+    def test_bucket(self):
+        """
+        A request about a bucket itself is for the root of its host.
+        """
+        routed = _route(
+            url_context(
+                scheme="https", host="s3.amazonaws.com", port=None,
+                path=["mybucket", ""],
+            ),
+            "cn-north-1",
+        )
+        self.assertEqual(
+            ("mybucket.s3.cn-north-1.amazonaws.com.cn", [""]),
+            (routed.host, routed.path),
+        )
+
+    def test_path_style(self):
+        """
+        A bucket whose name is not a host label is addressed by the path
+        at its region's endpoint.
+        """
+        routed = _route(
+            url_context(
+                scheme="https", host="s3.amazonaws.com", port=None,
+                path=["my.bucket", "key"],
+            ),
+            "eu-west-1",
+        )
+        self.assertEqual(
+            ("s3.eu-west-1.amazonaws.com", ["my.bucket", "key"]),
+            (routed.host, routed.path),
+        )
+
+
+class IsAWSHostTests(TestCase):
+    """
+    Tests for L{_is_aws_host}.
+    """
+    def test_is_aws_host(self):
+        """
+        The hosts of AWS's endpoints are AWS's and others are not.
+        """
+        self.assertEqual(
+            [True, True, True, False, False],
+            [_is_aws_host(host) for host in [
+                "s3.amazonaws.com",
+                b"s3.cn-north-1.amazonaws.com.cn",
+                "S3.EU-WEST-1.AMAZONAWS.COM",
+                "s3.example.invalid",
+                "notamazonaws.com",
+            ]],
+        )
+
+
+class BucketOfTests(TestCase):
+    """
+    Tests for L{_bucket_of}.
+    """
+    def test_bucket_of(self):
+        """
+        The bucket is found in the host of a virtual-hosted-style URL and
+        in the path of others.
+        """
+        self.assertEqual(
+            ["mybucket", "my.bucket", "mybucket", None],
+            [_bucket_of(url) for url in [
+                b"https://mybucket.s3.eu-west-1.amazonaws.com/key",
+                b"https://s3.eu-west-1.amazonaws.com/my.bucket/key",
+                b"http://s3.example.invalid:8080/mybucket/?location",
+                b"https://s3.amazonaws.com/",
+            ]],
+        )
+
+
+class StubResponse:
+    def __init__(self, headers):
+        self.headers = Headers(headers)
+
+
+class StubAgent:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def request(self, method, uri, headers=None, bodyProducer=None):
+        self.requests.append((method, uri))
+        return succeed(self.response)
+
+
+class RegionalAgentTests(TestCase):
+    """
+    Tests for L{_RegionalAgent}.
+    """
+    def setUp(self):
+        self.regions = bucket_regions()
+        self.agents = {}
+        self.response = StubResponse({})
+
+    def get_agent(self, scheme, host, port):
+        return self.agents.setdefault(
+            (scheme, host, port), StubAgent(self.response),
+        )
+
+    def test_per_host(self):
+        """
+        Each request is issued with the agent for its URL's host.
+        """
+        agent = _RegionalAgent(self.get_agent, self.regions)
+        for uri in [
+            b"https://a.s3.eu-west-1.amazonaws.com/key",
+            b"https://b.s3.eu-west-1.amazonaws.com/key",
+            b"https://a.s3.eu-west-1.amazonaws.com/other",
+        ]:
+            self.assertIdentical(
+                self.response,
+                self.successResultOf(agent.request(b"GET", uri)),
+            )
+        self.assertEqual(
+            {
+                (b"https", b"a.s3.eu-west-1.amazonaws.com", None): [
+                    (b"GET", b"https://a.s3.eu-west-1.amazonaws.com/key"),
+                    (b"GET", b"https://a.s3.eu-west-1.amazonaws.com/other"),
+                ],
+                (b"https", b"b.s3.eu-west-1.amazonaws.com", None): [
+                    (b"GET", b"https://b.s3.eu-west-1.amazonaws.com/key"),
+                ],
+            },
+            {key: agent.requests for (key, agent) in self.agents.items()},
+        )
+
+    def test_learn(self):
+        """
+        The region in the I{x-amz-bucket-region} header of a response is
+        remembered for the bucket the request was about, even if it was
+        sent to the wrong region.
+        """
+        self.response = StubResponse({b"x-amz-bucket-region": [b"eu-west-2"]})
+        agent = _RegionalAgent(self.get_agent, self.regions)
+        self.successResultOf(
+            agent.request(b"GET", b"https://s3.amazonaws.com/mybucket/key"),
+        )
+        self.assertEqual("eu-west-2", self.regions.get("mybucket"))
@@ -0,0 +1,390 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3._sync}.
+"""
+
+import os
+from datetime import datetime
+from hashlib import md5
+
+from dateutil.tz import tzutc
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Cooperator
+from twisted.trial.unittest import TestCase
+
+from txaws.credentials import AWSCredentials
+from txaws.s3 import _sync
+from txaws.s3._transfer import MIN_PART_SIZE
+from txaws.s3.client import S3Client
+from txaws.s3.exception import S3Error
+from txaws.s3.model import BucketItem, DeleteError, DeleteResult
+
+
+# The modification times given to files and objects.
+OLD = 1500000000
+NEW = 1600000000
+
+
+class ImmediateThreadPool:
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        try:
+            result = f(*a, **kw)
+        except Exception as e:
+            onResult(False, e)
+        else:
+            onResult(True, result)
+
+
+class ImmediateReactor:
+    """
+    A reactor stand-in running thread pool work as soon as it is given.
+    """
+    def getThreadPool(self):
+        return ImmediateThreadPool()
+
+    def callFromThread(self, f, *a, **kw):
+        f(*a, **kw)
+
+
+class Listing:
+    """
+    A listing of objects like the one L{S3Client.iter_bucket} gives.
+    """
+    def __init__(self, items):
+        self._items = iter(items)
+        self.closed = False
+
+    def next(self):
+        return succeed(next(self._items, None))
+
+    def close(self):
+        self.closed = True
+
+
+class FailingListing(Listing):
+    def next(self):
+        return fail(S3Error("<Error/>", 403))
+
+
+class SyncingS3:
+    """
+    The requests of an L{S3Client} to sync a directory, recorded and
+    answered by the test.
+
+    @ivar objects: The L{BucketItem}s listed, in key order.
+
+    @ivar uploads: A L{list} of C{(object_name, content_type, Deferred)}
+        for each upload begun.  Uploads succeed at once unless C{pending}
+        is set, in which case the test fires the L{Deferred}.
+
+    @ivar deletes: A L{list} of the names of the objects deleted by each
+        request.
+    """
+    def __init__(self, objects=()):
+        self.objects = list(objects)
+        self.listings = []
+        self.uploads = []
+        self.deletes = []
+        self.pending = False
+        self.delete_errors = ()
+
+    def iter_bucket(self, bucket, prefix=None):
+        listing = Listing(
+            item for item in self.objects
+            if prefix is None or item.key.startswith(prefix)
+        )
+        self.listings.append((prefix, listing))
+        return listing
+
+    def upload_file(self, source, bucket, object_name, part_size,
+                    concurrency, content_type):
+        d = Deferred() if self.pending else succeed(None)
+        self.uploads.append((object_name, content_type, d))
+        return d
+
+    def delete_objects(self, bucket, keys, quiet=False):
+        self.deletes.append(keys)
+        return succeed(DeleteResult(
+            errors=[
+                DeleteError(key, "AccessDenied", "Access Denied")
+                for key in keys if key in self.delete_errors
+            ],
+        ))
+
+    def uploaded(self):
+        return [name for (name, content_type, d) in self.uploads]
+
+
+def item(key, data, mtime=NEW, etag=None):
+    """
+    Make a listed object with some contents.
+    """
+    if etag is None:
+        etag = '"{}"'.format(md5(data).hexdigest())
+    return BucketItem(
+        key, datetime.fromtimestamp(mtime, tzutc()), etag, str(len(data)),
+        "STANDARD",
+    )
+
+
+class LocalFilesTests(TestCase):
+    """
+    Tests for L{_sync._local_files}.
+    """
+    def test_order(self):
+        """
+        The files are walked in the order of their keys, in which a slash
+        sorts after some characters allowed in names.
+        """
+        directory = self.mktemp()
+        os.makedirs(os.path.join(directory, "a", "c"))
+        for name in ["a-c", "a.txt", "b", os.path.join("a", "c", "d")]:
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(b"x")
+        self.assertEqual(
+            ["p/a-c", "p/a.txt", "p/a/c/d", "p/b"],
+            [local.key for local in _sync._local_files(directory, "p/")],
+        )
+
+    def test_stat(self):
+        """
+        The size and modification time of each file are given.
+        """
+        directory = self.mktemp()
+        os.makedirs(directory)
+        path = os.path.join(directory, "file")
+        with open(path, "wb") as f:
+            f.write(b"hello")
+        os.utime(path, (OLD, OLD))
+        [local] = _sync._local_files(directory, "")
+        self.assertEqual(
+            ("file", path, 5, OLD),
+            (local.key, local.path, local.size, local.mtime),
+        )
+
+
+class SyncTests(TestCase):
+    """
+    Tests for L{_sync.sync}.
+    """
+    def setUp(self):
+        self.directory = self.mktemp()
+        os.makedirs(self.directory)
+        self.cooperator = Cooperator(scheduler=lambda f: f())
+
+    def write(self, name, data, mtime=OLD):
+        path = os.path.join(self.directory, name)
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        with open(path, "wb") as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+
+    def sync(self, s3, prefix="", delete=True, concurrency=2):
+        return _sync.sync(
+            s3, self.directory, "bucket", prefix, delete, concurrency,
+            MIN_PART_SIZE, 1, ImmediateReactor(), self.cooperator,
+        )
+
+    def test_upload_new(self):
+        """
+        Files with no object are uploaded with a type guessed from their
+        names.
+        """
+        self.write("index.html", b"<html/>")
+        self.write("sub/data", b"data")
+        s3 = SyncingS3()
+        result = self.successResultOf(self.sync(s3, prefix="site/"))
+        self.assertEqual(
+            [("site/index.html", "text/html"), ("site/sub/data", None)],
+            [(name, content_type) for (name, content_type, d) in s3.uploads],
+        )
+        self.assertEqual(["site/index.html", "site/sub/data"], result.uploaded)
+        self.assertEqual([("site/", s3.listings[0][1])], s3.listings)
+
+    def test_unchanged(self):
+        """
+        A file of the same size as its object and modified before it is
+        not uploaded.
+        """
+        self.write("a", b"hello", mtime=OLD)
+        s3 = SyncingS3([item("a", b"world", mtime=NEW)])
+        result = self.successResultOf(self.sync(s3))
+        self.assertEqual([], s3.uploads)
+        self.assertEqual(1, result.unchanged)
+
+    def test_size_changed(self):
+        """
+        A file of a different size to its object is uploaded.
+        """
+        self.write("a", b"hello there", mtime=OLD)
+        s3 = SyncingS3([item("a", b"hello", mtime=NEW)])
+        result = self.successResultOf(self.sync(s3))
+        self.assertEqual(["a"], s3.uploaded())
+        self.assertEqual(0, result.unchanged)
+
+    def test_touched(self):
+        """
+        A file modified after its object but with contents matching its
+        ETag is not uploaded.
+        """
+        self.write("a", b"hello", mtime=NEW)
+        s3 = SyncingS3([item("a", b"hello", mtime=OLD)])
+        result = self.successResultOf(self.sync(s3))
+        self.assertEqual([], s3.uploads)
+        self.assertEqual(1, result.unchanged)
+
+    def test_touched_multipart(self):
+        """
+        A file whose object has a multipart ETag is compared against it
+        using the part size of the sync.
+        """
+        data = b"x" * (MIN_PART_SIZE + 1)
+        self.write("a", data, mtime=NEW)
+        digests = [md5(data[:MIN_PART_SIZE]), md5(data[MIN_PART_SIZE:])]
+        etag = '"{}-2"'.format(
+            md5(b"".join(d.digest() for d in digests)).hexdigest(),
+        )
+        s3 = SyncingS3([item("a", data, mtime=OLD, etag=etag)])
+        result = self.successResultOf(self.sync(s3))
+        self.assertEqual([], s3.uploads)
+        self.assertEqual(1, result.unchanged)
+
+    def test_modified(self):
+        """
+        A file modified after its object, with contents not matching its
+        ETag, is uploaded.
+        """
+        self.write("a", b"hello", mtime=NEW)
+        s3 = SyncingS3([item("a", b"world", mtime=OLD)])
+        result = self.successResultOf(self.sync(s3))
+        self.assertEqual(["a"], s3.uploaded())
+        self.assertEqual(["a"], result.uploaded)
+
+    def test_uncheckable_etag(self):
+        """
+        A file modified after its object is uploaded if the object's ETag
+        cannot be checked.
+        """
+        self.write("a", b"hello", mtime=NEW)
+        s3 = SyncingS3([item("a", b"hello", mtime=OLD, etag='"abc-3"')])
+        self.successResultOf(self.sync(s3))
+        self.assertEqual(["a"], s3.uploaded())
+
+    def test_delete(self):
+        """
+        Objects with no file are deleted in a batch, the objects which
+        could not be deleted reported.
+        """
+        self.write("b", b"b")
+        s3 = SyncingS3([
+            item("a", b"a"), item("b", b"b"), item("c", b"c"), item("d", b"d"),
+        ])
+        s3.delete_errors = {"d"}
+        result = self.successResultOf(self.sync(s3))
+        self.assertEqual([["a", "c", "d"]], s3.deletes)
+        self.assertEqual(["a", "c"], result.deleted)
+        self.assertEqual(
+            [DeleteError("d", "AccessDenied", "Access Denied")], result.errors,
+        )
+
+    def test_delete_batches(self):
+        """
+        Objects are deleted in batches of as many as S3 allows.
+        """
+        s3 = SyncingS3(
+            [item("{:05}".format(i), b"x") for i in range(1500)],
+        )
+        result = self.successResultOf(self.sync(s3))
+        self.assertEqual([1000, 500], [len(keys) for keys in s3.deletes])
+        self.assertEqual(1500, len(result.deleted))
+
+    def test_no_delete(self):
+        """
+        Unless asked to, objects with no file are left.
+        """
+        s3 = SyncingS3([item("a", b"a")])
+        result = self.successResultOf(self.sync(s3, delete=False))
+        self.assertEqual([], s3.deletes)
+        self.assertEqual([], result.deleted)
+
+    def test_concurrency(self):
+        """
+        No more than C{concurrency} files are uploaded at a time.
+        """
+        for name in "abcd":
+            self.write(name, b"x")
+        s3 = SyncingS3()
+        s3.pending = True
+        d = self.sync(s3, concurrency=2)
+        self.assertEqual(["a", "b"], s3.uploaded())
+        s3.uploads[0][2].callback(None)
+        self.assertEqual(["a", "b", "c"], s3.uploaded())
+        for upload in s3.uploads[1:]:
+            upload[2].callback(None)
+        s3.uploads[3][2].callback(None)
+        self.assertEqual(["a", "b", "c", "d"], self.successResultOf(d).uploaded)
+        self.assertTrue(s3.listings[0][1].closed)
+
+    def test_upload_fails(self):
+        """
+        If a file cannot be uploaded, no more are started and the sync
+        fails.
+        """
+        for name in "abcd":
+            self.write(name, b"x")
+        s3 = SyncingS3()
+        s3.pending = True
+        d = self.sync(s3, concurrency=2)
+        s3.uploads[0][2].errback(S3Error("<Error/>", 403))
+        s3.uploads[1][2].callback(None)
+        self.assertEqual(["a", "b"], s3.uploaded())
+        self.failureResultOf(d, S3Error)
+
+    def test_listing_fails(self):
+        """
+        If the bucket cannot be listed the sync fails.
+        """
+        self.write("a", b"x")
+        s3 = SyncingS3()
+        s3.iter_bucket = lambda bucket, prefix: FailingListing([])
+        self.failureResultOf(self.sync(s3), S3Error)
+        self.assertEqual([], s3.uploads)
+
+    def test_invalid(self):
+        """
+        L{_sync.sync} raises L{ValueError} for a concurrency below one, a
+        part size S3 would refuse or a directory which is not one.
+        """
+        s3 = SyncingS3()
+        self.assertRaises(ValueError, self.sync, s3, concurrency=0)
+        self.assertRaises(
+            ValueError, _sync.sync, s3, self.directory, "bucket", "", False,
+            1, MIN_PART_SIZE - 1, 1, None, self.cooperator,
+        )
+        self.assertRaises(
+            ValueError, _sync.sync, s3, self.mktemp(), "bucket", "", False,
+            1, MIN_PART_SIZE, 1, None, self.cooperator,
+        )
+
+
+class S3ClientSyncTests(TestCase):
+    """
+    Tests for L{S3Client.sync}.
+    """
+    def test_sync(self):
+        """
+        L{S3Client.sync} syncs using the client's requests.
+        """
+        s3 = S3Client(AWSCredentials("foo", "bar"))
+        calls = []
+        self.patch(_sync, "sync", lambda *a: calls.append(a))
+        s3.sync("dir", "bucket", "prefix/", delete=True, concurrency=3)
+        self.assertEqual(
+            [(s3, "dir", "bucket", "prefix/", True, 3, 8 * 2 ** 20, 4, None,
+              s3._cooperator)],
+            calls,
+        )
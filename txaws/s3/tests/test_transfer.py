@@ -0,0 +1,585 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3._transfer}.
+"""
+
+import os
+from hashlib import md5
+from io import BytesIO
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock, Cooperator
+from twisted.trial.unittest import TestCase
+
+from txaws.client.retry import retry_budget, retry_policy
+from txaws.credentials import AWSCredentials
+from txaws.s3 import _transfer
+from txaws.s3._transfer import MIN_PART_SIZE, _FileSegment, _part_size
+from txaws.s3.client import S3Client
+from txaws.s3.exception import ETagMismatch, S3Error
+from txaws.s3.model import MultipartInitiationResponse
+
+
+ACCESS_DENIED = (
+    b"<Error><Code>AccessDenied</Code><Message>Access Denied</Message>"
+    b"</Error>"
+)
+
+SLOW_DOWN = (
+    b"<Error><Code>SlowDown</Code><Message>Reduce your request rate."
+    b"</Message></Error>"
+)
+
+
+class FakeS3:
+    """
+    The multipart requests of an L{S3Client}, recorded and answered by
+    the test.
+
+    @ivar parts: A L{list} of C{(part_number, data, Deferred)} for each
+        part upload begun.  The test fires the L{Deferred} with the
+        response headers or a failure.
+    """
+    def __init__(self):
+        self.calls = []
+        self.parts = []
+        self.objects = {}
+        self.files = []
+
+    def put_object(self, bucket, object_name, content_type=None,
+                   metadata={}, amz_headers={}, body_producer=None):
+        segment = body_producer._inputFile
+        self.files.append(segment._file)
+        self.objects[bucket, object_name] = segment.read()
+        return succeed(b"")
+
+    def init_multipart_upload(self, bucket, object_name, content_type=None,
+                              metadata={}, amz_headers={}):
+        self.calls.append(("init", bucket, object_name, content_type))
+        return succeed(
+            MultipartInitiationResponse(bucket, object_name, "upload-id"),
+        )
+
+    def upload_part(self, bucket, object_name, upload_id, part_number,
+                    body_producer=None):
+        d = Deferred()
+        self.parts.append(
+            (part_number, body_producer._inputFile.read(), d),
+        )
+        return d
+
+    def complete_multipart_upload(self, bucket, object_name, upload_id,
+                                  parts_list):
+        self.calls.append(("complete", upload_id, parts_list))
+        return succeed(None)
+
+    def abort_multipart_upload(self, bucket, object_name, upload_id):
+        self.calls.append(("abort", upload_id))
+        return succeed(None)
+
+
+class FileSegmentTests(TestCase):
+    """
+    Tests for L{_FileSegment}.
+    """
+    def test_read(self):
+        """
+        A segment reads only its part of the file, whatever else has been
+        read from the file meanwhile.
+        """
+        fileobj = BytesIO(b"0123456789")
+        first = _FileSegment(fileobj, 2, 3)
+        second = _FileSegment(fileobj, 6, 10)
+        self.assertEqual(b"23", first.read(2))
+        self.assertEqual(b"678", second.read(3))
+        self.assertEqual(b"4", first.read())
+        self.assertEqual(b"", first.read())
+        self.assertEqual(b"9", second.read())
+
+    def test_seek(self):
+        """
+        A segment's positions are relative to its start and end.
+        """
+        segment = _FileSegment(BytesIO(b"0123456789"), 2, 3)
+        self.assertEqual(3, segment.seek(0, 2))
+        segment.seek(1)
+        self.assertEqual(1, segment.tell())
+        self.assertEqual(b"34", segment.read())
+
+    def test_close(self):
+        """
+        Closing a segment leaves the file open.
+        """
+        fileobj = BytesIO(b"0123456789")
+        _FileSegment(fileobj, 2, 3).close()
+        self.assertFalse(fileobj.closed)
+
+
+class PartSizeTests(TestCase):
+    """
+    Tests for L{_part_size}.
+    """
+    def test_too_small(self):
+        """
+        Parts may not be smaller than S3 allows.
+        """
+        self.assertRaises(ValueError, _part_size, 100, MIN_PART_SIZE - 1)
+
+    def test_too_many_parts(self):
+        """
+        Parts are made larger if there would otherwise be too many.
+        """
+        self.assertEqual(MIN_PART_SIZE, _part_size(10, MIN_PART_SIZE))
+        size = MIN_PART_SIZE * 10000 + 1
+        self.assertEqual(MIN_PART_SIZE + 1, _part_size(size, MIN_PART_SIZE))
+
+
+class UploadFileTests(TestCase):
+    """
+    Tests for L{_transfer.upload_file}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.cooperator = Cooperator(
+            scheduler=lambda f: self.clock.callLater(0, f),
+        )
+        self.s3 = FakeS3()
+        self.policy = retry_policy(reactor=self.clock)
+
+    def pump(self):
+        """
+        Run the delayed calls which are due, but not retries still backing
+        off.
+        """
+        while any(
+            call.getTime() <= self.clock.seconds()
+            for call in self.clock.getDelayedCalls()
+        ):
+            self.clock.advance(0)
+
+    def wait(self, seconds):
+        self.clock.advance(seconds)
+        self.pump()
+
+    def upload(self, source, concurrency=2, part_attempts=3):
+        d = _transfer.upload_file(
+            self.s3, source, "bucket", "key", MIN_PART_SIZE, concurrency,
+            part_attempts, "text/plain", {}, {}, self.policy, self.clock,
+            self.cooperator,
+        )
+        self.pump()
+        return d
+
+    def respond(self, part_number, result):
+        """
+        Answer the most recent upload of a part.
+        """
+        for number, data, d in reversed(self.s3.parts):
+            if number == part_number:
+                if isinstance(result, Exception):
+                    d.errback(result)
+                else:
+                    d.callback(result)
+                self.pump()
+                return
+        self.fail("Part {} was not uploaded".format(part_number))
+
+    def test_single_request(self):
+        """
+        A file no larger than a part is put in one request, from the
+        file's current position.
+        """
+        source = BytesIO(b"xxhello")
+        source.seek(2)
+        d = self.upload(source)
+        self.assertIdentical(None, self.successResultOf(d))
+        self.assertEqual({("bucket", "key"): b"hello"}, self.s3.objects)
+        self.assertEqual([], self.s3.calls)
+        self.assertFalse(source.closed)
+
+    def test_path(self):
+        """
+        A file named by a path is opened and closed again.
+        """
+        path = self.mktemp()
+        with open(path, "wb") as fileobj:
+            fileobj.write(b"hello")
+        d = self.upload(path)
+        self.successResultOf(d)
+        self.assertEqual({("bucket", "key"): b"hello"}, self.s3.objects)
+        [fileobj] = self.s3.files
+        self.assertTrue(fileobj.closed)
+
+    def test_parts(self):
+        """
+        A larger file is uploaded in parts, no more than C{concurrency} at a
+        time, and the upload is completed with the ETags of the parts.
+        """
+        data = b"a" * MIN_PART_SIZE + b"b" * MIN_PART_SIZE + b"c"
+        d = self.upload(BytesIO(data))
+        self.assertEqual(
+            [("init", "bucket", "key", "text/plain")], self.s3.calls,
+        )
+        self.assertEqual([1, 2], [part[0] for part in self.s3.parts])
+        self.respond(2, {b"Etag": b'"two"'})
+        self.assertEqual([1, 2, 3], [part[0] for part in self.s3.parts])
+        self.respond(3, {b"Etag": b'"three"'})
+        self.assertNoResult(d)
+        self.respond(1, {b"Etag": b'"one"'})
+        self.assertIdentical(None, self.successResultOf(d))
+        self.assertEqual(
+            data, b"".join(part[1] for part in sorted(self.s3.parts)),
+        )
+        self.assertEqual(
+            ("complete", "upload-id",
+             [(1, '"one"'), (2, '"two"'), (3, '"three"')]),
+            self.s3.calls[-1],
+        )
+
+    def test_retry_part(self):
+        """
+        A part whose upload fails is uploaded again after a delay.
+        """
+        data = b"a" * MIN_PART_SIZE + b"b"
+        d = self.upload(BytesIO(data))
+        self.respond(2, ValueError("connection lost"))
+        self.assertEqual([1, 2], [part[0] for part in self.s3.parts])
+        self.wait(self.policy.max_delay)
+        self.assertEqual([1, 2, 2], [part[0] for part in self.s3.parts])
+        self.assertEqual(b"b", self.s3.parts[-1][1])
+        self.respond(2, {b"Etag": b'"two"'})
+        self.respond(1, {b"Etag": b'"one"'})
+        self.successResultOf(d)
+        self.assertEqual("complete", self.s3.calls[-1][0])
+
+    def test_part_attempts(self):
+        """
+        A part is uploaded no more than C{part_attempts} times, after which
+        the upload is aborted once the other parts being uploaded are done.
+        """
+        data = b"a" * MIN_PART_SIZE * 2 + b"b"
+        d = self.upload(BytesIO(data), part_attempts=2)
+        self.respond(1, ValueError("first"))
+        self.wait(self.policy.max_delay)
+        self.respond(1, ValueError("second"))
+        # The part in progress is finished but no other is started.
+        self.assertEqual([1, 2, 1], [part[0] for part in self.s3.parts])
+        self.assertNoResult(d)
+        self.respond(2, {b"Etag": b'"two"'})
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(("abort", "upload-id"), self.s3.calls[-1])
+
+    def test_backoff(self):
+        """
+        A part which S3 throttled is retried after no less than the
+        policy's throttling base delay.
+        """
+        data = b"a" * MIN_PART_SIZE + b"b"
+        d = self.upload(BytesIO(data))
+        self.respond(1, S3Error(SLOW_DOWN, 503))
+        self.wait(self.policy.throttling_base_delay - 0.01)
+        self.assertEqual([1, 2], [part[0] for part in self.s3.parts])
+        self.wait(self.policy.max_delay)
+        self.assertEqual([1, 2, 1], [part[0] for part in self.s3.parts])
+        self.respond(1, {b"Etag": b'"one"'})
+        self.respond(2, {b"Etag": b'"two"'})
+        self.successResultOf(d)
+
+    def test_budget(self):
+        """
+        A part is not uploaded again once the policy's retry budget is
+        spent, however many attempts it has left.
+        """
+        self.policy = retry_policy(
+            reactor=self.clock,
+            budget=retry_budget(capacity=1, rate=0, clock=self.clock),
+        )
+        data = b"a" * MIN_PART_SIZE + b"b"
+        d = self.upload(BytesIO(data), part_attempts=5)
+        self.respond(1, ValueError("first"))
+        self.wait(self.policy.max_delay)
+        self.respond(1, ValueError("second"))
+        self.respond(2, {b"Etag": b'"two"'})
+        self.wait(self.policy.max_delay)
+        self.assertEqual([1, 2, 1], [part[0] for part in self.s3.parts])
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(("abort", "upload-id"), self.s3.calls[-1])
+
+    def test_fatal_error(self):
+        """
+        A part S3 refuses as the fault of the request is not uploaded again.
+        """
+        data = b"a" * MIN_PART_SIZE + b"b"
+        d = self.upload(BytesIO(data))
+        self.respond(1, S3Error(ACCESS_DENIED, 403))
+        self.respond(2, {b"Etag": b'"two"'})
+        self.assertEqual([1, 2], [part[0] for part in self.s3.parts])
+        self.failureResultOf(d, S3Error)
+        self.assertEqual(("abort", "upload-id"), self.s3.calls[-1])
+
+    def test_complete_fails(self):
+        """
+        If the upload cannot be completed, it is aborted.
+        """
+        self.s3.complete_multipart_upload = (
+            lambda *a: fail(S3Error(ACCESS_DENIED, 403))
+        )
+        d = self.upload(BytesIO(b"a" * MIN_PART_SIZE + b"b"))
+        self.respond(1, {b"Etag": b'"one"'})
+        self.respond(2, {b"Etag": b'"two"'})
+        self.failureResultOf(d, S3Error)
+        self.assertEqual(("abort", "upload-id"), self.s3.calls[-1])
+
+    def test_invalid_concurrency(self):
+        """
+        At least one part must be uploaded at a time.
+        """
+        self.assertRaises(
+            ValueError, _transfer.upload_file, self.s3, BytesIO(b""),
+            "bucket", "key", MIN_PART_SIZE, 0, 1, None, {}, {},
+            self.policy, self.clock, self.cooperator,
+        )
+
+
+class S3ClientUploadFileTests(TestCase):
+    """
+    Tests for L{S3Client.upload_file}.
+    """
+    def test_upload_file(self):
+        """
+        L{S3Client.upload_file} uploads using the client's requests.
+        """
+        s3 = S3Client(AWSCredentials("foo", "bar"))
+        uploads = []
+        self.patch(
+            _transfer, "upload_file", lambda *a: uploads.append(a),
+        )
+        s3.upload_file(BytesIO(b"hello"), "bucket", "key", concurrency=3)
+        [args] = uploads
+        self.assertIdentical(s3, args[0])
+        self.assertEqual(("bucket", "key", 8 * 2 ** 20, 3), args[2:6])
+
+
+class ImmediateThreadPool:
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        try:
+            result = f(*a, **kw)
+        except Exception as e:
+            onResult(False, e)
+        else:
+            onResult(True, result)
+
+
+class ImmediateReactor:
+    """
+    A reactor stand-in running thread pool work as soon as it is given.
+    """
+    def getThreadPool(self):
+        return ImmediateThreadPool()
+
+    def callFromThread(self, f, *a, **kw):
+        f(*a, **kw)
+
+
+class ManualThreadPool:
+    """
+    A thread pool stand-in running its work only when the test calls
+    C{run}.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def callInThreadWithCallback(self, onResult, f, *a, **kw):
+        self.calls.append((onResult, f, a, kw))
+
+    def run(self):
+        immediate = ImmediateThreadPool()
+        while self.calls:
+            onResult, f, a, kw = self.calls.pop(0)
+            immediate.callInThreadWithCallback(onResult, f, *a, **kw)
+
+
+class ManualReactor(ImmediateReactor):
+    """
+    A reactor stand-in whose thread pool runs work when the test says.
+    """
+    def __init__(self):
+        self.threadpool = ManualThreadPool()
+
+    def getThreadPool(self):
+        return self.threadpool
+
+
+class ObjectS3:
+    """
+    The requests of an L{S3Client} to get one object, recorded and
+    answered by the test.
+
+    @ivar ranges: A L{list} of C{(first, last, if_match)} for each range
+        requested.
+    """
+    def __init__(self, data, etag):
+        self.data = data
+        self.etag = etag
+        self.ranges = []
+        self.pending = []
+        self.heads = []
+
+    def head_object(self, bucket, object_name, cached=True):
+        self.heads.append(cached)
+        return succeed({
+            b"Content-Length": str(len(self.data)).encode("ascii"),
+            b"Etag": self.etag.encode("ascii"),
+        })
+
+    def get_object_range(self, bucket, object_name, consumer, first, last,
+                         if_match=None):
+        self.ranges.append((first, last, if_match))
+        d = Deferred()
+        self.pending.append((consumer, first, last, d))
+        return d
+
+    def respond(self, failure=None):
+        """
+        Answer the oldest range request not yet answered.
+        """
+        consumer, first, last, d = self.pending.pop(0)
+        if failure is not None:
+            d.errback(failure)
+        else:
+            consumer.write(self.data[first:last + 1])
+            d.callback({})
+
+
+class DownloadFileTests(TestCase):
+    """
+    Tests for L{_transfer.download_file}.
+    """
+    def setUp(self):
+        self.cooperator = Cooperator(scheduler=lambda f: f())
+        self.path = self.mktemp()
+
+    def download(self, s3, part_size=4, verify=True, reactor=None):
+        if reactor is None:
+            reactor = ImmediateReactor()
+        return _transfer.download_file(
+            s3, "bucket", "key", self.path, part_size, 2, verify,
+            reactor, self.cooperator,
+        )
+
+    def content(self):
+        with open(self.path, "rb") as fileobj:
+            return fileobj.read()
+
+    def test_ranges(self):
+        """
+        The object is got in ranges, no more than C{concurrency} at a time,
+        each written at its place in the file, and checked against its
+        ETag.
+        """
+        data = b"0123456789"
+        s3 = ObjectS3(data, '"{}"'.format(md5(data).hexdigest()))
+        d = self.download(s3)
+        self.assertEqual(
+            [(0, 3, s3.etag), (4, 7, s3.etag)], s3.ranges,
+        )
+        s3.pending.reverse()
+        s3.respond()
+        self.assertEqual(3, len(s3.ranges))
+        s3.respond()
+        s3.respond()
+        headers = self.successResultOf(d)
+        self.assertEqual(s3.etag.encode("ascii"), headers[b"Etag"])
+        self.assertEqual(data, self.content())
+
+    def test_uncached_head(self):
+        """
+        The object is headed without the client's object cache, whose
+        headers may be stale.
+        """
+        s3 = ObjectS3(b"", '"{}"'.format(md5(b"").hexdigest()))
+        self.successResultOf(self.download(s3))
+        self.assertEqual([False], s3.heads)
+
+    def test_multipart_etag(self):
+        """
+        An object uploaded in parts is checked against its ETag if the part
+        size can be guessed.
+        """
+        data = b"0123456789"
+        digests = b"".join(
+            md5(data[i:i + 4]).digest() for i in range(0, 10, 4)
+        )
+        s3 = ObjectS3(data, '"{}-3"'.format(md5(digests).hexdigest()))
+        d = self.download(s3)
+        for i in range(3):
+            s3.respond()
+        self.successResultOf(d)
+        self.assertEqual(data, self.content())
+
+    def test_mismatch(self):
+        """
+        If the file does not match the ETag, the download fails and the
+        file is removed.
+        """
+        s3 = ObjectS3(b"0123456789", '"{}"'.format(md5(b"other").hexdigest()))
+        d = self.download(s3)
+        for i in range(3):
+            s3.respond()
+        self.failureResultOf(d, ETagMismatch)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_no_verify(self):
+        """
+        With C{verify} false, the ETag is not checked.
+        """
+        s3 = ObjectS3(b"0123456789", '"not-a-digest"')
+        d = self.download(s3, verify=False)
+        for i in range(3):
+            s3.respond()
+        self.successResultOf(d)
+
+    def test_range_fails(self):
+        """
+        If a range cannot be got, no more are requested and the download
+        fails once those in progress are done, removing the file.
+        """
+        s3 = ObjectS3(b"0123456789", '"etag"')
+        d = self.download(s3)
+        s3.respond(ValueError("broken"))
+        self.assertEqual(2, len(s3.ranges))
+        self.assertNoResult(d)
+        s3.respond()
+        self.failureResultOf(d, ValueError)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_range_fails_while_writing(self):
+        """
+        The file of a failed download is not closed or removed until what
+        arrived of the failed range has been written to it.
+        """
+        reactor = ManualReactor()
+        s3 = ObjectS3(b"0123456789", '"etag"')
+        d = self.download(s3, part_size=5, reactor=reactor)
+        s3.pending.reverse()
+        s3.respond()
+        reactor.threadpool.run()
+        consumer = s3.pending[0][0]
+        consumer.write(b"01")
+        s3.respond(ValueError("broken"))
+        self.assertNoResult(d)
+        self.assertTrue(os.path.exists(self.path))
+        reactor.threadpool.run()
+        self.failureResultOf(d, ValueError)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_empty(self):
+        """
+        An empty object is downloaded without getting any ranges.
+        """
+        s3 = ObjectS3(b"", '"{}"'.format(md5(b"").hexdigest()))
+        d = self.download(s3)
+        self.successResultOf(d)
+        self.assertEqual([], s3.ranges)
+        self.assertEqual(b"", self.content())
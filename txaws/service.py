@@ -183,13 +183,9 @@ class AWSServiceRegion:
                                endpoint=self.s3_endpoint, query_factory=None)
 
 
-    _agent = None
     def get_route53_client(self):
         from txaws.route53.client import get_route53_client
 
-        if self._agent is None:
-            from twisted.web.client import Agent
-            from twisted.internet import reactor
-            self._agent = Agent(reactor)
-
-        return get_route53_client(self._agent, self)
+        # Without an agent the client issues requests using agents from
+        # the shared connection pool.
+        return get_route53_client(None, self)
@@ -226,6 +226,8 @@ class _SQSURLContext(_URLContext):
     # Backwards compatibility layer.  For deprecation.  s3_url_context
     # should just return an _URLContext and application code should
     # interact with that interface.
+    __slots__ = ()
+
     def get_host(self):
         return self.get_encoded_host()
 
@@ -239,10 +241,11 @@ class QuerysSignatureV4(BaseQuery):
 
     version = '2012-11-05'
 
-    def __init__(self, creds, endpoint, agent=None):
+    def __init__(self, creds, endpoint, agent=None, scheduler=None):
         super(QuerysSignatureV4, self).__init__(endpoint.get_host(), agent)
         self.creds = creds
         self.endpoint = endpoint
+        self.scheduler = scheduler
         self.region = endpoint.get_host().split('.')[1]
 
     def _get_amz(self, dt):
@@ -326,10 +329,11 @@ class QuerySignatureV2(BaseQuery):
     version = '2012-11-05'
     DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
-    def __init__(self, creds, endpoint, agent=None):
+    def __init__(self, creds, endpoint, agent=None, scheduler=None):
         super(QuerySignatureV2, self).__init__(endpoint.get_host(), agent)
         self.creds = creds
         self.endpoint = endpoint
+        self.scheduler = scheduler
 
     def _calculate_signature(self, query_params_list):
         query_string = quote(query_params_list)
@@ -369,8 +373,15 @@ class SQSClient(BaseClient):
             - ListQueues.
     """
 
-    def __init__(self, creds=None, endpoint=None, query_factory=None):
-        query_factory = QuerysSignatureV4(creds, endpoint)
+    def __init__(self, creds=None, endpoint=None, query_factory=None,
+                 scheduler=None):
+        """
+            @param scheduler: optional, the scheduler, possibly shared with
+                              other clients, which limits how many requests
+                              are in flight to each host.  Queues got from
+                              this client share it.
+        """
+        query_factory = QuerysSignatureV4(creds, endpoint, scheduler=scheduler)
         super(SQSClient, self).__init__(creds, endpoint, query_factory)
 
     def get_queue(self, owner_id, queue):
@@ -384,7 +395,8 @@ class SQSClient(BaseClient):
         endpoint = AWSServiceEndpoint(uri=self.endpoint.get_uri())
         endpoint.set_path('/{}/{}/'.format(owner_id, queue))
         query_factory = QuerysSignatureV4(self.creds, endpoint,
-                                          self.query_factory.agent)
+                                          self.query_factory.agent,
+                                          self.query_factory.scheduler)
         return Queue(self.creds, endpoint, query_factory)
 
     def create_queue(self, name, attrs=None):
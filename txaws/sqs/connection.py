@@ -2,22 +2,13 @@ from io import StringIO
 
 
 from twisted.python import log
-from twisted.internet import reactor, ssl, defer, protocol
-from twisted.web.client import Agent, HTTPConnectionPool
+from twisted.internet import reactor, defer, protocol
 from twisted.web.http_headers import Headers
 
-from txaws.client.ssl import VerifyingContextFactory
+from txaws.client.base import default_connection_pool
 from txaws.sqs.errors import ApiError, ResponseError
 
 
-class SSLClientContextFactory(VerifyingContextFactory):
-    """
-        SSL context factory to make necessary verification.
-    """
-    def getContext(self, host, port):
-        return VerifyingContextFactory.getContext(self)
-
-
 class BodyReceiver(protocol.Protocol):
 
     def __init__(self, finished, response):
@@ -41,15 +32,11 @@ class BodyReceiver(protocol.Protocol):
 
 class SQSConnection:
 
-    def __init__(self, host, agent=None):
+    def __init__(self, host, agent=None, connection_pool=None):
         if agent is None:
-            pool = HTTPConnectionPool(reactor)
-            contextFactory = SSLClientContextFactory(host)
-            agent = Agent(
-                reactor,
-                contextFactory=contextFactory,
-                pool=pool
-            )
+            if connection_pool is None:
+                connection_pool = default_connection_pool(reactor)
+            agent = connection_pool.get_agent("https", host)
         self.agent = agent
 
     def call(self, url, method='GET', headers={}):
@@ -978,6 +978,34 @@ sample_get_bucket_result = """\
 """ % (version.s3_api,)
 
 
+sample_list_objects_v2_result = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<ListBucketResult xmlns="http://s3.amazonaws.com/doc/%s/">
+  <Name>mybucket</Name>
+  <Prefix>photos/</Prefix>
+  <StartAfter>photos/a</StartAfter>
+  <KeyCount>3</KeyCount>
+  <MaxKeys>3</MaxKeys>
+  <Delimiter>/</Delimiter>
+  <IsTruncated>true</IsTruncated>
+  <NextContinuationToken>1ueGcxLPRx1Tr/XYExHnhbYLgveDs2J/wm36Hy4vbOwM=</NextContinuationToken>
+  <Contents>
+    <Key>photos/b.jpg</Key>
+    <LastModified>2006-01-01T12:00:00.000Z</LastModified>
+    <ETag>&quot;828ef3fdfa96f00ad9f27c383fc9ac7f&quot;</ETag>
+    <Size>5</Size>
+    <StorageClass>STANDARD</StorageClass>
+  </Contents>
+  <CommonPrefixes>
+    <Prefix>photos/2006/</Prefix>
+  </CommonPrefixes>
+  <CommonPrefixes>
+    <Prefix>photos/2007/</Prefix>
+  </CommonPrefixes>
+</ListBucketResult>
+""" % (version.s3_api,)
+
+
 sample_get_bucket_location_result = """\
 <LocationConstraint xmlns="http://s3.amazonaws.com/doc/2006-03-01/">EU\
 </LocationConstraint>
@@ -1143,3 +1171,16 @@ sample_s3_complete_multipart_upload_result = """\
   <Key>example-object</Key>
   <ETag>"3858f62230ac3c915f300c664312c11f-9"</ETag>
 </CompleteMultipartUploadResult>"""
+
+sample_delete_objects_result = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<DeleteResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+  <Deleted>
+    <Key>sample1.txt</Key>
+  </Deleted>
+  <Error>
+    <Key>sample2.txt</Key>
+    <Code>AccessDenied</Code>
+    <Message>Access Denied</Message>
+  </Error>
+</DeleteResult>"""
@@ -8,7 +8,9 @@ U{http://docs.aws.amazon.com/general/latest/gr/signature-v4-test-suite.html}
 
 import attr
 import datetime
+import hashlib
 import re
+from urllib.parse import unquote
 
 from twisted.trial import unittest
 from twisted.python import filepath
@@ -24,6 +26,7 @@ from txaws._auth_v4 import (
     makeAMZDate,
     _SignableAWS4HMAC256Token,
 )
+from txaws.client.base import url_context
 from txaws.credentials import AWSCredentials
 
 
@@ -47,6 +50,34 @@ _SKIPS = {
     "post-vanilla-query-space": _NOT_YET_SUPPORTED_SKIP,
 }
 
+# Canonical requests built from a URL context start from path segments
+# and query arguments, so there is no path to normalize and the URL
+# quoting problems above do not arise.
+_URL_CONTEXT_SKIPS = {
+    # The request parser folds continuation lines with a space.
+    "get-header-value-multiline": _NOT_YET_SUPPORTED_SKIP,
+    # The fixture's request line carries its path unencoded, which its
+    # canonical request encodes once.  A request built from segments is
+    # sent with its path encoded, which is encoded again for every
+    # service but S3.
+    "get-utf8": "Paths are encoded twice for services other than S3.",
+    "normalize-path/get-relative": _NOT_YET_SUPPORTED_SKIP,
+    "normalize-path/get-relative-relative": _NOT_YET_SUPPORTED_SKIP,
+    "normalize-path/get-slash": _NOT_YET_SUPPORTED_SKIP,
+    "normalize-path/get-slash-dot-slash": _NOT_YET_SUPPORTED_SKIP,
+    "normalize-path/get-slash-pointless-dot": _NOT_YET_SUPPORTED_SKIP,
+    "normalize-path/get-slashes": _NOT_YET_SUPPORTED_SKIP,
+    "normalize-path/get-space": _NOT_YET_SUPPORTED_SKIP,
+    "post-sts-token/post-sts-header-before": _NOT_YET_SUPPORTED_SKIP,
+    # These requests' unquoted query strings cannot be split into
+    # arguments unambiguously.
+    "post-vanilla-query-nonunreserved": _NOT_YET_SUPPORTED_SKIP,
+    "post-vanilla-query-space": _NOT_YET_SUPPORTED_SKIP,
+}
+
+
+_NON_ASCII = re.compile(b'[\x80-\xff]')
+
 
 @attr.s(frozen=True)
 class _AWSRequest:
@@ -87,10 +118,17 @@ class _AWSRequest:
         if blank_line not in byte_string:
             byte_string += blank_line
 
+        # Newer versions of HTTPChannel reject a request line which is not
+        # ASCII, as some fixtures' are, so percent-encode it first.
+        request_line, rest = byte_string.split(b'\n', 1)
+        request_line = _NON_ASCII.sub(
+            lambda match: b'%%%02X' % ord(match.group()), request_line,
+        )
+
         channel = HTTPChannel()
         channel.delimiter = b'\n'
         channel.makeConnection(StringTransport())
-        channel.dataReceived(byte_string)
+        channel.dataReceived(request_line + b'\n' + rest)
         channel.connectionLost(ConnectionDone())
         request = channel.requests[-1]
 
@@ -175,6 +213,60 @@ class _AWS4TestSuiteTestCaseMixin:
                          serialized_canonical_request)
         return canonical_request
 
+    def _test_url_context_canonical_request(self, path):
+        """
+        Extract AWS request and canonical request fixtures from
+        C{path}, and compare a L{_CanonicalRequest} instance
+        constructed from a URL context describing the request to the
+        canonical request.
+
+        @return: The constructed canonical request
+        @rtype: L{_CanonicalRequest}
+        """
+        request_path = self._globOne(path, '*.req')
+        canonical_request_path = self._globOne(path, '*.creq')
+
+        with request_path.open() as f:
+            request = _AWSRequest.frombytes(f.read())
+
+        with canonical_request_path.open() as f:
+            serialized_canonical_request = f.read()
+
+        request_path, _, request_query = request.path.decode(
+            "utf-8").partition("?")
+        query = []
+        if request_query:
+            for argument in request_query.split("&"):
+                query.append(tuple(
+                    unquote(part) for part in argument.split("=", 1)
+                ))
+        headers = {
+            name.decode("utf-8").lower(): [
+                value.decode("utf-8") for value in values
+            ]
+            for (name, values) in request.headers.items()
+        }
+
+        canonical_request = _CanonicalRequest.from_url_context(
+            method=request.method,
+            url_context=url_context(
+                scheme="https",
+                host=headers["host"][0],
+                port=None,
+                path=[unquote(segment)
+                      for segment in request_path.split("/")[1:]],
+                query=query,
+            ),
+            headers=headers,
+            headers_to_sign=headers.keys(),
+            payload_hash=hashlib.sha256(request.body).hexdigest(),
+            service=self.service,
+        )
+
+        self.assertEqual(canonical_request.serialize(),
+                         serialized_canonical_request)
+        return canonical_request
+
     def _test_string_to_sign(self, path, canonical_request):
         """
         Extract an AWS string-to-sign fixture from C{path} and compare it
@@ -218,6 +310,12 @@ class _AWS4TestSuiteTestCaseMixin:
         self._test_string_to_sign(path, canonical_request)
         self._test_authorization(path, canonical_request)
 
+    def _test_url_context_case(self, path):
+        # The authorization header depends only on the string to sign,
+        # which _test_case covers.
+        canonical_request = self._test_url_context_canonical_request(path)
+        self._test_string_to_sign(path, canonical_request)
+
 
 _RENAME_FILE = re.compile('[/-]')
 
@@ -256,6 +354,32 @@ def _build_test_method(test_suite_path, fixture_path):
     return method
 
 
+def _build_url_context_test_method(test_suite_path, fixture_path):
+    """
+    Construct a test method, like L{_build_test_method}, that runs a test
+    of L{_CanonicalRequest.from_url_context} against the given fixture
+    path.
+
+    The test method's name will be its path, prefixed with
+    C{url_context_} and with slashes (C{/}) and dashes (C{-}) replaced
+    with underscores (C{_})
+
+    @see: L{_build_test_method}
+    """
+    def method(self):
+        self._test_url_context_case(fixture_path)
+
+    relative = fixture_path.path.replace(test_suite_path.path, '').lstrip('/')
+    skip_reason = _URL_CONTEXT_SKIPS.get(relative)
+    if skip_reason:
+        method.skip = skip_reason
+
+    name = 'test_url_context_' + _RENAME_FILE.sub('_', relative)
+
+    method.__name__ = name
+    return method
+
+
 def _collect_fixture_directories(path):
     """
     Yield all the AWS fixture directories under the given path.
@@ -288,6 +412,8 @@ def test_suite():
     for fixture_path in _collect_fixture_directories(path):
         method = _build_test_method(path, fixture_path)
         methods[method.__name__] = method
+        method = _build_url_context_test_method(path, fixture_path)
+        methods[method.__name__] = method
 
     suite = unittest.TestSuite()
     suite.name = "test_aws4_testsuite"
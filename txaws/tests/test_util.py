@@ -3,7 +3,7 @@ import binascii
 
 from twisted.trial.unittest import TestCase
 
-from txaws.util import hmac_sha1, iso8601time, parse
+from txaws.util import XML, hmac_sha1, iso8601time, parse
 
 
 class MiscellaneousTestCase(TestCase):
@@ -26,6 +26,25 @@ class MiscellaneousTestCase(TestCase):
                          iso8601time((2006, 7, 7, 15, 4, 56, 0, 0, 0)))
 
 
+
+class XMLTestCase(TestCase):
+    """
+    Tests for L{XML}.
+    """
+    def test_namespaces_stripped(self):
+        """
+        The tags of the elements of a document in a namespace, as most AWS
+        responses are, are found without the namespace.
+        """
+        root = XML(
+            b'<InitiateMultipartUploadResult '
+            b'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            b'<UploadId>abc</UploadId>'
+            b'</InitiateMultipartUploadResult>'
+        )
+        self.assertEqual("InitiateMultipartUploadResult", root.tag)
+        self.assertEqual("abc", root.findtext("UploadId"))
+
 class ParseUrlTestCase(TestCase):
     """
     Test URL parsing facility and defaults values.
@@ -61,7 +61,13 @@ class NamespaceFixXmlTreeBuilder(XMLParser):
 def XML(text):
     parser = NamespaceFixXmlTreeBuilder()
     parser.feed(text)
-    return parser.close()
+    root = parser.close()
+    # The C accelerated parser never calls _fixname so strip the
+    # namespaces from the tags it built.
+    for element in root.iter():
+        if "}" in element.tag:
+            element.tag = element.tag.split("}", 1)[1]
+    return root
 
 
 def parse(url, defaultPort=True):